@@ -0,0 +1,219 @@
+from neo4j import AsyncGraphDatabase
+from neo4j.exceptions import Neo4jError
+import asyncio
+import os
+import time
+from contextlib import asynccontextmanager
+from dotenv import load_dotenv
+import schema
+from database import SEARCH_MODES, Neo4jQueryPlans, check_mode
+from metrics import AsyncInstrumentedSession
+
+# 加载环境变量
+load_dotenv()
+
+
+class AsyncNeo4jDatabase(Neo4jQueryPlans):
+    """
+    Neo4j异步数据库访问类
+
+    与 Neo4jDatabase 提供相同的公共方法，基于 AsyncGraphDatabase 和异步会话，
+    查询执行期间不会阻塞事件循环，单个worker可以同时处理多个请求。
+    查询逻辑与 Neo4jDatabase 共用（见 Neo4jQueryPlans），这里只负责会话和查询的执行。
+    """
+    
+    def __init__(self):
+        super().__init__()
+        # 会话使用统计（每个执行中的会话占用一个连接）
+        self.sessions_in_use = 0
+        self.peak_sessions_in_use = 0
+        self.sessions_opened = 0
+        # 保证并发请求只触发一次标题索引构建
+        self._title_index_lock = asyncio.Lock()
+    
+    def connect(self):
+        """建立数据库连接（驱动本身惰性建立连接）"""
+        if self.driver is None:
+            self.driver = AsyncGraphDatabase.driver(self.uri, auth=(self.user, self.password), **self.pool_config)
+        return self.driver
+    
+    async def close(self):
+        """关闭数据库连接"""
+        if self.driver:
+            await self.driver.close()
+            self.driver = None
+    
+    @asynccontextmanager
+    async def get_session(self):
+        """获取异步数据库会话，并统计正在使用的会话数；会话中的查询记录耗时和返回行数（见 metrics）"""
+        self.sessions_in_use += 1
+        self.sessions_opened += 1
+        self.peak_sessions_in_use = max(self.peak_sessions_in_use, self.sessions_in_use)
+        try:
+            async with self.connect().session() as session:
+                yield AsyncInstrumentedSession(session)
+        finally:
+            self.sessions_in_use -= 1
+    
+    async def warm_up(self, connections=None):
+        """
+        验证连通性并预先建立连接，避免首个请求承担建连开销
+        
+        Args:
+            connections: 预热的连接数，默认读取 NEO4J_WARMUP_CONNECTIONS（默认5）
+        """
+        if connections is None:
+            connections = int(os.getenv("NEO4J_WARMUP_CONNECTIONS", "5"))
+        connections = max(1, min(connections, self.pool_config['max_connection_pool_size']))
+        
+        await self.connect().verify_connectivity()
+        # 并发执行的会话会各自占用一个连接，结束后连接留在池中
+        await asyncio.gather(*[self._fetch_one("RETURN 1 as ok") for _ in range(connections)])
+    
+    async def health(self):
+        """
+        健康检查：探测查询延迟并报告连接池使用情况
+        
+        Returns:
+            dict: status为'ok'或'unavailable'
+        """
+        report = {
+            'pool': {
+                'max_size': self.pool_config['max_connection_pool_size'],
+                'acquisition_timeout': self.pool_config['connection_acquisition_timeout'],
+                'max_connection_lifetime': self.pool_config['max_connection_lifetime'],
+                'sessions_in_use': self.sessions_in_use,
+                'peak_sessions_in_use': self.peak_sessions_in_use,
+                'sessions_opened': self.sessions_opened,
+            },
+        }
+        start = time.perf_counter()
+        try:
+            await self._fetch_one("RETURN 1 as ok")
+        except Exception as e:
+            report.update(status='unavailable', error=str(e))
+            return report
+        report.update(status='ok', query_latency_ms=round((time.perf_counter() - start) * 1000, 2))
+        return report
+    
+    async def _run_plan(self, plan):
+        """在一个会话中执行查询计划（见 Neo4jQueryPlans），不需要查询的计划不打开会话"""
+        try:
+            request = next(plan)
+        except StopIteration as stop:
+            return stop.value
+        async with self.get_session() as session:
+            while True:
+                if isinstance(request, dict):
+                    response = await self._run_concurrently(request)
+                    advance = plan.send
+                else:
+                    query, params = request
+                    try:
+                        response = [record async for record in await session.run(query, **params)]
+                        advance = plan.send
+                    except Neo4jError as error:
+                        response, advance = error, plan.throw
+                try:
+                    request = advance(response)
+                except StopIteration as stop:
+                    return stop.value
+    
+    async def _run_concurrently(self, queries):
+        """各查询使用独立会话并发执行，返回 {名称: (记录列表, 耗时毫秒)}"""
+        names = list(queries)
+        results = await asyncio.gather(*[self._timed_fetch(query, params) for query, params in queries.values()])
+        return dict(zip(names, results))
+    
+    async def _timed_fetch(self, query, params):
+        """在独立会话中执行查询，返回 (记录列表, 耗时毫秒)"""
+        start = time.perf_counter()
+        records = await self._fetch(query, **params)
+        return records, round((time.perf_counter() - start) * 1000, 2)
+    
+    async def _fetch(self, query, **params):
+        """执行查询并返回全部记录"""
+        async with self.get_session() as session:
+            result = await session.run(query, **params)
+            return [record async for record in result]
+    
+    async def _fetch_one(self, query, **params):
+        """执行查询并返回第一条记录，无结果时返回None"""
+        async with self.get_session() as session:
+            result = await session.run(query, **params)
+            return await result.single()
+    
+    async def check_schema(self):
+        """检查约束和索引，返回缺失的名称列表"""
+        return await schema.async_check_schema(self.connect())
+    
+    async def ensure_schema(self):
+        """幂等地创建约束和索引，返回本次补建的名称列表"""
+        return await schema.async_ensure_schema(self.connect())
+    
+    async def get_data_version(self):
+        """读取图中的数据版本，未导入过数据时返回None"""
+        return await self._run_plan(self.data_version_plan())
+    
+    async def get_movies(self, limit=100, skip=0):
+        """获取电影列表"""
+        return await self._run_plan(self.movies_plan(limit, skip))
+    
+    async def get_movies_page(self, after_id=None, limit=100):
+        """游标分页获取电影列表，返回包含movies和next_cursor的字典"""
+        return await self._run_plan(self.movies_page_plan(after_id, limit))
+    
+    async def get_top_movies(self, sort='score', genre=None, year_from=None, year_to=None, min_ratings=0, limit=20):
+        """电影排行榜，参数与返回值同 Neo4jDatabase.get_top_movies"""
+        return await self._run_plan(self.top_movies_plan(sort, genre, year_from, year_to, min_ratings, limit))
+    
+    async def get_movie_count(self):
+        """获取电影总数"""
+        return await self._run_plan(self.movie_count_plan())
+    
+    async def search_movies(self, keyword, limit=10, mode='index'):
+        """搜索电影（按标题），mode含义同 Neo4jDatabase.search_movies"""
+        if check_mode('搜索方式', mode, SEARCH_MODES) == 'index':
+            return (await self.get_title_index()).search(keyword, limit=limit)
+        return await self._run_plan(self.search_movies_plan(keyword, limit, mode))
+    
+    async def get_title_index(self):
+        """获取进程内标题索引，构建与刷新规则同 Neo4jDatabase.get_title_index"""
+        if self.title_index_is_fresh():
+            return self._title_index
+        async with self._title_index_lock:
+            return await self._run_plan(self.title_index_plan())
+    
+    async def search_users(self, keyword, limit=10):
+        """按ID前缀搜索用户，按评分数降序；非数字关键词返回空列表"""
+        return await self._run_plan(self.search_users_plan(keyword, limit))
+    
+    async def get_movie_network(self, movie_id, depth=2, max_nodes=100, mode='bfs'):
+        """获取电影的关系网络，参数含义同 Neo4jDatabase.get_movie_network"""
+        return await self._run_plan(self.movie_network_plan(movie_id, depth, max_nodes, mode))
+    
+    async def get_user_recommendations(self, user_id, limit=20, min_rating=4.0):
+        """基于知识图谱获取用户个性化推荐，参数含义同 Neo4jDatabase.get_user_recommendations"""
+        return await self._run_plan(self.recommendations_plan(user_id, limit, min_rating))
+    
+    async def get_movies_by_tag(self, tag, limit=20):
+        """打了某个标签的电影，参数含义同 Neo4jDatabase.get_movies_by_tag"""
+        return await self._run_plan(self.movies_by_tag_plan(tag, limit))
+    
+    async def get_similar_tag_movies(self, movie_id, limit=10):
+        """标签向量相似度最高的电影，参数含义同 Neo4jDatabase.get_similar_tag_movies"""
+        return await self._run_plan(self.similar_tag_movies_plan(movie_id, limit))
+    
+    async def get_user_liked_movies(self, user_id, min_rating=4.0, limit=10):
+        """获取用户喜欢的电影列表"""
+        return await self._run_plan(self.liked_movies_plan(user_id, min_rating, limit))
+    
+    async def find_shortest_path(self, start_type, start_id, end_type, end_id, max_depth=6,
+                                 algorithm='shortest', rel_types=None, via_labels=None, k=3):
+        """查找两个节点之间的最短路径（六度空间），参数含义同 Neo4jDatabase.find_shortest_path"""
+        return await self._run_plan(self.shortest_path_plan(start_type, start_id, end_type, end_id, max_depth,
+                                                            algorithm, rel_types, via_labels, k))
+
+
+# 全局异步数据库实例（供API使用）
+async_db = AsyncNeo4jDatabase()
@@ -0,0 +1,125 @@
+"""
+图数据后端
+
+API只依赖 GraphBackend 中列出的异步方法，通过 GRAPH_ENGINE 环境变量选择实现：
+- neo4j（默认）：async_database.AsyncNeo4jDatabase
+- snapshot：graph_snapshot.SnapshotDatabase，内存图快照
+- sqlite：sqlite_database.SQLiteDatabase，从CSV构建的SQLite文件，不依赖Neo4j服务
+同步实现用 SyncBackendAdapter 包装，在线程池中执行。
+"""
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Dict, List, Optional, Protocol
+
+from search_index import TitleSearchIndex
+
+GRAPH_ENGINES = ('neo4j', 'snapshot', 'sqlite')
+
+# API用到的后端方法（SyncBackendAdapter 只包装这些方法）
+BACKEND_METHODS = (
+    'warm_up', 'close', 'health', 'check_schema', 'ensure_schema', 'get_data_version', 'get_title_index',
+    'get_movies', 'get_movies_page', 'get_top_movies', 'get_movie_count', 'search_movies', 'search_users',
+    'get_movie_network', 'get_user_recommendations', 'get_user_liked_movies', 'find_shortest_path',
+    'get_movies_by_tag', 'get_similar_tag_movies',
+)
+
+
+class GraphBackend(Protocol):
+    """API依赖的后端接口，返回值格式以 Neo4jDatabase 为准"""
+
+    async def warm_up(self, connections: Optional[int] = None) -> None: ...
+
+    async def close(self) -> None: ...
+
+    async def health(self) -> Dict: ...
+
+    async def check_schema(self) -> List[str]: ...
+
+    async def ensure_schema(self) -> List[str]: ...
+
+    async def get_data_version(self) -> Optional[str]: ...
+
+    async def get_title_index(self) -> TitleSearchIndex: ...
+
+    async def get_movies(self, limit: int = 100, skip: int = 0) -> List[Dict]: ...
+
+    async def get_movies_page(self, after_id: Optional[str] = None, limit: int = 100) -> Dict: ...
+
+    async def get_top_movies(self, sort: str = 'score', genre: Optional[str] = None, year_from: Optional[int] = None,
+                             year_to: Optional[int] = None, min_ratings: int = 0, limit: int = 20) -> List[Dict]: ...
+
+    async def get_movie_count(self) -> int: ...
+
+    async def search_movies(self, keyword: str, limit: int = 10, mode: str = 'index') -> List[Dict]: ...
+
+    async def search_users(self, keyword: str, limit: int = 10) -> List[Dict]: ...
+
+    async def get_movie_network(self, movie_id, depth: int = 2, max_nodes: int = 100, mode: str = 'bfs') -> Dict: ...
+
+    async def get_user_recommendations(self, user_id, limit: int = 20, min_rating: float = 4.0) -> Dict: ...
+
+    async def get_user_liked_movies(self, user_id, min_rating: float = 4.0, limit: int = 10) -> List[Dict]: ...
+
+    async def find_shortest_path(self, start_type: str, start_id, end_type: str, end_id, max_depth: int = 6,
+                                 algorithm: str = 'shortest', rel_types: Optional[List[str]] = None,
+                                 via_labels: Optional[List[str]] = None, k: int = 3) -> Dict: ...
+
+    async def get_movies_by_tag(self, tag: str, limit: int = 20) -> List[Dict]: ...
+
+    async def get_similar_tag_movies(self, movie_id, limit: int = 10) -> List[Dict]: ...
+
+
+class SyncBackendAdapter:
+    """
+    把同步后端（如 SQLiteDatabase）包装为 GraphBackend
+
+    BACKEND_METHODS 中的方法在专用线程池中执行，其余属性直接转发。
+    """
+
+    def __init__(self, backend, max_workers=8):
+        self.backend = backend
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='backend')
+
+    def __getattr__(self, name):
+        attribute = getattr(self.backend, name)
+        if name not in BACKEND_METHODS or name == 'close':
+            return attribute
+
+        async def wrapper(*args, **kwargs):
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, partial(attribute, *args, **kwargs))
+        return wrapper
+
+    async def close(self):
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self._executor, self.backend.close)
+        self._executor.shutdown(wait=False)
+
+
+def backend_from_env():
+    """
+    按 GRAPH_ENGINE 选择后端
+
+    - neo4j（默认）：AsyncNeo4jDatabase
+    - snapshot：内存图快照，配置见 SnapshotDatabase.from_env
+    - sqlite：SQLite文件（SQLITE_PATH，默认 ml-latest-small/movielens.sqlite），
+      CSV（SQLITE_DATA_DIR）变化时自动重建；SQLITE_WORKERS 为查询线程数（默认8）
+    """
+    engine = os.getenv("GRAPH_ENGINE", "neo4j")
+    if engine == "snapshot":
+        from graph_snapshot import SnapshotDatabase
+        return SnapshotDatabase.from_env()
+    if engine == "sqlite":
+        from sqlite_database import DEFAULT_SQLITE_PATH, SQLiteDatabase
+        from graph_snapshot import DEFAULT_DATA_DIR
+        backend = SQLiteDatabase(
+            path=os.getenv("SQLITE_PATH", DEFAULT_SQLITE_PATH),
+            data_dir=os.getenv("SQLITE_DATA_DIR", DEFAULT_DATA_DIR),
+        )
+        return SyncBackendAdapter(backend, max_workers=int(os.getenv("SQLITE_WORKERS", "8")))
+    if engine != "neo4j":
+        raise ValueError(f"不支持的 GRAPH_ENGINE: {engine}，可选值: {', '.join(GRAPH_ENGINES)}")
+    from async_database import async_db
+    return async_db
@@ -0,0 +1,165 @@
+import json
+import os
+import time
+from collections import OrderedDict
+from functools import wraps
+
+
+def estimate_size(value):
+    """结果的近似大小（字节）：JSON序列化后的长度，与接口响应体大小相当"""
+    return len(json.dumps(value, ensure_ascii=False, default=str).encode('utf-8'))
+
+
+class ResultCache:
+    """
+    进程内的LRU + TTL结果缓存
+
+    条目数和总大小（estimate_size 估算）都有上限，超出任一上限时淘汰最久未使用的条目；
+    单个超过总大小上限的结果不缓存。每个条目在ttl秒后过期。
+    """
+
+    def __init__(self, max_entries=1024, max_bytes=64 * 1024 * 1024, ttl=300.0):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        self.rejections = 0
+        self.version_check_failures = 0
+
+    def get(self, key):
+        """
+        读取缓存
+
+        Returns:
+            tuple: (是否命中, 值)
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return False, None
+        expires_at, size, value = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            self.bytes -= size
+            self.expirations += 1
+            self.misses += 1
+            return False, None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return True, value
+
+    def set(self, key, value):
+        """写入缓存，必要时淘汰最久未使用的条目"""
+        size = estimate_size(value)
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self.bytes -= previous[1]
+        if size > self.max_bytes:
+            self.rejections += 1
+            return
+        self._entries[key] = (time.monotonic() + self.ttl, size, value)
+        self.bytes += size
+        while len(self._entries) > self.max_entries or self.bytes > self.max_bytes:
+            _, (_, evicted_size, _) = self._entries.popitem(last=False)
+            self.bytes -= evicted_size
+            self.evictions += 1
+
+    def clear(self):
+        """清空全部条目（数据版本变化时调用）"""
+        self._entries.clear()
+        self.bytes = 0
+        self.invalidations += 1
+
+    def stats(self):
+        """命中/未命中等统计信息"""
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'max_entries': self.max_entries,
+            'bytes': self.bytes,
+            'max_bytes': self.max_bytes,
+            'ttl_seconds': self.ttl,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+            'invalidations': self.invalidations,
+            'rejections': self.rejections,
+            'version_check_failures': self.version_check_failures,
+        }
+
+
+class CachedDatabase:
+    """
+    在异步数据库访问对象前加一层结果缓存
+
+    只缓存指定的只读方法，键为 (方法名, 位置参数, 关键字参数)。返回字典的方法在结果中附带
+    cached（是否来自缓存；命中时 timings_ms 等耗时是首次计算时的数值）。导入脚本每次写入后
+    会更新图中的数据版本（ImportState.data_version），这里每隔 version_check_interval
+    秒读取一次版本，发现变化即清空缓存；读取失败（如数据库暂时不可用）时记录日志并继续
+    使用现有条目直到过期，命中的请求不受影响。其余属性和方法直接转发给被包装的对象。
+    """
+
+    def __init__(self, database, cache, methods, version_check_interval=5.0):
+        self._database = database
+        self.cache = cache
+        self.version_check_interval = version_check_interval
+        self.data_version = None
+        self._version_checked_at = None
+        for name in methods:
+            setattr(self, name, self._cached(name, getattr(database, name)))
+
+    def __getattr__(self, name):
+        return getattr(self._database, name)
+
+    def _cached(self, name, method):
+        @wraps(method)
+        async def wrapper(*args, **kwargs):
+            await self._check_data_version()
+            key = (name, args, tuple(sorted(kwargs.items())))
+            hit, value = self.cache.get(key)
+            if not hit:
+                value = await method(*args, **kwargs)
+                self.cache.set(key, value)
+            # 返回浅拷贝，不修改缓存中的结果
+            return {**value, 'cached': hit} if isinstance(value, dict) else value
+        return wrapper
+
+    async def _check_data_version(self):
+        """定期读取数据版本，变化时使缓存失效"""
+        now = time.monotonic()
+        if self._version_checked_at is not None and now - self._version_checked_at < self.version_check_interval:
+            return
+        self._version_checked_at = now
+        try:
+            version = await self._database.get_data_version()
+        except Exception as exc:
+            self.cache.version_check_failures += 1
+            print(f"[缓存] 读取数据版本失败，继续使用现有条目: {exc!r}")
+            return
+        if version != self.data_version:
+            if self.data_version is not None or self.cache.stats()['entries']:
+                self.cache.clear()
+            self.data_version = version
+
+
+def cache_from_env():
+    """
+    从环境变量创建结果缓存
+
+    - CACHE_MAX_ENTRIES: 最大条目数（默认1024）
+    - CACHE_MAX_BYTES: 全部条目的最大总大小（字节，默认64MB）
+    - CACHE_TTL_SECONDS: 条目存活时间（默认300）
+    """
+    return ResultCache(
+        max_entries=int(os.getenv("CACHE_MAX_ENTRIES", "1024")),
+        max_bytes=int(os.getenv("CACHE_MAX_BYTES", str(64 * 1024 * 1024))),
+        ttl=float(os.getenv("CACHE_TTL_SECONDS", "300")),
+    )
@@ -1,46 +1,1870 @@
 from neo4j import GraphDatabase
+from neo4j.exceptions import CypherSyntaxError, Neo4jError
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import heapq
+import json
+import math
 import os
+import time
 from dotenv import load_dotenv
+import schema
+from factor_model import factor_models
+from metrics import InstrumentedSession, query_names
+from tag_vectors import require_tag_vectors, tag_vectors
+from search_index import TitleSearchIndex, tokenize
 
 # 加载环境变量
 load_dotenv()
 
 
-class Neo4jDatabase:
-    """Neo4j数据库连接管理类"""
+class InvalidArgument(ValueError):
+    """请求参数不合法（ID格式或不在白名单中的排序方式、节点类型、关系类型、路径算法、模式），接口返回400"""
+
+
+# ==================== Cypher查询 ====================
+# 同步（Neo4jDatabase）与异步（AsyncNeo4jDatabase）两套数据访问层共用
+
+# 导入状态节点：保存导入水位线和数据版本（每次导入/离线计算写入后更新）
+IMPORT_STATE_SOURCE = 'movielens'
+
+DATA_VERSION_QUERY = "MATCH (s:ImportState {source: $source}) RETURN s.data_version as version"
+
+BUMP_DATA_VERSION_QUERY = """
+MERGE (s:ImportState {source: $source})
+SET s.data_version = randomUUID()
+"""
+
+# 先按id分页，再只为当前页的电影收集类型
+MOVIES_QUERY = """
+MATCH (m:Movie)
+WITH m
+ORDER BY m.id
+SKIP $skip
+LIMIT $limit
+OPTIONAL MATCH (m)-[:IN_GENRE]->(g:Genre)
+WITH m, collect(g.name) as genres
+RETURN m.id as id, m.title as title, m.year as year, genres,
+       m.rating_count as rating_count, m.avg_rating as avg_rating
+ORDER BY m.id
+"""
+
+# 游标分页：从 Movie.id 唯一约束的索引中定位到 $after_id 之后，
+# 任意一页的代价都与第一页相同
+MOVIES_PAGE_QUERY = """
+MATCH (m:Movie)
+WHERE m.id > $after_id
+WITH m
+ORDER BY m.id
+LIMIT $limit
+OPTIONAL MATCH (m)-[:IN_GENRE]->(g:Genre)
+WITH m, collect(g.name) as genres
+RETURN m.id as id, m.title as title, m.year as year, genres,
+       m.rating_count as rating_count, m.avg_rating as avg_rating
+ORDER BY m.id
+"""
+
+# 第一页的游标（MovieLens的电影id均为正整数）
+FIRST_PAGE_CURSOR = 0
+
+MOVIE_COUNT_QUERY = "MATCH (m:Movie) RETURN count(m) as count"
+
+# 排行榜：排序方式 -> 导入脚本物化的 Movie 属性（均有范围索引）
+TOP_MOVIES_SORTS = {'score': 'bayesian_rating', 'popular': 'rating_count', 'rating': 'avg_rating'}
+
+# 排行榜查询模板，{sort_property} 只会填入 TOP_MOVIES_SORTS 中的属性名；
+# 直接读取物化的评分统计，不再聚合RATED关系
+TOP_MOVIES_QUERY = """
+MATCH (m:Movie)
+WHERE m.{sort_property} IS NOT NULL
+  AND m.rating_count >= $min_ratings
+  AND ($year_from IS NULL OR m.year >= $year_from)
+  AND ($year_to IS NULL OR m.year <= $year_to)
+  AND ($genre IS NULL OR EXISTS {{ (m)-[:IN_GENRE]->(:Genre {{name: $genre}}) }})
+WITH m
+ORDER BY m.{sort_property} DESC, m.id
+LIMIT $limit
+OPTIONAL MATCH (m)-[:IN_GENRE]->(g:Genre)
+WITH m, collect(g.name) as genres
+RETURN m.id as id, m.title as title, m.year as year, genres,
+       m.rating_count as rating_count, m.avg_rating as avg_rating,
+       m.bayesian_rating as bayesian_rating, m.rating_histogram as rating_histogram
+ORDER BY m.{sort_property} DESC, m.id
+"""
+
+# contains模式：逐个扫描Movie节点做子串匹配（区分大小写，无相关度）
+SEARCH_MOVIES_QUERY = """
+MATCH (m:Movie)
+WHERE m.title CONTAINS $keyword
+OPTIONAL MATCH (m)-[:IN_GENRE]->(g:Genre)
+WITH m, collect(g.name) as genres
+RETURN m.id as id, m.title as title, m.year as year, genres
+ORDER BY m.title
+LIMIT $limit
+"""
+
+# 标题搜索方式：index 进程内索引；fulltext 全文索引；contains 子串扫描
+SEARCH_MODES = ('index', 'fulltext', 'contains')
+
+# fulltext模式：使用 movie_title_fulltext 全文索引，按Lucene相关度排序
+SEARCH_MOVIES_FULLTEXT_QUERY = """
+CALL db.index.fulltext.queryNodes('movie_title_fulltext', $query, {limit: $limit})
+YIELD node AS m, score
+OPTIONAL MATCH (m)-[:IN_GENRE]->(g:Genre)
+WITH m, score, collect(g.name) as genres
+RETURN m.id as id, m.title as title, m.year as year, genres, score
+ORDER BY score DESC
+"""
+
+# 构建进程内标题索引用的全部电影
+ALL_MOVIES_QUERY = """
+MATCH (m:Movie)
+OPTIONAL MATCH (m)-[:IN_GENRE]->(g:Genre)
+WITH m, collect(g.name) as genres
+RETURN m.id as id, m.title as title, m.year as year, genres
+"""
+
+# 进程内标题索引检查数据版本的间隔（秒），版本变化时重建
+TITLE_INDEX_REFRESH_SECONDS = float(os.getenv("TITLE_INDEX_REFRESH_SECONDS", "60"))
+
+# 按ID前缀搜索用户：id_text 上有TEXT索引，rating_count 由导入脚本维护，按活跃度排序
+SEARCH_USERS_QUERY = """
+MATCH (u:User)
+WHERE u.id_text STARTS WITH $prefix
+RETURN u.id as id, u.id as name, u.rating_count as rating_count
+ORDER BY u.rating_count DESC, u.id
+LIMIT $limit
+"""
+
+# 关系网络的扩展方式：bfs 逐层扩展；paths 枚举可变长度路径；projection 路径枚举并在Cypher中去重投影
+NETWORK_MODES = ('bfs', 'paths', 'projection')
+
+MOVIE_START_QUERY = "MATCH (m:Movie {id: $movie_id}) RETURN m, elementId(m) as element_id"
+
+# 投影模式（projection）：与paths模式相同的路径枚举，但在Cypher中去重，
+# 节点和关系各只返回一次，并且只投影前端用到的字段（电影另带年份和类型）；
+# 关系只保留两端都在节点列表中的，最多 $max_links 条
+MOVIE_NETWORK_PROJECTION_QUERY = """
+MATCH (start:Movie {{id: $movie_id}})
+MATCH path = (start)-[:IN_GENRE|RATED|TAGGED*1..{depth}]-(related)
+WITH path
+LIMIT $query_limit
+WITH collect(path) as paths
+CALL {{
+    WITH paths
+    UNWIND paths as p
+    UNWIND nodes(p) as n
+    RETURN collect(DISTINCT n)[..$max_nodes] as ns
+}}
+CALL {{
+    WITH paths, ns
+    UNWIND paths as p
+    UNWIND relationships(p) as r
+    WITH DISTINCT r, ns
+    WHERE startNode(r) IN ns AND endNode(r) IN ns
+    WITH r
+    LIMIT $max_links
+    RETURN collect({{
+        source: toString(coalesce(startNode(r).id, startNode(r).name)),
+        target: toString(coalesce(endNode(r).id, endNode(r).name)),
+        type: type(r)
+    }}) as links
+}}
+RETURN [n IN ns | {{
+    id: toString(coalesce(n.id, n.name)),
+    name: coalesce(n.title, n.name, labels(n)[0] + '_' + toString(n.id)),
+    type: labels(n)[0],
+    properties: CASE
+        WHEN n:Movie THEN {{id: n.id, title: n.title, year: n.year,
+                            genres: [(n)-[:IN_GENRE]->(g:Genre) | g.name]}}
+        WHEN n:User THEN {{id: n.id}}
+        ELSE {{name: n.name}}
+    END
+}}] as nodes, links
+"""
+
+# projection 模式平均每个节点最多返回的关系数（控制响应大小）
+NETWORK_PROJECTION_LINKS_PER_NODE = 5
+
+# 逐层扩展（bfs模式）：对当前层的每个节点，按度数（评分数/电影数）取前 $per_node 个未访问的邻居；
+# 整层的去重和名额分配在 LevelNetworkExpansion 中完成
+NETWORK_LEVEL_QUERY = """
+UNWIND $frontier AS node_id
+MATCH (n) WHERE elementId(n) = node_id
+CALL {
+    WITH n
+    MATCH (n)-[:IN_GENRE|RATED|TAGGED]-(nb)
+    WHERE NOT elementId(nb) IN $visited
+    WITH DISTINCT nb
+    WITH nb, COUNT { (nb)-[:IN_GENRE|RATED|TAGGED]-() } as weight
+    ORDER BY weight DESC
+    LIMIT $per_node
+    RETURN nb, weight
+}
+RETURN node_id as source, nb as node, elementId(nb) as element_id, weight
+"""
+
+# 选中节点之间的全部关系（导出子图）
+NETWORK_EDGES_QUERY = """
+MATCH (a) WHERE elementId(a) IN $ids
+MATCH (b) WHERE elementId(b) IN $ids
+MATCH (a)-[r:IN_GENRE|RATED|TAGGED]->(b)
+RETURN elementId(a) as source, elementId(b) as target, type(r) as type
+"""
+
+# 可变长度路径的深度无法参数化，由调用方在限制范围（1-3）内填入
+# 只沿数据集本身的关系展开，不经过预计算的 SIMILAR_TO / SIMILAR_MOVIE
+MOVIE_NETWORK_QUERY = """
+MATCH (start:Movie {{id: $movie_id}})
+MATCH path = (start)-[:IN_GENRE|RATED|TAGGED*1..{depth}]-(related)
+WITH start, related, relationships(path) as rels
+RETURN DISTINCT start, related, rels
+LIMIT $query_limit
+"""
+
+# 策略1: 基于用户喜欢的电影类型推荐
+# 找到用户评分>=min_rating的电影及其类型
+RECOMMEND_BY_GENRE_QUERY = """
+MATCH (u:User {id: $user_id})-[r:RATED]->(m:Movie)
+WHERE r.rating >= $min_rating
+MATCH (m)-[:IN_GENRE]->(g:Genre)
+WITH g, count(DISTINCT m) as genre_count
+ORDER BY genre_count DESC
+LIMIT 5
+MATCH (g)<-[:IN_GENRE]-(rec:Movie)
+WHERE NOT EXISTS {
+    MATCH (u)-[:RATED]->(rec)
+}
+OPTIONAL MATCH (rec)-[:IN_GENRE]->(genres:Genre)
+WITH rec, collect(genres.name) as genres, g.name as reason_genre
+RETURN DISTINCT rec.id as id, rec.title as title, rec.year as year, 
+       genres, '类型偏好: ' + reason_genre as reason, 1 as score
+LIMIT $limit
+"""
+
+# 策略2: 基于相似用户推荐
+# 读取离线预计算的 SIMILAR_TO 关系（dev/compute_user_similarity.py），
+# 只展开最相似的 $neighbours 位用户的评分，而不是实时计算共同评分
+RECOMMEND_BY_SIMILAR_USERS_QUERY = """
+MATCH (u:User {id: $user_id})-[s:SIMILAR_TO]->(other:User)
+WITH u, other, s
+ORDER BY s.score DESC
+LIMIT $neighbours
+MATCH (other)-[:RATED]->(m2:Movie)
+WHERE NOT EXISTS {
+    MATCH (u)-[:RATED]->(m2)
+}
+WITH m2, max(s.score) as max_score, max(s.common_movies) as max_common_movies
+ORDER BY max_score DESC, max_common_movies DESC
+LIMIT $limit
+OPTIONAL MATCH (m2)-[:IN_GENRE]->(g:Genre)
+WITH m2, max_score, max_common_movies, collect(DISTINCT g.name) as genres
+ORDER BY max_score DESC, max_common_movies DESC
+RETURN m2.id as id, m2.title as title, m2.year as year, 
+       genres, '相似用户推荐 (共同评分' + toString(max_common_movies) + '部电影)' as reason,
+       2 as score
+"""
+
+# 策略3: 基于用户高评分电影的相似电影推荐
+# 读取离线预计算的 SIMILAR_MOVIE 关系（dev/compute_movie_similarity.py），
+# 每部喜欢的电影只展开固定数量的邻居，延迟与类型大小无关
+RECOMMEND_BY_SIMILAR_MOVIES_QUERY = """
+MATCH (u:User {id: $user_id})-[r:RATED]->(liked:Movie)
+WHERE r.rating >= $min_rating
+MATCH (liked)-[s:SIMILAR_MOVIE]->(similar:Movie)
+WHERE NOT EXISTS {
+    MATCH (u)-[:RATED]->(similar)
+}
+WITH similar, liked, s.score * r.rating as weight
+ORDER BY weight DESC
+WITH similar, collect(liked.title)[0] as liked_title, sum(weight) as total_weight
+ORDER BY total_weight DESC
+LIMIT $limit
+OPTIONAL MATCH (similar)-[:IN_GENRE]->(genres:Genre)
+WITH similar, liked_title, total_weight, collect(DISTINCT genres.name) as genres
+ORDER BY total_weight DESC
+RETURN similar.id as id, similar.title as title, similar.year as year,
+       genres, '基于您喜欢的《' + liked_title + '》' as reason, 3 as score
+"""
+
+# 按ID（唯一索引）取电影信息
+MOVIES_BY_ID_QUERY = """
+MATCH (m:Movie) WHERE m.id IN $movie_ids
+OPTIONAL MATCH (m)-[:IN_GENRE]->(g:Genre)
+WITH m, collect(g.name) as genres
+RETURN m.id as id, m.title as title, m.year as year, genres
+"""
+
+# 策略4: 隐因子模型（factor_model.py）在进程内打分得到电影ID，这里按ID取电影信息；
+# 模型只排除了训练时已有的评分，训练之后用户评过分的电影在这里排除
+FACTOR_MOVIES_QUERY = """
+MATCH (u:User {id: $user_id})
+MATCH (m:Movie) WHERE m.id IN $movie_ids AND NOT EXISTS { (u)-[:RATED]->(m) }
+OPTIONAL MATCH (m)-[:IN_GENRE]->(g:Genre)
+WITH m, collect(g.name) as genres
+RETURN m.id as id, m.title as title, m.year as year, genres
+"""
+
+# 策略5: 标签向量（tag_vectors.py）由用户的全部评分在进程内算出标签偏好并打分，
+# 这里先取评分（与其他策略并发），打分后再用 MOVIES_BY_ID_QUERY 取电影信息
+USER_RATINGS_QUERY = """
+MATCH (u:User {id: $user_id})-[r:RATED]->(m:Movie)
+RETURN m.id as id, r.rating as rating
+"""
+
+# 获取用户偏好类型统计
+GENRE_PREFERENCE_QUERY = """
+MATCH (u:User {id: $user_id})-[r:RATED]->(m:Movie)
+WHERE r.rating >= $min_rating
+MATCH (m)-[:IN_GENRE]->(g:Genre)
+WITH g, count(DISTINCT m) as movie_count, avg(r.rating) as avg_rating
+ORDER BY movie_count DESC
+RETURN g.name as genre, movie_count, avg_rating
+LIMIT 10
+"""
+
+# 获取相似用户信息（预计算的 SIMILAR_TO 关系）
+SIMILAR_USERS_QUERY = """
+MATCH (u:User {id: $user_id})-[s:SIMILAR_TO]->(other:User)
+RETURN other.id as user_id, s.common_movies as common_movies, s.score as similarity
+ORDER BY s.score DESC
+LIMIT 5
+"""
+
+# 策略2中参与推荐的相似用户数
+SIMILAR_USER_NEIGHBOURS = 20
+
+# ==================== 预计算推荐 ====================
+# dev/compute_recommendations.py 离线为每位用户写入：
+# (u:User)-[:RECOMMENDED {rank, strategy, reason}]->(m:Movie)，推理过程JSON保存在 rank 1 关系的 reasoning 属性上
+# （不放在 User 节点上，网络/路径接口返回的节点属性里不会带出预计算数据）
+
+# 推荐策略名称，顺序即推荐结果中的 score（1/2/3/4/5）
+RECOMMENDATION_STRATEGIES = ('genre', 'similar_users', 'similar_movies', 'latent_factors', 'tags')
+
+# 每位用户预计算的推荐数（与接口的 limit 上限一致）
+RECOMMENDATION_STORE_TOP_N = 50
+
+# 预计算时使用的最低评分阈值，请求其他阈值时实时计算
+RECOMMENDATION_STORE_MIN_RATING = 4.0
+
+# store（默认）：优先读取预计算结果，没有时实时计算；live：总是实时计算
+RECOMMENDATIONS_SOURCE = os.getenv("RECOMMENDATIONS_SOURCE", "store")
+
+# 从 User.id 唯一索引定位用户后只展开其 RECOMMENDED 关系；按 rank 排序，第一行带推理过程
+STORED_RECOMMENDATIONS_QUERY = """
+MATCH (u:User {id: $user_id})-[r:RECOMMENDED]->(m:Movie)
+WHERE r.rank <= $limit
+OPTIONAL MATCH (m)-[:IN_GENRE]->(g:Genre)
+WITH r, m, collect(g.name) as genres
+RETURN r.reasoning as reasoning, r.strategy as strategy, r.reason as reason,
+       m.id as id, m.title as title, m.year as year, genres
+ORDER BY r.rank
+"""
+
+LIKED_MOVIES_QUERY = """
+MATCH (u:User {id: $user_id})-[r:RATED]->(m:Movie)
+WHERE r.rating >= $min_rating
+OPTIONAL MATCH (m)-[:IN_GENRE]->(g:Genre)
+WITH m, r.rating as rating, collect(g.name) as genres
+RETURN m.id as id, m.title as title, m.year as year, 
+       genres, rating
+ORDER BY rating DESC, m.title
+LIMIT $limit
+"""
+
+# ==================== 路径查找 ====================
+# 标签和关系类型只能取自下面的固定集合，校验后才拼入查询；
+# 节点ID、途经标签等其余输入都作为参数传入，查询文本的组合数有限，执行计划可以缓存
+
+# 可作为路径端点/途经节点的标签 -> 用于定位节点的属性
+PATH_NODE_KEYS = {'Movie': 'id', 'User': 'id', 'Genre': 'name'}
+
+# 标签别名（前端的六度空间面板使用Person表示用户）
+PATH_LABEL_ALIASES = {'Person': 'User'}
+
+# 允许遍历的关系类型（不包括 SIMILAR_TO / SIMILAR_MOVIE 等预计算关系）
+PATH_RELATIONSHIP_TYPES = ('IN_GENRE', 'RATED', 'TAGGED')
+
+# 路径算法：shortest 单条最短路径；k_shortest 前k条最短路径；bidirectional 有界双向BFS；
+# weighted 按度数加权的最短路径（见 WeightedPathSearch）
+PATH_ALGORITHMS = ('shortest', 'k_shortest', 'bidirectional', 'weighted')
+
+MAX_PATH_DEPTH = 10
+MAX_K_PATHS = 10
+
+# Yen算法（内存快照/SQLite后端以及旧版Neo4j的 k_shortest）最多执行的分叉搜索次数，超过后返回已找到的路径
+K_SHORTEST_MAX_SPURS = 40
+
+# 双向BFS每层最多展开的节点数，以及每个节点最多展开的邻居数
+PATH_MAX_FRONTIER = 2000
+PATH_FAN_OUT = 200
+
+# 使用shortestPath函数，无向搜索；路径上所有节点的标签都必须在 $labels 中（端点标签总是允许）
+SHORTEST_PATH_QUERY = """
+MATCH (start:{start_type} {{{start_key}: $start_id}})
+MATCH (end:{end_type} {{{end_key}: $end_id}})
+MATCH path = shortestPath((start)-[:{rel_types}*..{max_depth}]-(end))
+WHERE all(n IN nodes(path) WHERE any(label IN labels(n) WHERE label IN $labels))
+RETURN path
+"""
+
+# 前k条最短路径（GQL的 SHORTEST k 语法，需要 Neo4j 5.21+）
+K_SHORTEST_PATHS_QUERY = """
+MATCH (start:{start_type} {{{start_key}: $start_id}})
+MATCH (end:{end_type} {{{end_key}: $end_id}})
+MATCH path = SHORTEST {k} (start)-[:{rel_types}]-{{1,{max_depth}}}(end)
+WHERE all(n IN nodes(path) WHERE any(label IN labels(n) WHERE label IN $labels))
+RETURN path
+ORDER BY length(path)
+"""
+
+# 旧版Neo4j不支持 SHORTEST k 时，Yen算法的一次分叉搜索：禁用节点和禁用关系不能出现在路径上
+K_SHORTEST_SPUR_QUERY = """
+MATCH (start) WHERE elementId(start) = $start
+MATCH (end) WHERE elementId(end) = $end
+MATCH path = shortestPath((start)-[:{rel_types}*..{max_depth}]-(end))
+WHERE all(n IN nodes(path) WHERE any(label IN labels(n) WHERE label IN $labels)
+                               AND NOT elementId(n) IN $banned_nodes)
+  AND none(r IN relationships(path) WHERE elementId(r) IN $banned_rels)
+RETURN [n IN nodes(path) | elementId(n)] as node_ids, nodes(path) as nodes,
+       [r IN relationships(path) | elementId(r)] as rel_ids,
+       [r IN relationships(path) | type(r)] as types,
+       [r IN relationships(path) | elementId(startNode(r))] as rel_starts
+"""
+
+PATH_ENDPOINTS_QUERY = """
+MATCH (start:{start_type} {{{start_key}: $start_id}})
+MATCH (end:{end_type} {{{end_key}: $end_id}})
+RETURN start, elementId(start) as start_element_id, end, elementId(end) as end_element_id
+"""
+
+# 双向BFS的一层扩展：每个前沿节点最多取 $fan_out 个邻居
+PATH_EXPAND_QUERY = """
+UNWIND $frontier AS source
+MATCH (n) WHERE elementId(n) = source
+CALL {{
+    WITH n
+    MATCH (n)-[r:{rel_types}]-(m)
+    WHERE any(label IN labels(m) WHERE label IN $labels)
+    RETURN r, m
+    LIMIT $fan_out
+}}
+RETURN source, elementId(m) as target, m, type(r) as type, elementId(startNode(r)) as rel_start
+"""
+
+# 加权路径的一批扩展：与 PATH_EXPAND_QUERY 相同，另返回邻居的度数（只计数据集本身的关系）
+PATH_WEIGHTED_EXPAND_QUERY = """
+UNWIND $frontier AS source
+MATCH (n) WHERE elementId(n) = source
+CALL {{
+    WITH n
+    MATCH (n)-[r:{rel_types}]-(m)
+    WHERE any(label IN labels(m) WHERE label IN $labels)
+    RETURN r, m
+    LIMIT $fan_out
+}}
+RETURN source, elementId(m) as target, m, type(r) as type, elementId(startNode(r)) as rel_start,
+       COUNT {{ (m)-[:IN_GENRE|RATED|TAGGED]-() }} as degree
+"""
+
+# 指标和慢查询日志中按常量名称（去掉 _QUERY 后缀）标识查询
+query_names.register(globals(), '_QUERY')
+
+
+# ==================== 连接池配置 ====================
+
+def pool_config_from_env():
+    """
+    从环境变量读取驱动连接池配置
+    
+    - NEO4J_MAX_POOL_SIZE: 连接池最大连接数（默认100）
+    - NEO4J_CONNECTION_ACQUISITION_TIMEOUT: 获取连接的超时时间，秒（默认60）
+    - NEO4J_MAX_CONNECTION_LIFETIME: 单个连接的最长存活时间，秒（默认3600）
+    - NEO4J_CONNECTION_TIMEOUT: 建立TCP连接的超时时间，秒（默认30）
+    
+    Returns:
+        dict: 可直接传给 GraphDatabase.driver 的关键字参数
+    """
+    return {
+        'max_connection_pool_size': int(os.getenv("NEO4J_MAX_POOL_SIZE", "100")),
+        'connection_acquisition_timeout': float(os.getenv("NEO4J_CONNECTION_ACQUISITION_TIMEOUT", "60")),
+        'max_connection_lifetime': float(os.getenv("NEO4J_MAX_CONNECTION_LIFETIME", "3600")),
+        'connection_timeout': float(os.getenv("NEO4J_CONNECTION_TIMEOUT", "30")),
+    }
+
+
+# ==================== 结果转换 ====================
+
+def safe_int_convert(value):
+    """
+    安全地将值转换为整数
+    支持整数、浮点数字符串等格式
+
+    Raises:
+        InvalidArgument: 无法转换
+    """
+    if isinstance(value, int):
+        return value
+    if isinstance(value, float):
+        return int(value)
+    if isinstance(value, str):
+        # 尝试直接转换为整数
+        try:
+            return int(value)
+        except ValueError:
+            # 如果是浮点数字符串，先转换为浮点数再转整数
+            try:
+                return int(float(value))
+            except (ValueError, TypeError):
+                raise InvalidArgument(f"无法将 '{value}' 转换为整数")
+    raise InvalidArgument(f"不支持的类型: {type(value)}")
+
+
+def get_node_id(node):
+    """获取节点的ID"""
+    # 优先使用id属性
+    node_id = node.get('id')
+    if node_id is not None:
+        return str(node_id)
+    # Genre节点使用name作为ID
+    node_name = node.get('name')
+    if node_name is not None:
+        return str(node_name)
+    # 如果都没有，使用节点的内部ID（不推荐，但作为后备方案）
+    return str(node.element_id) if hasattr(node, 'element_id') else str(id(node))
+
+
+def get_node_type(node):
+    """获取节点类型"""
+    labels = list(node.labels)
+    if labels:
+        return labels[0]
+    return 'Unknown'
+
+
+def node_to_dict(node, node_type):
+    """将Neo4j节点转换为字典"""
+    node_id = get_node_id(node)
+    
+    # 获取节点名称
+    name = node.get('title') or node.get('name') or f"{node_type}_{node_id}"
+    
+    # 构建属性字典
+    properties = {}
+    for key, value in node.items():
+        properties[key] = value
+    
+    return {
+        'id': node_id,
+        'name': name,
+        'type': node_type,
+        'properties': properties
+    }
+
+
+def movie_record_to_dict(record):
+    """将包含 id/title/year/genres 的查询记录转换为电影字典"""
+    # 将类型列表转换为字符串，用|分隔
+    genres_list = record['genres'] or []
+    genres_str = '|'.join(genres_list) if genres_list else ''
+    return {
+        'id': str(record['id']) if record['id'] is not None else '',
+        'title': record['title'] or '',
+        'year': record['year'] if record['year'] is not None else None,
+        'genres': genres_str
+    }
+
+
+def fulltext_title_query(keyword):
+    """
+    将搜索关键词转换为Lucene查询串
+
+    关键词先切分为词（丢弃Lucene特殊字符），每个词匹配精确词、前缀或（较长的词）
+    模糊词，所有词之间为AND关系。
+
+    Returns:
+        str: Lucene查询串，关键词中没有可搜索的词时为None
+    """
+    clauses = []
+    for term in tokenize(keyword):
+        options = [f"{term}^3", f"{term}*^2"]
+        if len(term) >= 4:
+            options.append(f"{term}~")
+        clauses.append(f"({' OR '.join(options)})")
+    return ' AND '.join(clauses) or None
+
+
+def scored_movie_record_to_dict(record):
+    """将带相关度得分的搜索记录转换为电影字典"""
+    movie = movie_record_to_dict(record)
+    movie['score'] = round(record['score'], 4)
+    return movie
+
+
+def rated_movie_record_to_dict(record):
+    """将附带评分统计（rating_count/avg_rating）的电影记录转换为字典，未导入统计时为0/None"""
+    movie = movie_record_to_dict(record)
+    movie['rating_count'] = record['rating_count'] or 0
+    movie['avg_rating'] = record['avg_rating']
+    return movie
+
+
+def top_movie_record_to_dict(record):
+    """将排行榜记录转换为字典（另含贝叶斯加权分和评分直方图）"""
+    movie = rated_movie_record_to_dict(record)
+    movie['bayesian_rating'] = record['bayesian_rating']
+    movie['rating_histogram'] = list(record['rating_histogram'] or [])
+    return movie
+
+
+def top_movies_sort_property(sort):
+    """
+    排行榜排序方式对应的 Movie 属性名
+
+    Raises:
+        InvalidArgument: 不支持的排序方式
+    """
+    if sort not in TOP_MOVIES_SORTS:
+        raise InvalidArgument(f"不支持的排序方式: {sort}，可选值: {', '.join(TOP_MOVIES_SORTS)}")
+    return TOP_MOVIES_SORTS[sort]
+
+
+def check_mode(kind, mode, modes):
+    """
+    校验接口的模式参数（搜索方式、网络扩展方式等）
+
+    Raises:
+        InvalidArgument: mode 不在 modes 中
+    """
+    if mode not in modes:
+        raise InvalidArgument(f"不支持的{kind}: {mode}，可选值: {', '.join(modes)}")
+    return mode
+
+
+def top_movies_query(sort):
+    """排行榜查询语句（排序属性经过白名单校验）"""
+    return TOP_MOVIES_QUERY.format(sort_property=top_movies_sort_property(sort))
+
+
+def build_movie_page(records, limit):
+    """
+    构建游标分页结果
+    
+    Returns:
+        dict: movies为当前页电影；next_cursor为下一页的after_id，没有下一页时为None
+    """
+    movies = [rated_movie_record_to_dict(record) for record in records]
+    next_cursor = movies[-1]['id'] if len(movies) == limit else None
+    return {'movies': movies, 'next_cursor': next_cursor}
+
+
+def user_id_prefix(keyword):
+    """
+    将用户搜索关键词规范化为ID前缀（去掉空白和前导零）
+
+    Returns:
+        str: ID前缀，关键词不是数字时为None
+    """
+    keyword = (keyword or '').strip()
+    if not keyword.isdigit():
+        return None
+    return str(int(keyword))
+
+
+def user_record_to_dict(record):
+    """将用户搜索记录转换为字典"""
+    return {
+        'id': str(record['id']) if record['id'] is not None else '',
+        'name': f"用户 {record['id']}",
+        'rating_count': record['rating_count'] or 0
+    }
+
+
+def liked_movie_record_to_dict(record):
+    """将用户喜欢的电影记录转换为字典"""
+    movie = movie_record_to_dict(record)
+    movie['rating'] = record['rating']
+    return movie
+
+
+def build_movie_network(start_node, records, max_nodes):
+    """
+    由起始节点和路径查询结果构建关系网络
+    
+    Args:
+        start_node: 起始电影节点
+        records: MOVIE_NETWORK_QUERY 的结果记录（可迭代）
+        max_nodes: 最大节点数量
+    
+    Returns:
+        dict: 包含nodes和links的字典
+    """
+    nodes_dict = {}
+    links_set = set()
+    
+    # 添加起始节点
+    start_id = str(start_node.get('id', ''))
+    nodes_dict[start_id] = node_to_dict(start_node, 'Movie')
+    
+    for record in records:
+        # 如果已经达到最大节点数限制，停止添加新节点
+        if len(nodes_dict) >= max_nodes:
+            break
+            
+        related_node = record['related']
+        rels = record['rels']
+        
+        # 添加相关节点
+        related_id = get_node_id(related_node)
+        if related_id not in nodes_dict:
+            node_type = get_node_type(related_node)
+            nodes_dict[related_id] = node_to_dict(related_node, node_type)
+        
+        # 添加路径中的所有关系（只添加已存在节点之间的关系）
+        for rel in rels:
+            rel_start_node = rel.start_node
+            rel_end_node = rel.end_node
+            rel_type = rel.type
+            
+            rel_start_id = get_node_id(rel_start_node)
+            rel_end_id = get_node_id(rel_end_node)
+            
+            # 只添加两个节点都在我们节点字典中的关系
+            if rel_start_id in nodes_dict and rel_end_id in nodes_dict:
+                # 创建关系的唯一标识
+                link_key = (rel_start_id, rel_end_id, rel_type)
+                if link_key not in links_set:
+                    links_set.add(link_key)
+    
+    # 转换links_set为列表（只包含已存在节点之间的关系）
+    links = []
+    for start_id, end_id, rel_type in links_set:
+        if start_id in nodes_dict and end_id in nodes_dict:
+            links.append({
+                'source': start_id,
+                'target': end_id,
+                'type': rel_type
+            })
+    
+    return {
+        'nodes': list(nodes_dict.values()),
+        'links': links
+    }
+
+
+def recommendation_dict(record, strategy, details):
+    """将某一策略的推荐记录转换为推荐字典（score 为策略编号）"""
+    return {
+        'id': str(record['id']),
+        'title': record['title'] or '',
+        'year': record['year'],
+        'genres': '|'.join(record['genres'] or []),
+        'reason': record['reason'],
+        'score': record['score'],
+        'strategy': strategy,
+        'details': details
+    }
+
+
+def interleave_strategies(candidates, limit):
+    """
+    轮流从各策略取下一部尚未推荐的电影，直到取满 limit 部
+
+    每种策略都返回最多 limit 部电影，按策略编号排序后截断会让靠后的策略几乎进不了结果；
+    轮流合并时每种有结果的策略都能出现在前 limit 部中。同一部电影由先轮到的策略推荐。
+    合并结果的前缀与 limit 无关，按策略分组后再次合并得到同样的顺序（预计算结果依赖这一点）。
+
+    Args:
+        candidates: 每种策略的推荐字典列表（按策略编号顺序）
+        limit: 返回推荐数量
+
+    Returns:
+        list: 合并后的推荐字典
+    """
+    merged = {}
+    queues = [deque(recs) for recs in candidates]
+    while len(merged) < limit and any(queues):
+        for queue in queues:
+            while queue and queue[0]['id'] in merged:
+                queue.popleft()
+            if queue and len(merged) < limit:
+                rec = queue.popleft()
+                merged[rec['id']] = rec
+    return list(merged.values())
+
+
+def build_recommendations(genre_records, similar_user_records, genre_recs, user_recs, movie_recs, limit,
+                          timings=None, factor_recs=(), tag_recs=()):
+    """
+    合并五种推荐策略的结果，生成推荐列表和推理过程
+    
+    Args:
+        genre_records: GENRE_PREFERENCE_QUERY 的结果
+        similar_user_records: SIMILAR_USERS_QUERY 的结果
+        genre_recs: 策略1（类型偏好）的结果
+        user_recs: 策略2（相似用户）的结果
+        movie_recs: 策略3（相似电影）的结果
+        limit: 返回推荐数量
+        timings: 可选，各查询耗时（毫秒），放入 reasoning.timings_ms
+        factor_recs: 策略4（隐因子模型）的结果，见 factor_strategy_records；没有模型时为空
+        tag_recs: 策略5（标签相似）的结果，见 tag_strategy_records；没有标签向量时为空
+    
+    Returns:
+        dict: 包含推荐列表和推理过程的字典
+    """
+    genre_preferences = []
+    for record in genre_records:
+        genre_preferences.append({
+            'genre': record['genre'],
+            'movie_count': record['movie_count'],
+            'avg_rating': round(record['avg_rating'], 2)
+        })
+    
+    similar_users = []
+    for record in similar_user_records:
+        similar_users.append({
+            'user_id': str(record['user_id']),
+            'common_movies': record['common_movies'],
+            'similarity': round(record['similarity'], 4)
+        })
+    
+    # 每种策略按各自的顺序生成候选，details 为该推荐的详细推理信息
+    candidates = [[] for _ in RECOMMENDATION_STRATEGIES]
+    
+    # 查询1：基于类型偏好
+    for record in genre_recs:
+        genre_name = record['reason'].replace('类型偏好: ', '')
+        candidates[0].append(recommendation_dict(record, '类型偏好推荐', {
+            'strategy': '类型偏好推荐',
+            'reason_genre': genre_name,
+            'explanation': f'您喜欢{genre_name}类型的电影，我们为您推荐同类型电影'
+        }))
+    
+    # 查询2：基于相似用户
+    for record in user_recs:
+        common_count = record['reason'].split('共同评分')[1].split('部')[0] if '共同评分' in record['reason'] else '3'
+        candidates[1].append(recommendation_dict(record, '相似用户推荐', {
+            'strategy': '相似用户推荐',
+            'common_movies': int(common_count),
+            'explanation': f'与您有相似偏好的用户（共同评分{common_count}部电影）也喜欢这部电影'
+        }))
+    
+    # 查询3：基于相似电影
+    for record in movie_recs:
+        liked_title = record['reason'].replace('基于您喜欢的《', '').replace('》', '')
+        candidates[2].append(recommendation_dict(record, '相似电影推荐', {
+            'strategy': '相似电影推荐',
+            'based_on_movie': liked_title,
+            'explanation': f'喜欢《{liked_title}》的用户也常给这部电影打高分'
+        }))
+    
+    # 查询4：基于隐因子模型
+    for record in factor_recs:
+        predicted_rating = float(record['reason'].replace('隐因子模型预测评分 ', ''))
+        candidates[3].append(recommendation_dict(record, '隐因子推荐', {
+            'strategy': '隐因子推荐',
+            'predicted_rating': predicted_rating,
+            'explanation': f'根据您的评分模式，预计您会给这部电影打{predicted_rating}分'
+        }))
+    
+    # 查询5：基于标签相似
+    for record in tag_recs:
+        matched_tag = record['reason'].replace('标签相似: ', '')
+        candidates[4].append(recommendation_dict(record, '标签相似推荐', {
+            'strategy': '标签相似推荐',
+            'matched_tag': matched_tag,
+            'explanation': f'您喜欢的电影常被标记为“{matched_tag}”，这部电影也有这个标签'
+        }))
+    
+    sorted_recs = interleave_strategies(candidates, limit)
+    
+    reasoning = {
+        'genre_preferences': genre_preferences,
+        'similar_users': similar_users,
+        'total_recommendations': len(sorted_recs)
+    }
+    if timings is not None:
+        reasoning['timings_ms'] = timings
+    
+    return {
+        'recommendations': sorted_recs,
+        'reasoning': reasoning
+    }
+
+
+def use_stored_recommendations(limit, min_rating):
+    """请求能否由预计算结果满足（store模式、limit不超过预计算数量、阈值与预计算时相同）"""
+    return (RECOMMENDATIONS_SOURCE == 'store' and limit <= RECOMMENDATION_STORE_TOP_N
+            and min_rating == RECOMMENDATION_STORE_MIN_RATING)
+
+
+def stored_recommendation_rows(result):
+    """
+    将一位用户的推荐结果（build_recommendations 的输出）转换为写入 RECOMMENDED 关系的参数
+
+    Returns:
+        dict: user_id 以外的部分，reasoning 为JSON字符串，recommendations 为 rank/strategy/reason 列表
+    """
+    reasoning = result['reasoning']
+    return {
+        'reasoning': json.dumps({'genre_preferences': reasoning['genre_preferences'],
+                                 'similar_users': reasoning['similar_users']}, ensure_ascii=False),
+        'recommendations': [
+            {'movie_id': int(rec['id']), 'rank': rank, 'strategy': RECOMMENDATION_STRATEGIES[rec['score'] - 1],
+             'reason': rec['reason']}
+            for rank, rec in enumerate(result['recommendations'], start=1)
+        ],
+    }
+
+
+def build_stored_recommendations(records, limit, timings=None):
+    """
+    由 STORED_RECOMMENDATIONS_QUERY 的结果还原与实时计算相同格式的推荐
+
+    预计算结果已经去重并按轮流合并的顺序排好，按策略分组后交给 build_recommendations
+    再次合并，得到的推荐列表和details与实时计算一致；reasoning.source 标记为 store。
+    """
+    reasoning = json.loads(records[0]['reasoning'])
+    strategies = {name: [] for name in RECOMMENDATION_STRATEGIES}
+    for record in records:
+        strategies[record['strategy']].append({
+            'id': record['id'], 'title': record['title'], 'year': record['year'], 'genres': record['genres'],
+            'reason': record['reason'], 'score': RECOMMENDATION_STRATEGIES.index(record['strategy']) + 1,
+        })
+    result = build_recommendations(
+        reasoning['genre_preferences'], reasoning['similar_users'],
+        strategies['genre'], strategies['similar_users'], strategies['similar_movies'], limit, timings=timings,
+        factor_recs=strategies['latent_factors'], tag_recs=strategies['tags']
+    )
+    result['reasoning']['source'] = 'store'
+    return result
+
+
+def factor_predictions(user_id, limit):
+    """策略4：隐因子模型为用户打分，返回 (电影ID, 预测评分) 列表；没有训练好的模型或用户不在模型中时为空"""
+    model = factor_models.get()
+    return model.recommend(user_id, limit) if model is not None else []
+
+
+def factor_strategy_records(records, predictions):
+    """
+    按预测评分顺序把电影信息（FACTOR_MOVIES_QUERY 的结果）组装为策略4的推荐记录
+
+    Args:
+        records: 包含 id/title/year/genres 的电影记录（不含用户已评分的电影）
+        predictions: factor_predictions 的结果
+    """
+    movies = {record['id']: record for record in records}
+    return [
+        {'id': movie_id, 'title': movies[movie_id]['title'], 'year': movies[movie_id]['year'],
+         'genres': movies[movie_id]['genres'], 'reason': f'隐因子模型预测评分 {rating:.1f}', 'score': 4}
+        for movie_id, rating in predictions if movie_id in movies
+    ]
+
+
+def tag_predictions(rating_records, min_rating, limit):
+    """
+    策略5：按用户喜欢的电影的标签向量打分
+
+    Args:
+        rating_records: 用户全部评分（USER_RATINGS_QUERY 的结果，包含 id/rating）
+        min_rating: 喜欢的电影的最低评分
+        limit: 返回数量
+
+    Returns:
+        list: (电影ID, 相似度, 共同标签列表) 列表；没有标签向量或喜欢的电影都没有标签时为空
+    """
+    model = tag_vectors.get()
+    if model is None:
+        return []
+    return model.recommend(((record['id'], record['rating']) for record in rating_records), min_rating, limit)
+
+
+def tag_strategy_records(records, predictions):
+    """
+    按相似度顺序把电影信息（MOVIES_BY_ID_QUERY 的结果）组装为策略5的推荐记录，理由为贡献最大的标签
+
+    Args:
+        records: 包含 id/title/year/genres 的电影记录
+        predictions: tag_predictions 的结果
+    """
+    movies = {record['id']: record for record in records}
+    return [
+        {'id': movie_id, 'title': movies[movie_id]['title'], 'year': movies[movie_id]['year'],
+         'genres': movies[movie_id]['genres'], 'reason': f'标签相似: {shared_tags[0]}', 'score': 5}
+        for movie_id, _, shared_tags in predictions if movie_id in movies
+    ]
+
+
+def tag_dicts(tags):
+    """search_tags 的结果 -> 标签字典列表"""
+    return [{'tag': tag, 'movie_count': movie_count} for tag, movie_count in tags]
+
+
+def tagged_movie_dicts(records, matches):
+    """
+    按 movies_by_tag 的顺序组装电影字典，附带 tag_count（打该标签的用户数）
+
+    Args:
+        records: 包含 id/title/year/genres 的电影记录
+        matches: (电影ID, 用户数) 列表
+    """
+    movies = {record['id']: record for record in records}
+    return [dict(movie_record_to_dict(movies[movie_id]), tag_count=count)
+            for movie_id, count in matches if movie_id in movies]
+
+
+def similar_tag_movie_dicts(records, matches):
+    """
+    按 similar_movies 的顺序组装电影字典，附带 similarity（标签向量余弦相似度）和 shared_tags（主要的共同标签）
+
+    Args:
+        records: 包含 id/title/year/genres 的电影记录
+        matches: (电影ID, 相似度, 共同标签列表) 列表
+    """
+    movies = {record['id']: record for record in records}
+    return [dict(movie_record_to_dict(movies[movie_id]), similarity=round(similarity, 4), shared_tags=shared_tags)
+            for movie_id, similarity, shared_tags in matches if movie_id in movies]
+
+
+def recommendation_queries(user_id, limit, min_rating, predictions=None, with_ratings=False):
+    """
+    推荐所需的查询及其参数，按名称索引
+    
+    这些查询互不依赖，可以在不同会话中并发执行。
+    predictions 为隐因子模型的打分结果（factor_predictions），非空时加入取电影信息的 factor_strategy 查询；
+    with_ratings 为True（有标签向量）时加入策略5所需的 user_ratings 查询。
+    """
+    queries = {
+        'genre_preferences': (GENRE_PREFERENCE_QUERY, {'user_id': user_id, 'min_rating': min_rating}),
+        'similar_users': (SIMILAR_USERS_QUERY, {'user_id': user_id}),
+        'genre_strategy': (RECOMMEND_BY_GENRE_QUERY, {'user_id': user_id, 'min_rating': min_rating, 'limit': limit}),
+        'similar_users_strategy': (RECOMMEND_BY_SIMILAR_USERS_QUERY,
+                                   {'user_id': user_id, 'limit': limit, 'neighbours': SIMILAR_USER_NEIGHBOURS}),
+        'similar_movies_strategy': (RECOMMEND_BY_SIMILAR_MOVIES_QUERY,
+                                    {'user_id': user_id, 'min_rating': min_rating, 'limit': limit}),
+    }
+    if predictions:
+        queries['factor_strategy'] = (FACTOR_MOVIES_QUERY, {'user_id': user_id,
+                                                            'movie_ids': [movie_id for movie_id, _ in predictions]})
+    if with_ratings:
+        queries['user_ratings'] = (USER_RATINGS_QUERY, {'user_id': user_id})
+    return queries
+
+
+def path_to_dict(path):
+    """将最短路径转换为包含nodes和links的字典"""
+    nodes_list = []  # 保持节点顺序
+    nodes_dict = {}  # 用于去重
+    links = []
+    
+    # 按顺序提取路径中的所有节点
+    for node in path.nodes:
+        node_id = get_node_id(node)
+        node_type = get_node_type(node)
+        
+        if node_id not in nodes_dict:
+            node_dict = node_to_dict(node, node_type)
+            nodes_dict[node_id] = node_dict
+            nodes_list.append(node_dict)
+    
+    # 提取路径中的所有关系，按顺序
+    for rel in path.relationships:
+        start_node = rel.start_node
+        end_node = rel.end_node
+        
+        start_id_str = get_node_id(start_node)
+        end_id_str = get_node_id(end_node)
+        rel_type = rel.type
+        
+        # 确保两个节点都在节点列表中
+        if start_id_str in nodes_dict and end_id_str in nodes_dict:
+            links.append({
+                'source': start_id_str,
+                'target': end_id_str,
+                'type': rel_type
+            })
+    
+    return {
+        'nodes': nodes_list,
+        'links': links
+    }
+
+
+def path_label(label):
+    """
+    校验路径端点/途经节点的标签（支持别名）
+
+    Raises:
+        InvalidArgument: 标签不在 PATH_NODE_KEYS 中
+    """
+    label = PATH_LABEL_ALIASES.get(label, label)
+    if label not in PATH_NODE_KEYS:
+        raise InvalidArgument(f"不支持的节点类型: {label}，可选值: {', '.join(PATH_NODE_KEYS)}")
+    return label
+
+
+def path_node_key(label, node_id):
+    """将端点ID转换为对应属性的取值：Movie/User 为整数，Genre 为名称"""
+    if PATH_NODE_KEYS[label] == 'id':
+        return safe_int_convert(node_id)
+    return str(node_id)
+
+
+def path_query_params(start_type, start_id, end_type, end_id, max_depth=6, rel_types=None, via_labels=None):
+    """
+    校验路径查找参数
+
+    Args:
+        rel_types: 允许遍历的关系类型列表，为None时使用全部 PATH_RELATIONSHIP_TYPES
+        via_labels: 允许出现在路径上的节点标签列表，为None时允许全部标签；端点标签总是允许
+
+    Returns:
+        tuple: (查询模板的格式化参数, 查询参数)
+
+    Raises:
+        InvalidArgument: 标签、关系类型或深度不合法
+    """
+    start_type, end_type = path_label(start_type), path_label(end_type)
+    rel_types = sorted(set(rel_types or PATH_RELATIONSHIP_TYPES))
+    invalid = [rel_type for rel_type in rel_types if rel_type not in PATH_RELATIONSHIP_TYPES]
+    if invalid:
+        raise InvalidArgument(f"不支持的关系类型: {', '.join(invalid)}，可选值: {', '.join(PATH_RELATIONSHIP_TYPES)}")
+    labels = {path_label(label) for label in (via_labels or PATH_NODE_KEYS)}
+    if not 1 <= max_depth <= MAX_PATH_DEPTH:
+        raise InvalidArgument(f"max_depth 必须在 1 到 {MAX_PATH_DEPTH} 之间")
+
+    template = {
+        'start_type': start_type, 'start_key': PATH_NODE_KEYS[start_type],
+        'end_type': end_type, 'end_key': PATH_NODE_KEYS[end_type],
+        'rel_types': '|'.join(rel_types), 'max_depth': int(max_depth),
+    }
+    params = {
+        'start_id': path_node_key(start_type, start_id),
+        'end_id': path_node_key(end_type, end_id),
+        'labels': sorted(labels | {start_type, end_type}),
+    }
+    return template, params
+
+
+def path_records_to_dict(records):
+    """将多条路径合并为一个 nodes/links 字典，同时保留每条路径的节点ID序列"""
+    return merge_path_dicts(path_to_dict(record['path']) for record in records)
+
+
+def merge_path_dicts(paths):
+    """合并多条路径字典（path_to_dict 格式）：节点和关系去重，paths 为每条路径的节点ID序列"""
+    nodes, links, node_ids = {}, {}, []
+    for path in paths:
+        for node in path['nodes']:
+            nodes.setdefault(node['id'], node)
+        for link in path['links']:
+            links.setdefault((link['source'], link['target'], link['type']), link)
+        node_ids.append([node['id'] for node in path['nodes']])
+    return {'nodes': list(nodes.values()), 'links': list(links.values()), 'paths': node_ids}
+
+
+def yen_k_shortest(start, end, max_depth, k, max_spurs=K_SHORTEST_MAX_SPURS):
+    """
+    Yen算法：依次求出前k条无环最短路径
+
+    生成器，不接触数据：每次需要一条最短路径时 yield (起点, 终点, 最大深度, 禁用节点集合, 禁用关系集合)，
+    调用方 send 回 (节点列表, 关系列表) 或 None（不可达）。这样内存快照/SQLite 的同步回调
+    （k_shortest_paths）和Neo4j的查询计划可以共用同一份算法。
+
+    每条新路径需要在上一条路径的每个节点处分叉搜索一次，总搜索次数限制为 max_spurs，
+    用完后返回已找到的路径（可能少于k条），避免长路径、大k时的代价失控。
+
+    Returns:
+        list: (节点列表, 关系列表) 列表，按长度升序
+    """
+    first = yield start, end, max_depth, frozenset(), frozenset()
+    if first is None:
+        return []
+    found = [first]
+    candidates = []
+    spurs = 0
+    while len(found) < k:
+        prev_nodes, prev_rels = found[-1]
+        # 在上一条路径的每个节点处分叉：保留前缀，禁用已有路径在此处用过的关系后重新搜索
+        for i in range(len(prev_nodes) - 1):
+            if spurs >= max_spurs:
+                break
+            spurs += 1
+            root_nodes, root_rels = prev_nodes[:i + 1], prev_rels[:i]
+            banned_rels = frozenset(rels[i] for nodes, rels in found if nodes[:i + 1] == root_nodes)
+            spur = yield root_nodes[-1], end, max_depth - i, frozenset(root_nodes[:-1]), banned_rels
+            if spur is None:
+                continue
+            path = (root_nodes + spur[0][1:], root_rels + spur[1])
+            if path not in found and all(path != candidate for _, candidate in candidates):
+                heapq.heappush(candidates, (len(path[1]), path))
+        if not candidates:
+            break
+        found.append(heapq.heappop(candidates)[1])
+    return found
+
+
+def k_shortest_paths(shortest_path, start, end, max_depth, k, max_spurs=K_SHORTEST_MAX_SPURS):
+    """
+    用同步的最短路径函数执行Yen算法（见 yen_k_shortest）
+
+    Args:
+        shortest_path: 函数 (起点, 终点, 最大深度, 禁用节点集合, 禁用关系集合) -> (节点列表, 关系列表) 或 None
+        start, end: 端点
+        max_depth: 最大路径长度
+        k: 路径数
+        max_spurs: 最多执行的分叉搜索次数
+
+    Returns:
+        list: (节点列表, 关系列表) 列表，按长度升序
+    """
+    search = yen_k_shortest(start, end, max_depth, k, max_spurs)
+    path = None
+    try:
+        while True:
+            path = shortest_path(*search.send(path))
+    except StopIteration as stop:
+        return stop.value
+
+
+def element_path_to_dict(chain, hops, nodes):
+    """
+    由逐步扩展得到的路径构建与 path_to_dict 相同格式的字典
+
+    Args:
+        chain: 路径上节点的elementId序列
+        hops: 相邻节点之间的 (关系类型, 关系起点elementId) 序列
+        nodes: elementId -> 节点
+    """
+    node_dicts = [node_to_dict(nodes[element_id], get_node_type(nodes[element_id])) for element_id in chain]
+    links = []
+    for left, right, (rel_type, rel_start) in zip(chain, chain[1:], hops):
+        source, target = (left, right) if rel_start == left else (right, left)
+        links.append({
+            'source': get_node_id(nodes[source]),
+            'target': get_node_id(nodes[target]),
+            'type': rel_type,
+        })
+    return {'nodes': node_dicts, 'links': links}
+
+
+class BidirectionalPathSearch:
+    """
+    有界双向BFS的状态（与数据访问方式无关，同步和异步数据访问层共用）
+
+    每一轮选择前沿较小的一侧，用 PATH_EXPAND_QUERY 扩展一层，两侧相遇时停止。
+    每层最多展开 max_frontier 个节点、每个节点最多 PATH_FAN_OUT 个邻居，
+    因此结果不保证是全局最短路径，但代价有上界，不会被超级节点拖垮。
+
+    用法：
+        search = BidirectionalPathSearch(endpoints_record, max_depth)
+        while (side := search.next_side()) is not None:
+            search.expand(side, 执行 PATH_EXPAND_QUERY，frontier=search.frontier(side))
+        result = search.to_dict()
+    """
+
+    def __init__(self, endpoints, max_depth, max_frontier=PATH_MAX_FRONTIER):
+        start_id, end_id = endpoints['start_element_id'], endpoints['end_element_id']
+        self.max_depth = max_depth
+        self.max_frontier = max_frontier
+        self.nodes = {start_id: endpoints['start'], end_id: endpoints['end']}
+        # 每侧：element_id -> (深度, 上一个节点, 关系类型, 关系起点)
+        self.visited = ({start_id: (0, None, None, None)}, {end_id: (0, None, None, None)})
+        self.frontiers = [[start_id], [end_id]]
+        self.depths = [0, 0]
+        self.meeting = start_id if start_id == end_id else None
+        self.expansions = 0
+
+    def next_side(self):
+        """下一轮要扩展的一侧（0为起点侧，1为终点侧），搜索结束时返回None"""
+        if self.meeting is not None or sum(self.depths) >= self.max_depth:
+            return None
+        if not self.frontiers[0] or not self.frontiers[1]:
+            return None
+        return 0 if len(self.frontiers[0]) <= len(self.frontiers[1]) else 1
+
+    def frontier(self, side):
+        return self.frontiers[side][:self.max_frontier]
+
+    def expand(self, side, records):
+        """用一层扩展的结果更新访问表，并检查两侧是否相遇"""
+        visited, other = self.visited[side], self.visited[1 - side]
+        depth = self.depths[side] + 1
+        next_frontier = []
+        best = None
+        for record in records:
+            target = record['target']
+            if target in visited:
+                continue
+            visited[target] = (depth, record['source'], record['type'], record['rel_start'])
+            self.nodes[target] = record['m']
+            next_frontier.append(target)
+            # 同一层可能有多个相遇点，取另一侧深度最小的，保证路径最短
+            if target in other and (best is None or other[target][0] < other[best][0]):
+                best = target
+        self.frontiers[side] = next_frontier
+        self.depths[side] = depth
+        self.meeting = best
+        self.expansions += 1
+
+    def to_dict(self):
+        """重建相遇路径，返回与 path_to_dict 相同格式的字典（未找到时为空）"""
+        if self.meeting is None:
+            return {'nodes': [], 'links': []}
+        start_half = self._walk(self.visited[0], self.meeting)
+        end_half = self._walk(self.visited[1], self.meeting)
+        chain = [element_id for element_id, _ in reversed(start_half)] + [element_id for element_id, _ in end_half[1:]]
+        hops = [hop for _, hop in reversed(start_half) if hop] + [hop for _, hop in end_half if hop]
+        return element_path_to_dict(chain, hops, self.nodes)
+
+    @staticmethod
+    def _walk(visited, element_id):
+        """从相遇点沿父指针走回该侧的端点，返回 [(节点, 到父节点的关系)]"""
+        steps = []
+        while element_id is not None:
+            _, parent, rel_type, rel_start = visited[element_id]
+            steps.append((element_id, (rel_type, rel_start) if parent is not None else None))
+            element_id = parent
+        return steps
+
+
+class WeightedPathSearch:
+    """
+    按度数加权的最短路径（与数据访问方式无关，三个后端共用）
+
+    进入一个节点的代价为 1 + ln(度数)：经过超级节点（热门类型、重度用户、热门电影）的路径代价高，
+    结果偏向经由冷门节点的、更具体的关联。每步代价至少为1，所以代价在 [d, d+1) 内的节点
+    不能再互相缩短距离，可以用一次查询成批扩展（Dial算法的桶），查询次数与路径代价成正比。
+    每批最多扩展 max_frontier 个节点，查询中每个节点最多取 PATH_FAN_OUT 个邻居；
+    路径不超过 max_depth 步（每个节点只保留代价最小的那条路径的步数）。
+
+    用法：
+        search = WeightedPathSearch(start, end, max_depth)
+        while (frontier := search.next_frontier()) is not None:
+            search.expand((来源, 邻居, 邻居度数, 关系) for 执行 PATH_WEIGHTED_EXPAND_QUERY，frontier=frontier)
+        nodes, hops = search.path()
+    """
+
+    def __init__(self, start, end, max_depth, max_frontier=PATH_MAX_FRONTIER):
+        self.end = end
+        self.max_depth = max_depth
+        self.max_frontier = max_frontier
+        # 节点 -> (代价, 步数, 上一个节点, 关系)
+        self.best = {start: (0.0, 0, None, None)}
+        self.settled = set()
+        self._heap = [(0.0, 0, start)]
+        self._pushed = 1
+        self.expansions = 0
+
+    @staticmethod
+    def step_cost(degree):
+        return 1.0 + math.log(max(degree, 1))
+
+    def next_frontier(self):
+        """下一批要扩展的节点（代价最小的一个桶），找到终点或无法继续时返回None"""
+        while self._heap:
+            bucket_end = self._heap[0][0] + 1.0
+            frontier = []
+            while self._heap and self._heap[0][0] < bucket_end and len(frontier) < self.max_frontier:
+                cost, _, node = heapq.heappop(self._heap)
+                if node in self.settled or cost > self.best[node][0]:
+                    continue
+                self.settled.add(node)
+                if node == self.end:
+                    return None
+                if self.best[node][1] < self.max_depth:
+                    frontier.append(node)
+            if frontier:
+                return frontier
+        return None
+
+    def expand(self, rows):
+        """
+        Args:
+            rows: (来源节点, 邻居, 邻居度数, 关系) 序列，关系原样保存在路径中
+        """
+        for source, target, degree, hop in rows:
+            if target in self.settled:
+                continue
+            cost, steps, _, _ = self.best[source]
+            cost += self.step_cost(degree)
+            if target not in self.best or cost < self.best[target][0]:
+                self.best[target] = (cost, steps + 1, source, hop)
+                heapq.heappush(self._heap, (cost, self._pushed, target))
+                self._pushed += 1
+        self.expansions += 1
+
+    @property
+    def cost(self):
+        return round(self.best[self.end][0], 4) if self.end in self.settled else None
+
+    def path(self):
+        """
+        Returns:
+            tuple: (节点列表, 关系列表)，未找到时返回None
+        """
+        if self.end not in self.settled:
+            return None
+        nodes, hops = [self.end], []
+        while True:
+            _, _, parent, hop = self.best[nodes[-1]]
+            if parent is None:
+                return nodes[::-1], hops[::-1]
+            hops.append(hop)
+            nodes.append(parent)
+
+
+def build_projected_network(record):
+    """
+    由 MOVIE_NETWORK_PROJECTION_QUERY 的结果构建关系网络
+
+    节点和关系已在Cypher中去重、投影和过滤，这里直接返回。
+    """
+    if record is None or not record['nodes']:
+        return {'nodes': [], 'links': []}
+    return {'nodes': record['nodes'], 'links': record['links']}
+
+
+def network_level_budget(max_nodes, selected, level, depth):
+    """
+    bfs模式下第level层（从1开始）可以加入的节点数
+
+    按已选中的节点数计算：剩余名额在剩余层之间平均分配，最后一层（及之后）取全部剩余名额，
+    前面各层没有用完的名额自动计入后面的层。
+    """
+    remaining = max_nodes - selected
+    levels_left = depth - level + 1
+    if levels_left <= 1:
+        return remaining
+    return -(-remaining // levels_left)
+
+
+def network_fan_out(budget, frontier_size):
+    """
+    bfs模式下每个前沿节点最多贡献的邻居数（在整个前沿范围内去重后计数）
+
+    取本层平均名额的两倍，使本层名额分散到多个前沿节点，
+    避免全部被单个高度数节点的邻居占满。
+    """
+    return max(1, min(budget, -(-2 * budget // max(frontier_size, 1))))
+
+
+class LevelNetworkExpansion:
+    """
+    bfs模式关系网络的逐层扩展状态（与数据访问方式无关，三个后端共用）
+
+    每一轮取出前沿节点的未访问邻居（每个前沿节点按权重降序至多取 per_node 个），
+    在整个前沿范围内去重后再分配本轮名额（network_level_budget）：
+    - 轮流让每个前沿节点贡献下一个尚未选中的邻居，每个节点至多 network_fan_out 个，重复的邻居不占名额
+    - 超出名额时按权重截断；不足时依次用本轮其余邻居、前几轮见过但未选中的节点补足
+    - 仍不足、且有节点的邻居被 per_node 截断（包括前几轮的节点）时，放宽到本轮名额重新查询这些节点
+    没有用完的名额计入下一轮；补进来的节点没到最大深度的，下一轮继续扩展。
+    因此只要深度内可达的节点足够，最终恰好选出 max_nodes 个节点。
+
+    用法：
+        expansion = LevelNetworkExpansion(start, depth, max_nodes)
+        while (frontier := expansion.next_frontier()) is not None:
+            expansion.expand(执行 NETWORK_LEVEL_QUERY，visited=expansion.selected，per_node=expansion.per_node)
+        selected = expansion.selected
+    """
+
+    def __init__(self, start, depth, max_nodes):
+        self.depth = depth
+        self.max_nodes = max_nodes
+        self.selected = [start]
+        self.distance = {start: 0}
+        # 见过但未选中的节点 -> (权重, 距离)
+        self.spare = {}
+        # 邻居被 per_node 截断、可能还有未取出邻居的节点
+        self.truncated = {}
+        self.retried = False
+        self.pending = [start]
+        self.frontier = None
+        self.level = 0
+        self.budget = 0
+        self.per_node = 0
+        self.fan_out = 0
+
+    def next_frontier(self):
+        """下一轮要扩展的前沿节点，扩展结束时返回None；前沿为空时直接从见过的节点中补足名额"""
+        while True:
+            if self.frontier is not None:
+                # 上一轮名额不足且有邻居被截断，放宽 per_node 重新查询
+                return self.frontier
+            self.level += 1
+            self.retried = False
+            self.budget = network_level_budget(self.max_nodes, len(self.selected),
+                                               min(self.level, self.depth), self.depth)
+            frontier = self.frontier_nodes()
+            if self.budget <= 0 or (not frontier and not self.spare):
+                return None
+            self.fan_out = network_fan_out(self.budget, len(frontier)) if frontier else 0
+            if frontier:
+                # 每个前沿节点多取一倍，通常足以抵消去重
+                self.per_node = min(self.budget, 2 * self.fan_out)
+                return frontier
+            self.expand([])
+
+    def frontier_nodes(self):
+        """上一轮选中、还没到最大深度的节点"""
+        return [node for node in self.pending if self.distance[node] < self.depth]
+
+    def expand(self, candidates):
+        """
+        用一轮扩展的结果选出本轮的节点
+
+        Args:
+            candidates: (前沿节点, 邻居, 权重) 序列
+        """
+        ranked = {}
+        for source, node, weight in candidates:
+            if node not in self.distance:
+                ranked.setdefault(source, {})[node] = weight
+        self.truncated.update((source, True) for source, neighbours in ranked.items() if len(neighbours) >= self.per_node)
+        seen = {node for neighbours in ranked.values() for node in neighbours} | set(self.spare)
+        if len(seen) < self.budget and self.truncated and not self.retried:
+            # 放宽 per_node，重新查询本轮前沿和邻居被截断的节点（每轮至多一次）
+            self.frontier = list(dict.fromkeys(self.frontier_nodes() + list(self.truncated)))
+            self.per_node = self.budget
+            self.truncated.clear()
+            self.retried = True
+            return
+        self.frontier = None
+
+        for source, neighbours in ranked.items():
+            distance = self.distance[source] + 1
+            for node, weight in neighbours.items():
+                if node not in self.spare or distance < self.spare[node][1]:
+                    self.spare[node] = (weight, distance)
+        groups = [iter(sorted(neighbours, key=lambda node: -neighbours[node])) for neighbours in ranked.values()]
+
+        # 轮流从每个前沿节点取下一个尚未选中的邻居
+        chosen = {}
+        for _ in range(self.fan_out):
+            for group in groups:
+                node = next((node for node in group if node not in chosen), None)
+                if node is not None:
+                    chosen[node] = True
+        chosen = sorted(chosen, key=lambda node: -self.spare[node][0])[:self.budget]
+        if len(chosen) < self.budget:
+            # 先用本轮的其余邻居，再用前几轮见过但未选中的节点
+            fresh = {node for neighbours in ranked.values() for node in neighbours}
+            taken = set(chosen)
+            rest = sorted((node for node in self.spare if node not in taken),
+                          key=lambda node: (node not in fresh, -self.spare[node][0]))
+            chosen += rest[:self.budget - len(chosen)]
+
+        for node in chosen:
+            self.distance[node] = self.spare.pop(node)[1]
+        self.selected.extend(chosen)
+        self.pending = chosen
+
+
+def build_level_network(start_node, selected, nodes, edge_records):
+    """
+    由逐层扩展的结果构建关系网络
+
+    Args:
+        start_node: 起始电影节点
+        selected: LevelNetworkExpansion 选中的节点elementId（第一个为起始节点）
+        nodes: elementId -> 节点（NETWORK_LEVEL_QUERY 返回的 node）
+        edge_records: NETWORK_EDGES_QUERY 的结果
+
+    Returns:
+        dict: 包含nodes和links的字典
+    """
+    node_dicts = [node_to_dict(start_node, 'Movie')]
+    id_map = {selected[0]: node_dicts[0]['id']}
+    for element_id in selected[1:]:
+        node = nodes[element_id]
+        node_dict = node_to_dict(node, get_node_type(node))
+        id_map[element_id] = node_dict['id']
+        node_dicts.append(node_dict)
+
+    links = [
+        {'source': id_map[record['source']], 'target': id_map[record['target']], 'type': record['type']}
+        for record in edge_records
+    ]
+    return {'nodes': node_dicts, 'links': links}
+
+
+def clamp_network_params(depth, max_nodes):
+    """限制深度在1-3之间，节点数量在10-500之间"""
+    return max(1, min(3, depth)), max(10, min(500, max_nodes))
+
+
+class Neo4jQueryPlans:
+    """
+    Neo4j数据访问的查询逻辑，同步（Neo4jDatabase）与异步（AsyncNeo4jDatabase）实现共用
+
+    每个 *_plan 方法是一个生成器，只描述要执行的查询和结果转换，不接触会话：
+    - yield (query, params)：在当前会话中执行，send 回记录列表
+    - yield {name: (query, params)}：各查询在独立会话中并发执行，send 回 {name: (记录列表, 耗时毫秒)}
+    - return 的值就是公共方法的返回值
+    单个查询执行出错（Neo4jError）时异常会抛回计划，计划可以捕获后改用其他查询，不捕获时原样抛出。
+    子类只负责连接、会话和 _run_plan（同步或异步地执行这些请求）。
+    """
     
     def __init__(self):
         self.uri = os.getenv("NEO4J_URI", "bolt://localhost:7687")
         self.user = os.getenv("NEO4J_USER", "neo4j")
         self.password = os.getenv("NEO4J_PASSWORD", "password")
+        self.pool_config = pool_config_from_env()
         self.driver = None
+        # 进程内标题索引及其对应的数据版本
+        self._title_index = None
+        self._title_index_version = None
+        self._title_index_checked_at = 0.0
+        # 服务器是否支持 SHORTEST k（Neo4j 5.21+），第一次遇到语法错误后改用Yen算法
+        self._shortest_k_supported = True
     
-    @staticmethod
-    def _safe_int_convert(value):
-        """
-        安全地将值转换为整数
-        支持整数、浮点数字符串等格式
-        """
-        if isinstance(value, int):
-            return value
-        if isinstance(value, float):
-            return int(value)
-        if isinstance(value, str):
-            # 尝试直接转换为整数
-            try:
-                return int(value)
-            except ValueError:
-                # 如果是浮点数字符串，先转换为浮点数再转整数
+    def title_index_is_fresh(self):
+        """距上次检查数据版本不足 TITLE_INDEX_REFRESH_SECONDS 秒时直接使用现有标题索引"""
+        return (self._title_index is not None
+                and time.monotonic() - self._title_index_checked_at < TITLE_INDEX_REFRESH_SECONDS)
+    
+    def data_version_plan(self):
+        records = yield DATA_VERSION_QUERY, dict(source=IMPORT_STATE_SOURCE)
+        return records[0]['version'] if records else None
+    
+    def title_index_plan(self):
+        """首次调用时构建标题索引；之后定期检查数据版本，版本变化（重新导入）时重建"""
+        if self.title_index_is_fresh():
+            return self._title_index
+        now = time.monotonic()
+        version = yield from self.data_version_plan()
+        if self._title_index is None or version != self._title_index_version:
+            records = yield ALL_MOVIES_QUERY, {}
+            self._title_index = TitleSearchIndex(movie_record_to_dict(record) for record in records)
+            self._title_index_version = version
+        self._title_index_checked_at = now
+        return self._title_index
+    
+    def movies_plan(self, limit, skip):
+        records = yield MOVIES_QUERY, dict(skip=skip, limit=limit)
+        return [rated_movie_record_to_dict(record) for record in records]
+    
+    def movies_page_plan(self, after_id, limit):
+        after_id = FIRST_PAGE_CURSOR if after_id is None else safe_int_convert(after_id)
+        records = yield MOVIES_PAGE_QUERY, dict(after_id=after_id, limit=limit)
+        return build_movie_page(records, limit)
+    
+    def top_movies_plan(self, sort, genre, year_from, year_to, min_ratings, limit):
+        records = yield top_movies_query(sort), dict(genre=genre, year_from=year_from, year_to=year_to,
+                                                     min_ratings=min_ratings, limit=limit)
+        return [top_movie_record_to_dict(record) for record in records]
+    
+    def movie_count_plan(self):
+        records = yield MOVIE_COUNT_QUERY, {}
+        return records[0]['count'] if records else 0
+    
+    def search_movies_plan(self, keyword, limit, mode):
+        """fulltext/contains 模式的标题搜索（index 模式只查进程内索引，见 get_title_index）"""
+        if mode == 'fulltext':
+            query = fulltext_title_query(keyword)
+            if query is None:
+                return []
+            records = yield SEARCH_MOVIES_FULLTEXT_QUERY, dict(query=query, limit=limit)
+            return [scored_movie_record_to_dict(record) for record in records]
+        records = yield SEARCH_MOVIES_QUERY, dict(keyword=keyword, limit=limit)
+        return [movie_record_to_dict(record) for record in records]
+    
+    def search_users_plan(self, keyword, limit):
+        prefix = user_id_prefix(keyword)
+        if prefix is None:
+            return []
+        records = yield SEARCH_USERS_QUERY, dict(prefix=prefix, limit=limit)
+        return [user_record_to_dict(record) for record in records]
+    
+    def movie_network_plan(self, movie_id, depth, max_nodes, mode):
+        check_mode('扩展方式', mode, NETWORK_MODES)
+        depth, max_nodes = clamp_network_params(depth, max_nodes)
+        movie_id_int = safe_int_convert(movie_id)
+        
+        # 首先获取起始节点
+        start_records = yield MOVIE_START_QUERY, dict(movie_id=movie_id_int)
+        if not start_records:
+            return {'nodes': [], 'links': []}
+        start_record = start_records[0]
+        
+        if mode == 'bfs':
+            return (yield from self.expand_network_plan(start_record, depth, max_nodes))
+        
+        if mode == 'projection':
+            records = yield (MOVIE_NETWORK_PROJECTION_QUERY.format(depth=depth),
+                             dict(movie_id=movie_id_int, query_limit=max_nodes * 2, max_nodes=max_nodes,
+                                  max_links=max_nodes * NETWORK_PROJECTION_LINKS_PER_NODE))
+            return build_projected_network(records[0] if records else None)
+        
+        # 使用max_nodes * 2作为查询限制，因为实际返回的节点数可能少于查询限制
+        records = yield (MOVIE_NETWORK_QUERY.format(depth=depth),
+                         dict(movie_id=movie_id_int, query_limit=max_nodes * 2))
+        return build_movie_network(start_record['m'], records, max_nodes)
+    
+    def expand_network_plan(self, start_record, depth, max_nodes):
+        """逐层扩展关系网络（见 LevelNetworkExpansion），每层一次查询，最后一次查询取回选中节点间的关系"""
+        expansion = LevelNetworkExpansion(start_record['element_id'], depth, max_nodes)
+        nodes = {}
+        while (frontier := expansion.next_frontier()) is not None:
+            records = yield NETWORK_LEVEL_QUERY, dict(frontier=frontier, visited=expansion.selected,
+                                                      per_node=expansion.per_node)
+            nodes.update((record['element_id'], record['node']) for record in records)
+            expansion.expand((record['source'], record['element_id'], record['weight']) for record in records)
+        
+        edge_records = yield NETWORK_EDGES_QUERY, dict(ids=expansion.selected)
+        return build_level_network(start_record['m'], expansion.selected, nodes, edge_records)
+    
+    def recommendations_plan(self, user_id, limit, min_rating):
+        start = time.perf_counter()
+        if use_stored_recommendations(limit, min_rating):
+            # 预计算结果只需一次索引查找；未预计算的用户继续走实时计算
+            records = yield STORED_RECOMMENDATIONS_QUERY, dict(user_id=safe_int_convert(user_id), limit=limit)
+            if records:
+                return build_stored_recommendations(
+                    records, limit, timings={'total': round((time.perf_counter() - start) * 1000, 2)}
+                )
+        # 隐因子模型在进程内打分（一次矩阵-向量乘法），只有取电影信息需要查询
+        predictions = factor_predictions(safe_int_convert(user_id), limit)
+        queries = recommendation_queries(safe_int_convert(user_id), limit, min_rating, predictions,
+                                         with_ratings=tag_vectors.get() is not None)
+        
+        # 各查询互不依赖，并发执行，总延迟取决于最慢的一个
+        results = yield queries
+        timings = {name: elapsed for name, (_, elapsed) in results.items()}
+        records = {name: rows for name, (rows, _) in results.items()}
+        # 策略5依赖用户的评分，打分后再取电影信息
+        tag_matches = tag_predictions(records.get('user_ratings', []), min_rating, limit)
+        if tag_matches:
+            results = yield {'tag_strategy': (MOVIES_BY_ID_QUERY,
+                                              {'movie_ids': [movie_id for movie_id, _, _ in tag_matches]})}
+            records['tag_strategy'], timings['tag_strategy'] = results['tag_strategy']
+        timings['total'] = round((time.perf_counter() - start) * 1000, 2)
+        result = build_recommendations(
+            records['genre_preferences'], records['similar_users'],
+            records['genre_strategy'], records['similar_users_strategy'], records['similar_movies_strategy'],
+            limit, timings=timings,
+            factor_recs=factor_strategy_records(records.get('factor_strategy', []), predictions),
+            tag_recs=tag_strategy_records(records.get('tag_strategy', []), tag_matches)
+        )
+        result['reasoning']['source'] = 'live'
+        return result
+    
+    def movies_by_id_plan(self, movie_ids):
+        if not movie_ids:
+            return []
+        return (yield MOVIES_BY_ID_QUERY, dict(movie_ids=movie_ids))
+    
+    def movies_by_tag_plan(self, tag, limit):
+        # 电影ID来自进程内的标签向量（tag_vectors.py），只按ID取电影信息
+        matches = require_tag_vectors().movies_by_tag(tag, limit)
+        records = yield from self.movies_by_id_plan([movie_id for movie_id, _ in matches])
+        return tagged_movie_dicts(records, matches)
+    
+    def similar_tag_movies_plan(self, movie_id, limit):
+        matches = require_tag_vectors().similar_movies(safe_int_convert(movie_id), limit)
+        records = yield from self.movies_by_id_plan([movie_id for movie_id, _, _ in matches])
+        return similar_tag_movie_dicts(records, matches)
+    
+    def liked_movies_plan(self, user_id, min_rating, limit):
+        records = yield LIKED_MOVIES_QUERY, dict(user_id=safe_int_convert(user_id), min_rating=min_rating, limit=limit)
+        return [liked_movie_record_to_dict(record) for record in records]
+    
+    def shortest_path_plan(self, start_type, start_id, end_type, end_id, max_depth, algorithm, rel_types, via_labels, k):
+        template, params = path_query_params(start_type, start_id, end_type, end_id, max_depth, rel_types, via_labels)
+        if algorithm not in PATH_ALGORITHMS:
+            raise InvalidArgument(f"不支持的路径算法: {algorithm}，可选值: {', '.join(PATH_ALGORITHMS)}")
+        
+        if algorithm == 'k_shortest':
+            k = max(1, min(int(k), MAX_K_PATHS))
+            if self._shortest_k_supported:
                 try:
-                    return int(float(value))
-                except (ValueError, TypeError):
-                    raise ValueError(f"无法将 '{value}' 转换为整数")
-        raise ValueError(f"不支持的类型: {type(value)}")
+                    records = yield K_SHORTEST_PATHS_QUERY.format(k=k, **template), params
+                    return path_records_to_dict(records)
+                except CypherSyntaxError:
+                    self._shortest_k_supported = False
+            return (yield from self.yen_paths_plan(template, params, k))
+        
+        if algorithm == 'weighted':
+            endpoints = yield PATH_ENDPOINTS_QUERY.format(**template), params
+            if not endpoints:
+                return {'nodes': [], 'links': []}
+            ends = endpoints[0]
+            search = WeightedPathSearch(ends['start_element_id'], ends['end_element_id'], template['max_depth'])
+            nodes = {ends['start_element_id']: ends['start'], ends['end_element_id']: ends['end']}
+            expand_query = PATH_WEIGHTED_EXPAND_QUERY.format(**template)
+            while (frontier := search.next_frontier()) is not None:
+                records = yield expand_query, dict(frontier=frontier, labels=params['labels'], fan_out=PATH_FAN_OUT)
+                nodes.update((record['target'], record['m']) for record in records)
+                search.expand((record['source'], record['target'], record['degree'],
+                               (record['type'], record['rel_start'])) for record in records)
+            path = search.path()
+            if path is None:
+                return {'nodes': [], 'links': []}
+            return {**element_path_to_dict(*path, nodes), 'cost': search.cost}
+        
+        if algorithm == 'bidirectional':
+            endpoints = yield PATH_ENDPOINTS_QUERY.format(**template), params
+            if not endpoints:
+                return {'nodes': [], 'links': []}
+            search = BidirectionalPathSearch(endpoints[0], template['max_depth'])
+            expand_query = PATH_EXPAND_QUERY.format(**template)
+            while (side := search.next_side()) is not None:
+                records = yield expand_query, dict(frontier=search.frontier(side), labels=params['labels'],
+                                                   fan_out=PATH_FAN_OUT)
+                search.expand(side, records)
+            return search.to_dict()
+        
+        records = yield SHORTEST_PATH_QUERY.format(**template), params
+        if not records or not records[0]['path']:
+            return {'nodes': [], 'links': []}
+        return path_to_dict(records[0]['path'])
+
+    
+    def yen_paths_plan(self, template, params, k):
+        """Neo4j 5.21 之前不支持 SHORTEST k：用Yen算法（yen_k_shortest）逐次执行 K_SHORTEST_SPUR_QUERY"""
+        endpoints = yield PATH_ENDPOINTS_QUERY.format(**template), params
+        if not endpoints:
+            return {'nodes': [], 'links': [], 'paths': []}
+        ends = endpoints[0]
+        nodes = {ends['start_element_id']: ends['start'], ends['end_element_id']: ends['end']}
+        hops = {}  # 关系elementId -> (关系类型, 关系起点elementId)
+        search = yen_k_shortest(ends['start_element_id'], ends['end_element_id'], template['max_depth'], k)
+        path = None
+        try:
+            while True:
+                start, end, depth, banned_nodes, banned_rels = search.send(path)
+                if start == end:
+                    # shortestPath 不接受相同的起点和终点
+                    path = [start], []
+                    continue
+                records = yield (K_SHORTEST_SPUR_QUERY.format(rel_types=template['rel_types'], max_depth=depth),
+                                 dict(start=start, end=end, labels=params['labels'],
+                                      banned_nodes=list(banned_nodes), banned_rels=list(banned_rels)))
+                path = None
+                if records:
+                    record = records[0]
+                    nodes.update(zip(record['node_ids'], record['nodes']))
+                    hops.update(zip(record['rel_ids'], zip(record['types'], record['rel_starts'])))
+                    path = record['node_ids'], record['rel_ids']
+        except StopIteration as stop:
+            paths = stop.value
+        return merge_path_dicts(element_path_to_dict(chain, [hops[rel] for rel in rels], nodes)
+                                for chain, rels in paths)
+
+
+class Neo4jDatabase(Neo4jQueryPlans):
+    """Neo4j数据库连接管理类（查询逻辑见 Neo4jQueryPlans）"""
+    
+    def __init__(self):
+        super().__init__()
+        self._executor = None
     
     def connect(self):
         """建立数据库连接"""
         if self.driver is None:
-            self.driver = GraphDatabase.driver(self.uri, auth=(self.user, self.password))
+            self.driver = GraphDatabase.driver(self.uri, auth=(self.user, self.password), **self.pool_config)
         return self.driver
     
     def close(self):
@@ -48,121 +1872,147 @@ class Neo4jDatabase:
         if self.driver:
             self.driver.close()
             self.driver = None
+        if self._executor:
+            self._executor.shutdown(wait=False)
+            self._executor = None
     
     def get_session(self):
-        """获取数据库会话"""
+        """获取数据库会话（记录每个查询的耗时和返回行数，见 metrics.InstrumentedSession）"""
         if self.driver is None:
             self.connect()
-        return self.driver.session()
+        return InstrumentedSession(self.driver.session())
+    
+    def _run_plan(self, plan):
+        """在一个会话中执行查询计划（见 Neo4jQueryPlans），不需要查询的计划不打开会话"""
+        try:
+            request = next(plan)
+        except StopIteration as stop:
+            return stop.value
+        with self.get_session() as session:
+            while True:
+                if isinstance(request, dict):
+                    response = self._run_concurrently(request)
+                    advance = plan.send
+                else:
+                    query, params = request
+                    try:
+                        response = list(session.run(query, **params))
+                        advance = plan.send
+                    except Neo4jError as error:
+                        response, advance = error, plan.throw
+                try:
+                    request = advance(response)
+                except StopIteration as stop:
+                    return stop.value
+    
+    def _run_concurrently(self, queries):
+        """各查询在线程池中使用独立会话并发执行，返回 {名称: (记录列表, 耗时毫秒)}"""
+        if self._executor is None:
+            # 最多七个查询（有隐因子模型时加上 factor_strategy，有标签向量时加上 user_ratings）
+            self._executor = ThreadPoolExecutor(max_workers=7, thread_name_prefix="recommend")
+        futures = {
+            name: self._executor.submit(self._timed_fetch, query, params)
+            for name, (query, params) in queries.items()
+        }
+        return {name: future.result() for name, future in futures.items()}
+    
+    def _timed_fetch(self, query, params):
+        """在独立会话中执行查询，返回 (记录列表, 耗时毫秒)"""
+        start = time.perf_counter()
+        with self.get_session() as session:
+            records = list(session.run(query, **params))
+        return records, round((time.perf_counter() - start) * 1000, 2)
+    
+    def check_schema(self):
+        """检查约束和索引，返回缺失的名称列表"""
+        return schema.check_schema(self.connect())
+    
+    def ensure_schema(self):
+        """幂等地创建约束和索引，返回本次补建的名称列表"""
+        return schema.ensure_schema(self.connect())
+    
+    def get_data_version(self):
+        """读取图中的数据版本，未导入过数据时返回None"""
+        return self._run_plan(self.data_version_plan())
     
     def get_movies(self, limit=100, skip=0):
         """获取电影列表"""
-        query = """
-        MATCH (m:Movie)
-        OPTIONAL MATCH (m)-[:IN_GENRE]->(g:Genre)
-        WITH m, collect(g.name) as genres
-        RETURN m.id as id, m.title as title, m.year as year, genres
-        ORDER BY m.id
-        SKIP $skip
-        LIMIT $limit
+        return self._run_plan(self.movies_plan(limit, skip))
+    
+    def get_movies_page(self, after_id=None, limit=100):
         """
+        游标分页获取电影列表
         
-        with self.get_session() as session:
-            result = session.run(query, skip=skip, limit=limit)
-            movies = []
-            for record in result:
-                # 将类型列表转换为字符串，用|分隔
-                genres_list = record['genres'] or []
-                genres_str = '|'.join(genres_list) if genres_list else ''
-                movies.append({
-                    'id': str(record['id']) if record['id'] is not None else '',
-                    'title': record['title'] or '',
-                    'year': record['year'] if record['year'] is not None else None,
-                    'genres': genres_str
-                })
-            return movies
+        Args:
+            after_id: 上一页返回的next_cursor，为None时从第一页开始
+            limit: 每页数量
+        
+        Returns:
+            dict: 包含movies和next_cursor的字典
+        """
+        return self._run_plan(self.movies_page_plan(after_id, limit))
+    
+    def get_top_movies(self, sort='score', genre=None, year_from=None, year_to=None, min_ratings=0, limit=20):
+        """
+        电影排行榜，读取导入时物化的评分统计
+        
+        Args:
+            sort: score 贝叶斯加权分；popular 评分数；rating 平均分
+            genre: 只看该类型的电影
+            year_from: 起始年份（含）
+            year_to: 截止年份（含）
+            min_ratings: 最少评分数
+            limit: 返回数量
+        
+        Returns:
+            list: 电影字典列表，含 rating_count/avg_rating/bayesian_rating/rating_histogram
+        """
+        return self._run_plan(self.top_movies_plan(sort, genre, year_from, year_to, min_ratings, limit))
     
     def get_movie_count(self):
         """获取电影总数"""
-        query = "MATCH (m:Movie) RETURN count(m) as count"
-        
-        with self.get_session() as session:
-            result = session.run(query)
-            record = result.single()
-            return record['count'] if record else 0
+        return self._run_plan(self.movie_count_plan())
     
-    def search_movies(self, keyword, limit=10):
+    def search_movies(self, keyword, limit=10, mode='index'):
         """
         搜索电影
         
         Args:
             keyword: 搜索关键词（电影标题）
             limit: 返回结果数量限制
+            mode: index 使用进程内标题索引（不区分大小写，支持前缀和模糊匹配）；
+                  fulltext 使用Neo4j全文索引；contains 为原始的子串扫描
         
         Returns:
-            list: 电影列表
+            list: 电影列表，index/fulltext 模式按相关度排序并附带score
         """
-        query = """
-        MATCH (m:Movie)
-        WHERE m.title CONTAINS $keyword
-        OPTIONAL MATCH (m)-[:IN_GENRE]->(g:Genre)
-        WITH m, collect(g.name) as genres
-        RETURN m.id as id, m.title as title, m.year as year, genres
-        ORDER BY m.title
-        LIMIT $limit
+        if check_mode('搜索方式', mode, SEARCH_MODES) == 'index':
+            return self.get_title_index().search(keyword, limit=limit)
+        return self._run_plan(self.search_movies_plan(keyword, limit, mode))
+    
+    def get_title_index(self):
         """
+        获取进程内标题索引
         
-        with self.get_session() as session:
-            result = session.run(query, keyword=keyword, limit=limit)
-            movies = []
-            for record in result:
-                genres_list = record['genres'] or []
-                genres_str = '|'.join(genres_list) if genres_list else ''
-                movies.append({
-                    'id': str(record['id']) if record['id'] is not None else '',
-                    'title': record['title'] or '',
-                    'year': record['year'] if record['year'] is not None else None,
-                    'genres': genres_str
-                })
-            return movies
+        首次调用时构建；之后每隔 TITLE_INDEX_REFRESH_SECONDS 秒检查一次数据版本，
+        版本变化（重新导入）时重建
+        """
+        return self._run_plan(self.title_index_plan())
     
     def search_users(self, keyword, limit=10):
         """
-        搜索用户（通过ID搜索）
+        搜索用户（按ID前缀，例如 "12" 匹配 12、120、121...）
         
         Args:
-            keyword: 搜索关键词（用户ID）
+            keyword: 搜索关键词（用户ID或其前缀）
             limit: 返回结果数量限制
         
         Returns:
-            list: 用户列表
+            list: 用户列表，按评分数降序；关键词不是数字时为空列表
         """
-        try:
-            # 如果关键词是数字，尝试按ID搜索
-            user_id = self._safe_int_convert(keyword)
-            query = """
-            MATCH (u:User {id: $user_id})
-            OPTIONAL MATCH (u)-[r:RATED]->(m:Movie)
-            WITH u, count(r) as rating_count
-            RETURN u.id as id, u.id as name, rating_count
-            LIMIT 1
-            """
-            
-            with self.get_session() as session:
-                result = session.run(query, user_id=user_id)
-                users = []
-                for record in result:
-                    users.append({
-                        'id': str(record['id']) if record['id'] is not None else '',
-                        'name': f"用户 {record['id']}",
-                        'rating_count': record['rating_count'] or 0
-                    })
-                return users
-        except ValueError:
-            # 如果不是数字，返回空列表
-            return []
+        return self._run_plan(self.search_users_plan(keyword, limit))
     
-    def get_movie_network(self, movie_id, depth=2, max_nodes=100):
+    def get_movie_network(self, movie_id, depth=2, max_nodes=100, mode='bfs'):
         """
         获取电影的关系网络
         
@@ -170,132 +2020,14 @@ class Neo4jDatabase:
             movie_id: 电影ID
             depth: 关系深度（1-3）
             max_nodes: 最大节点数量限制（默认100）
+            mode: 'bfs' 逐层扩展，每层按度数挑选邻居，返回max_nodes个节点及其之间的全部关系；
+                  'paths' 枚举可变长度路径（旧方式，节点选择不确定）；
+                  'projection' 与paths相同的路径枚举，但节点和关系在Cypher中去重投影后只返回一次
         
         Returns:
             dict: 包含nodes和links的字典
         """
-        # 限制深度在1-3之间
-        depth = max(1, min(3, depth))
-        # 限制节点数量在10-500之间
-        max_nodes = max(10, min(500, max_nodes))
-        
-        with self.get_session() as session:
-            # 首先获取起始节点
-            start_query = "MATCH (m:Movie {id: $movie_id}) RETURN m"
-            start_result = session.run(start_query, movie_id=self._safe_int_convert(movie_id))
-            start_record = start_result.single()
-            
-            if not start_record:
-                return {'nodes': [], 'links': []}
-            
-            start_node = start_record['m']
-            nodes_dict = {}
-            links_set = set()
-            
-            # 添加起始节点
-            start_id = str(start_node.get('id', ''))
-            nodes_dict[start_id] = self._node_to_dict(start_node, 'Movie')
-            
-            # 根据深度获取相关节点和关系
-            # 使用可变长度路径，但限制在指定深度内
-            path_pattern = f"[*1..{depth}]"
-            
-            # 查询所有相关节点和路径中的关系
-            # 使用max_nodes * 2作为查询限制，因为实际返回的节点数可能少于查询限制
-            query_limit = max_nodes * 2
-            query = f"""
-            MATCH (start:Movie {{id: $movie_id}})
-            MATCH path = (start)-{path_pattern}-(related)
-            WITH start, related, relationships(path) as rels
-            RETURN DISTINCT start, related, rels
-            LIMIT $query_limit
-            """
-            
-            result = session.run(query, movie_id=self._safe_int_convert(movie_id), query_limit=query_limit)
-            
-            for record in result:
-                # 如果已经达到最大节点数限制，停止添加新节点
-                if len(nodes_dict) >= max_nodes:
-                    break
-                    
-                related_node = record['related']
-                rels = record['rels']
-                
-                # 添加相关节点
-                related_id = self._get_node_id(related_node)
-                if related_id not in nodes_dict:
-                    node_type = self._get_node_type(related_node)
-                    nodes_dict[related_id] = self._node_to_dict(related_node, node_type)
-                
-                # 添加路径中的所有关系（只添加已存在节点之间的关系）
-                for rel in rels:
-                    rel_start_node = rel.start_node
-                    rel_end_node = rel.end_node
-                    rel_type = rel.type
-                    
-                    rel_start_id = self._get_node_id(rel_start_node)
-                    rel_end_id = self._get_node_id(rel_end_node)
-                    
-                    # 只添加两个节点都在我们节点字典中的关系
-                    if rel_start_id in nodes_dict and rel_end_id in nodes_dict:
-                        # 创建关系的唯一标识
-                        link_key = (rel_start_id, rel_end_id, rel_type)
-                        if link_key not in links_set:
-                            links_set.add(link_key)
-            
-            # 转换links_set为列表（只包含已存在节点之间的关系）
-            links = []
-            for start_id, end_id, rel_type in links_set:
-                if start_id in nodes_dict and end_id in nodes_dict:
-                    links.append({
-                        'source': start_id,
-                        'target': end_id,
-                        'type': rel_type
-                    })
-            
-            return {
-                'nodes': list(nodes_dict.values()),
-                'links': links
-            }
-    
-    def _get_node_id(self, node):
-        """获取节点的ID"""
-        # 优先使用id属性
-        node_id = node.get('id')
-        if node_id is not None:
-            return str(node_id)
-        # Genre节点使用name作为ID
-        node_name = node.get('name')
-        if node_name is not None:
-            return str(node_name)
-        # 如果都没有，使用节点的内部ID（不推荐，但作为后备方案）
-        return str(node.element_id) if hasattr(node, 'element_id') else str(id(node))
-    
-    def _get_node_type(self, node):
-        """获取节点类型"""
-        labels = list(node.labels)
-        if labels:
-            return labels[0]
-        return 'Unknown'
-    
-    def _node_to_dict(self, node, node_type):
-        """将Neo4j节点转换为字典"""
-        node_id = self._get_node_id(node)
-        
-        # 获取节点名称
-        name = node.get('title') or node.get('name') or f"{node_type}_{node_id}"
-        
-        # 构建属性字典
-        properties = {}
-        for key, value in node.items():
-            properties[key] = value
-        
-        return {
-            'id': node_id,
-            'name': name,
-            'type': node_type,
-            'properties': properties
-        }
+        return self._run_plan(self.movie_network_plan(movie_id, depth, max_nodes, mode))
     
     def get_user_recommendations(self, user_id, limit=20, min_rating=4.0):
         """
@@ -314,196 +2046,35 @@ class Neo4jDatabase:
             min_rating: 最低评分阈值（用于确定用户喜欢的电影）
         
         Returns:
-            dict: 包含推荐列表和推理过程的字典
+            dict: 包含推荐列表和推理过程的字典；reasoning.source 为 store（预计算结果）或 live
         """
-        with self.get_session() as session:
-            user_id_int = self._safe_int_convert(user_id)
-            
-            # 策略1: 基于用户喜欢的电影类型推荐
-            # 找到用户评分>=min_rating的电影及其类型
-            query1 = """
-            MATCH (u:User {id: $user_id})-[r:RATED]->(m:Movie)
-            WHERE r.rating >= $min_rating
-            MATCH (m)-[:IN_GENRE]->(g:Genre)
-            WITH g, count(DISTINCT m) as genre_count
-            ORDER BY genre_count DESC
-            LIMIT 5
-            MATCH (g)<-[:IN_GENRE]-(rec:Movie)
-            WHERE NOT EXISTS {
-                MATCH (u)-[:RATED]->(rec)
-            }
-            OPTIONAL MATCH (rec)-[:IN_GENRE]->(genres:Genre)
-            WITH rec, collect(genres.name) as genres, g.name as reason_genre
-            RETURN DISTINCT rec.id as id, rec.title as title, rec.year as year, 
-                   genres, '类型偏好: ' + reason_genre as reason, 1 as score
-            LIMIT $limit
-            """
-            
-            # 策略2: 基于相似用户推荐
-            # 找到与用户有相似评分偏好的其他用户
-            query2 = """
-            MATCH (u:User {id: $user_id})-[:RATED]->(m1:Movie)
-            MATCH (other:User)-[:RATED]->(m1)
-            WHERE other.id <> $user_id
-            WITH other, count(DISTINCT m1) as common_movies
-            WHERE common_movies >= 3
-            MATCH (other)-[:RATED]->(m2:Movie)
-            WHERE NOT EXISTS {
-                MATCH (u)-[:RATED]->(m2)
-            }
-            OPTIONAL MATCH (m2)-[:IN_GENRE]->(g:Genre)
-            WITH m2, collect(DISTINCT g.name) as genres, 
-                 max(common_movies) as max_common_movies,
-                 '相似用户推荐 (共同评分' + toString(max(common_movies)) + '部电影)' as reason,
-                 2 as score
-            ORDER BY max_common_movies DESC
-            RETURN m2.id as id, m2.title as title, m2.year as year, 
-                   genres, reason, score
-            LIMIT $limit
-            """
-            
-            # 策略3: 基于用户高评分电影的相似电影推荐
-            # 找到用户高评分电影，然后找相同类型的其他电影
-            query3 = """
-            MATCH (u:User {id: $user_id})-[r:RATED]->(liked:Movie)
-            WHERE r.rating >= $min_rating
-            MATCH (liked)-[:IN_GENRE]->(g:Genre)<-[:IN_GENRE]-(similar:Movie)
-            WHERE NOT EXISTS {
-                MATCH (u)-[:RATED]->(similar)
-            }
-            AND similar.id <> liked.id
-            OPTIONAL MATCH (similar)-[:IN_GENRE]->(genres:Genre)
-            WITH similar, collect(DISTINCT genres.name) as genres, 
-                 liked.title as liked_title,
-                 '基于您喜欢的《' + liked.title + '》' as reason,
-                 3 as score
-            RETURN DISTINCT similar.id as id, similar.title as title, similar.year as year,
-                   genres, reason, score
-            LIMIT $limit
-            """
-            
-            # 获取用户偏好类型统计
-            genre_preference_query = """
-            MATCH (u:User {id: $user_id})-[r:RATED]->(m:Movie)
-            WHERE r.rating >= $min_rating
-            MATCH (m)-[:IN_GENRE]->(g:Genre)
-            WITH g, count(DISTINCT m) as movie_count, avg(r.rating) as avg_rating
-            ORDER BY movie_count DESC
-            RETURN g.name as genre, movie_count, avg_rating
-            LIMIT 10
-            """
-            
-            genre_preferences = []
-            genre_result = session.run(genre_preference_query, user_id=user_id_int, min_rating=min_rating)
-            for record in genre_result:
-                genre_preferences.append({
-                    'genre': record['genre'],
-                    'movie_count': record['movie_count'],
-                    'avg_rating': round(record['avg_rating'], 2)
-                })
-            
-            # 获取相似用户信息
-            similar_users_query = """
-            MATCH (u:User {id: $user_id})-[:RATED]->(m1:Movie)
-            MATCH (other:User)-[:RATED]->(m1)
-            WHERE other.id <> $user_id
-            WITH other, count(DISTINCT m1) as common_movies
-            WHERE common_movies >= 3
-            RETURN other.id as user_id, common_movies
-            ORDER BY common_movies DESC
-            LIMIT 5
-            """
-            
-            similar_users = []
-            similar_result = session.run(similar_users_query, user_id=user_id_int)
-            for record in similar_result:
-                similar_users.append({
-                    'user_id': str(record['user_id']),
-                    'common_movies': record['common_movies']
-                })
-            
-            recommendations = {}
-            recommendation_details = {}  # 存储每个推荐的详细推理信息
-            
-            # 执行查询1：基于类型偏好
-            result1 = session.run(query1, user_id=user_id_int, min_rating=min_rating, limit=limit)
-            for record in result1:
-                movie_id = str(record['id'])
-                if movie_id not in recommendations:
-                    genre_name = record['reason'].replace('类型偏好: ', '')
-                    recommendations[movie_id] = {
-                        'id': movie_id,
-                        'title': record['title'] or '',
-                        'year': record['year'],
-                        'genres': '|'.join(record['genres'] or []),
-                        'reason': record['reason'],
-                        'score': record['score'],
-                        'strategy': '类型偏好推荐'
-                    }
-                    recommendation_details[movie_id] = {
-                        'strategy': '类型偏好推荐',
-                        'reason_genre': genre_name,
-                        'explanation': f'您喜欢{genre_name}类型的电影，我们为您推荐同类型电影'
-                    }
-            
-            # 执行查询2：基于相似用户
-            result2 = session.run(query2, user_id=user_id_int, limit=limit)
-            for record in result2:
-                movie_id = str(record['id'])
-                if movie_id not in recommendations:
-                    common_count = record['reason'].split('共同评分')[1].split('部')[0] if '共同评分' in record['reason'] else '3'
-                    recommendations[movie_id] = {
-                        'id': movie_id,
-                        'title': record['title'] or '',
-                        'year': record['year'],
-                        'genres': '|'.join(record['genres'] or []),
-                        'reason': record['reason'],
-                        'score': record['score'],
-                        'strategy': '相似用户推荐'
-                    }
-                    recommendation_details[movie_id] = {
-                        'strategy': '相似用户推荐',
-                        'common_movies': int(common_count),
-                        'explanation': f'与您有相似偏好的用户（共同评分{common_count}部电影）也喜欢这部电影'
-                    }
-            
-            # 执行查询3：基于相似电影
-            result3 = session.run(query3, user_id=user_id_int, min_rating=min_rating, limit=limit)
-            for record in result3:
-                movie_id = str(record['id'])
-                if movie_id not in recommendations:
-                    liked_title = record['reason'].replace('基于您喜欢的《', '').replace('》', '')
-                    recommendations[movie_id] = {
-                        'id': movie_id,
-                        'title': record['title'] or '',
-                        'year': record['year'],
-                        'genres': '|'.join(record['genres'] or []),
-                        'reason': record['reason'],
-                        'score': record['score'],
-                        'strategy': '相似电影推荐'
-                    }
-                    recommendation_details[movie_id] = {
-                        'strategy': '相似电影推荐',
-                        'based_on_movie': liked_title,
-                        'explanation': f'基于您喜欢的《{liked_title}》，我们为您推荐相似类型的电影'
-                    }
-            
-            # 按score排序，返回前limit个
-            sorted_recs = sorted(recommendations.values(), key=lambda x: x['score'])[:limit]
-            
-            # 为每个推荐添加详细推理信息
-            for rec in sorted_recs:
-                if rec['id'] in recommendation_details:
-                    rec['details'] = recommendation_details[rec['id']]
-            
-            return {
-                'recommendations': sorted_recs,
-                'reasoning': {
-                    'genre_preferences': genre_preferences,
-                    'similar_users': similar_users,
-                    'total_recommendations': len(sorted_recs)
-                }
-            }
+        return self._run_plan(self.recommendations_plan(user_id, limit, min_rating))
+    
+    def get_movies_by_tag(self, tag, limit=20):
+        """
+        打了某个标签的电影，按打该标签的用户数降序
+        
+        Args:
+            tag: 标签名（不区分大小写）
+            limit: 返回数量
+        
+        Returns:
+            list: 电影字典，附带 tag_count
+        """
+        return self._run_plan(self.movies_by_tag_plan(tag, limit))
+    
+    def get_similar_tag_movies(self, movie_id, limit=10):
+        """
+        标签向量（TF-IDF）余弦相似度最高的电影
+        
+        Args:
+            movie_id: 电影ID
+            limit: 返回数量
+        
+        Returns:
+            list: 电影字典，附带 similarity 和 shared_tags；电影没有标签时为空列表
+        """
+        return self._run_plan(self.similar_tag_movies_plan(movie_id, limit))
     
     def get_user_liked_movies(self, user_id, min_rating=4.0, limit=10):
         """
@@ -517,104 +2088,32 @@ class Neo4jDatabase:
         Returns:
             list: 用户喜欢的电影列表
         """
-        with self.get_session() as session:
-            user_id_int = self._safe_int_convert(user_id)
-            
-            query = """
-            MATCH (u:User {id: $user_id})-[r:RATED]->(m:Movie)
-            WHERE r.rating >= $min_rating
-            OPTIONAL MATCH (m)-[:IN_GENRE]->(g:Genre)
-            WITH m, r.rating as rating, collect(g.name) as genres
-            RETURN m.id as id, m.title as title, m.year as year, 
-                   genres, rating
-            ORDER BY rating DESC, m.title
-            LIMIT $limit
-            """
-            
-            result = session.run(query, user_id=user_id_int, min_rating=min_rating, limit=limit)
-            movies = []
-            for record in result:
-                genres_list = record['genres'] or []
-                genres_str = '|'.join(genres_list) if genres_list else ''
-                movies.append({
-                    'id': str(record['id']) if record['id'] is not None else '',
-                    'title': record['title'] or '',
-                    'year': record['year'] if record['year'] is not None else None,
-                    'genres': genres_str,
-                    'rating': record['rating']
-                })
-            return movies
-    
-    def find_shortest_path(self, start_type, start_id, end_type, end_id, max_depth=6):
+        return self._run_plan(self.liked_movies_plan(user_id, min_rating, limit))
+    
+    def find_shortest_path(self, start_type, start_id, end_type, end_id, max_depth=6,
+                           algorithm='shortest', rel_types=None, via_labels=None, k=3):
         """
         查找两个节点之间的最短路径（六度空间）
         
         Args:
-            start_type: 起始节点类型（如 'User', 'Movie'）
-            start_id: 起始节点ID
+            start_type: 起始节点类型（'User'/'Person'、'Movie' 或 'Genre'）
+            start_id: 起始节点ID（Genre为名称）
             end_type: 目标节点类型
             end_id: 目标节点ID
             max_depth: 最大搜索深度（默认6度）
+            algorithm: shortest 单条最短路径；k_shortest 前k条最短路径；bidirectional 有界双向BFS；
+                       weighted 按度数加权的最短路径（避开超级节点，见 WeightedPathSearch）
+            rel_types: 允许遍历的关系类型，如 ['RATED'] 只经由评分关系，默认全部
+            via_labels: 允许出现在路径上的节点标签，如 ['Movie'] 可避开Genre超级节点，默认全部
+            k: k_shortest 模式返回的路径数（1-10）
         
         Returns:
-            dict: 包含nodes和links的字典，表示最短路径
+            dict: 包含nodes和links的字典，表示最短路径；k_shortest 模式另含 paths（每条路径的节点ID序列），
+                  weighted 模式另含 cost（路径代价）
         """
-        with self.get_session() as session:
-            # 构建查询，使用shortestPath函数
-            # 注意：使用无向路径搜索，因为关系可能是双向的
-            query = f"""
-            MATCH (start:{start_type} {{id: $start_id}})
-            MATCH (end:{end_type} {{id: $end_id}})
-            MATCH path = shortestPath((start)-[*..{max_depth}]-(end))
-            RETURN path, length(path) as path_length
-            ORDER BY path_length
-            LIMIT 1
-            """
-            
-            result = session.run(query, start_id=self._safe_int_convert(start_id), end_id=self._safe_int_convert(end_id))
-            record = result.single()
-            
-            if not record or not record['path']:
-                return {'nodes': [], 'links': []}
-            
-            path = record['path']
-            nodes_list = []  # 保持节点顺序
-            nodes_dict = {}  # 用于去重
-            links = []
-            
-            # 按顺序提取路径中的所有节点
-            for node in path.nodes:
-                node_id = self._get_node_id(node)
-                node_type = self._get_node_type(node)
-                
-                if node_id not in nodes_dict:
-                    node_dict = self._node_to_dict(node, node_type)
-                    nodes_dict[node_id] = node_dict
-                    nodes_list.append(node_dict)
-            
-            # 提取路径中的所有关系，按顺序
-            for rel in path.relationships:
-                start_node = rel.start_node
-                end_node = rel.end_node
-                
-                start_id_str = self._get_node_id(start_node)
-                end_id_str = self._get_node_id(end_node)
-                rel_type = rel.type
-                
-                # 确保两个节点都在节点列表中
-                if start_id_str in nodes_dict and end_id_str in nodes_dict:
-                    links.append({
-                        'source': start_id_str,
-                        'target': end_id_str,
-                        'type': rel_type
-                    })
-            
-            return {
-                'nodes': nodes_list,
-                'links': links
-            }
+        return self._run_plan(self.shortest_path_plan(start_type, start_id, end_type, end_id, max_depth,
+                                                      algorithm, rel_types, via_labels, k))
 
 
 # 全局数据库实例
 db = Neo4jDatabase()
-
@@ -0,0 +1,253 @@
+import argparse
+import asyncio
+import importlib
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+from urllib.parse import quote
+
+import httpx
+import pandas as pd
+
+# 通过ASGI直接调用 main.app，不需要启动uvicorn
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from load_test import percentile  # noqa: E402
+from graph_snapshot import DEFAULT_DATA_DIR  # noqa: E402
+
+# 每类实体抽样的数量
+SAMPLE_SIZE = 30
+
+
+class Workload:
+    """
+    从 ml-latest-small 的CSV抽取有代表性的参数：热门/冷门电影、重度/轻度用户和搜索词
+
+    所有场景共用一个随机数生成器，相同的 seed 生成相同的请求序列。
+    """
+
+    def __init__(self, data_dir, seed=0):
+        self.seed = seed
+        self.rng = random.Random(seed)
+        movies = pd.read_csv(os.path.join(data_dir, 'movies.csv'))
+        ratings = pd.read_csv(os.path.join(data_dir, 'ratings.csv'))
+        movie_counts = ratings['movieId'].value_counts()
+        user_counts = ratings['userId'].value_counts()
+
+        self.movie_ids = movies['movieId'].tolist()
+        self.popular_movies = movie_counts.index[:SAMPLE_SIZE].tolist()
+        self.obscure_movies = movie_counts[movie_counts <= 2].index[:SAMPLE_SIZE].tolist()
+        self.heavy_users = user_counts.index[:SAMPLE_SIZE].tolist()
+        self.light_users = user_counts.index[-SAMPLE_SIZE:].tolist()
+        self.genres = sorted({genre for raw in movies['genres'] for genre in raw.split('|')} - {'(no genres listed)'})
+        # 标签场景：最常用的标签，以及打过标签的热门电影
+        tags = pd.read_csv(os.path.join(data_dir, 'tags.csv'))
+        tag_names = tags['tag'].astype(str).str.strip().str.lower()
+        self.tags = tag_names.value_counts().index[:SAMPLE_SIZE].tolist()
+        self.tagged_movies = tags['movieId'].value_counts().index[:SAMPLE_SIZE].tolist()
+
+        # 搜索词：热门电影标题的前缀（模拟逐字输入），外加几个拼写错误
+        titles = movies.set_index('movieId').loc[self.popular_movies, 'title'].str.replace(r'\s*\(\d{4}\)\s*$', '', regex=True)
+        queries = [title[:length] for title in titles for length in (3, 6, len(title))]
+        queries += ["godfathr", "matrx", "shawshank redemtion", "forest gump"]
+        self.title_queries = [quote(query) for query in queries]
+
+    def reset(self):
+        """重置随机数生成器，使每个后端、每个场景得到相同的请求序列"""
+        self.rng = random.Random(self.seed)
+
+    def choice(self, values):
+        return self.rng.choice(values)
+
+    def path_endpoints(self):
+        """路径查询的两端：热门或冷门电影、重度或轻度用户、类型"""
+        candidates = [
+            lambda: ('Movie', self.choice(self.popular_movies)),
+            lambda: ('Movie', self.choice(self.obscure_movies)),
+            lambda: ('User', self.choice(self.heavy_users)),
+            lambda: ('User', self.choice(self.light_users)),
+            lambda: ('Genre', self.choice(self.genres)),
+        ]
+        (start_type, start_id), (end_type, end_id) = self.choice(candidates)(), self.choice(candidates)()
+        return f"{start_type}/{start_id}/{end_type}/{end_id}"
+
+
+# 场景名称 -> 由 Workload 生成请求路径的函数
+SCENARIOS = {
+    'movies': lambda w: f"/api/movies?limit=20&skip={w.rng.randint(0, 9000)}",
+    'movies_page': lambda w: f"/api/movies/page?limit=20&after_id={w.choice(w.movie_ids)}",
+    'movies_top': lambda w: f"/api/movies/top?sort={w.choice(['score', 'popular', 'rating'])}"
+                            f"&genre={w.choice(w.genres)}&year_from={w.rng.randint(1950, 2010)}",
+    'movie_count': lambda w: "/api/movies/count",
+    'search_index': lambda w: f"/api/movies/search?mode=index&q={w.choice(w.title_queries)}",
+    'search_fulltext': lambda w: f"/api/movies/search?mode=fulltext&q={w.choice(w.title_queries)}",
+    'search_contains': lambda w: f"/api/movies/search?mode=contains&q={w.choice(w.title_queries)}",
+    'search_users': lambda w: f"/api/users/search?q={w.rng.randint(1, 99)}",
+    'network_popular_d1': lambda w: f"/api/network/movie/{w.choice(w.popular_movies)}?depth=1&max_nodes=100",
+    'network_popular_d2': lambda w: f"/api/network/movie/{w.choice(w.popular_movies)}?depth=2&max_nodes=100",
+    'network_popular_d3': lambda w: f"/api/network/movie/{w.choice(w.popular_movies)}?depth=3&max_nodes=200",
+    'network_obscure_d2': lambda w: f"/api/network/movie/{w.choice(w.obscure_movies)}?depth=2&max_nodes=100",
+    'recommendations_heavy': lambda w: f"/api/recommendations/user/{w.choice(w.heavy_users)}",
+    'recommendations_light': lambda w: f"/api/recommendations/user/{w.choice(w.light_users)}",
+    'liked_movies': lambda w: f"/api/recommendations/user/{w.choice(w.heavy_users + w.light_users)}/liked",
+    'tags_search': lambda w: f"/api/tags?q={quote(w.choice(w.tags)[:2])}",
+    'movies_by_tag': lambda w: f"/api/tags/{quote(w.choice(w.tags), safe='')}/movies",
+    'similar_by_tags': lambda w: f"/api/movies/{w.choice(w.tagged_movies)}/similar-by-tags",
+    'path_shortest': lambda w: f"/api/network/path/{w.path_endpoints()}?max_depth={w.rng.randint(2, 10)}",
+    'path_k_shortest': lambda w: f"/api/network/path/{w.path_endpoints()}?algorithm=k_shortest&k=3&max_depth=6",
+    'path_bidirectional': lambda w: f"/api/network/path/{w.path_endpoints()}?algorithm=bidirectional&max_depth=10",
+    'path_weighted': lambda w: f"/api/network/path/{w.path_endpoints()}?algorithm=weighted&max_depth=6",
+}
+
+
+def load_app(engine, use_cache):
+    """按引擎重新导入 main，返回新的 FastAPI 应用（main 在导入时根据环境变量创建后端）"""
+    os.environ['GRAPH_ENGINE'] = engine
+    if not use_cache:
+        # 条目数为0时每次写入都立即被淘汰，测得的是后端本身的开销
+        os.environ['CACHE_MAX_ENTRIES'] = '0'
+    sys.modules.pop('main', None)
+    return importlib.import_module('main')
+
+
+async def run_scenario(client, urls, concurrency):
+    """
+    以固定并发数依次发送一组请求
+
+    Returns:
+        dict: 吞吐量、延迟百分位（毫秒）和响应大小（字节）
+    """
+    latencies, sizes, errors = [], [], 0
+    queue = iter(urls)
+
+    async def worker():
+        nonlocal errors
+        for url in queue:
+            start = time.perf_counter()
+            response = await client.get(url)
+            elapsed = (time.perf_counter() - start) * 1000
+            if response.status_code != 200:
+                errors += 1
+                continue
+            latencies.append(elapsed)
+            sizes.append(len(response.content))
+
+    start = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    wall = time.perf_counter() - start
+    return {
+        'requests': len(urls),
+        'errors': errors,
+        'throughput_rps': round(len(latencies) / wall, 1) if wall else 0.0,
+        'p50_ms': round(percentile(latencies, 50), 2),
+        'p95_ms': round(percentile(latencies, 95), 2),
+        'p99_ms': round(percentile(latencies, 99), 2),
+        'mean_ms': round(statistics.fmean(latencies), 2) if latencies else 0.0,
+        'bytes_mean': round(statistics.fmean(sizes)) if sizes else 0,
+        'bytes_max': max(sizes, default=0),
+    }
+
+
+async def run_engine(engine, workload, scenarios, args):
+    """对一个后端运行所有场景，返回 场景名 -> 统计"""
+    module = load_app(engine, args.cache)
+    results = {}
+    async with module.lifespan(module.app):
+        transport = httpx.ASGITransport(app=module.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=300) as client:
+            for name in scenarios:
+                workload.reset()
+                urls = [SCENARIOS[name](workload) for _ in range(args.warmup + args.requests)]
+                await run_scenario(client, urls[:args.warmup], args.concurrency)
+                results[name] = await run_scenario(client, urls[args.warmup:], args.concurrency)
+                stats = results[name]
+                print(f"[{engine}] {name:<22} p50 {stats['p50_ms']:>8} ms  p95 {stats['p95_ms']:>8} ms  "
+                      f"{stats['throughput_rps']:>8} req/s  错误 {stats['errors']}")
+    return results
+
+
+def git_commit():
+    """当前提交（用于比较不同提交的结果），不在git仓库中时为None"""
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT_DIR,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_comparison(results, scenarios):
+    """各后端并排的 p50 / p95"""
+    engines = list(results)
+    print("\n" + f"{'场景':<24}" + ''.join(f"{engine + ' p50/p95(ms)':>26}" for engine in engines))
+    for name in scenarios:
+        cells = [f"{results[engine][name]['p50_ms']}/{results[engine][name]['p95_ms']}" for engine in engines]
+        print(f"{name:<24}" + ''.join(f"{cell:>26}" for cell in cells))
+
+
+def print_regressions(results, baseline_path):
+    """与基线结果（之前某次提交的输出）比较 p50/p95 的变化"""
+    with open(baseline_path, encoding='utf-8') as f:
+        baseline = json.load(f)
+    print(f"\n对比基线 {baseline_path}（提交 {baseline['meta'].get('commit')}）")
+    for engine, scenarios in results.items():
+        for name, stats in scenarios.items():
+            before = baseline['results'].get(engine, {}).get(name)
+            if not before or not before['p50_ms']:
+                continue
+            changes = [f"{key} {(stats[key] - before[key]) / before[key] * 100:+.1f}%"
+                       for key in ('p50_ms', 'p95_ms') if before[key]]
+            print(f"[{engine}] {name:<22} {'  '.join(changes)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="通过ASGI对所有API接口做可复现的基准测试，结果输出为JSON")
+    parser.add_argument("--engines", nargs="+", default=["sqlite"], choices=["neo4j", "snapshot", "sqlite"],
+                        help="要测试的后端（GRAPH_ENGINE），多个时并排比较")
+    parser.add_argument("--scenarios", nargs="+", default=list(SCENARIOS), choices=list(SCENARIOS), help="要运行的场景")
+    parser.add_argument("--requests", type=int, default=200, help="每个场景的请求数")
+    parser.add_argument("--warmup", type=int, default=20, help="每个场景正式计时前的预热请求数")
+    parser.add_argument("--concurrency", type=int, default=8, help="并发请求数")
+    parser.add_argument("--seed", type=int, default=0, help="随机种子")
+    parser.add_argument("--data-dir", default=DEFAULT_DATA_DIR, help="抽样参数用的MovieLens数据目录")
+    parser.add_argument("--cache", action="store_true", help="保留结果缓存（默认关闭，测量后端本身）")
+    parser.add_argument("--output", help="将结果写入JSON文件")
+    parser.add_argument("--baseline", help="与之前输出的JSON比较")
+    args = parser.parse_args()
+    workload = Workload(args.data_dir, seed=args.seed)
+
+    results = {}
+    for engine in args.engines:
+        results[engine] = asyncio.run(run_engine(engine, workload, args.scenarios, args))
+
+    if len(results) > 1:
+        print_comparison(results, args.scenarios)
+    if args.baseline:
+        print_regressions(results, args.baseline)
+
+    report = {
+        'meta': {
+            'commit': git_commit(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'requests': args.requests,
+            'warmup': args.warmup,
+            'concurrency': args.concurrency,
+            'seed': args.seed,
+            'cache': args.cache,
+        },
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\n结果已写入 {args.output}")
+
+
+if __name__ == "__main__":
+    main()
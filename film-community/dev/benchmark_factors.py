@@ -0,0 +1,82 @@
+import argparse
+import os
+import random
+import sys
+import time
+
+import numpy as np
+
+# 复用服务端的模型加载和打分
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from factor_model import FACTOR_MODEL_DIR, FactorModel  # noqa: E402
+from rating_stats import RATING_VALUES  # noqa: E402
+from load_test import percentile  # noqa: E402
+
+
+def full_sort_recommend(model, user_id, k):
+    """对照组：对全部电影做完整排序再取前k个，输出格式与 FactorModel.recommend 相同（同分电影的取舍可能不同）"""
+    row = model.user_row(user_id)
+    scores = model.movie_factors @ model.user_factors[row]
+    scores[model.rated_indices[model.rated_indptr[row]:model.rated_indptr[row + 1]]] = -np.inf
+    top = np.argsort(-scores, kind='stable')[:k]
+    predicted = np.clip(model.user_means[row] + scores[top], RATING_VALUES[0], RATING_VALUES[-1])
+    return [(int(movie_id), float(rating)) for movie_id, rating in zip(model.movie_ids[top], predicted)]
+
+
+def measure(function, users, k):
+    """逐个用户调用 function(user_id, k)，返回延迟列表（毫秒）"""
+    latencies = []
+    for user_id in users:
+        start = time.perf_counter()
+        function(user_id, k)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+
+def report(name, latencies):
+    print(f"{name:<28} p50 {percentile(latencies, 50):.4f} ms  p99 {percentile(latencies, 99):.4f} ms  "
+          f"最大 {max(latencies):.4f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="隐因子推荐（策略4）的单次打分延迟基准")
+    parser.add_argument("--model-dir", default=FACTOR_MODEL_DIR, help="模型目录（dev/train_factors.py 的输出）")
+    parser.add_argument("--requests", type=int, default=10000, help="打分次数")
+    parser.add_argument("--k", type=int, default=20, help="每次推荐的电影数")
+    parser.add_argument("--no-mmap", action="store_true", help="把因子完整读入内存而不是mmap")
+    parser.add_argument("--seed", type=int, default=0, help="随机种子")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    model = FactorModel.load(args.model_dir, mmap=not args.no_mmap)
+    print(f"加载模型耗时 {(time.perf_counter() - start) * 1000:.1f} ms（mmap={not args.no_mmap}）：{model.meta}\n")
+
+    rng = random.Random(args.seed)
+    user_ids = model.user_ids.tolist()
+    users = [rng.choice(user_ids) for _ in range(args.requests)]
+
+    # 预热：首次访问时mmap的页面才读入页缓存
+    measure(model.recommend, users[:100], args.k)
+
+    for user_id in users[:100]:
+        fast = [rating for _, rating in model.recommend(user_id, args.k)]
+        full = [rating for _, rating in full_sort_recommend(model, user_id, args.k)]
+        assert np.allclose(fast, full), f"用户 {user_id} 的结果不一致"
+
+    report(f"argpartition top-{args.k}", measure(model.recommend, users, args.k))
+    report("argsort 完整排序（对照）", measure(lambda user_id, k: full_sort_recommend(model, user_id, k), users, args.k))
+
+    # 打分成本与用户的评分数无关：按评分数分组比较
+    counts = np.diff(model.rated_indptr)
+    order = np.argsort(counts)
+    light = [int(model.user_ids[row]) for row in order[:50]]
+    heavy = [int(model.user_ids[row]) for row in order[-50:]]
+    repeats = max(1, args.requests // 100)
+    print()
+    report(f"轻度用户（{counts[order[:50]].mean():.0f} 条评分）", measure(model.recommend, light * repeats, args.k))
+    report(f"重度用户（{counts[order[-50:]].mean():.0f} 条评分）", measure(model.recommend, heavy * repeats, args.k))
+
+
+if __name__ == "__main__":
+    main()
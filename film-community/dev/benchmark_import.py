@@ -0,0 +1,92 @@
+import argparse
+import json
+import os
+import time
+
+from dotenv import load_dotenv
+
+from import_data import MovieLensImporter, DEFAULT_BATCH_SIZE
+
+# 加载环境变量
+load_dotenv()
+
+
+def run_benchmark(importer, worker_counts):
+    """
+    对比不同工作线程数下评分和标签的并行导入性能
+
+    电影和类型只导入一次；每轮开始前删除所有用户及其关系后重新导入。
+
+    Args:
+        importer: MovieLensImporter实例
+        worker_counts: 要测试的线程数列表
+
+    Returns:
+        list: 每轮的测试结果
+    """
+    importer.ensure_schema()
+    importer.clear_database()
+    importer.import_movies_and_genres_batched()
+
+    results = []
+    for workers in worker_counts:
+        importer.clear_users()
+
+        start = time.perf_counter()
+        rating_stats = importer.import_ratings_parallel(workers)
+        ratings_elapsed = time.perf_counter() - start
+
+        start = time.perf_counter()
+        tag_stats = importer.import_tags_parallel(workers)
+        tags_elapsed = time.perf_counter() - start
+
+        rating_rows = sum(stat['rows'] for stat in rating_stats)
+        tag_rows = sum(stat['rows'] for stat in tag_stats)
+        results.append({
+            'workers': workers,
+            'ratings_seconds': round(ratings_elapsed, 3),
+            'ratings_per_second': round(rating_rows / max(ratings_elapsed, 1e-9)),
+            'tags_seconds': round(tags_elapsed, 3),
+            'tags_per_second': round(tag_rows / max(tags_elapsed, 1e-9)),
+            'retries': sum(stat['retries'] for stat in rating_stats + tag_stats),
+            'per_worker_ratings_per_second': [
+                round(stat['rows'] / max(stat['busy_seconds'], 1e-9)) for stat in rating_stats
+            ],
+        })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="并行导入基准测试（ml-latest-small）")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8], help="要测试的线程数")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="每个事务写入的行数")
+    parser.add_argument("--output", help="将结果写入JSON文件")
+    args = parser.parse_args()
+
+    importer = MovieLensImporter(
+        os.getenv("NEO4J_URI", "bolt://localhost:7687"),
+        os.getenv("NEO4J_USER", "neo4j"),
+        os.getenv("NEO4J_PASSWORD", "password"),
+        batch_size=args.batch_size,
+    )
+    try:
+        results = run_benchmark(importer, args.workers)
+    finally:
+        importer.close()
+
+    baseline = results[0]['ratings_seconds']
+    print("\n线程数 | 评分耗时(秒) | 评分行/秒 | 加速比 | 标签耗时(秒) | 重试次数")
+    for result in results:
+        speedup = baseline / max(result['ratings_seconds'], 1e-9)
+        print(
+            f"{result['workers']:>6} | {result['ratings_seconds']:>12} | {result['ratings_per_second']:>9} | "
+            f"{speedup:>6.2f} | {result['tags_seconds']:>12} | {result['retries']:>8}"
+        )
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+import argparse
+import os
+import random
+import sys
+import time
+
+import pandas as pd
+
+# 复用服务端的标题索引和导入脚本的标题解析
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from search_index import TitleSearchIndex  # noqa: E402
+from import_data import DATA_DIR, MovieLensImporter  # noqa: E402
+
+# 模拟联想输入的查询：逐字输入、大小写混用和拼写错误
+QUERIES = ["t", "to", "toy", "Toy St", "star w", "STAR WARS", "godfathr", "matrx", "amelie", "lord of the r"]
+
+
+def load_movies(data_dir):
+    """从 movies.csv 读取电影，标题与导入后的 Movie 节点一致（去掉年份）"""
+    movies_df = pd.read_csv(os.path.join(data_dir, 'movies.csv'))
+    parsed = MovieLensImporter.parse_movie_titles(movies_df['title'])
+    return [
+        {'id': str(movie_id), 'title': title, 'year': None if pd.isna(year) else int(year), 'genres': genres}
+        for movie_id, title, year, genres in zip(movies_df['movieId'], parsed['title'], parsed['year'], movies_df['genres'])
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="进程内标题索引的搜索延迟基准")
+    parser.add_argument("--data-dir", default=DATA_DIR, help="MovieLens数据目录")
+    parser.add_argument("--queries", type=int, default=10000, help="查询次数")
+    parser.add_argument("--limit", type=int, default=10, help="每次返回的结果数")
+    args = parser.parse_args()
+
+    index = TitleSearchIndex(load_movies(args.data_dir))
+    print(f"索引 {len(index)} 部电影，构建耗时 {index.build_seconds * 1000:.1f} ms\n")
+
+    for query in QUERIES:
+        titles = [movie['title'] for movie in index.search(query, limit=3)]
+        print(f"{query!r:<18} -> {titles}")
+
+    rng = random.Random(0)
+    latencies = []
+    for _ in range(args.queries):
+        query = rng.choice(QUERIES)
+        start = time.perf_counter()
+        index.search(query, limit=args.limit)
+        latencies.append((time.perf_counter() - start) * 1000)
+    latencies.sort()
+    print(f"\n{args.queries} 次查询：p50 {latencies[len(latencies) // 2]:.3f} ms，"
+          f"p99 {latencies[int(len(latencies) * 0.99) - 1]:.3f} ms，最大 {latencies[-1]:.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+import argparse
+import os
+import random
+import sys
+import timeit
+
+# 复用服务端的结果转换函数
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from database import build_movie_network, build_projected_network  # noqa: E402
+
+
+class FakeNode:
+    """模拟 neo4j.graph.Node 中被结果转换用到的接口"""
+
+    def __init__(self, label, props):
+        self.labels = frozenset([label])
+        self._props = props
+        self.element_id = f"{label}:{props.get('id', props.get('name'))}"
+
+    def get(self, key, default=None):
+        return self._props.get(key, default)
+
+    def items(self):
+        return self._props.items()
+
+
+class FakeRelationship:
+    """模拟 neo4j.graph.Relationship 中被结果转换用到的接口"""
+
+    def __init__(self, start_node, end_node, rel_type):
+        self.start_node = start_node
+        self.end_node = end_node
+        self.type = rel_type
+
+
+def node_key(node):
+    """与投影查询一致的节点ID：coalesce(n.id, n.name)"""
+    value = node.get('id')
+    return str(value if value is not None else node.get('name'))
+
+
+def synthetic_paths(path_count, depth, max_nodes, seed=0):
+    """
+    生成围绕一部电影的合成路径结果，路径按 Movie<-User->Movie->Genre 的顺序延伸
+
+    Returns:
+        tuple: (起始节点, paths模式的记录列表, projection模式的记录)
+    """
+    rng = random.Random(seed)
+    start = FakeNode('Movie', {'id': 1, 'title': 'Toy Story', 'year': 1995})
+    users = [FakeNode('User', {'id': i}) for i in range(1, 611)]
+    movies = [FakeNode('Movie', {'id': i, 'title': f'Movie {i}', 'year': 1990 + i % 30}) for i in range(2, 2000)]
+    genres = [FakeNode('Genre', {'name': f'Genre {i}'}) for i in range(19)]
+
+    records = []
+    for _ in range(path_count):
+        user, movie, genre = rng.choice(users), rng.choice(movies), rng.choice(genres)
+        hops = [
+            (user, FakeRelationship(user, start, 'RATED')),
+            (movie, FakeRelationship(user, movie, 'RATED')),
+            (genre, FakeRelationship(movie, genre, 'IN_GENRE')),
+        ][:depth]
+        records.append({'start': start, 'related': hops[-1][0], 'rels': [rel for _, rel in hops]})
+
+    # 与投影查询相同的去重结果：节点按首次出现的顺序取前 max_nodes 个，关系各出现一次且两端都在节点中
+    node_dicts = {node_key(start): start}
+    link_set = set()
+    for record in records:
+        for rel in record['rels']:
+            node_dicts.setdefault(node_key(rel.start_node), rel.start_node)
+            node_dicts.setdefault(node_key(rel.end_node), rel.end_node)
+            link_set.add((node_key(rel.start_node), node_key(rel.end_node), rel.type))
+    node_dicts = dict(list(node_dicts.items())[:max_nodes])
+    projected = {
+        'nodes': [
+            {
+                'id': key,
+                'name': node.get('title') or node.get('name') or f"{next(iter(node.labels))}_{key}",
+                'type': next(iter(node.labels)),
+                'properties': dict(node.items()),
+            }
+            for key, node in node_dicts.items()
+        ],
+        'links': [{'source': s, 'target': t, 'type': r} for s, t, r in link_set
+                  if s in node_dicts and t in node_dicts],
+    }
+    return start, records, projected
+
+
+def main():
+    parser = argparse.ArgumentParser(description="关系网络结果转换的微基准")
+    parser.add_argument("--paths", type=int, default=1000, help="路径数量（paths模式的记录数）")
+    parser.add_argument("--depth", type=int, default=3, help="路径长度")
+    parser.add_argument("--max-nodes", type=int, default=500, help="最大节点数")
+    parser.add_argument("--repeat", type=int, default=50, help="重复次数")
+    args = parser.parse_args()
+
+    start, records, projected = synthetic_paths(args.paths, args.depth, args.max_nodes)
+
+    paths_seconds = min(timeit.repeat(
+        lambda: build_movie_network(start, records, args.max_nodes), number=1, repeat=args.repeat
+    ))
+    projection_seconds = min(timeit.repeat(
+        lambda: build_projected_network(projected), number=1, repeat=args.repeat
+    ))
+
+    print(f"路径数 {args.paths}，深度 {args.depth}，最大节点数 {args.max_nodes}")
+    print(f"paths 模式转换:      {paths_seconds * 1000:.3f} ms")
+    print(f"projection 模式转换: {projection_seconds * 1000:.3f} ms")
+    print(f"加速比: {paths_seconds / max(projection_seconds, 1e-12):.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+import argparse
+import os
+import random
+import sys
+import time
+
+import pandas as pd
+from neo4j import GraphDatabase
+from dotenv import load_dotenv
+
+# 加载环境变量
+load_dotenv()
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from tag_vectors import TAG_MODEL_DIR, TagVectors, load_tags_csv, movie_tag_counts  # noqa: E402
+from graph_snapshot import DEFAULT_DATA_DIR  # noqa: E402
+from compute_user_similarity import bump_data_version  # noqa: E402
+from load_test import percentile  # noqa: E402
+
+# 导入脚本物化的每部电影的标签计数（见 import_data.update_tag_counts）
+MOVIE_TAG_COUNTS_QUERY = """
+MATCH (m:Movie)-[h:HAS_TAG]->(t:Tag)
+RETURN m.id as movie_id, t.name as tag, h.count as count
+"""
+
+
+class TagVectorJob:
+    """
+    从图中的 HAS_TAG 计数构建TF-IDF标签向量并保存到模型目录
+
+    导入数据后运行（import_data.py 默认会调用）；服务端检测到新的 meta.json 后自动重新加载。
+    """
+
+    def __init__(self, driver, output_dir=TAG_MODEL_DIR):
+        self.driver = driver
+        self.output_dir = output_dir
+
+    def run(self):
+        """
+        Returns:
+            TagVectors: 构建好的标签向量，图中没有标签时为None
+        """
+        start = time.perf_counter()
+        with self.driver.session() as session:
+            counts = pd.DataFrame([dict(record) for record in session.run(MOVIE_TAG_COUNTS_QUERY)],
+                                  columns=['movie_id', 'tag', 'count'])
+        print(f"[标签向量] 读取 {len(counts)} 条电影标签计数，耗时 {time.perf_counter() - start:.1f} 秒")
+        if counts.empty:
+            print("[标签向量] 图中没有标签，跳过")
+            return None
+        model = build_and_save(counts, self.output_dir, source='neo4j')
+        # 推荐结果缓存按数据版本失效
+        bump_data_version(self.driver)
+        return model
+
+
+def build_and_save(counts, output_dir, source):
+    """构建TF-IDF标签向量并保存"""
+    model = TagVectors.build(counts)
+    model.meta['source'] = source
+    model.save(output_dir)
+    print(f"[标签向量] 已保存到 {output_dir}：{model.meta}")
+    return model
+
+
+def benchmark(model, requests, seed=0):
+    """用保存后的mmap版本测量三种查询的单次延迟"""
+    rng = random.Random(seed)
+    movie_ids = model.movie_ids.tolist()
+    tags = [tag for tag, _ in model.search_tags(limit=200)]
+    scenarios = {
+        '相似电影 similar_movies': lambda: model.similar_movies(rng.choice(movie_ids), 10),
+        '按标签找电影 movies_by_tag': lambda: model.movies_by_tag(rng.choice(tags), 20),
+        '标签前缀搜索 search_tags': lambda: model.search_tags(rng.choice(tags)[:2], 20),
+        '标签推荐 recommend': lambda: model.recommend(
+            [(movie_id, 5.0) for movie_id in rng.sample(movie_ids, 20)], limit=20
+        ),
+    }
+    for name, function in scenarios.items():
+        latencies = []
+        for _ in range(requests):
+            start = time.perf_counter()
+            function()
+            latencies.append((time.perf_counter() - start) * 1000)
+        print(f"{name:<28} p50 {percentile(latencies, 50):.4f} ms  p99 {percentile(latencies, 99):.4f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="构建电影的TF-IDF标签向量（标签相关接口和推荐策略5），保存为 .npy 文件；"
+                    "之后运行 compute_recommendations.py 更新预计算推荐"
+    )
+    parser.add_argument("--source", choices=["csv", "neo4j"], default="csv", help="标签数据来源")
+    parser.add_argument("--data-dir", default=DEFAULT_DATA_DIR, help="source=csv 时的MovieLens数据目录")
+    parser.add_argument("--output-dir", default=TAG_MODEL_DIR, help="输出目录（服务端读取 TAG_MODEL_DIR）")
+    parser.add_argument("--benchmark", type=int, default=1000, help="构建后每种查询的测量次数，0表示不测量")
+    args = parser.parse_args()
+
+    if args.source == "neo4j":
+        driver = GraphDatabase.driver(
+            os.getenv("NEO4J_URI", "bolt://localhost:7687"),
+            auth=(os.getenv("NEO4J_USER", "neo4j"), os.getenv("NEO4J_PASSWORD", "password")),
+        )
+        try:
+            model = TagVectorJob(driver, args.output_dir).run()
+        finally:
+            driver.close()
+    else:
+        start = time.perf_counter()
+        tags = load_tags_csv(args.data_dir)
+        counts = movie_tag_counts(tags)
+        print(f"[标签向量] 读取 {len(tags)} 条标签，归并为 {len(counts)} 条电影标签计数，"
+              f"耗时 {time.perf_counter() - start:.1f} 秒")
+        model = build_and_save(counts, args.output_dir, source='csv') if not counts.empty else None
+
+    if model is not None and args.benchmark > 0:
+        benchmark(TagVectors.load(args.output_dir), args.benchmark)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+import argparse
+import os
+import time
+
+import numpy as np
+from neo4j import GraphDatabase
+from scipy import sparse
+from dotenv import load_dotenv
+
+from compute_user_similarity import bump_data_version, load_ratings
+from similarity import center_by_user_mean, top_k_cosine
+
+# 加载环境变量
+load_dotenv()
+
+# 每部电影保留的相似电影数
+DEFAULT_TOP_N = 20
+
+# 至少被这么多位用户共同评分才算相似电影（过滤偶然的共现）
+MIN_COMMON_USERS = 3
+
+# 每次计算相似度的电影行数
+DEFAULT_BLOCK_SIZE = 1024
+
+# 写回Neo4j时每个事务处理的电影数
+WRITE_BATCH_SIZE = 500
+
+
+class MovieSimilarityJob:
+    """
+    离线计算电影-电影相似度并写回 SIMILAR_MOVIE 关系
+
+    使用调整余弦相似度：先减去每位用户的平均评分，再对 电影×用户 矩阵的行
+    计算余弦相似度。每部电影保留至少 MIN_COMMON_USERS 位共同评分用户、
+    相似度为正的前 top_n 部电影：
+    (m:Movie)-[:SIMILAR_MOVIE {score, common_users}]->(other:Movie)
+
+    推荐时每部喜欢的电影只展开 top_n 条边，与类型大小无关。
+    """
+
+    def __init__(self, driver, top_n=DEFAULT_TOP_N, block_size=DEFAULT_BLOCK_SIZE):
+        self.driver = driver
+        self.top_n = top_n
+        self.block_size = block_size
+
+    def run(self):
+        """
+        全量重算并替换所有 SIMILAR_MOVIE 关系
+
+        Returns:
+            int: 写入了相似关系的电影数
+        """
+        start = time.perf_counter()
+        user_ids, movie_ids, ratings, _ = load_ratings(self.driver)
+        if len(user_ids) == 0:
+            print("[相似电影] 没有评分数据，跳过")
+            return 0
+
+        matrix, movies = self.adjusted_rating_matrix(user_ids, movie_ids, ratings)
+        neighbours = self.compute_neighbours(matrix)
+        self._write_neighbours(movies, neighbours)
+        bump_data_version(self.driver)
+
+        print(f"[相似电影] {len(movies)} 部电影，耗时 {time.perf_counter() - start:.1f} 秒")
+        return len(movies)
+
+    def compute_neighbours(self, matrix):
+        """计算每部电影的 top_n 相似电影，见 top_k_cosine"""
+        return top_k_cosine(matrix, np.arange(matrix.shape[0]), self.top_n, self.block_size, MIN_COMMON_USERS)
+
+    @staticmethod
+    def adjusted_rating_matrix(user_ids, movie_ids, ratings):
+        """
+        构建按用户均值中心化的 电影×用户 CSR矩阵
+
+        Returns:
+            tuple: (矩阵, 行号对应的电影ID数组)
+        """
+        movies, movie_index = np.unique(movie_ids, return_inverse=True)
+        _, user_index = np.unique(user_ids, return_inverse=True)
+        centered = center_by_user_mean(ratings, user_index)
+        matrix = sparse.csr_matrix(
+            (centered, (movie_index, user_index)),
+            shape=(len(movies), user_index.max() + 1),
+        )
+        return matrix, movies
+
+    def _write_neighbours(self, movies, neighbours):
+        """替换全部电影的 SIMILAR_MOVIE 关系"""
+        rows = [
+            {
+                'movie_id': int(movies[i]),
+                'neighbours': [
+                    {'movie_id': int(movies[j]), 'score': float(score), 'common_users': int(common)}
+                    for j, score, common in zip(order, scores, commons)
+                ],
+            }
+            for i, (order, scores, commons) in enumerate(neighbours)
+        ]
+        with self.driver.session() as session:
+            for offset in range(0, len(rows), WRITE_BATCH_SIZE):
+                session.execute_write(self._replace_similar_movie, rows[offset:offset + WRITE_BATCH_SIZE])
+
+    @staticmethod
+    def _replace_similar_movie(tx, rows):
+        query = """
+        UNWIND $rows AS row
+        MATCH (m:Movie {id: row.movie_id})
+        OPTIONAL MATCH (m)-[old:SIMILAR_MOVIE]->()
+        DELETE old
+        WITH DISTINCT m, row
+        UNWIND row.neighbours AS n
+        MATCH (other:Movie {id: n.movie_id})
+        CREATE (m)-[:SIMILAR_MOVIE {score: n.score, common_users: n.common_users}]->(other)
+        """
+        tx.run(query, rows=rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="计算电影相似度并写入 SIMILAR_MOVIE 关系")
+    parser.add_argument("--top-n", type=int, default=DEFAULT_TOP_N, help="每部电影保留的相似电影数")
+    parser.add_argument("--block-size", type=int, default=DEFAULT_BLOCK_SIZE, help="每块计算的电影数")
+    args = parser.parse_args()
+
+    driver = GraphDatabase.driver(
+        os.getenv("NEO4J_URI", "bolt://localhost:7687"),
+        auth=(os.getenv("NEO4J_USER", "neo4j"), os.getenv("NEO4J_PASSWORD", "password")),
+    )
+    try:
+        MovieSimilarityJob(driver, top_n=args.top_n, block_size=args.block_size).run()
+    finally:
+        driver.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from neo4j import GraphDatabase
+from dotenv import load_dotenv
+
+# 加载环境变量
+load_dotenv()
+
+# 复用服务端的推荐实现和存储格式
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from database import (  # noqa: E402
+    IMPORT_STATE_SOURCE, RECOMMENDATION_STORE_TOP_N, RECOMMENDATION_STORE_MIN_RATING, stored_recommendation_rows,
+)
+from graph_snapshot import GraphSnapshot  # noqa: E402
+from compute_user_similarity import bump_data_version  # noqa: E402
+
+# 默认工作进程数
+DEFAULT_WORKERS = os.cpu_count() or 4
+
+# 每个任务计算的用户数
+CHUNK_SIZE = 32
+
+# 写回Neo4j时每个事务处理的用户数（每位用户最多 top_n 条关系）
+WRITE_BATCH_SIZE = 100
+
+# 分批删除旧关系时每个事务删除的数量
+DELETE_BATCH_SIZE = 10000
+
+# 工作进程中的图快照（fork时直接继承父进程的内存，不需要序列化）
+_snapshot = None
+
+
+def _init_worker(snapshot):
+    global _snapshot
+    _snapshot = snapshot
+
+
+def _recommend_chunk(user_ids, top_n):
+    """在工作进程中为一组用户计算推荐，返回写入参数列表"""
+    rows = []
+    for user_id in user_ids:
+        result = _snapshot.recommendations(user_id, limit=top_n, min_rating=RECOMMENDATION_STORE_MIN_RATING)
+        rows.append({'user_id': int(user_id), **stored_recommendation_rows(result)})
+    return rows
+
+
+class RecommendationJob:
+    """
+    离线为全部用户预计算推荐并写回Neo4j
+
+    从图中加载内存快照（graph_snapshot.GraphSnapshot），推荐算法与实时接口完全相同；
+    所有电影的相似电影在父进程中一次算好，再fork出进程池分块计算各用户的推荐。
+    结果写为 (u:User)-[:RECOMMENDED {rank, strategy, reason}]->(m:Movie)，
+    推理过程以JSON保存在 rank 1 关系的 reasoning 属性上，接口的store模式一次索引查找即可返回。
+    """
+
+    def __init__(self, driver, top_n=RECOMMENDATION_STORE_TOP_N, workers=DEFAULT_WORKERS):
+        self.driver = driver
+        self.top_n = top_n
+        self.workers = workers
+
+    def run(self):
+        """
+        重新计算并替换全部用户的 RECOMMENDED 关系
+
+        Returns:
+            int: 写入了推荐的用户数
+        """
+        start = time.perf_counter()
+        snapshot = GraphSnapshot.from_neo4j(self.driver)
+        if snapshot.n_users == 0:
+            print("[预计算推荐] 没有用户数据，跳过")
+            return 0
+        snapshot.similar_movies(list(range(snapshot.n_movies)))
+        print(f"[预计算推荐] 快照加载完成 {snapshot.stats()}，耗时 {time.perf_counter() - start:.1f} 秒")
+
+        rows = self.compute(snapshot)
+        print(f"[预计算推荐] 已计算 {len(rows)} 位用户，耗时 {time.perf_counter() - start:.1f} 秒")
+
+        self._write(rows)
+        bump_data_version(self.driver)
+        print(f"[预计算推荐] 完成，耗时 {time.perf_counter() - start:.1f} 秒")
+        return len(rows)
+
+    def compute(self, snapshot):
+        """在进程池中计算全部用户的推荐，返回写入参数列表"""
+        user_ids = snapshot.user_ids.tolist()
+        chunks = [user_ids[offset:offset + CHUNK_SIZE] for offset in range(0, len(user_ids), CHUNK_SIZE)]
+        if self.workers <= 1:
+            _init_worker(snapshot)
+            return [row for chunk in chunks for row in _recommend_chunk(chunk, self.top_n)]
+
+        # fork时快照随进程内存继承；不支持fork的平台上initargs会被序列化传给每个进程
+        methods = multiprocessing.get_all_start_methods()
+        context = multiprocessing.get_context('fork' if 'fork' in methods else None)
+        rows = []
+        with ProcessPoolExecutor(max_workers=self.workers, mp_context=context,
+                                 initializer=_init_worker, initargs=(snapshot,)) as executor:
+            for done, chunk_rows in enumerate(executor.map(_recommend_chunk, chunks, [self.top_n] * len(chunks)), 1):
+                rows.extend(chunk_rows)
+                if done % 5 == 0 or done == len(chunks):
+                    print(f"[预计算推荐] 已完成 {len(rows)}/{len(user_ids)} 位用户")
+        return rows
+
+    def _write(self, rows):
+        """删除旧的 RECOMMENDED 关系后分批写入新结果"""
+        with self.driver.session() as session:
+            # CALL { ... } IN TRANSACTIONS 只能在自动提交事务中执行
+            session.run(f"""
+            MATCH ()-[r:RECOMMENDED]->()
+            CALL {{ WITH r DELETE r }} IN TRANSACTIONS OF {DELETE_BATCH_SIZE} ROWS
+            """).consume()
+            # 旧版本把推理过程保存在 User 节点上，会随节点属性出现在网络/路径接口中
+            session.run(f"""
+            MATCH (u:User) WHERE u.recommendation_reasoning IS NOT NULL
+            CALL {{ WITH u REMOVE u.recommendation_reasoning }} IN TRANSACTIONS OF {DELETE_BATCH_SIZE} ROWS
+            """).consume()
+            for offset in range(0, len(rows), WRITE_BATCH_SIZE):
+                session.execute_write(self._create_recommended, rows[offset:offset + WRITE_BATCH_SIZE])
+            session.run("""
+            MERGE (s:ImportState {source: $source})
+            SET s.recommendations_updated_at = datetime(), s.recommendations_top_n = $top_n
+            """, source=IMPORT_STATE_SOURCE, top_n=self.top_n).consume()
+
+    @staticmethod
+    def _create_recommended(tx, rows):
+        query = """
+        UNWIND $rows AS row
+        MATCH (u:User {id: row.user_id})
+        UNWIND row.recommendations AS rec
+        MATCH (m:Movie {id: rec.movie_id})
+        CREATE (u)-[r:RECOMMENDED {rank: rec.rank, strategy: rec.strategy, reason: rec.reason}]->(m)
+        SET r.reasoning = CASE WHEN rec.rank = 1 THEN row.reasoning END
+        """
+        tx.run(query, rows=rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="为全部用户预计算推荐并写入 RECOMMENDED 关系")
+    parser.add_argument("--top-n", type=int, default=RECOMMENDATION_STORE_TOP_N, help="每位用户保存的推荐数")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="计算推荐的进程数")
+    args = parser.parse_args()
+
+    driver = GraphDatabase.driver(
+        os.getenv("NEO4J_URI", "bolt://localhost:7687"),
+        auth=(os.getenv("NEO4J_USER", "neo4j"), os.getenv("NEO4J_PASSWORD", "password")),
+    )
+    try:
+        RecommendationJob(driver, top_n=args.top_n, workers=args.workers).run()
+    finally:
+        driver.close()
+
+
+if __name__ == "__main__":
+    main()
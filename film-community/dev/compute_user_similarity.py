@@ -0,0 +1,235 @@
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+from neo4j import GraphDatabase
+from scipy import sparse
+from dotenv import load_dotenv
+
+# 加载环境变量
+load_dotenv()
+
+# 复用服务端的导入状态定义
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from database import IMPORT_STATE_SOURCE, BUMP_DATA_VERSION_QUERY  # noqa: E402
+from similarity import CosineNeighbours  # noqa: E402
+
+# 每个用户保留的相似用户数
+DEFAULT_TOP_K = 20
+
+# 与推荐查询保持一致：至少共同评分这么多部电影才算相似用户
+MIN_COMMON_MOVIES = 3
+
+# 每次计算相似度的用户行数（控制稠密中间矩阵的内存占用）
+DEFAULT_BLOCK_SIZE = 512
+
+# 写回Neo4j时每个事务处理的用户数
+WRITE_BATCH_SIZE = 500
+
+# 水位线之后有新评分的用户；与水位线相同时间戳的评分也算（可能在上次计算之后才导入）
+CHANGED_USERS_QUERY = """
+MATCH (u:User)-[r:RATED]->()
+WHERE r.timestamp >= $watermark
+RETURN DISTINCT u.id as user_id
+"""
+
+# 当前把这些用户列为邻居的用户
+LISTING_USERS_QUERY = """
+MATCH (other:User)-[:SIMILAR_TO]->(u:User)
+WHERE u.id IN $user_ids
+RETURN DISTINCT other.id as user_id
+"""
+
+# 每个用户进入其 top_k 所需的最低相似度：当前第 top_k 个邻居的相似度，邻居不足 top_k 个时为0
+NEIGHBOUR_THRESHOLD_QUERY = """
+MATCH (u:User)
+OPTIONAL MATCH (u)-[s:SIMILAR_TO]->()
+WITH u, count(s) as neighbours, min(s.score) as lowest
+RETURN u.id as user_id, CASE WHEN neighbours >= $top_k THEN lowest ELSE 0.0 END as threshold
+"""
+
+
+def bump_data_version(driver):
+    """更新图中的数据版本，使API的结果缓存失效"""
+    with driver.session() as session:
+        session.run(BUMP_DATA_VERSION_QUERY, source=IMPORT_STATE_SOURCE).consume()
+
+
+def load_ratings(driver):
+    """
+    从图中读取全部评分
+
+    Returns:
+        tuple: (用户ID数组, 电影ID数组, 评分数组, 最大时间戳)，无评分时时间戳为None
+    """
+    with driver.session() as session:
+        result = session.run("""
+        MATCH (u:User)-[r:RATED]->(m:Movie)
+        RETURN u.id as user_id, m.id as movie_id, r.rating as rating, r.timestamp as timestamp
+        """)
+        rows = [(record['user_id'], record['movie_id'], record['rating'], record['timestamp']) for record in result]
+
+    if not rows:
+        return np.array([]), np.array([]), np.array([]), None
+    user_ids, movie_ids, ratings, timestamps = (np.array(column) for column in zip(*rows))
+    return user_ids, movie_ids, ratings, int(timestamps.max())
+
+
+class UserSimilarityJob:
+    """
+    离线计算用户-用户相似度并写回 SIMILAR_TO 关系
+
+    以稀疏的 用户×电影 评分矩阵计算余弦相似度，同时用0/1矩阵统计共同评分数，
+    为每个用户保留共同评分数 >= MIN_COMMON_MOVIES 的前 top_k 个邻居：
+    (u:User)-[:SIMILAR_TO {score, common_movies}]->(other:User)
+    """
+
+    def __init__(self, driver, top_k=DEFAULT_TOP_K, block_size=DEFAULT_BLOCK_SIZE):
+        self.driver = driver
+        self.top_k = top_k
+        self.block_size = block_size
+
+    def run(self, incremental=True):
+        """
+        刷新相似度关系
+
+        Args:
+            incremental: 为True且存在水位线时，只重算受新评分影响的用户（见 _affected_users），
+                         结果与全量重算相同；否则全量重算
+
+        Returns:
+            int: 写入了相似关系的用户数
+        """
+        start = time.perf_counter()
+        user_ids, movie_ids, ratings, max_timestamp = load_ratings(self.driver)
+        if len(user_ids) == 0:
+            print("[相似用户] 没有评分数据，跳过")
+            return 0
+
+        matrix, users = self._rating_matrix(user_ids, movie_ids, ratings)
+        model = CosineNeighbours(matrix, self.top_k, MIN_COMMON_MOVIES)
+        watermark = self._load_watermark() if incremental else None
+
+        if watermark is None:
+            targets = np.arange(len(users))
+            print(f"[相似用户] 全量计算 {len(users)} 位用户")
+        else:
+            targets = self._affected_users(model, users, watermark)
+            print(f"[相似用户] 增量计算：水位线 {watermark}，需要刷新 {len(targets)} 位用户")
+
+        neighbours = model.compute(targets, self.block_size)
+        self._write_neighbours(users, targets, neighbours)
+        self._save_watermark(max_timestamp)
+        bump_data_version(self.driver)
+
+        print(f"[相似用户] 完成，耗时 {time.perf_counter() - start:.1f} 秒")
+        return len(targets)
+
+    @staticmethod
+    def _rating_matrix(user_ids, movie_ids, ratings):
+        """由评分三元组构建CSR矩阵，返回 (矩阵, 行号对应的用户ID数组)"""
+        users, user_index = np.unique(user_ids, return_inverse=True)
+        _, movie_index = np.unique(movie_ids, return_inverse=True)
+        matrix = sparse.csr_matrix(
+            (ratings.astype(np.float64), (user_index, movie_index)),
+            shape=(len(users), movie_index.max() + 1),
+        )
+        return matrix, users
+
+    def _affected_users(self, model, users, watermark):
+        """
+        增量刷新时需要重算的用户
+
+        两位用户的相似度只取决于他们自己的评分，评分有变化的用户之外，其余用户对之间的相似度不变，
+        因此重算以下用户即可得到与全量计算相同的 SIMILAR_TO：
+        - 水位线之后有新评分的用户
+        - 当前把他们列为邻居的用户（旧的相似度可能下降，需要从完整的一行中重新选邻居）
+        - 与他们的新相似度不低于自己当前 top_k 门槛的用户（新邻居可能挤进 top_k）
+
+        Args:
+            model: 当前评分矩阵上的 CosineNeighbours
+            users: 行号对应的用户ID数组
+
+        Returns:
+            ndarray: 需要重算的行号
+        """
+        with self.driver.session() as session:
+            changed_ids = [record['user_id'] for record in session.run(CHANGED_USERS_QUERY, watermark=watermark)]
+            listing_ids = [record['user_id'] for record in session.run(LISTING_USERS_QUERY, user_ids=changed_ids)]
+            thresholds = {record['user_id']: record['threshold']
+                          for record in session.run(NEIGHBOUR_THRESHOLD_QUERY, top_k=self.top_k)}
+
+        changed = np.flatnonzero(np.isin(users, changed_ids))
+        affected = np.isin(users, changed_ids + listing_ids)
+        threshold = np.array([thresholds.get(int(user_id), 0.0) for user_id in users])
+        for _, scores, _ in model.blocks(changed, self.block_size):
+            affected |= ((scores > 0) & (scores >= threshold[None, :])).any(axis=0)
+        return np.flatnonzero(affected)
+
+    def _write_neighbours(self, users, targets, neighbours):
+        """替换目标用户的 SIMILAR_TO 关系"""
+        rows = [
+            {
+                'user_id': int(users[target]),
+                'neighbours': [
+                    {'user_id': int(users[j]), 'score': float(score), 'common_movies': int(common)}
+                    for j, score, common in zip(order, scores, commons)
+                ],
+            }
+            for target, (order, scores, commons) in zip(targets, neighbours)
+        ]
+        with self.driver.session() as session:
+            for offset in range(0, len(rows), WRITE_BATCH_SIZE):
+                session.execute_write(self._replace_similar_to, rows[offset:offset + WRITE_BATCH_SIZE])
+
+    @staticmethod
+    def _replace_similar_to(tx, rows):
+        query = """
+        UNWIND $rows AS row
+        MATCH (u:User {id: row.user_id})
+        OPTIONAL MATCH (u)-[old:SIMILAR_TO]->()
+        DELETE old
+        WITH DISTINCT u, row
+        UNWIND row.neighbours AS n
+        MATCH (other:User {id: n.user_id})
+        CREATE (u)-[:SIMILAR_TO {score: n.score, common_movies: n.common_movies}]->(other)
+        """
+        tx.run(query, rows=rows)
+
+    def _load_watermark(self):
+        with self.driver.session() as session:
+            record = session.run(
+                "MATCH (s:ImportState {source: $source}) RETURN s.similarity_max_timestamp as watermark",
+                source=IMPORT_STATE_SOURCE
+            ).single()
+            return record['watermark'] if record else None
+
+    def _save_watermark(self, max_timestamp):
+        with self.driver.session() as session:
+            session.run("""
+            MERGE (s:ImportState {source: $source})
+            SET s.similarity_max_timestamp = $watermark
+            """, source=IMPORT_STATE_SOURCE, watermark=max_timestamp).consume()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="计算用户相似度并写入 SIMILAR_TO 关系")
+    parser.add_argument("--full", action="store_true", help="忽略水位线，全量重算")
+    parser.add_argument("--top-k", type=int, default=DEFAULT_TOP_K, help="每个用户保留的相似用户数")
+    parser.add_argument("--block-size", type=int, default=DEFAULT_BLOCK_SIZE, help="每块计算的用户数")
+    args = parser.parse_args()
+
+    driver = GraphDatabase.driver(
+        os.getenv("NEO4J_URI", "bolt://localhost:7687"),
+        auth=(os.getenv("NEO4J_USER", "neo4j"), os.getenv("NEO4J_PASSWORD", "password")),
+    )
+    try:
+        UserSimilarityJob(driver, top_k=args.top_k, block_size=args.block_size).run(incremental=not args.full)
+    finally:
+        driver.close()
+
+
+if __name__ == "__main__":
+    main()
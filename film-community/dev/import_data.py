@@ -1,54 +1,328 @@
+import argparse
+import hashlib
+import queue
+import random
+import sys
+import threading
+import time
+from collections import Counter
+
 import pandas as pd
 from neo4j import GraphDatabase
+from neo4j.exceptions import ServiceUnavailable, SessionExpired, TransientError
 import os
 from dotenv import load_dotenv
 
 # 加载环境变量
 load_dotenv()
 
+# 复用服务端的模式定义
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import schema  # noqa: E402
+from database import IMPORT_STATE_SOURCE  # noqa: E402
+from rating_stats import movie_rating_stats, rating_histogram  # noqa: E402
+from movie_titles import parse_movie_title, parse_movie_titles  # noqa: E402
+from tag_vectors import movie_tag_counts  # noqa: E402
+from compute_user_similarity import UserSimilarityJob  # noqa: E402
+from compute_movie_similarity import MovieSimilarityJob  # noqa: E402
+from compute_recommendations import RecommendationJob  # noqa: E402
+from build_tag_vectors import TagVectorJob  # noqa: E402
+
+# 数据集目录（相对于dev目录）
+DATA_DIR = '../ml-latest-small'
+
+# 批量导入时每个事务写入的行数
+DEFAULT_BATCH_SIZE = 5000
+
+# 并行导入的默认工作线程数
+DEFAULT_WORKERS = 4
+
+# 并行写入遇到死锁/瞬时错误时的最大重试次数
+MAX_WRITE_RETRIES = 5
+
+# 可重试的异常（死锁属于TransientError）
+RETRYABLE_ERRORS = (TransientError, ServiceUnavailable, SessionExpired)
+
+# 分批删除时每个事务删除的节点数
+DELETE_BATCH_SIZE = 10000
+
 
 class MovieLensImporter:
-    def __init__(self, uri, user, password):
+    def __init__(self, uri, user, password, batch_size=DEFAULT_BATCH_SIZE):
         self.driver = GraphDatabase.driver(uri, auth=(user, password))
+        self.batch_size = batch_size
 
     def close(self):
         self.driver.close()
 
-    def import_all_data(self):
-        """导入所有数据"""
+    def import_all_data(self, mode='batch', workers=DEFAULT_WORKERS):
+        """
+        导入所有数据
+
+        Args:
+            mode: 导入模式
+                  - 'batch': 按块读取CSV，每块一个UNWIND事务
+                  - 'parallel': 电影批量导入后，评分和标签按userId分区并行写入
+                  - 'row': 逐行写入
+                  - 'incremental': 不清空数据库，只写入相对水位线新增或变化的数据
+            workers: parallel模式下的工作线程数
+        """
+        if mode == 'incremental':
+            self.import_incremental()
+            return
+
         print("开始导入MovieLens数据...")
 
+        # 先建立约束和索引，使后续MERGE走索引查找
+        self.ensure_schema()
+
         # 清空现有数据（可选，第一次运行时使用）
         self.clear_database()
 
-        # 导入电影和类型
-        self.import_movies_and_genres()
+        if mode == 'batch':
+            self.import_movies_and_genres_batched()
+            self.import_ratings_batched()
+            self.import_tags_batched()
+        elif mode == 'parallel':
+            self.import_movies_and_genres_batched()
+            self.import_ratings_parallel(workers)
+            self.import_tags_parallel(workers)
+        else:
+            # 导入电影和类型
+            self.import_movies_and_genres()
+
+            # 导入用户和评分
+            self.import_ratings()
 
-        # 导入用户和评分
-        self.import_ratings()
+            # 导入标签
+            self.import_tags()
 
-        # 导入标签
-        self.import_tags()
+        self.update_user_stats()
+        self.update_movie_stats()
+        self.update_tag_counts()
+
+        # 记录水位线，之后可以使用增量模式
+        self.save_import_state(self.compute_file_state())
 
         print("数据导入完成！")
 
-    def clear_database(self):
-        """清空数据库（谨慎使用）"""
+    def import_incremental(self):
+        """
+        增量导入
+
+        与图中保存的水位线比较：
+        - 文件校验和未变化的CSV直接跳过
+        - 电影：与图中现有的标题/年份/类型逐条比较，只写入新增或变化的电影
+        - 评分/标签：只写入时间戳不早于上次最大时间戳的记录（重新评分会产生新时间戳；
+          与水位线相等的记录会被重复写入，MERGE 保证幂等）
+
+        注意：CSV中被删除的记录不会从图中删除，需要时请执行全量导入。
+        """
+        print("开始增量导入MovieLens数据...")
+        self.ensure_schema()
+
+        previous = self.load_import_state()
+        current = self.compute_file_state()
+        if previous is None:
+            print("未找到导入水位线，将按增量方式写入全部数据")
+            previous = {}
+
+        if previous.get('movies_checksum') != current['movies_checksum']:
+            self.import_changed_movies()
+        else:
+            print("movies.csv 未变化，跳过")
+
+        for stage, filename, key, to_rows, write_batch in (
+            ('评分', 'ratings.csv', 'ratings', self._rating_rows, self._create_ratings_batch),
+            ('标签', 'tags.csv', 'tags', self._tag_rows, self._create_tags_batch),
+        ):
+            if previous.get(f'{key}_checksum') == current[f'{key}_checksum']:
+                print(f"{filename} 未变化，跳过")
+                continue
+            watermark = previous.get(f'{key}_max_timestamp')
+            row_filter = None
+            if watermark is not None:
+                print(f"[{stage}] 水位线时间戳: {watermark}")
+                # 时间戳等于水位线的记录也重新写入：同一秒内可能有上次未导入的行，MERGE 保证重复写入幂等
+                row_filter = lambda chunk, wm=watermark: chunk[chunk['timestamp'] >= wm]
+            self._import_csv_in_batches(stage, filename, to_rows, write_batch, row_filter=row_filter)
+
+        self.update_user_stats(previous.get('ratings_max_timestamp'))
+        if previous.get('movies_checksum') != current['movies_checksum'] \
+                or previous.get('ratings_checksum') != current['ratings_checksum']:
+            self.update_movie_stats()
+        if previous.get('tags_checksum') != current['tags_checksum']:
+            self.update_tag_counts()
+        self.save_import_state(current)
+        print("增量导入完成！")
+
+    def import_changed_movies(self):
+        """只写入新增或标题/年份/类型发生变化的电影"""
+        movies_df = pd.read_csv(os.path.join(DATA_DIR, 'movies.csv'))
+        incoming = self._movie_rows(movies_df)
+
         with self.driver.session() as session:
-            session.execute_write(self._clear_database)
-            print("数据库已清空")
+            existing = {
+                record['id']: (record['title'], record['year'], sorted(record['genres']))
+                for record in session.run("""
+                MATCH (m:Movie)
+                OPTIONAL MATCH (m)-[:IN_GENRE]->(g:Genre)
+                RETURN m.id as id, m.title as title, m.year as year, collect(g.name) as genres
+                """)
+            }
+            changed = [
+                row for row in incoming
+                if existing.get(row['movie_id']) != (row['title'], row['year'], sorted(row['genres']))
+            ]
+            print(f"[电影] 共 {len(incoming)} 部，其中新增或变化 {len(changed)} 部")
+            for start in range(0, len(changed), self.batch_size):
+                session.execute_write(self._upsert_movies_batch, changed[start:start + self.batch_size])
 
     @staticmethod
-    def _clear_database(tx):
-        query = "MATCH (n) DETACH DELETE n"
-        tx.run(query)
+    def compute_file_state():
+        """计算每个CSV的校验和以及评分/标签的最大时间戳"""
+        state = {}
+        for key in ('movies', 'ratings', 'tags'):
+            path = os.path.join(DATA_DIR, f'{key}.csv')
+            digest = hashlib.md5()
+            with open(path, 'rb') as f:
+                for block in iter(lambda: f.read(1 << 20), b''):
+                    digest.update(block)
+            state[f'{key}_checksum'] = digest.hexdigest()
+
+            if key != 'movies':
+                max_timestamp = None
+                for chunk in pd.read_csv(path, usecols=['timestamp'], chunksize=DEFAULT_BATCH_SIZE * 20):
+                    chunk_max = int(chunk['timestamp'].max())
+                    max_timestamp = chunk_max if max_timestamp is None else max(max_timestamp, chunk_max)
+                state[f'{key}_max_timestamp'] = max_timestamp
+        return state
+
+    def load_import_state(self):
+        """读取图中保存的导入水位线，不存在时返回None"""
+        with self.driver.session() as session:
+            record = session.run(
+                "MATCH (s:ImportState {source: $source}) RETURN properties(s) as state",
+                source=IMPORT_STATE_SOURCE
+            ).single()
+            return dict(record['state']) if record else None
+
+    def save_import_state(self, state):
+        """保存导入水位线，并更新数据版本使API的结果缓存失效"""
+        with self.driver.session() as session:
+            session.run("""
+            MERGE (s:ImportState {source: $source})
+            SET s += $state, s.updated_at = datetime(), s.data_version = randomUUID()
+            """, source=IMPORT_STATE_SOURCE, state=state).consume()
+
+    def update_user_stats(self, since_timestamp=None):
+        """
+        维护用户搜索所需的冗余属性：rating_count（评分数）和 id_text（ID字符串，用于前缀搜索）
+
+        Args:
+            since_timestamp: 为None时刷新全部用户；否则只刷新新用户以及在该时间戳及之后有评分的用户
+        """
+        if since_timestamp is None:
+            match = "MATCH (u:User)"
+        else:
+            match = """
+            MATCH (u:User)
+            WHERE u.rating_count IS NULL
+               OR EXISTS { (u)-[r:RATED]->() WHERE r.timestamp >= $since_timestamp }
+            """
+        with self.driver.session() as session:
+            # CALL { ... } IN TRANSACTIONS 只能在自动提交事务中执行
+            summary = session.run(f"""
+            {match}
+            CALL {{
+                WITH u
+                SET u.rating_count = COUNT {{ (u)-[:RATED]->() }}, u.id_text = toString(u.id)
+            }} IN TRANSACTIONS OF {self.batch_size} ROWS
+            """, since_timestamp=since_timestamp).consume()
+            print(f"[用户] 已更新 {summary.counters.properties_set // 2} 位用户的评分数")
+
+    def update_movie_stats(self):
+        """
+        物化每部电影的评分统计：rating_count、avg_rating、bayesian_rating 和 rating_histogram
+
+        按块读取 ratings.csv，每块一次 groupby 得到各分数档的评分数，累加后统一推出各项统计
+        （见 rating_stats.py）。贝叶斯加权分依赖全站平均分，因此每次都重写全部电影，
+        增量导入时只要电影或评分有变化就调用。
+        """
+        start = time.perf_counter()
+        movie_ids = pd.read_csv(os.path.join(DATA_DIR, 'movies.csv'), usecols=['movieId'])['movieId']
+        histogram = None
+        reader = pd.read_csv(os.path.join(DATA_DIR, 'ratings.csv'), usecols=['movieId', 'rating'],
+                             chunksize=DEFAULT_BATCH_SIZE * 20)
+        for chunk in reader:
+            chunk_histogram = rating_histogram(chunk.rename(columns={'movieId': 'movie_id'}))
+            histogram = chunk_histogram if histogram is None else histogram.add(chunk_histogram, fill_value=0)
+        stats = movie_rating_stats(histogram, movie_ids=movie_ids.to_numpy())
+
+        rows = [
+            {'movie_id': int(movie_id), 'rating_count': int(count), 'avg_rating': avg_rating,
+             'bayesian_rating': float(bayesian_rating), 'rating_histogram': histogram_row}
+            for movie_id, count, avg_rating, bayesian_rating, histogram_row in zip(
+                stats.index, stats['rating_count'], stats['avg_rating'], stats['bayesian_rating'],
+                stats['rating_histogram']
+            )
+        ]
+        with self.driver.session() as session:
+            for offset in range(0, len(rows), self.batch_size):
+                session.execute_write(self._set_movie_stats_batch, rows[offset:offset + self.batch_size])
+        print(f"[电影] 已更新 {len(rows)} 部电影的评分统计（全站平均分 {stats.attrs['global_mean']:.3f}），"
+              f"耗时 {time.perf_counter() - start:.1f} 秒")
+
+    def update_tag_counts(self):
+        """
+        由 TAGGED.tags 物化 (m:Movie)-[:HAS_TAG {count}]->(t:Tag)
+
+        标签名归一化为 toLower(trim(tag))（与 tag_vectors.normalize_tags 相同），
+        count 为给该电影打过这个标签的用户数。每次都从全部 TAGGED 关系重新统计，可以重复执行；
+        引入 tags 列表之前导入的关系只有 t.tag，按单个标签统计。
+        """
+        start = time.perf_counter()
+        with self.driver.session() as session:
+            # CALL { ... } IN TRANSACTIONS 只能在自动提交事务中执行
+            summary = session.run(f"""
+            MATCH (:User)-[r:TAGGED]->(m:Movie)
+            UNWIND coalesce(r.tags, [r.tag]) AS tag
+            WITH m, toLower(trim(tag)) AS name, count(DISTINCT r) AS count
+            WHERE name <> ''
+            CALL {{
+                WITH m, name, count
+                MERGE (t:Tag {{name: name}})
+                MERGE (m)-[h:HAS_TAG]->(t)
+                SET h.count = count
+            }} IN TRANSACTIONS OF {self.batch_size} ROWS
+            """).consume()
+            print(f"[标签] 新建 {summary.counters.nodes_created} 个标签、{summary.counters.relationships_created} 条"
+                  f" HAS_TAG 关系，耗时 {time.perf_counter() - start:.1f} 秒")
+
+    def ensure_schema(self):
+        """创建唯一性约束和索引（幂等）"""
+        created = schema.ensure_schema(self.driver)
+        if created:
+            print(f"已创建约束/索引: {', '.join(created)}")
+        else:
+            print("约束和索引均已存在")
+
+    def clear_database(self):
+        """清空数据库（谨慎使用），分批删除以避免单个大事务耗尽堆内存"""
+        with self.driver.session() as session:
+            # CALL { ... } IN TRANSACTIONS 只能在自动提交事务中执行
+            session.run(f"""
+            MATCH (n)
+            CALL {{ WITH n DETACH DELETE n }} IN TRANSACTIONS OF {DELETE_BATCH_SIZE} ROWS
+            """).consume()
+            print("数据库已清空")
 
     def import_movies_and_genres(self):
         """导入电影和类型数据"""
         print("正在导入电影和类型数据...")
 
         # 读取movies.csv
-        movies_df = pd.read_csv('../ml-latest-small/movies.csv')
+        movies_df = pd.read_csv(os.path.join(DATA_DIR, 'movies.csv'))
         print(f"找到 {len(movies_df)} 部电影")
 
         with self.driver.session() as session:
@@ -71,7 +345,7 @@ class MovieLensImporter:
         """导入用户评分数据"""
         print("正在导入评分数据...")
 
-        ratings_df = pd.read_csv('../ml-latest-small/ratings.csv')
+        ratings_df = pd.read_csv(os.path.join(DATA_DIR, 'ratings.csv'))
         print(f"找到 {len(ratings_df)} 条评分记录")
 
         with self.driver.session() as session:
@@ -88,7 +362,7 @@ class MovieLensImporter:
         """导入标签数据"""
         print("正在导入标签数据...")
 
-        tags_df = pd.read_csv('../ml-latest-small/tags.csv')
+        tags_df = pd.read_csv(os.path.join(DATA_DIR, 'tags.csv'))
         print(f"找到 {len(tags_df)} 条标签记录")
 
         with self.driver.session() as session:
@@ -98,19 +372,236 @@ class MovieLensImporter:
                     row['userId'], row['movieId'], row['tag'], row['timestamp']
                 )
 
+    def import_movies_and_genres_batched(self):
+        """批量导入电影和类型数据"""
+        self._import_csv_in_batches(
+            '电影', 'movies.csv', self._movie_rows, self._create_movies_batch
+        )
+
+    def import_ratings_batched(self):
+        """批量导入用户评分数据"""
+        self._import_csv_in_batches(
+            '评分', 'ratings.csv', self._rating_rows, self._create_ratings_batch
+        )
+
+    def import_tags_batched(self):
+        """批量导入标签数据"""
+        self._import_csv_in_batches(
+            '标签', 'tags.csv', self._tag_rows, self._create_tags_batch
+        )
+
+    def _import_csv_in_batches(self, stage, filename, to_rows, write_batch, row_filter=None):
+        """
+        按块读取CSV并逐块写入Neo4j
+
+        每个块转换为参数列表后，通过一个 UNWIND $rows 事务写入，
+        并输出该阶段的进度与吞吐量。
+
+        Args:
+            stage: 阶段名称（用于日志输出）
+            filename: 数据集目录下的CSV文件名
+            to_rows: 将DataFrame块转换为参数字典列表的函数
+            write_batch: 事务函数，签名为 (tx, rows)
+            row_filter: 可选，写入前对每个DataFrame块进行过滤的函数
+
+        Returns:
+            int: 写入的总行数
+        """
+        print(f"正在批量导入{stage}数据（每批 {self.batch_size} 行）...")
+
+        total = 0
+        stage_start = time.perf_counter()
+        reader = pd.read_csv(os.path.join(DATA_DIR, filename), chunksize=self.batch_size)
+
+        with self.driver.session() as session:
+            for chunk in reader:
+                if row_filter is not None:
+                    chunk = row_filter(chunk)
+                    if chunk.empty:
+                        continue
+                rows = to_rows(chunk)
+                batch_start = time.perf_counter()
+                session.execute_write(write_batch, rows)
+                batch_elapsed = time.perf_counter() - batch_start
+
+                total += len(rows)
+                elapsed = time.perf_counter() - stage_start
+                print(
+                    f"[{stage}] 已处理 {total} 行 | "
+                    f"本批 {len(rows) / max(batch_elapsed, 1e-9):.0f} 行/秒 | "
+                    f"累计 {total / max(elapsed, 1e-9):.0f} 行/秒"
+                )
+
+        elapsed = time.perf_counter() - stage_start
+        print(f"[{stage}] 完成：{total} 行，耗时 {elapsed:.1f} 秒")
+        return total
+
+    def import_ratings_parallel(self, workers=DEFAULT_WORKERS):
+        """按userId分区并行导入评分数据（要求电影已导入）"""
+        return self._import_csv_partitioned(
+            '评分', 'ratings.csv', self._rating_rows, self._create_ratings_partition, workers
+        )
+
+    def import_tags_parallel(self, workers=DEFAULT_WORKERS):
+        """按userId分区并行导入标签数据（要求电影已导入）"""
+        return self._import_csv_partitioned(
+            '标签', 'tags.csv', self._tag_rows, self._create_tags_partition, workers
+        )
+
+    def _import_csv_partitioned(self, stage, filename, to_rows, write_batch, workers):
+        """
+        按userId分区，由工作线程池并行写入
+
+        主线程按块读取CSV，将每行按 userId % workers 分配到分区；每个分区
+        由唯一的工作线程负责，因此同一个User节点不会被多个事务同时加锁。
+        分区缓冲达到batch_size后放入该线程的有界队列（提供背压）。
+
+        Args:
+            stage: 阶段名称（用于日志输出）
+            filename: 数据集目录下的CSV文件名
+            to_rows: 将DataFrame块转换为参数字典列表的函数
+            write_batch: 事务函数，签名为 (tx, rows)
+            workers: 工作线程数
+
+        Returns:
+            list: 每个工作线程的统计信息
+        """
+        print(f"正在并行导入{stage}数据（{workers} 个线程，每批 {self.batch_size} 行）...")
+
+        queues = [queue.Queue(maxsize=2) for _ in range(workers)]
+        stats = [
+            {'worker': i, 'rows': 0, 'batches': 0, 'retries': 0, 'busy_seconds': 0.0, 'error': None}
+            for i in range(workers)
+        ]
+        threads = [
+            threading.Thread(
+                target=self._partition_worker,
+                args=(queues[i], write_batch, stats[i]),
+                name=f"{stage}-worker-{i}",
+                daemon=True,
+            )
+            for i in range(workers)
+        ]
+        for thread in threads:
+            thread.start()
+
+        stage_start = time.perf_counter()
+        buffers = [[] for _ in range(workers)]
+        try:
+            for chunk in pd.read_csv(os.path.join(DATA_DIR, filename), chunksize=self.batch_size):
+                partitions = (chunk['userId'] % workers).to_numpy()
+                for partition, group in chunk.groupby(partitions):
+                    buffers[partition].extend(to_rows(group))
+                    if len(buffers[partition]) >= self.batch_size:
+                        queues[partition].put(buffers[partition])
+                        buffers[partition] = []
+            for partition, rows in enumerate(buffers):
+                if rows:
+                    queues[partition].put(rows)
+        finally:
+            # 结束标记
+            for q in queues:
+                q.put(None)
+            for thread in threads:
+                thread.join()
+
+        elapsed = time.perf_counter() - stage_start
+        total = sum(stat['rows'] for stat in stats)
+        for stat in stats:
+            throughput = stat['rows'] / max(stat['busy_seconds'], 1e-9)
+            print(
+                f"[{stage}] 线程{stat['worker']}: {stat['rows']} 行 / {stat['batches']} 批 | "
+                f"{throughput:.0f} 行/秒 | 重试 {stat['retries']} 次"
+            )
+        print(f"[{stage}] 完成：{total} 行，耗时 {elapsed:.1f} 秒，总吞吐 {total / max(elapsed, 1e-9):.0f} 行/秒")
+
+        errors = [stat['error'] for stat in stats if stat['error']]
+        if errors:
+            raise RuntimeError(f"{stage}并行导入失败: {errors[0]}")
+        return stats
+
+    def _partition_worker(self, batches, write_batch, stat):
+        """工作线程：从队列中取出批次并写入，直到收到结束标记"""
+        with self.driver.session() as session:
+            while True:
+                rows = batches.get()
+                if rows is None:
+                    return
+                if stat['error']:
+                    # 已失败的线程只消费队列，避免阻塞读取线程
+                    continue
+                start = time.perf_counter()
+                try:
+                    stat['retries'] += self._write_with_retry(session, write_batch, rows)
+                except Exception as e:
+                    stat['error'] = e
+                    continue
+                stat['busy_seconds'] += time.perf_counter() - start
+                stat['rows'] += len(rows)
+                stat['batches'] += 1
+
     @staticmethod
-    def parse_movie_title(title):
-        """解析电影标题和年份"""
-        import re
-        # 匹配标题中的年份，如 "Toy Story (1995)"
-        match = re.search(r'^(.*?)\s*\((\d{4})\)\s*$', title)
-        if match:
-            movie_title = match.group(1).strip()
-            year = int(match.group(2))
-        else:
-            movie_title = title
-            year = None
-        return movie_title, year
+    def _write_with_retry(session, write_batch, rows):
+        """
+        在显式事务中写入一批数据，遇到死锁或瞬时错误时指数退避重试
+
+        Returns:
+            int: 本批次发生的重试次数
+        """
+        for attempt in range(MAX_WRITE_RETRIES + 1):
+            try:
+                with session.begin_transaction() as tx:
+                    write_batch(tx, rows)
+                    tx.commit()
+                return attempt
+            except RETRYABLE_ERRORS:
+                if attempt == MAX_WRITE_RETRIES:
+                    raise
+                time.sleep(min(0.1 * 2 ** attempt, 5.0) * (1 + random.random()))
+
+    def clear_users(self):
+        """删除所有用户及其评分/标签关系（保留电影和类型，供基准测试反复导入）"""
+        with self.driver.session() as session:
+            session.run(f"""
+            MATCH (u:User)
+            CALL {{ WITH u DETACH DELETE u }} IN TRANSACTIONS OF {DELETE_BATCH_SIZE} ROWS
+            """).consume()
+
+    @classmethod
+    def _movie_rows(cls, chunk):
+        """将movies.csv的数据块转换为UNWIND参数"""
+        rows = []
+        for movie_id, raw_title, raw_genres in zip(chunk['movieId'], chunk['title'], chunk['genres']):
+            title, year = cls.parse_movie_title(raw_title)
+            genres = raw_genres.split('|') if raw_genres != '(no genres listed)' else []
+            rows.append({'movie_id': int(movie_id), 'title': title, 'year': year, 'genres': genres})
+        return rows
+
+    @staticmethod
+    def _rating_rows(chunk):
+        """将ratings.csv的数据块转换为UNWIND参数"""
+        return [
+            {'user_id': int(user_id), 'movie_id': int(movie_id),
+             'rating': float(rating), 'timestamp': int(timestamp)}
+            for user_id, movie_id, rating, timestamp in zip(
+                chunk['userId'], chunk['movieId'], chunk['rating'], chunk['timestamp']
+            )
+        ]
+
+    @staticmethod
+    def _tag_rows(chunk):
+        """将tags.csv的数据块转换为UNWIND参数"""
+        return [
+            {'user_id': int(user_id), 'movie_id': int(movie_id),
+             'tag': str(tag), 'timestamp': int(timestamp)}
+            for user_id, movie_id, tag, timestamp in zip(
+                chunk['userId'], chunk['movieId'], chunk['tag'], chunk['timestamp']
+            )
+        ]
+
+    # 标题解析与内存图快照共用（见 movie_titles.py）
+    parse_movie_title = staticmethod(parse_movie_title)
+    parse_movie_titles = staticmethod(parse_movie_titles)
 
     @staticmethod
     def _create_movie_and_genres(tx, movie_id, title, year, genres):
@@ -139,28 +630,403 @@ class MovieLensImporter:
 
     @staticmethod
     def _create_tag_relationship(tx, user_id, movie_id, tag, timestamp):
-        """创建用户标签关系"""
+        """创建用户标签关系（同一用户给同一电影的多个标签都追加到 t.tags，t.tag 为最后一个）"""
         query = """
         MERGE (u:User {id: $user_id})
         MERGE (m:Movie {id: $movie_id})
         MERGE (u)-[t:TAGGED]->(m)
-        SET t.tag = $tag, t.timestamp = $timestamp
+        SET t.tag = $tag, t.timestamp = $timestamp,
+            t.tags = CASE WHEN $tag IN coalesce(t.tags, []) THEN t.tags ELSE coalesce(t.tags, []) + $tag END
         """
         tx.run(query, user_id=user_id, movie_id=movie_id, tag=tag, timestamp=timestamp)
 
+    @staticmethod
+    def _create_movies_batch(tx, rows):
+        """批量创建电影节点和类型关系"""
+        query = """
+        UNWIND $rows AS row
+        MERGE (m:Movie {id: row.movie_id})
+        SET m.title = row.title, m.year = row.year
+        WITH m, row
+        UNWIND row.genres AS genre
+        MERGE (g:Genre {name: genre})
+        MERGE (m)-[:IN_GENRE]->(g)
+        """
+        tx.run(query, rows=rows)
+
+    @staticmethod
+    def _upsert_movies_batch(tx, rows):
+        """批量更新电影：重写标题/年份，并用CSV中的类型替换原有IN_GENRE关系"""
+        query = """
+        UNWIND $rows AS row
+        MERGE (m:Movie {id: row.movie_id})
+        SET m.title = row.title, m.year = row.year
+        WITH m, row
+        OPTIONAL MATCH (m)-[old:IN_GENRE]->(:Genre)
+        DELETE old
+        WITH DISTINCT m, row
+        UNWIND row.genres AS genre
+        MERGE (g:Genre {name: genre})
+        MERGE (m)-[:IN_GENRE]->(g)
+        """
+        tx.run(query, rows=rows)
+
+    @staticmethod
+    def _set_movie_stats_batch(tx, rows):
+        """批量写入电影的评分统计"""
+        query = """
+        UNWIND $rows AS row
+        MATCH (m:Movie {id: row.movie_id})
+        SET m.rating_count = row.rating_count,
+            m.avg_rating = row.avg_rating,
+            m.bayesian_rating = row.bayesian_rating,
+            m.rating_histogram = row.rating_histogram
+        """
+        tx.run(query, rows=rows)
+
+    @staticmethod
+    def _create_ratings_batch(tx, rows):
+        """批量创建用户评分关系"""
+        query = """
+        UNWIND $rows AS row
+        MERGE (u:User {id: row.user_id})
+        MERGE (m:Movie {id: row.movie_id})
+        MERGE (u)-[r:RATED]->(m)
+        SET r.rating = row.rating, r.timestamp = row.timestamp
+        """
+        tx.run(query, rows=rows)
+
+    @staticmethod
+    def _create_tags_batch(tx, rows):
+        """批量创建用户标签关系（语义同 _create_tag_relationship）"""
+        query = """
+        UNWIND $rows AS row
+        MERGE (u:User {id: row.user_id})
+        MERGE (m:Movie {id: row.movie_id})
+        MERGE (u)-[t:TAGGED]->(m)
+        SET t.tag = row.tag, t.timestamp = row.timestamp,
+            t.tags = CASE WHEN row.tag IN coalesce(t.tags, []) THEN t.tags ELSE coalesce(t.tags, []) + row.tag END
+        """
+        tx.run(query, rows=rows)
+
+    @staticmethod
+    def _create_ratings_partition(tx, rows):
+        """并行模式下批量创建评分关系（电影已存在，只MATCH不MERGE以减少锁竞争）"""
+        query = """
+        UNWIND $rows AS row
+        MATCH (m:Movie {id: row.movie_id})
+        MERGE (u:User {id: row.user_id})
+        MERGE (u)-[r:RATED]->(m)
+        SET r.rating = row.rating, r.timestamp = row.timestamp
+        """
+        tx.run(query, rows=rows)
+
+    @staticmethod
+    def _create_tags_partition(tx, rows):
+        """并行模式下批量创建标签关系（电影已存在，只MATCH不MERGE以减少锁竞争）"""
+        query = """
+        UNWIND $rows AS row
+        MATCH (m:Movie {id: row.movie_id})
+        MERGE (u:User {id: row.user_id})
+        MERGE (u)-[t:TAGGED]->(m)
+        SET t.tag = row.tag, t.timestamp = row.timestamp,
+            t.tags = CASE WHEN row.tag IN coalesce(t.tags, []) THEN t.tags ELSE coalesce(t.tags, []) + row.tag END
+        """
+        tx.run(query, rows=rows)
+
+    def verify_import(self):
+        """验证数据导入结果"""
+        print("\n验证数据导入结果...")
+        with self.driver.session() as session:
+            # 统计节点数量
+            result = session.execute_read(self._count_nodes)
+            print(f"数据库中的节点数量: {result['total_nodes']}")
+            print(f"电影数量: {result['movie_count']}")
+            print(f"用户数量: {result['user_count']}")
+            print(f"类型数量: {result['genre_count']}")
+            print(f"标签数量: {result['tag_node_count']}")
+
+            # 统计关系数量
+            rel_result = session.execute_read(self._count_relationships)
+            print(f"评分关系数量: {rel_result['rating_count']}")
+            print(f"标签关系数量: {rel_result['tag_count']}")
+
+    @staticmethod
+    def _count_nodes(tx):
+        query = """
+        MATCH (n)
+        RETURN 
+            count(n) as total_nodes,
+            count(CASE WHEN n:Movie THEN 1 ELSE null END) as movie_count,
+            count(CASE WHEN n:User THEN 1 ELSE null END) as user_count,
+            count(CASE WHEN n:Genre THEN 1 ELSE null END) as genre_count,
+            count(CASE WHEN n:Tag THEN 1 ELSE null END) as tag_node_count
+        """
+        result = tx.run(query)
+        return result.single()
+
+    @staticmethod
+    def _count_relationships(tx):
+        query = """
+        MATCH ()-[r]->()
+        RETURN 
+            count(CASE WHEN type(r) = 'RATED' THEN 1 ELSE null END) as rating_count,
+            count(CASE WHEN type(r) = 'TAGGED' THEN 1 ELSE null END) as tag_count
+        """
+        result = tx.run(query)
+        return result.single()
+
+
+class BulkImportExporter:
+    """
+    生成 neo4j-admin database import 所需的节点/关系文件
+
+    每类实体输出一个 *_header.csv 和一个数据文件；评分按块流式写出，
+    不会一次性读入内存。节点ID使用整数（导入时需 --id-type=INTEGER），
+    类型节点使用 factorize 生成的整数ID，名称作为属性保存。
+    """
+
+    def __init__(self, output_dir, chunk_size=DEFAULT_BATCH_SIZE * 20):
+        self.output_dir = output_dir
+        self.chunk_size = chunk_size
+        self._user_ratings = Counter()
+        self._movies = None
+        self._movie_histogram = None
+
+    def export_all(self):
+        """导出全部节点和关系文件"""
+        os.makedirs(self.output_dir, exist_ok=True)
+        self._user_ratings = Counter()
+        start = time.perf_counter()
+
+        self._write_header('users_header.csv', ['id:ID(User)', 'id_text', 'rating_count:int', ':LABEL'])
+        self._write_header('rated_header.csv',
+                           [':START_ID(User)', ':END_ID(Movie)', 'rating:float', 'timestamp:long', ':TYPE'])
+        self._write_header('tagged_header.csv',
+                           [':START_ID(User)', ':END_ID(Movie)', 'tag', 'tags:string[]', 'timestamp:long', ':TYPE'])
+        for name in ('rated.csv', 'tagged.csv'):
+            open(os.path.join(self.output_dir, name), 'w').close()
+
+        self.export_movies_and_genres()
+        self.export_ratings()
+        self.export_tags()
+        self.export_movies()
+        self.export_users()
+
+        print(f"导出完成，耗时 {time.perf_counter() - start:.1f} 秒，共 {len(self._user_ratings)} 位用户")
+        print(self.import_command())
+
+    def export_movies_and_genres(self):
+        """导出类型节点和IN_GENRE关系；电影节点在评分导出后由 export_movies 写出"""
+        movies_df = pd.read_csv(os.path.join(DATA_DIR, 'movies.csv'))
+        parsed = MovieLensImporter.parse_movie_titles(movies_df['title'])
+
+        self._movies = pd.DataFrame({
+            'id': movies_df['movieId'],
+            'title': parsed['title'],
+            'year': parsed['year'],
+        })
+
+        movie_genres = pd.DataFrame({
+            'movie_id': movies_df['movieId'],
+            'genre': movies_df['genres'].str.split('|'),
+        }).explode('genre')
+        movie_genres = movie_genres[movie_genres['genre'] != '(no genres listed)']
+        genre_codes, genre_names = pd.factorize(movie_genres['genre'])
+
+        genres = pd.DataFrame({'id': range(len(genre_names)), 'name': genre_names, 'label': 'Genre'})
+        self._write_header('genres_header.csv', [':ID(Genre)', 'name', ':LABEL'])
+        genres.to_csv(os.path.join(self.output_dir, 'genres.csv'), index=False, header=False)
+
+        in_genre = pd.DataFrame({
+            'movie_id': movie_genres['movie_id'].to_numpy(),
+            'genre_id': genre_codes,
+            'type': 'IN_GENRE',
+        })
+        self._write_header('in_genre_header.csv', [':START_ID(Movie)', ':END_ID(Genre)', ':TYPE'])
+        in_genre.to_csv(os.path.join(self.output_dir, 'in_genre.csv'), index=False, header=False)
+
+        print(f"[导出] 类型 {len(genres)} 个，IN_GENRE {len(in_genre)} 条")
+
+    def export_ratings(self):
+        """按块导出RATED关系，并累计每位用户的评分数和每部电影的评分直方图"""
+        total = 0
+        reader = pd.read_csv(os.path.join(DATA_DIR, 'ratings.csv'), chunksize=self.chunk_size)
+        for chunk in reader:
+            self._user_ratings.update(chunk['userId'].value_counts().to_dict())
+            chunk_histogram = rating_histogram(chunk.rename(columns={'movieId': 'movie_id'}))
+            self._movie_histogram = chunk_histogram if self._movie_histogram is None \
+                else self._movie_histogram.add(chunk_histogram, fill_value=0)
+            rated = pd.DataFrame({
+                'user_id': chunk['userId'],
+                'movie_id': chunk['movieId'],
+                'rating': chunk['rating'],
+                'timestamp': chunk['timestamp'],
+                'type': 'RATED',
+            })
+            rated.to_csv(os.path.join(self.output_dir, 'rated.csv'), mode='a', index=False, header=False)
+            total += len(rated)
+            print(f"[导出] 已写出 {total} 条评分")
+
+    def export_tags(self):
+        """
+        导出TAGGED关系，以及Tag节点和HAS_TAG关系（与导入脚本的写入语义一致）
+
+        每个用户-电影对一条TAGGED关系：tags 为该用户给这部电影打过的全部标签，tag/timestamp 取最后一条；
+        HAS_TAG.count 为给电影打过该（归一化后的）标签的用户数，与 update_tag_counts 相同。
+        """
+        tags_df = pd.read_csv(os.path.join(DATA_DIR, 'tags.csv'))
+        tags_df['tag'] = tags_df['tag'].astype(str)
+        # 只有标签没有评分的用户评分数为0
+        self._user_ratings.update(dict.fromkeys(tags_df['userId'].unique().tolist(), 0))
+        # neo4j-admin 数组默认以分号分隔
+        tag_lists = tags_df.drop_duplicates(['userId', 'movieId', 'tag']) \
+            .groupby(['userId', 'movieId'], sort=False)['tag'].agg(';'.join).rename('tags').reset_index()
+        last = tags_df.drop_duplicates(['userId', 'movieId'], keep='last').merge(tag_lists, on=['userId', 'movieId'])
+        tagged = pd.DataFrame({
+            'user_id': last['userId'],
+            'movie_id': last['movieId'],
+            'tag': last['tag'],
+            'tags': last['tags'],
+            'timestamp': last['timestamp'],
+            'type': 'TAGGED',
+        })
+        tagged.to_csv(os.path.join(self.output_dir, 'tagged.csv'), mode='a', index=False, header=False)
+
+        counts = movie_tag_counts(tags_df.rename(columns={'userId': 'user_id', 'movieId': 'movie_id'}))
+        tag_codes, tag_names = pd.factorize(counts['tag'])
+        tag_nodes = pd.DataFrame({'id': range(len(tag_names)), 'name': tag_names, 'label': 'Tag'})
+        self._write_header('tags_header.csv', [':ID(Tag)', 'name', ':LABEL'])
+        tag_nodes.to_csv(os.path.join(self.output_dir, 'tags.csv'), index=False, header=False)
+        has_tag = pd.DataFrame({
+            'movie_id': counts['movie_id'],
+            'tag_id': tag_codes,
+            'count': counts['count'],
+            'type': 'HAS_TAG',
+        })
+        self._write_header('has_tag_header.csv', [':START_ID(Movie)', ':END_ID(Tag)', 'count:int', ':TYPE'])
+        has_tag.to_csv(os.path.join(self.output_dir, 'has_tag.csv'), index=False, header=False)
+        print(f"[导出] 标签 {len(tags_df)} 条（TAGGED {len(tagged)} 条），Tag {len(tag_nodes)} 个，"
+              f"HAS_TAG {len(has_tag)} 条")
+
+    def import_command(self):
+        """返回对应的 neo4j-admin 导入命令"""
+        return (
+            "neo4j-admin database import full neo4j --overwrite-destination --id-type=INTEGER "
+            "--nodes=movies_header.csv,movies.csv "
+            "--nodes=genres_header.csv,genres.csv "
+            "--nodes=users_header.csv,users.csv "
+            "--nodes=tags_header.csv,tags.csv "
+            "--relationships=in_genre_header.csv,in_genre.csv "
+            "--relationships=rated_header.csv,rated.csv "
+            "--relationships=tagged_header.csv,tagged.csv "
+            "--relationships=has_tag_header.csv,has_tag.csv"
+        )
+
+    def export_movies(self):
+        """导出电影节点，附带评分统计（与 update_movie_stats 物化的属性相同）"""
+        stats = movie_rating_stats(self._movie_histogram, movie_ids=self._movies['id'].to_numpy())
+        movies = self._movies.assign(
+            rating_count=stats['rating_count'].to_numpy(),
+            avg_rating=stats['avg_rating'].to_numpy(),
+            bayesian_rating=stats['bayesian_rating'].to_numpy(),
+            # neo4j-admin 数组默认以分号分隔
+            rating_histogram=[';'.join(map(str, row)) for row in stats['rating_histogram']],
+            label='Movie',
+        )
+        self._write_header('movies_header.csv', [
+            'id:ID(Movie)', 'title', 'year:int', 'rating_count:int', 'avg_rating:float', 'bayesian_rating:float',
+            'rating_histogram:int[]', ':LABEL'
+        ])
+        movies.to_csv(os.path.join(self.output_dir, 'movies.csv'), index=False, header=False)
+        print(f"[导出] 电影 {len(movies)} 部（含评分统计）")
+
+    def export_users(self):
+        """导出用户节点，附带用户搜索所需的 id_text 和 rating_count"""
+        users = pd.DataFrame({
+            'id': list(self._user_ratings),
+            'rating_count': list(self._user_ratings.values()),
+        })
+        users['id_text'] = users['id'].astype(str)
+        users['label'] = 'User'
+        users[['id', 'id_text', 'rating_count', 'label']].to_csv(
+            os.path.join(self.output_dir, 'users.csv'), index=False, header=False
+        )
+        print(f"[导出] 用户 {len(users)} 位")
+
+    def _write_header(self, filename, columns):
+        with open(os.path.join(self.output_dir, filename), 'w', encoding='utf-8') as f:
+            f.write(','.join(columns) + '\n')
+
+
+def parse_args():
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(description="导入MovieLens数据到Neo4j")
+    parser.add_argument(
+        "--mode", choices=["batch", "parallel", "incremental", "row", "export"], default="batch",
+        help="导入模式：batch 为分块UNWIND批量写入，parallel 为按用户分区并行写入，"
+             "incremental 为基于水位线的增量写入（不清空数据库），row 为逐行写入，"
+             "export 为生成 neo4j-admin 离线导入文件（默认 batch）"
+    )
+    parser.add_argument(
+        "--skip-similarity", action="store_true",
+        help="导入后不刷新 SIMILAR_TO / SIMILAR_MOVIE 预计算相似关系"
+    )
+    parser.add_argument(
+        "--skip-tag-vectors", action="store_true",
+        help="导入后不重建TF-IDF标签向量（标签接口和标签推荐策略读取）"
+    )
+    parser.add_argument(
+        "--skip-recommendations", action="store_true",
+        help="导入后不刷新 RECOMMENDED 预计算推荐"
+    )
+    parser.add_argument(
+        "--output-dir", default="bulk_import",
+        help="export模式下的输出目录（默认 bulk_import）"
+    )
+    parser.add_argument(
+        "--workers", type=int, default=DEFAULT_WORKERS,
+        help=f"parallel模式下的工作线程数（默认 {DEFAULT_WORKERS}）"
+    )
+    parser.add_argument(
+        "--batch-size", type=int, default=DEFAULT_BATCH_SIZE,
+        help=f"批量模式下每个事务写入的行数（默认 {DEFAULT_BATCH_SIZE}）"
+    )
+    return parser.parse_args()
+
 
 def main():
+    args = parse_args()
+
+    if args.mode == "export":
+        # 离线导出不需要连接数据库
+        BulkImportExporter(args.output_dir).export_all()
+        return
+
     # Neo4j连接配置 - 修改为你的配置
     NEO4J_URI = os.getenv("NEO4J_URI", "bolt://localhost:7687")
     NEO4J_USER = os.getenv("NEO4J_USER", "neo4j")
     NEO4J_PASSWORD = os.getenv("NEO4J_PASSWORD", "password")
 
     # 创建导入器实例
-    importer = MovieLensImporter(NEO4J_URI, NEO4J_USER, NEO4J_PASSWORD)
+    importer = MovieLensImporter(NEO4J_URI, NEO4J_USER, NEO4J_PASSWORD, batch_size=args.batch_size)
 
     try:
         # 执行数据导入
-        importer.import_all_data()
+        importer.import_all_data(mode=args.mode, workers=args.workers)
+
+        # 刷新预计算的相似关系（增量导入时相似用户只重算受影响的用户）
+        if not args.skip_similarity:
+            UserSimilarityJob(importer.driver).run(incremental=args.mode == "incremental")
+            MovieSimilarityJob(importer.driver).run()
+
+        # 由 HAS_TAG 计数重建标签向量（预计算推荐的标签策略也用到）
+        if not args.skip_tag_vectors:
+            TagVectorJob(importer.driver).run()
+
+        # 预计算全部用户的推荐（接口的store模式直接读取）
+        if not args.skip_recommendations:
+            RecommendationJob(importer.driver).run()
 
         # 验证数据导入
         importer.verify_import()
@@ -171,48 +1037,5 @@ def main():
         importer.close()
 
 
-def verify_import(self):
-    """验证数据导入结果"""
-    print("\n验证数据导入结果...")
-    with self.driver.session() as session:
-        # 统计节点数量
-        result = session.execute_write(self._count_nodes)
-        print(f"数据库中的节点数量: {result['total_nodes']}")
-        print(f"电影数量: {result['movie_count']}")
-        print(f"用户数量: {result['user_count']}")
-        print(f"类型数量: {result['genre_count']}")
-
-        # 统计关系数量
-        rel_result = session.execute_write(self._count_relationships)
-        print(f"评分关系数量: {rel_result['rating_count']}")
-        print(f"标签关系数量: {rel_result['tag_count']}")
-
-
-@staticmethod
-def _count_nodes(tx):
-    query = """
-    MATCH (n)
-    RETURN 
-        count(n) as total_nodes,
-        count(CASE WHEN n:Movie THEN 1 ELSE null END) as movie_count,
-        count(CASE WHEN n:User THEN 1 ELSE null END) as user_count,
-        count(CASE WHEN n:Genre THEN 1 ELSE null END) as genre_count
-    """
-    result = tx.run(query)
-    return result.single()
-
-
-@staticmethod
-def _count_relationships(tx):
-    query = """
-    MATCH ()-[r]-()
-    RETURN 
-        count(CASE WHEN type(r) = 'RATED' THEN 1 ELSE null END) as rating_count,
-        count(CASE WHEN type(r) = 'TAGGED' THEN 1 ELSE null END) as tag_count
-    """
-    result = tx.run(query)
-    return result.single()
-
-
 if __name__ == "__main__":
     main()
\ No newline at end of file
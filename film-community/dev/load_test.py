@@ -0,0 +1,98 @@
+import argparse
+import asyncio
+import json
+import math
+import random
+import statistics
+import time
+
+import httpx
+
+# 压测使用的接口（路径模板 -> 参数生成函数）
+ROUTES = {
+    'movies': lambda: "/api/movies?limit=20&skip=%d" % random.randint(0, 9000),
+    'movie_count': lambda: "/api/movies/count",
+    'search_movies': lambda: "/api/movies/search?q=%s" % random.choice(["Star", "Love", "The", "Man", "War"]),
+    'network': lambda: "/api/network/movie/%d?depth=2&max_nodes=100" % random.choice([1, 2, 260, 296, 318, 356, 593]),
+    'recommendations': lambda: "/api/recommendations/user/%d" % random.randint(1, 610),
+}
+
+
+def percentile(values, pct):
+    """计算百分位数（最近秩法）"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, math.ceil(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+async def client_loop(client, route_names, deadline, latencies, errors):
+    """单个并发客户端：在截止时间前循环发送请求"""
+    while time.perf_counter() < deadline:
+        name = random.choice(route_names)
+        start = time.perf_counter()
+        try:
+            response = await client.get(ROUTES[name]())
+            response.raise_for_status()
+        except httpx.HTTPError:
+            errors[name] = errors.get(name, 0) + 1
+            continue
+        latencies.setdefault(name, []).append((time.perf_counter() - start) * 1000)
+
+
+async def run_load_test(base_url, concurrency, duration, route_names):
+    """
+    以固定并发数对API施压
+
+    Returns:
+        dict: 每个接口的请求数、吞吐量和 p50/p99 延迟（毫秒）
+    """
+    latencies, errors = {}, {}
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+        deadline = time.perf_counter() + duration
+        await asyncio.gather(*[
+            client_loop(client, route_names, deadline, latencies, errors) for _ in range(concurrency)
+        ])
+
+    report = {}
+    for name in route_names:
+        values = latencies.get(name, [])
+        report[name] = {
+            'requests': len(values),
+            'errors': errors.get(name, 0),
+            'rps': round(len(values) / duration, 1),
+            'p50_ms': round(percentile(values, 50), 2),
+            'p99_ms': round(percentile(values, 99), 2),
+            'mean_ms': round(statistics.fmean(values), 2) if values else 0.0,
+        }
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="API并发压测（需先启动 uvicorn main:app）")
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000", help="API地址")
+    parser.add_argument("--concurrency", type=int, default=50, help="并发客户端数")
+    parser.add_argument("--duration", type=float, default=30, help="压测时长（秒）")
+    parser.add_argument("--routes", nargs="+", default=list(ROUTES), choices=list(ROUTES), help="要压测的接口")
+    parser.add_argument("--output", help="将结果写入JSON文件")
+    args = parser.parse_args()
+
+    report = asyncio.run(run_load_test(args.base_url, args.concurrency, args.duration, args.routes))
+
+    print(f"\n并发 {args.concurrency}，时长 {args.duration} 秒")
+    print(f"{'接口':<16} {'请求数':>8} {'错误':>6} {'RPS':>8} {'p50(ms)':>10} {'p99(ms)':>10}")
+    for name, stats in report.items():
+        print(
+            f"{name:<16} {stats['requests']:>8} {stats['errors']:>6} {stats['rps']:>8} "
+            f"{stats['p50_ms']:>10} {stats['p99_ms']:>10}"
+        )
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
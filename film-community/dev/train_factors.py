@@ -0,0 +1,106 @@
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+from neo4j import GraphDatabase
+from dotenv import load_dotenv
+
+# 加载环境变量
+load_dotenv()
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from factor_model import FACTOR_METHODS, FACTOR_MODEL_DIR, FactorModel, load_ratings_csv  # noqa: E402
+from graph_snapshot import DEFAULT_DATA_DIR  # noqa: E402
+from compute_user_similarity import bump_data_version, load_ratings  # noqa: E402
+
+# 默认隐因子维数
+DEFAULT_FACTORS = 32
+
+
+def load_ratings_neo4j(driver):
+    """
+    从图中读取训练数据（包含增量导入后的评分）
+
+    Returns:
+        tuple: (评分DataFrame, 全部电影ID数组)
+    """
+    user_ids, movie_ids, ratings, _ = load_ratings(driver)
+    with driver.session() as session:
+        all_movie_ids = np.array([record['id'] for record in session.run("MATCH (m:Movie) RETURN m.id as id")])
+    return pd.DataFrame({'user_id': user_ids, 'movie_id': movie_ids, 'rating': ratings}), all_movie_ids
+
+
+def rmse(predicted, actual):
+    return float(np.sqrt(np.mean((predicted - actual) ** 2)))
+
+
+def evaluate(ratings, movie_ids, holdout, seed, **params):
+    """
+    随机留出一部分评分，在其余评分上训练，打印留出集上模型与"用户平均分"基线的RMSE
+    """
+    rng = np.random.default_rng(seed)
+    test_mask = rng.random(len(ratings)) < holdout
+    train, test = ratings[~test_mask], ratings[test_mask]
+    model = FactorModel.fit(train, movie_ids, seed=seed, **params)
+
+    test_users, test_movies = test['user_id'].to_numpy(np.int64), test['movie_id'].to_numpy(np.int64)
+    predicted = model.predict(test_users, test_movies)
+    known = ~np.isnan(predicted)
+    actual = test['rating'].to_numpy(np.float64)[known]
+    baseline = model.user_means[np.searchsorted(model.user_ids, test_users[known])]
+    print(f"[隐因子] 留出 {known.sum()} 条评分：模型 RMSE {rmse(predicted[known], actual):.4f}，"
+          f"用户平均分基线 RMSE {rmse(baseline, actual):.4f}（训练 {model.meta['train_seconds']} 秒）")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="训练隐因子推荐模型（推荐策略4），因子保存为 .npy 文件；之后运行 compute_recommendations.py 更新预计算推荐"
+    )
+    parser.add_argument("--method", choices=FACTOR_METHODS, default="als", help="训练方法：ALS或截断SVD")
+    parser.add_argument("--factors", type=int, default=DEFAULT_FACTORS, help="隐因子维数")
+    parser.add_argument("--regularization", type=float, default=0.05, help="ALS的正则系数")
+    parser.add_argument("--iterations", type=int, default=10, help="ALS的迭代次数")
+    parser.add_argument("--seed", type=int, default=0, help="随机种子（ALS初始化和留出集划分）")
+    parser.add_argument("--holdout", type=float, default=0.1, help="评估用的留出比例，0表示不评估")
+    parser.add_argument("--source", choices=["csv", "neo4j"], default="csv", help="训练数据来源")
+    parser.add_argument("--data-dir", default=DEFAULT_DATA_DIR, help="source=csv 时的MovieLens数据目录")
+    parser.add_argument("--output-dir", default=FACTOR_MODEL_DIR, help="模型目录（服务端读取 FACTOR_MODEL_DIR）")
+    args = parser.parse_args()
+
+    driver = None
+    if args.source == "neo4j":
+        driver = GraphDatabase.driver(
+            os.getenv("NEO4J_URI", "bolt://localhost:7687"),
+            auth=(os.getenv("NEO4J_USER", "neo4j"), os.getenv("NEO4J_PASSWORD", "password")),
+        )
+    try:
+        start = time.perf_counter()
+        ratings, movie_ids = load_ratings_neo4j(driver) if driver else load_ratings_csv(args.data_dir)
+        print(f"[隐因子] 读取 {len(ratings)} 条评分、{len(movie_ids)} 部电影，耗时 {time.perf_counter() - start:.1f} 秒")
+        if ratings.empty:
+            print("[隐因子] 没有评分数据，跳过")
+            return
+
+        params = {'method': args.method, 'factors': args.factors,
+                  'regularization': args.regularization, 'iterations': args.iterations}
+        if args.holdout > 0:
+            evaluate(ratings, movie_ids, args.holdout, args.seed, **params)
+
+        model = FactorModel.fit(ratings, movie_ids, seed=args.seed, **params)
+        model.meta['source'] = args.source
+        model.save(args.output_dir)
+        print(f"[隐因子] 模型已保存到 {args.output_dir}：{model.meta}")
+
+        # 推荐结果缓存按数据版本失效
+        if driver:
+            bump_data_version(driver)
+    finally:
+        if driver:
+            driver.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,294 @@
+"""
+隐因子（矩阵分解）推荐模型
+
+离线在 用户×电影 评分矩阵上训练（dev/train_factors.py），支持两种方法：
+- svd：对按用户均值中心化的评分矩阵做截断SVD（scipy.sparse.linalg.svds）
+- als：只在已评分项上拟合的交替最小二乘（ALS-WR，正则项按评分数加权）
+
+因子以 .npy 文件保存，服务端用 mmap 方式加载，多个进程共享同一份页缓存。
+每次请求的打分只有一次矩阵-向量乘法加 argpartition 取 top-k，与用户的评分历史长度无关。
+"""
+import json
+import os
+import time
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from scipy.sparse.linalg import svds
+
+from rating_stats import RATING_VALUES
+from similarity import center_by_user_mean
+
+# 默认模型目录（已加入.gitignore），可用 FACTOR_MODEL_DIR 覆盖
+DEFAULT_FACTOR_MODEL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'models', 'factors')
+FACTOR_MODEL_DIR = os.getenv("FACTOR_MODEL_DIR", DEFAULT_FACTOR_MODEL_DIR)
+
+FACTOR_METHODS = ('svd', 'als')
+
+# 模型由这些数组组成，每个数组保存为同名 .npy 文件
+MODEL_ARRAYS = ('user_ids', 'movie_ids', 'user_factors', 'movie_factors', 'user_means', 'rated_indptr', 'rated_indices')
+
+# 模型元数据（训练方法、参数、评估结果）；写入完成后最后写它，加载方据此判断模型是否完整、是否更新
+META_FILE = 'meta.json'
+
+
+def save_model_arrays(model_dir, arrays, meta):
+    """
+    把模型数组逐个原子地写为 .npy 文件，最后写入 meta.json
+
+    Args:
+        model_dir: 模型目录（不存在时创建）
+        arrays: 名称 -> NumPy数组
+        meta: 可JSON序列化的元数据
+    """
+    os.makedirs(model_dir, exist_ok=True)
+    for name, array in arrays.items():
+        temp_path = os.path.join(model_dir, f"{name}.tmp.npy")
+        np.save(temp_path, np.ascontiguousarray(array))
+        os.replace(temp_path, os.path.join(model_dir, f"{name}.npy"))
+    temp_path = os.path.join(model_dir, f"{META_FILE}.tmp")
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+    os.replace(temp_path, os.path.join(model_dir, META_FILE))
+
+
+def load_model_arrays(model_dir, names, mmap=True):
+    """
+    读取 save_model_arrays 写出的数组和元数据
+
+    Returns:
+        tuple: (名称 -> 数组, 元数据)；mmap=True 时数组是只读的内存映射
+    """
+    arrays = {name: np.load(os.path.join(model_dir, f"{name}.npy"), mmap_mode='r' if mmap else None)
+              for name in names}
+    with open(os.path.join(model_dir, META_FILE), encoding='utf-8') as f:
+        meta = json.load(f)
+    return arrays, meta
+
+
+def rating_matrix(ratings, movie_ids):
+    """
+    构建 用户×电影 评分矩阵
+
+    Args:
+        ratings: DataFrame，包含 user_id/movie_id/rating 列
+        movie_ids: 全部电影ID（决定列顺序，没有评分的电影也有一列）
+
+    Returns:
+        tuple: (CSR矩阵, 行号对应的用户ID数组, 列号对应的电影ID数组)
+    """
+    movie_ids = np.unique(np.asarray(movie_ids, dtype=np.int64))
+    ratings = ratings[ratings['movie_id'].isin(movie_ids)]
+    user_ids, user_rows = np.unique(ratings['user_id'].to_numpy(np.int64), return_inverse=True)
+    movie_cols = np.searchsorted(movie_ids, ratings['movie_id'].to_numpy(np.int64))
+    matrix = sparse.csr_matrix((ratings['rating'].to_numpy(np.float64), (user_rows, movie_cols)),
+                               shape=(len(user_ids), len(movie_ids)))
+    matrix.sum_duplicates()
+    return matrix, user_ids, movie_ids
+
+
+def center_rows(matrix):
+    """
+    按用户均值中心化
+
+    Returns:
+        tuple: (中心化后的CSR矩阵, 每位用户的平均评分)
+    """
+    coo = matrix.tocoo()
+    counts = np.diff(matrix.indptr)
+    user_means = np.divide(np.asarray(matrix.sum(axis=1)).ravel(), counts,
+                           out=np.zeros(matrix.shape[0]), where=counts > 0)
+    centered = sparse.csr_matrix((center_by_user_mean(coo.data, coo.row), (coo.row, coo.col)), shape=matrix.shape)
+    return centered, user_means
+
+
+def train_svd(centered, factors):
+    """截断SVD：用户因子为 U·S，电影因子为 V"""
+    k = min(factors, min(centered.shape) - 1)
+    u, s, vt = svds(centered, k=k)
+    order = np.argsort(-s)
+    return u[:, order] * s[order], vt[order].T
+
+
+def _als_step(matrix, fixed, regularization):
+    """固定一侧因子，逐行求解另一侧（正则项乘以该行的评分数）"""
+    factors = fixed.shape[1]
+    result = np.zeros((matrix.shape[0], factors))
+    identity = np.eye(factors)
+    for row in range(matrix.shape[0]):
+        start, end = matrix.indptr[row], matrix.indptr[row + 1]
+        if start == end:
+            continue
+        basis = fixed[matrix.indices[start:end]]
+        gram = basis.T @ basis + regularization * (end - start) * identity
+        result[row] = np.linalg.solve(gram, basis.T @ matrix.data[start:end])
+    return result
+
+
+def train_als(centered, factors, regularization=0.05, iterations=10, seed=0):
+    """
+    显式评分的ALS，只在已评分项上计算损失
+
+    Returns:
+        tuple: (用户因子, 电影因子)
+    """
+    rng = np.random.default_rng(seed)
+    user_factors = rng.normal(0, 0.1, (centered.shape[0], factors))
+    movie_factors = rng.normal(0, 0.1, (centered.shape[1], factors))
+    centered_t = centered.T.tocsr()
+    for _ in range(iterations):
+        user_factors = _als_step(centered, movie_factors, regularization)
+        movie_factors = _als_step(centered_t, user_factors, regularization)
+    return user_factors, movie_factors
+
+
+class FactorModel:
+    """
+    训练好的隐因子模型
+
+    预测评分 = 用户平均分 + 用户因子·电影因子（截断到评分范围）；推荐时只比较点积部分。
+    rated_indptr/rated_indices 是训练数据中每位用户已评分电影的列号（CSR），用于排除已看过的电影。
+    """
+
+    def __init__(self, user_ids, movie_ids, user_factors, movie_factors, user_means, rated_indptr, rated_indices,
+                 meta=None):
+        self.user_ids = user_ids
+        self.movie_ids = movie_ids
+        self.user_factors = user_factors
+        self.movie_factors = movie_factors
+        self.user_means = user_means
+        self.rated_indptr = rated_indptr
+        self.rated_indices = rated_indices
+        self.meta = meta or {}
+
+    @classmethod
+    def fit(cls, ratings, movie_ids, method='als', factors=32, regularization=0.05, iterations=10, seed=0):
+        """
+        训练模型
+
+        Args:
+            ratings: DataFrame，包含 user_id/movie_id/rating 列
+            movie_ids: 全部电影ID
+            method: als（默认，留出集RMSE更低）或 svd（训练更快）
+            factors: 隐因子维数
+            regularization: als 的正则系数
+            iterations: als 的迭代次数
+            seed: als 的随机种子
+        """
+        if method not in FACTOR_METHODS:
+            raise ValueError(f"不支持的训练方法: {method}，可选值: {', '.join(FACTOR_METHODS)}")
+        start = time.perf_counter()
+        matrix, user_ids, movie_ids = rating_matrix(ratings, movie_ids)
+        centered, user_means = center_rows(matrix)
+        if method == 'svd':
+            user_factors, movie_factors = train_svd(centered, factors)
+        else:
+            user_factors, movie_factors = train_als(centered, factors, regularization, iterations, seed)
+        meta = {
+            'method': method,
+            'factors': int(user_factors.shape[1]),
+            'regularization': regularization if method == 'als' else None,
+            'iterations': iterations if method == 'als' else None,
+            'users': len(user_ids),
+            'movies': len(movie_ids),
+            'ratings': int(matrix.nnz),
+            'train_seconds': round(time.perf_counter() - start, 2),
+            'trained_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        }
+        return cls(user_ids, movie_ids, user_factors.astype(np.float32), movie_factors.astype(np.float32),
+                   user_means.astype(np.float32), matrix.indptr.astype(np.int64), matrix.indices.astype(np.int32),
+                   meta)
+
+    def save(self, model_dir):
+        """保存为 .npy 文件；meta.json 最后写入，加载方看到它时其余文件已经完整"""
+        save_model_arrays(model_dir, {name: getattr(self, name) for name in MODEL_ARRAYS}, self.meta)
+
+    @classmethod
+    def load(cls, model_dir, mmap=True):
+        """加载模型，mmap=True 时数组按需从页缓存读取，不复制到进程内存"""
+        arrays, meta = load_model_arrays(model_dir, MODEL_ARRAYS, mmap)
+        return cls(meta=meta, **arrays)
+
+    def user_row(self, user_id):
+        """用户ID -> 行号，训练数据中没有该用户时返回None"""
+        row = int(np.searchsorted(self.user_ids, user_id))
+        return row if row < len(self.user_ids) and self.user_ids[row] == user_id else None
+
+    def recommend(self, user_id, k=20):
+        """
+        为用户推荐 k 部未评分的电影
+
+        Returns:
+            list: (电影ID, 预测评分) 列表，按预测评分降序；训练数据中没有该用户时为空列表
+        """
+        row = self.user_row(user_id)
+        if row is None:
+            return []
+        scores = self.movie_factors @ self.user_factors[row]
+        scores[self.rated_indices[self.rated_indptr[row]:self.rated_indptr[row + 1]]] = -np.inf
+        k = min(k, int(np.isfinite(scores).sum()))
+        if k <= 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind='stable')]
+        predicted = np.clip(self.user_means[row] + scores[top], RATING_VALUES[0], RATING_VALUES[-1])
+        return [(int(movie_id), float(rating)) for movie_id, rating in zip(self.movie_ids[top], predicted)]
+
+    def predict(self, user_ids, movie_ids):
+        """批量预测评分（用于评估），未知用户/电影的预测为用户均值或NaN"""
+        rows = np.searchsorted(self.user_ids, user_ids).clip(0, len(self.user_ids) - 1)
+        cols = np.searchsorted(self.movie_ids, movie_ids).clip(0, len(self.movie_ids) - 1)
+        known = (self.user_ids[rows] == user_ids) & (self.movie_ids[cols] == movie_ids)
+        dots = np.einsum('ij,ij->i', self.user_factors[rows], self.movie_factors[cols])
+        predicted = np.clip(self.user_means[rows] + dots, RATING_VALUES[0], RATING_VALUES[-1])
+        return np.where(known, predicted, np.nan)
+
+
+class FactorModelLoader:
+    """
+    按需加载模型目录中的模型，训练脚本写出新的 meta.json 后自动重新加载
+
+    模型不存在时 get() 返回None，依赖它的推荐策略随之跳过。
+
+    Args:
+        model_dir: 模型目录
+        model_class: 提供 load(model_dir) 的模型类
+        name: 日志中的模型名称
+    """
+
+    def __init__(self, model_dir=FACTOR_MODEL_DIR, model_class=FactorModel, name='隐因子'):
+        self.model_dir = model_dir
+        self.model_class = model_class
+        self.name = name
+        self._model = None
+        self._mtime = None
+
+    def get(self):
+        try:
+            mtime = os.stat(os.path.join(self.model_dir, META_FILE)).st_mtime
+        except FileNotFoundError:
+            return None
+        if mtime != self._mtime:
+            self._model = self.model_class.load(self.model_dir)
+            self._mtime = mtime
+            print(f"[{self.name}] 已加载模型 {self._model.meta}")
+        return self._model
+
+
+def load_ratings_csv(data_dir):
+    """
+    读取 ratings.csv 和 movies.csv 作为训练数据（与导入后的RATED关系一致，每个用户-电影对保留最后一条）
+
+    Returns:
+        tuple: (评分DataFrame, 全部电影ID数组)
+    """
+    ratings = pd.read_csv(os.path.join(data_dir, 'ratings.csv')).rename(
+        columns={'userId': 'user_id', 'movieId': 'movie_id'}
+    ).drop_duplicates(['user_id', 'movie_id'], keep='last')
+    movie_ids = pd.read_csv(os.path.join(data_dir, 'movies.csv'), usecols=['movieId'])['movieId'].to_numpy()
+    return ratings, movie_ids
+
+
+# 服务端共用的模型加载器
+factor_models = FactorModelLoader()
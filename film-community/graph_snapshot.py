@@ -0,0 +1,830 @@
+"""
+内存图快照引擎
+
+MovieLens小数据集（约1万部电影、600位用户、10万条评分）可以整体放入内存。
+快照把图保存为紧凑的NumPy数组：
+- 节点按 电影 | 用户 | 类型 的顺序编号，label数组记录每个节点的标签
+- 每条关系（IN_GENRE/RATED/TAGGED）在 rel_source/rel_target/rel_type 中各占一项
+- 无向CSR邻接表（indptr/adjacency）同时记录每个邻接项对应的关系编号，
+  关系类型、方向和评分都可以按邻接项向量化过滤
+- 用户×电影 的稀疏评分矩阵，用于相似用户/相似电影推荐
+
+快照可以从Neo4j或直接从 ml-latest-small 的CSV加载，加载后只读。
+SnapshotDatabase 提供与 AsyncNeo4jDatabase 相同的公共方法，重新加载时在后台构建新快照，
+构建完成后一次性替换引用（原子切换），进行中的请求继续使用旧快照。
+"""
+import asyncio
+import heapq
+import os
+import time
+from bisect import bisect_left, bisect_right
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from database import (
+    ALL_MOVIES_QUERY, DATA_VERSION_QUERY, IMPORT_STATE_SOURCE, FIRST_PAGE_CURSOR,
+    PATH_ALGORITHMS, MAX_K_PATHS, SIMILAR_USER_NEIGHBOURS, SEARCH_MODES,
+    InvalidArgument, Neo4jDatabase, check_mode, safe_int_convert, clamp_network_params, path_query_params, user_id_prefix, k_shortest_paths,
+    WeightedPathSearch,
+    LevelNetworkExpansion, movie_record_to_dict, build_movie_page, top_movies_sort_property,
+    rated_movie_record_to_dict, top_movie_record_to_dict, liked_movie_record_to_dict, user_record_to_dict, build_recommendations,
+    factor_predictions, factor_strategy_records, tag_predictions, tag_strategy_records,
+    tagged_movie_dicts, similar_tag_movie_dicts,
+)
+from movie_titles import parse_movie_titles
+from rating_stats import movie_rating_stats, rating_histogram
+from search_index import TitleSearchIndex
+from similarity import CosineNeighbours, center_by_user_mean
+from tag_vectors import require_tag_vectors
+
+LABELS = ('Movie', 'User', 'Genre')
+MOVIE, USER, GENRE = range(len(LABELS))
+
+RELATIONSHIP_TYPES = ('IN_GENRE', 'RATED', 'TAGGED')
+IN_GENRE, RATED, TAGGED = range(len(RELATIONSHIP_TYPES))
+
+# 默认数据目录（相对于本文件）
+DEFAULT_DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ml-latest-small')
+
+# 与离线相似度任务一致：每个用户/电影保留的邻居数和最少共同评分数
+SIMILAR_MOVIE_NEIGHBOURS = 20
+MIN_COMMON_RATINGS = 3
+
+# 按需计算相似电影时每块的电影数（控制稠密中间矩阵的内存占用）
+SIMILARITY_BLOCK_SIZE = 128
+
+RATINGS_QUERY = """
+MATCH (u:User)-[r:RATED]->(m:Movie)
+RETURN u.id as user_id, m.id as movie_id, r.rating as rating, r.timestamp as timestamp
+"""
+
+TAGS_QUERY = """
+MATCH (u:User)-[t:TAGGED]->(m:Movie)
+RETURN u.id as user_id, m.id as movie_id, t.timestamp as timestamp
+"""
+
+
+def csv_version(data_dir):
+    """CSV数据的版本：三个文件的最大修改时间"""
+    mtimes = [os.path.getmtime(os.path.join(data_dir, f'{name}.csv')) for name in ('movies', 'ratings', 'tags')]
+    return f"csv:{max(mtimes):.0f}"
+
+
+class GraphSnapshot:
+    """
+    只读的内存图快照
+
+    Args:
+        movies: DataFrame，列为 id/title/year/genres（genres为类型名称列表）
+        ratings: DataFrame，列为 user_id/movie_id/rating/timestamp
+        tags: DataFrame，列为 user_id/movie_id/timestamp（每个用户-电影对一行）
+        version: 数据版本（Neo4j中的data_version或CSV的修改时间）
+    """
+
+    def __init__(self, movies, ratings, tags, version=None):
+        start = time.perf_counter()
+        self.version = version
+
+        # ---------- 节点 ----------
+        movies = movies.sort_values('id').reset_index(drop=True)
+        self.movie_ids = movies['id'].to_numpy(np.int64)
+        self.titles = movies['title'].tolist()
+        self.years = [None if pd.isna(year) else int(year) for year in movies['year']]
+        self.year_values = np.array([np.nan if year is None else year for year in self.years], dtype=np.float64)
+        self.user_ids = np.unique(np.concatenate([ratings['user_id'].to_numpy(np.int64),
+                                                  tags['user_id'].to_numpy(np.int64)]))
+        self.genre_names = sorted({genre for genres in movies['genres'] for genre in genres})
+
+        self.n_movies, self.n_users = len(self.movie_ids), len(self.user_ids)
+        self.user_offset = self.n_movies
+        self.genre_offset = self.n_movies + self.n_users
+        self.n_nodes = self.genre_offset + len(self.genre_names)
+        self.label = np.repeat(np.array([MOVIE, USER, GENRE], dtype=np.int8),
+                               [self.n_movies, self.n_users, len(self.genre_names)])
+        genre_index = {name: i for i, name in enumerate(self.genre_names)}
+        self.genre_index = genre_index
+
+        # ---------- 关系 ----------
+        genre_pairs = [(movie, genre_index[genre]) for movie, genres in enumerate(movies['genres']) for genre in genres]
+        in_genre = np.array(genre_pairs, dtype=np.int64).reshape(-1, 2)
+        rated_users = self._user_nodes(ratings['user_id'])
+        rated_movies = self._movie_rows(ratings['movie_id'])
+        tagged_users = self._user_nodes(tags['user_id'])
+        tagged_movies = self._movie_rows(tags['movie_id'])
+
+        self.rel_source = np.concatenate([in_genre[:, 0], rated_users, tagged_users]).astype(np.int32)
+        self.rel_target = np.concatenate([in_genre[:, 1] + self.genre_offset, rated_movies, tagged_movies]).astype(np.int32)
+        self.rel_type = np.repeat(np.array([IN_GENRE, RATED, TAGGED], dtype=np.int8),
+                                  [len(in_genre), len(rated_users), len(tagged_users)])
+
+        # 无向CSR：每条关系在两个端点的邻接表中各出现一次
+        ends = np.concatenate([self.rel_source, self.rel_target])
+        others = np.concatenate([self.rel_target, self.rel_source])
+        rel_ids = np.tile(np.arange(len(self.rel_source), dtype=np.int32), 2)
+        order = np.argsort(ends, kind='stable')
+        self.adjacency = others[order]
+        self.adjacency_rel = rel_ids[order]
+        self.adjacency_type = self.rel_type[self.adjacency_rel]
+        self.indptr = np.zeros(self.n_nodes + 1, dtype=np.int64)
+        np.cumsum(np.bincount(ends, minlength=self.n_nodes), out=self.indptr[1:])
+        self.degree = np.diff(self.indptr)
+
+        # ---------- 评分矩阵 ----------
+        user_rows = rated_users - self.user_offset
+        rating_values = ratings['rating'].to_numpy(np.float64)
+        self.ratings = sparse.csr_matrix((rating_values, (user_rows, rated_movies)),
+                                         shape=(self.n_users, self.n_movies))
+        self.rating_count = np.diff(self.ratings.indptr)
+        # 每部电影的评分统计（与导入脚本物化到 Movie 节点的属性相同）
+        stats = movie_rating_stats(rating_histogram(ratings), movie_ids=self.movie_ids)
+        self.movie_rating_count = stats['rating_count'].to_numpy(np.int64)
+        self.movie_avg_rating = stats['avg_rating'].to_numpy(np.float64, na_value=np.nan)
+        self.movie_bayesian_rating = stats['bayesian_rating'].to_numpy(np.float64)
+        self.movie_rating_histogram = stats['rating_histogram'].tolist()
+        # 用户很少，全部相似用户在加载时算好；相似电影在推荐时按需计算（见 similar_movies）
+        self._user_neighbours = CosineNeighbours(self.ratings, SIMILAR_USER_NEIGHBOURS, MIN_COMMON_RATINGS) \
+            .compute(np.arange(self.n_users))
+        centered = sparse.csr_matrix((center_by_user_mean(rating_values, user_rows), (rated_movies, user_rows)),
+                                     shape=(self.n_movies, self.n_users))
+        self._movie_similarity = CosineNeighbours(centered, SIMILAR_MOVIE_NEIGHBOURS, MIN_COMMON_RATINGS)
+        self._movie_neighbours = {}
+
+        # ---------- 查找表 ----------
+        self.user_id_texts = sorted((str(user_id), row) for row, user_id in enumerate(self.user_ids))
+        self.title_index = TitleSearchIndex(self.movie_dict(row) for row in range(self.n_movies))
+        self.build_seconds = time.perf_counter() - start
+
+    # ==================== 加载 ====================
+
+    @classmethod
+    def from_csv(cls, data_dir=DEFAULT_DATA_DIR):
+        """直接从 ml-latest-small 的CSV构建快照，与导入脚本的写入语义一致"""
+        movies_df = pd.read_csv(os.path.join(data_dir, 'movies.csv'))
+        parsed = parse_movie_titles(movies_df['title'])
+        movies = pd.DataFrame({
+            'id': movies_df['movieId'],
+            'title': parsed['title'],
+            'year': parsed['year'],
+            'genres': [[] if raw == '(no genres listed)' else raw.split('|') for raw in movies_df['genres']],
+        })
+        ratings = pd.read_csv(os.path.join(data_dir, 'ratings.csv')).rename(
+            columns={'userId': 'user_id', 'movieId': 'movie_id'}
+        ).drop_duplicates(['user_id', 'movie_id'], keep='last')
+        # 导入时 MERGE (u)-[:TAGGED]->(m)，每个用户-电影对只有一条关系（全部标签在 t.tags 中）
+        tags = pd.read_csv(os.path.join(data_dir, 'tags.csv')).rename(
+            columns={'userId': 'user_id', 'movieId': 'movie_id'}
+        ).drop_duplicates(['user_id', 'movie_id'], keep='last')
+        return cls(movies, ratings, tags[['user_id', 'movie_id', 'timestamp']], version=csv_version(data_dir))
+
+    @classmethod
+    def from_neo4j(cls, driver):
+        """
+        从Neo4j读取整张图构建快照
+
+        Args:
+            driver: Neo4j驱动实例（如 Neo4jDatabase.connect() 的返回值）
+        """
+        with driver.session() as session:
+            record = session.run(DATA_VERSION_QUERY, source=IMPORT_STATE_SOURCE).single()
+            version = record['version'] if record else None
+            movies = pd.DataFrame([dict(record) for record in session.run(ALL_MOVIES_QUERY)],
+                                  columns=['id', 'title', 'year', 'genres'])
+            ratings = pd.DataFrame([dict(record) for record in session.run(RATINGS_QUERY)],
+                                   columns=['user_id', 'movie_id', 'rating', 'timestamp'])
+            tags = pd.DataFrame([dict(record) for record in session.run(TAGS_QUERY)],
+                                columns=['user_id', 'movie_id', 'timestamp'])
+        movies['genres'] = movies['genres'].map(lambda genres: genres or [])
+        return cls(movies, ratings, tags, version=version)
+
+    def _movie_rows(self, movie_ids):
+        """电影ID -> 节点编号（电影节点编号即行号）"""
+        return np.searchsorted(self.movie_ids, movie_ids.to_numpy(np.int64))
+
+    def _user_nodes(self, user_ids):
+        """用户ID -> 节点编号"""
+        return np.searchsorted(self.user_ids, user_ids.to_numpy(np.int64)) + self.user_offset
+
+    # ==================== 节点 ====================
+
+    def find_movie(self, movie_id):
+        """电影ID -> 节点编号，不存在时返回None"""
+        row = np.searchsorted(self.movie_ids, movie_id)
+        return int(row) if row < self.n_movies and self.movie_ids[row] == movie_id else None
+
+    def find_user(self, user_id):
+        """用户ID -> 节点编号，不存在时返回None"""
+        row = np.searchsorted(self.user_ids, user_id)
+        return int(row) + self.user_offset if row < self.n_users and self.user_ids[row] == user_id else None
+
+    def find_node(self, label, key):
+        """按标签和 PATH_NODE_KEYS 中的属性值定位节点"""
+        if label == 'Movie':
+            return self.find_movie(key)
+        if label == 'User':
+            return self.find_user(key)
+        row = self.genre_index.get(key)
+        return None if row is None else row + self.genre_offset
+
+    def movie_genres(self, row):
+        """电影的类型名称列表"""
+        start, end = self.indptr[row], self.indptr[row + 1]
+        mask = self.adjacency_type[start:end] == IN_GENRE
+        return [self.genre_names[node - self.genre_offset] for node in self.adjacency[start:end][mask]]
+
+    def movie_dict(self, row):
+        """电影字典（与 movie_record_to_dict 的输出相同）"""
+        return movie_record_to_dict(self.movie_record(row))
+
+    def movie_record(self, row, **extra):
+        """与Cypher查询结果字段相同的电影记录"""
+        return {'id': int(self.movie_ids[row]), 'title': self.titles[row], 'year': self.years[row],
+                'genres': self.movie_genres(row), **extra}
+
+    def movie_stats(self, row):
+        """电影的评分统计字段（与 TOP_MOVIES_QUERY 返回的字段相同）"""
+        avg_rating = self.movie_avg_rating[row]
+        return {'rating_count': int(self.movie_rating_count[row]),
+                'avg_rating': None if np.isnan(avg_rating) else float(avg_rating),
+                'bayesian_rating': float(self.movie_bayesian_rating[row]),
+                'rating_histogram': self.movie_rating_histogram[row]}
+
+    def node_key(self, node):
+        """节点的ID字符串（与 get_node_id 一致：电影/用户为id，类型为名称）"""
+        label = self.label[node]
+        if label == MOVIE:
+            return str(self.movie_ids[node])
+        if label == USER:
+            return str(self.user_ids[node - self.user_offset])
+        return self.genre_names[node - self.genre_offset]
+
+    def node_dict(self, node):
+        """节点字典（与 node_to_dict 的输出相同）"""
+        label = self.label[node]
+        key = self.node_key(node)
+        if label == MOVIE:
+            properties = {'id': int(self.movie_ids[node]), 'title': self.titles[node]}
+            if self.years[node] is not None:
+                properties['year'] = self.years[node]
+            name = self.titles[node]
+        elif label == USER:
+            row = node - self.user_offset
+            properties = {'id': int(self.user_ids[row]), 'id_text': key, 'rating_count': int(self.rating_count[row])}
+            name = f"User_{key}"
+        else:
+            properties = {'name': key}
+            name = key
+        return {'id': key, 'name': name or f"{LABELS[label]}_{key}", 'type': LABELS[label], 'properties': properties}
+
+    def link_dict(self, rel):
+        """关系字典（按关系本身的方向）"""
+        return {
+            'source': self.node_key(self.rel_source[rel]),
+            'target': self.node_key(self.rel_target[rel]),
+            'type': RELATIONSHIP_TYPES[self.rel_type[rel]],
+        }
+
+    def neighbours(self, frontier, type_mask=None, node_mask=None):
+        """
+        一次性展开一组节点的邻接项（向量化）
+
+        Args:
+            frontier: 节点编号数组
+            type_mask: 长度为关系类型数的布尔数组，只保留允许的关系类型
+            node_mask: 长度为节点数的布尔数组，只保留允许的邻居
+
+        Returns:
+            tuple: (来源节点数组, 邻居节点数组, 关系编号数组)
+        """
+        frontier = np.asarray(frontier, dtype=np.int64)
+        starts = self.indptr[frontier]
+        lengths = self.indptr[frontier + 1] - starts
+        total = int(lengths.sum())
+        if total == 0:
+            empty = np.array([], dtype=np.int64)
+            return empty, empty, empty
+        offsets = np.repeat(starts - (np.cumsum(lengths) - lengths), lengths)
+        positions = np.arange(total) + offsets
+        sources = np.repeat(frontier, lengths)
+        keep = np.ones(total, dtype=bool)
+        if type_mask is not None:
+            keep &= type_mask[self.adjacency_type[positions]]
+        if node_mask is not None:
+            keep &= node_mask[self.adjacency[positions]]
+        positions = positions[keep]
+        return sources[keep], self.adjacency[positions].astype(np.int64), self.adjacency_rel[positions].astype(np.int64)
+
+    # ==================== 电影列表与搜索 ====================
+
+    def movies(self, skip=0, limit=100):
+        return [rated_movie_record_to_dict(self.movie_record(row, **self.movie_stats(row)))
+                for row in range(skip, min(skip + limit, self.n_movies))]
+
+    def movies_page(self, after_id=None, limit=100):
+        after_id = FIRST_PAGE_CURSOR if after_id is None else safe_int_convert(after_id)
+        start = int(np.searchsorted(self.movie_ids, after_id, side='right'))
+        return build_movie_page([self.movie_record(row, **self.movie_stats(row))
+                                 for row in range(start, min(start + limit, self.n_movies))], limit)
+
+    def top_movies(self, sort='score', genre=None, year_from=None, year_to=None, min_ratings=0, limit=20):
+        """与 get_top_movies 相同的排行榜：按条件过滤后按排序值降序、电影ID升序"""
+        values = {
+            'bayesian_rating': self.movie_bayesian_rating,
+            'rating_count': self.movie_rating_count.astype(np.float64),
+            'avg_rating': self.movie_avg_rating,
+        }[top_movies_sort_property(sort)]
+        mask = ~np.isnan(values) & (self.movie_rating_count >= min_ratings)
+        if year_from is not None:
+            mask &= self.year_values >= year_from
+        if year_to is not None:
+            mask &= self.year_values <= year_to
+        if genre is not None:
+            if genre not in self.genre_index:
+                return []
+            _, genre_movies, _ = self.neighbours([self.genre_index[genre] + self.genre_offset])
+            in_genre = np.zeros(self.n_movies, dtype=bool)
+            in_genre[genre_movies] = True
+            mask &= in_genre
+        rows = np.flatnonzero(mask)
+        rows = rows[np.lexsort((self.movie_ids[rows], -values[rows]))[:limit]]
+        return [top_movie_record_to_dict(self.movie_record(row, **self.movie_stats(row))) for row in rows]
+
+    def search_movies(self, keyword, limit=10, mode='index'):
+        """index/fulltext 模式都使用内存标题索引；contains 模式为区分大小写的子串匹配"""
+        if check_mode('搜索方式', mode, SEARCH_MODES) != 'contains':
+            return self.title_index.search(keyword, limit=limit)
+        rows = sorted((row for row, title in enumerate(self.titles) if keyword in title), key=lambda row: self.titles[row])
+        return [self.movie_dict(row) for row in rows[:limit]]
+
+    def search_users(self, keyword, limit=10):
+        """按ID前缀搜索用户，按评分数降序"""
+        prefix = user_id_prefix(keyword)
+        if prefix is None:
+            return []
+        lo = bisect_left(self.user_id_texts, (prefix,))
+        hi = bisect_right(self.user_id_texts, (prefix + '\uffff',))
+        rows = [row for _, row in self.user_id_texts[lo:hi]]
+        top = heapq.nsmallest(limit, rows, key=lambda row: (-self.rating_count[row], self.user_ids[row]))
+        return [user_record_to_dict({'id': int(self.user_ids[row]), 'rating_count': int(self.rating_count[row])})
+                for row in top]
+
+    # ==================== 关系网络 ====================
+
+    def movie_network(self, movie_id, depth=2, max_nodes=100):
+        """
+        与bfs模式的 get_movie_network 相同的逐层扩展：每层按度数挑选邻居，
+        最后返回选中节点之间的全部关系
+        """
+        depth, max_nodes = clamp_network_params(depth, max_nodes)
+        start = self.find_movie(safe_int_convert(movie_id))
+        if start is None:
+            return {'nodes': [], 'links': []}
+
+        visited = np.zeros(self.n_nodes, dtype=bool)
+        expansion = LevelNetworkExpansion(start, depth, max_nodes)
+        while (frontier := expansion.next_frontier()) is not None:
+            visited[expansion.selected] = True
+            sources, targets, _ = self.neighbours(frontier, node_mask=~visited)
+            # 同一对节点之间可能有多条关系（评分并打了标签），先去重
+            pairs = np.unique(sources * self.n_nodes + targets)
+            sources, targets = pairs // self.n_nodes, pairs % self.n_nodes
+            # 每个前沿节点按度数降序至多取 per_node 个邻居
+            order = np.lexsort((targets, -self.degree[targets], sources))
+            sources, targets = sources[order], targets[order]
+            group_starts = np.flatnonzero(np.r_[True, sources[1:] != sources[:-1]])
+            rank = np.arange(len(sources)) - np.repeat(group_starts, np.diff(np.r_[group_starts, len(sources)]))
+            keep = rank < expansion.per_node
+            sources, targets = sources[keep], targets[keep]
+            expansion.expand(zip(sources.tolist(), targets.tolist(), self.degree[targets].tolist()))
+        selected = expansion.selected
+
+        chosen = np.zeros(self.n_nodes, dtype=bool)
+        chosen[selected] = True
+        rels = np.flatnonzero(chosen[self.rel_source] & chosen[self.rel_target])
+        return {
+            'nodes': [self.node_dict(node) for node in selected],
+            'links': [self.link_dict(rel) for rel in rels],
+        }
+
+    # ==================== 路径 ====================
+
+    def shortest_path(self, start_type, start_id, end_type, end_id, max_depth=6,
+                      algorithm='shortest', rel_types=None, via_labels=None, k=3):
+        """
+        与 find_shortest_path 相同的参数和返回格式
+
+        内存中的BFS总是精确的，shortest 与 bidirectional 返回同一条最短路径；
+        k_shortest 使用Yen算法（k_shortest_paths）依次求出前k条无环最短路径；
+        weighted 与Neo4j后端相同，由 WeightedPathSearch 逐批扩展（这里不限制每个节点的邻居数）。
+        """
+        template, params = path_query_params(start_type, start_id, end_type, end_id, max_depth, rel_types, via_labels)
+        if algorithm not in PATH_ALGORITHMS:
+            raise InvalidArgument(f"不支持的路径算法: {algorithm}，可选值: {', '.join(PATH_ALGORITHMS)}")
+        start = self.find_node(template['start_type'], params['start_id'])
+        end = self.find_node(template['end_type'], params['end_id'])
+        if start is None or end is None:
+            return {'nodes': [], 'links': [], 'paths': []} if algorithm == 'k_shortest' else {'nodes': [], 'links': []}
+
+        type_mask = np.array([rel_type in template['rel_types'].split('|') for rel_type in RELATIONSHIP_TYPES])
+        node_mask = np.isin(self.label, [LABELS.index(label) for label in params['labels']])
+        max_depth = template['max_depth']
+
+        if algorithm == 'weighted':
+            if not node_mask[start] or not node_mask[end]:
+                return {'nodes': [], 'links': []}
+            search = WeightedPathSearch(start, end, max_depth)
+            while (frontier := search.next_frontier()) is not None:
+                sources, targets, rels = self.neighbours(frontier, type_mask, node_mask)
+                search.expand(zip(sources.tolist(), targets.tolist(), self.degree[targets].tolist(), rels.tolist()))
+            path = search.path()
+            return {**self._path_dict(*path), 'cost': search.cost} if path else {'nodes': [], 'links': []}
+
+        if algorithm != 'k_shortest':
+            path = self._bfs_path(start, end, max_depth, type_mask, node_mask)
+            return self._path_dict(*path) if path else {'nodes': [], 'links': []}
+
+        def shortest(source, target, depth, banned_nodes, banned_rels):
+            mask = node_mask.copy()
+            mask[list(banned_nodes)] = False
+            return self._bfs_path(source, target, depth, type_mask, mask, banned_rels)
+
+        paths = k_shortest_paths(shortest, start, end, max_depth, max(1, min(int(k), MAX_K_PATHS)))
+        nodes, links = {}, {}
+        for path_nodes, path_rels in paths:
+            result = self._path_dict(path_nodes, path_rels)
+            for node in result['nodes']:
+                nodes.setdefault(node['id'], node)
+            for link in result['links']:
+                links.setdefault((link['source'], link['target'], link['type']), link)
+        return {'nodes': list(nodes.values()), 'links': list(links.values()),
+                'paths': [[self.node_key(node) for node in path_nodes] for path_nodes, _ in paths]}
+
+    def _bfs_path(self, start, end, max_depth, type_mask, node_mask, banned_rels=None):
+        """
+        逐层向量化BFS
+
+        Returns:
+            tuple: (节点编号列表, 关系编号列表)，不可达时返回None
+        """
+        if not node_mask[start] or not node_mask[end]:
+            return None
+        if start == end:
+            return [start], []
+        parent = np.full(self.n_nodes, -1, dtype=np.int64)
+        parent_rel = np.full(self.n_nodes, -1, dtype=np.int64)
+        seen = ~node_mask
+        seen[start] = True
+        frontier = np.array([start])
+        for _ in range(max_depth):
+            sources, targets, rels = self.neighbours(frontier, type_mask, ~seen)
+            if banned_rels:
+                keep = ~np.isin(rels, list(banned_rels))
+                sources, targets, rels = sources[keep], targets[keep], rels[keep]
+            targets, first = np.unique(targets, return_index=True)
+            if len(targets) == 0:
+                return None
+            parent[targets] = sources[first]
+            parent_rel[targets] = rels[first]
+            seen[targets] = True
+            if seen[end] and parent[end] >= 0:
+                nodes, path_rels = [end], []
+                while nodes[-1] != start:
+                    path_rels.append(int(parent_rel[nodes[-1]]))
+                    nodes.append(int(parent[nodes[-1]]))
+                return nodes[::-1], path_rels[::-1]
+            frontier = targets
+        return None
+
+    def _path_dict(self, nodes, rels):
+        return {'nodes': [self.node_dict(node) for node in nodes], 'links': [self.link_dict(rel) for rel in rels]}
+
+    # ==================== 推荐 ====================
+
+    def liked_movies(self, user_id, min_rating=4.0, limit=None):
+        """
+        用户评分 >= min_rating 的电影
+
+        Returns:
+            list: (电影行号, 评分) 列表，按评分降序、标题升序
+        """
+        node = self.find_user(safe_int_convert(user_id))
+        if node is None:
+            return []
+        row = node - self.user_offset
+        start, end = self.ratings.indptr[row], self.ratings.indptr[row + 1]
+        movies, ratings = self.ratings.indices[start:end], self.ratings.data[start:end]
+        liked = sorted(((int(movie), float(rating)) for movie, rating in zip(movies, ratings) if rating >= min_rating),
+                       key=lambda item: (-item[1], self.titles[item[0]]))
+        return liked[:limit] if limit is not None else liked
+
+    def user_liked_movies(self, user_id, min_rating=4.0, limit=10):
+        return [liked_movie_record_to_dict(self.movie_record(movie, rating=rating))
+                for movie, rating in self.liked_movies(user_id, min_rating, limit)]
+
+    def recommendations(self, user_id, limit=20, min_rating=4.0):
+        """与 get_user_recommendations 相同的五种策略和返回格式，全部在内存中计算"""
+        start = time.perf_counter()
+        stages = (
+            ('genre_preferences', lambda: self._genre_preferences(liked)),
+            ('similar_users', lambda: self._similar_users(row)),
+            ('genre_strategy', lambda: self._genre_strategy(liked, rated, limit)),
+            ('similar_users_strategy', lambda: self._similar_users_strategy(row, rated, limit)),
+            ('similar_movies_strategy', lambda: self._similar_movies_strategy(liked, rated, limit)),
+            ('factor_strategy', lambda: self._factor_strategy(user_id, rated, limit)),
+            ('tag_strategy', lambda: self._tag_strategy(row, min_rating, limit)),
+        )
+        node = self.find_user(safe_int_convert(user_id))
+        if node is None:
+            # 用户不存在时各策略都没有结果，耗时的键与正常路径一致
+            timings = {name: 0.0 for name, _ in stages}
+            timings['total'] = round((time.perf_counter() - start) * 1000, 2)
+            result = build_recommendations([], [], [], [], [], limit, timings=timings)
+            result['reasoning']['source'] = 'live'
+            return result
+        row = node - self.user_offset
+        liked = self.liked_movies(user_id, min_rating)
+        rated = np.zeros(self.n_movies, dtype=bool)
+        rated[self.ratings.indices[self.ratings.indptr[row]:self.ratings.indptr[row + 1]]] = True
+
+        records, timings = {}, {}
+        for name, stage in stages:
+            stage_start = time.perf_counter()
+            records[name] = stage()
+            timings[name] = round((time.perf_counter() - stage_start) * 1000, 2)
+        timings['total'] = round((time.perf_counter() - start) * 1000, 2)
+        result = build_recommendations(
+            records['genre_preferences'], records['similar_users'],
+            records['genre_strategy'], records['similar_users_strategy'], records['similar_movies_strategy'],
+            limit, timings=timings, factor_recs=records['factor_strategy'], tag_recs=records['tag_strategy']
+        )
+        result['reasoning']['source'] = 'live'
+        return result
+
+    def _genre_counts(self, liked):
+        """喜欢的电影按类型统计：类型 -> (电影数, 评分和)"""
+        counts = {}
+        for movie, rating in liked:
+            for genre in self.movie_genres(movie):
+                count, total = counts.get(genre, (0, 0.0))
+                counts[genre] = (count + 1, total + rating)
+        return sorted(counts.items(), key=lambda item: (-item[1][0], item[0]))
+
+    def _genre_preferences(self, liked):
+        return [{'genre': genre, 'movie_count': count, 'avg_rating': total / count}
+                for genre, (count, total) in self._genre_counts(liked)[:10]]
+
+    def _similar_users(self, row):
+        order, scores, commons = self._user_neighbours[row]
+        return [{'user_id': int(self.user_ids[other]), 'common_movies': int(common), 'similarity': float(score)}
+                for other, score, common in list(zip(order, scores, commons))[:5]]
+
+    def _genre_strategy(self, liked, rated, limit):
+        records = []
+        for genre, _ in self._genre_counts(liked)[:5]:
+            genre_node = self.genre_index[genre] + self.genre_offset
+            _, movies, _ = self.neighbours([genre_node])
+            for movie in np.sort(movies):
+                if not rated[movie]:
+                    records.append(self.movie_record(movie, reason=f'类型偏好: {genre}', score=1))
+                    if len(records) >= limit:
+                        return records
+        return records
+
+    def _similar_users_strategy(self, row, rated, limit):
+        order, scores, commons = self._user_neighbours[row]
+        best = {}
+        for other, score, common in list(zip(order, scores, commons))[:SIMILAR_USER_NEIGHBOURS]:
+            start, end = self.ratings.indptr[other], self.ratings.indptr[other + 1]
+            for movie in self.ratings.indices[start:end]:
+                if rated[movie]:
+                    continue
+                current = best.get(movie, (0.0, 0))
+                best[movie] = (max(current[0], float(score)), max(current[1], int(common)))
+        ranked = heapq.nsmallest(limit, best.items(), key=lambda item: (-item[1][0], -item[1][1], item[0]))
+        return [self.movie_record(movie, reason=f'相似用户推荐 (共同评分{common}部电影)', score=2)
+                for movie, (_, common) in ranked]
+
+    def _similar_movies_strategy(self, liked, rated, limit):
+        neighbours = self.similar_movies([movie for movie, _ in liked])
+        totals, best_source = {}, {}
+        for movie, rating in liked:
+            order, scores, _ = neighbours[movie]
+            for similar, score in zip(order, scores):
+                if rated[similar]:
+                    continue
+                weight = float(score) * rating
+                totals[similar] = totals.get(similar, 0.0) + weight
+                if weight > best_source.get(similar, (-1.0, None))[0]:
+                    best_source[similar] = (weight, movie)
+        ranked = heapq.nsmallest(limit, totals.items(), key=lambda item: (-item[1], item[0]))
+        return [self.movie_record(similar, reason=f'基于您喜欢的《{self.titles[best_source[similar][1]]}》', score=3)
+                for similar, _ in ranked]
+
+    def _factor_strategy(self, user_id, rated, limit):
+        """隐因子模型只排除了训练时已有的评分，这里再排除快照中用户已评分的电影"""
+        predictions = factor_predictions(safe_int_convert(user_id), limit)
+        rows = [self.find_movie(movie_id) for movie_id, _ in predictions]
+        records = [self.movie_record(row) for row in rows if row is not None and not rated[row]]
+        return factor_strategy_records(records, predictions)
+
+    def _tag_strategy(self, row, min_rating, limit):
+        start, end = self.ratings.indptr[row], self.ratings.indptr[row + 1]
+        ratings = [{'id': int(self.movie_ids[movie]), 'rating': float(rating)}
+                   for movie, rating in zip(self.ratings.indices[start:end], self.ratings.data[start:end])]
+        predictions = tag_predictions(ratings, min_rating, limit)
+        return tag_strategy_records(self._movie_records([movie_id for movie_id, _, _ in predictions]), predictions)
+
+    def _movie_records(self, movie_ids):
+        """按电影ID取电影记录，跳过快照中不存在的电影"""
+        rows = [self.find_movie(movie_id) for movie_id in movie_ids]
+        return [self.movie_record(row) for row in rows if row is not None]
+
+    # ==================== 标签 ====================
+
+    def movies_by_tag(self, tag, limit=20):
+        matches = require_tag_vectors().movies_by_tag(tag, limit)
+        return tagged_movie_dicts(self._movie_records([movie_id for movie_id, _ in matches]), matches)
+
+    def similar_tag_movies(self, movie_id, limit=10):
+        matches = require_tag_vectors().similar_movies(safe_int_convert(movie_id), limit)
+        return similar_tag_movie_dicts(self._movie_records([movie_id for movie_id, _, _ in matches]), matches)
+
+    def similar_movies(self, movies):
+        """
+        电影的相似电影（调整余弦相似度），首次用到时计算并缓存在快照中
+
+        Returns:
+            dict: 电影行号 -> (邻居行号数组, 相似度数组, 共同评分用户数数组)
+        """
+        missing = np.array(sorted(set(movies) - self._movie_neighbours.keys()), dtype=np.int64)
+        if len(missing):
+            for movie, result in zip(missing, self._movie_similarity.compute(missing, SIMILARITY_BLOCK_SIZE)):
+                self._movie_neighbours[int(movie)] = result
+        return {movie: self._movie_neighbours[movie] for movie in movies}
+
+    def stats(self):
+        return {
+            'version': self.version,
+            'movies': self.n_movies,
+            'users': self.n_users,
+            'genres': len(self.genre_names),
+            'relationships': int(len(self.rel_type)),
+            'build_seconds': round(self.build_seconds, 3),
+            'memory_mb': round(sum(array.nbytes for array in (
+                self.label, self.rel_source, self.rel_target, self.rel_type, self.adjacency,
+                self.adjacency_rel, self.adjacency_type, self.indptr, self.ratings.data, self.ratings.indices,
+            )) / 1e6, 2),
+        }
+
+
+class SnapshotDatabase:
+    """
+    以内存图快照提供与 AsyncNeo4jDatabase 相同公共方法的数据访问对象
+
+    source='neo4j' 时从Neo4j加载并定期检查图中的数据版本；source='csv' 时直接读取CSV
+    并检查文件修改时间。版本变化时在线程中构建新快照，完成后替换 self.snapshot，
+    每个请求开始时取一次引用，因此总是看到完整的一份数据。
+    """
+
+    def __init__(self, source='csv', data_dir=DEFAULT_DATA_DIR, refresh_interval=60.0):
+        if source not in ('csv', 'neo4j'):
+            raise ValueError(f"不支持的快照数据源: {source}")
+        self.source = source
+        self.data_dir = data_dir
+        self.refresh_interval = refresh_interval
+        self.snapshot = None
+        self._neo4j = Neo4jDatabase() if source == 'neo4j' else None
+        self._reload_lock = asyncio.Lock()
+        self._refresh_task = None
+        self.reloads = 0
+
+    @classmethod
+    def from_env(cls):
+        """
+        从环境变量创建
+
+        - SNAPSHOT_SOURCE: csv（默认）或 neo4j
+        - SNAPSHOT_DATA_DIR: CSV目录（默认 ml-latest-small）
+        - SNAPSHOT_REFRESH_SECONDS: 检查数据版本的间隔，0表示不自动重新加载（默认60）
+        """
+        return cls(
+            source=os.getenv("SNAPSHOT_SOURCE", "csv"),
+            data_dir=os.getenv("SNAPSHOT_DATA_DIR", DEFAULT_DATA_DIR),
+            refresh_interval=float(os.getenv("SNAPSHOT_REFRESH_SECONDS", "60")),
+        )
+
+    def _load(self):
+        if self.source == 'neo4j':
+            return GraphSnapshot.from_neo4j(self._neo4j.connect())
+        return GraphSnapshot.from_csv(self.data_dir)
+
+    def _source_version(self):
+        if self.source == 'neo4j':
+            return self._neo4j.get_data_version()
+        return csv_version(self.data_dir)
+
+    async def reload(self):
+        """在线程中构建新快照并原子替换，返回新快照"""
+        async with self._reload_lock:
+            snapshot = await asyncio.to_thread(self._load)
+            self.snapshot = snapshot
+            self.reloads += 1
+            print(f"[快照] 已加载 {snapshot.stats()}")
+            return snapshot
+
+    async def _refresh_loop(self):
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            try:
+                version = await asyncio.to_thread(self._source_version)
+                if self.snapshot is None or version != self.snapshot.version:
+                    await self.reload()
+            except Exception as e:
+                print(f"[快照] 检查数据版本失败: {e}")
+
+    async def _current(self):
+        """当前快照（首次调用时加载）"""
+        return self.snapshot or await self.reload()
+
+    # ==================== 生命周期 ====================
+
+    async def warm_up(self, connections=None):
+        """加载快照，并按需启动后台刷新任务"""
+        await self._current()
+        if self.refresh_interval > 0 and self._refresh_task is None:
+            self._refresh_task = asyncio.create_task(self._refresh_loop())
+
+    async def close(self):
+        if self._refresh_task is not None:
+            self._refresh_task.cancel()
+            self._refresh_task = None
+        if self._neo4j is not None:
+            self._neo4j.close()
+
+    async def health(self):
+        if self.snapshot is None:
+            return {'status': 'unavailable', 'engine': 'snapshot', 'error': '快照尚未加载'}
+        return {'status': 'ok', 'engine': 'snapshot', 'source': self.source, 'reloads': self.reloads,
+                'snapshot': self.snapshot.stats()}
+
+    async def check_schema(self):
+        """快照没有数据库模式"""
+        return []
+
+    async def ensure_schema(self):
+        return []
+
+    async def get_data_version(self):
+        return (await self._current()).version
+
+    async def get_title_index(self):
+        return (await self._current()).title_index
+
+    # ==================== 查询 ====================
+
+    async def get_movies(self, limit=100, skip=0):
+        return (await self._current()).movies(skip=skip, limit=limit)
+
+    async def get_movies_page(self, after_id=None, limit=100):
+        return (await self._current()).movies_page(after_id=after_id, limit=limit)
+
+    async def get_top_movies(self, sort='score', genre=None, year_from=None, year_to=None, min_ratings=0, limit=20):
+        return (await self._current()).top_movies(sort, genre, year_from, year_to, min_ratings, limit)
+
+    async def get_movie_count(self):
+        return (await self._current()).n_movies
+
+    async def search_movies(self, keyword, limit=10, mode='index'):
+        return (await self._current()).search_movies(keyword, limit=limit, mode=mode)
+
+    async def search_users(self, keyword, limit=10):
+        return (await self._current()).search_users(keyword, limit=limit)
+
+    async def get_movie_network(self, movie_id, depth=2, max_nodes=100, mode='bfs'):
+        """快照只实现bfs扩展；paths/projection 是Neo4j的查询方式，快照不支持"""
+        if mode != 'bfs':
+            raise InvalidArgument(f"内存快照后端只支持 bfs 模式，不支持: {mode}")
+        snapshot = await self._current()
+        return await asyncio.to_thread(snapshot.movie_network, movie_id, depth, max_nodes)
+
+    async def get_user_recommendations(self, user_id, limit=20, min_rating=4.0):
+        snapshot = await self._current()
+        return await asyncio.to_thread(snapshot.recommendations, user_id, limit, min_rating)
+
+    async def get_user_liked_movies(self, user_id, min_rating=4.0, limit=10):
+        return (await self._current()).user_liked_movies(user_id, min_rating=min_rating, limit=limit)
+
+    async def get_movies_by_tag(self, tag, limit=20):
+        return (await self._current()).movies_by_tag(tag, limit=limit)
+
+    async def get_similar_tag_movies(self, movie_id, limit=10):
+        return (await self._current()).similar_tag_movies(movie_id, limit=limit)
+
+    async def find_shortest_path(self, start_type, start_id, end_type, end_id, max_depth=6,
+                                 algorithm='shortest', rel_types=None, via_labels=None, k=3):
+        snapshot = await self._current()
+        return await asyncio.to_thread(
+            snapshot.shortest_path, start_type, start_id, end_type, end_id, max_depth,
+            algorithm, rel_types, via_labels, k
+        )
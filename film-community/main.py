@@ -1,9 +1,46 @@
-from fastapi import FastAPI, Query
+import os
+import time
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-from database import db
-from typing import List, Dict
+from fastapi.responses import JSONResponse, PlainTextResponse
+from neo4j.exceptions import ServiceUnavailable, SessionExpired, TransientError
+from backends import backend_from_env
+from cache import CachedDatabase, cache_from_env
+from database import InvalidArgument, tag_dicts
+from metrics import metrics, stats_lines
+from tag_vectors import TagVectorsUnavailable, require_tag_vectors
+from typing import List, Dict, Optional
 
-app = FastAPI()
+
+# 只读接口的结果缓存；导入数据后通过图中的数据版本自动失效
+db = CachedDatabase(
+    backend_from_env(),
+    cache_from_env(),
+    methods=['get_movies', 'get_movies_page', 'get_top_movies', 'get_movie_count', 'get_movie_network',
+             'get_user_recommendations'],
+    version_check_interval=float(os.getenv("CACHE_VERSION_CHECK_SECONDS", "5")),
+)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """应用生命周期：启动时预热连接池、检查图数据库模式并构建标题索引，关闭时释放连接"""
+    try:
+        await db.warm_up()
+        missing = await db.check_schema()
+        if missing:
+            print(f"缺少约束/索引 {missing}，正在创建...")
+            await db.ensure_schema()
+        index = await db.get_title_index()
+        print(f"标题索引已构建：{len(index)} 部电影，耗时 {index.build_seconds * 1000:.1f} ms")
+    except Exception as e:
+        print(f"数据库初始化失败: {e}")
+    yield
+    await db.close()
+
+
+app = FastAPI(lifespan=lifespan)
 
 # 配置CORS，允许前端访问
 app.add_middleware(
@@ -15,6 +52,77 @@ app.add_middleware(
 )
 
 
+# 出错时返回对应的状态码，响应体仍为 {"error": ...}，便于按状态码统计失败
+@app.exception_handler(InvalidArgument)
+async def invalid_argument_handler(request: Request, exc: InvalidArgument):
+    """参数不合法（如不支持的节点类型、关系类型、路径算法）；其他 ValueError 属于服务端错误，返回500"""
+    return JSONResponse({"error": str(exc)}, status_code=400)
+
+
+@app.exception_handler(ServiceUnavailable)
+@app.exception_handler(SessionExpired)
+@app.exception_handler(TransientError)
+@app.exception_handler(TagVectorsUnavailable)
+async def database_unavailable_handler(request: Request, exc: Exception):
+    """数据库不可用或暂时性错误（或标签向量尚未构建），客户端可以重试"""
+    return JSONResponse({"error": str(exc)}, status_code=503)
+
+
+@app.exception_handler(Exception)
+async def internal_error_handler(request: Request, exc: Exception):
+    return JSONResponse({"error": str(exc)}, status_code=500)
+
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    """按路由模板（而不是实际路径）和状态码记录请求耗时，未匹配任何路由的请求记为 unmatched"""
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        route = request.scope.get('route')
+        metrics.observe_request(request.method, route.path if route else 'unmatched', status,
+                                time.perf_counter() - start)
+
+
+@app.get("/health")
+async def health():
+    """
+    健康检查
+    
+    返回连接池配置与使用情况、探测查询延迟和结果缓存统计；数据库不可用时返回503
+    """
+    report = await db.health()
+    report['cache'] = db.cache.stats()
+    status_code = 200 if report['status'] == 'ok' else 503
+    return JSONResponse(report, status_code=status_code)
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """
+    Prometheus 指标
+    
+    每个接口（路由模板、状态码）和每个查询的延迟直方图，查询返回行数、服务端耗时、错误和慢查询计数，
+    以及结果缓存统计
+    """
+    return PlainTextResponse(metrics.render(stats_lines('cache', db.cache.stats())),
+                             media_type="text/plain; version=0.0.4")
+
+
+@app.get("/metrics/slow-queries")
+async def get_slow_queries():
+    """
+    最近的慢查询（超过 SLOW_QUERY_MS），最近的在前
+    
+    开启 SLOW_QUERY_PROFILE 时附带 PROFILE 执行计划（SQLite后端为 EXPLAIN QUERY PLAN）
+    """
+    return {'threshold_ms': metrics.slow_query_ms, 'queries': metrics.slow_query_log()}
+
+
 @app.get("/hello/{name}")
 async def say_hello(name: str):
     return {"message": f"Hello {name}"}
@@ -31,64 +139,150 @@ async def get_movies(
     - **limit**: 返回的电影数量（1-1000）
     - **skip**: 跳过的电影数量（用于分页）
     """
-    try:
-        movies = db.get_movies(limit=limit, skip=skip)
-        return movies
-    except Exception as e:
-        return {"error": str(e)}
+    movies = await db.get_movies(limit=limit, skip=skip)
+    return movies
+
+
+@app.get("/api/movies/page")
+async def get_movies_page(
+    after_id: Optional[str] = Query(default=None, description="上一页返回的next_cursor，不传表示第一页"),
+    limit: int = Query(default=100, ge=1, le=1000, description="每页电影数量")
+):
+    """
+    游标分页获取电影列表
+    
+    - **after_id**: 上一页返回的 next_cursor
+    - **limit**: 每页电影数量（1-1000）
+    
+    返回 movies 和 next_cursor，next_cursor 为 null 表示没有下一页
+    """
+    return await db.get_movies_page(after_id=after_id, limit=limit)
+
+
+@app.get("/api/movies/top")
+async def get_top_movies(
+    sort: str = Query(default="score", pattern="^(score|popular|rating)$", description="排序方式（score/popular/rating）"),
+    genre: Optional[str] = Query(default=None, description="只看该类型的电影，如 Comedy"),
+    year_from: Optional[int] = Query(default=None, ge=1800, le=2100, description="起始年份（含）"),
+    year_to: Optional[int] = Query(default=None, ge=1800, le=2100, description="截止年份（含）"),
+    min_ratings: int = Query(default=0, ge=0, description="最少评分数"),
+    limit: int = Query(default=20, ge=1, le=100, description="返回数量")
+):
+    """
+    电影排行榜
+    
+    - **sort**: score 贝叶斯加权分（默认，评分少的电影向全站平均分收缩）；popular 评分数；rating 平均分
+    - **genre**: 类型过滤
+    - **year_from** / **year_to**: 上映年份范围
+    - **min_ratings**: 最少评分数，按平均分排序时可以排除评分很少的电影
+    - **limit**: 返回数量（1-100）
+    
+    读取导入时物化在电影上的评分统计，每部电影附带 rating_count、avg_rating、bayesian_rating 和 rating_histogram
+    （0.5~5.0分各档的评分数）
+    """
+    return await db.get_top_movies(sort=sort, genre=genre, year_from=year_from, year_to=year_to,
+                                   min_ratings=min_ratings, limit=limit)
 
 
 @app.get("/api/movies/count")
 async def get_movie_count():
     """获取电影总数"""
-    try:
-        count = db.get_movie_count()
-        return {"count": count}
-    except Exception as e:
-        return {"error": str(e)}
+    count = await db.get_movie_count()
+    return {"count": count}
 
 
 @app.get("/api/movies/search")
 async def search_movies(
     q: str = Query(..., description="搜索关键词"),
-    limit: int = Query(default=10, ge=1, le=50, description="返回结果数量")
+    limit: int = Query(default=10, ge=1, le=50, description="返回结果数量"),
+    mode: str = Query(default="index", pattern="^(index|fulltext|contains)$", description="搜索方式（index/fulltext/contains）")
 ):
     """
     搜索电影
     
     - **q**: 搜索关键词（电影标题）
     - **limit**: 返回结果数量（1-50）
+    - **mode**: index 进程内标题索引（默认，不区分大小写，支持前缀和模糊匹配）；
+      fulltext Neo4j全文索引；contains 子串扫描（区分大小写）
+    
+    index/fulltext 模式按相关度排序，每部电影附带 score
     """
-    try:
-        movies = db.search_movies(q, limit=limit)
-        return movies
-    except Exception as e:
-        return {"error": str(e)}
+    movies = await db.search_movies(q, limit=limit, mode=mode)
+    return movies
 
 
 @app.get("/api/users/search")
 async def search_users(
-    q: str = Query(..., description="搜索关键词（用户ID）"),
+    q: str = Query(..., description="搜索关键词（用户ID或其前缀）"),
     limit: int = Query(default=10, ge=1, le=50, description="返回结果数量")
 ):
     """
     搜索用户
     
-    - **q**: 搜索关键词（用户ID）
+    - **q**: 用户ID前缀，例如 12 匹配 12、120、121...；非数字关键词返回空列表
     - **limit**: 返回结果数量（1-50）
+    
+    结果按评分数降序排列
     """
-    try:
-        users = db.search_users(q, limit=limit)
-        return users
-    except Exception as e:
-        return {"error": str(e)}
+    users = await db.search_users(q, limit=limit)
+    return users
+
+
+@app.get("/api/movies/{movie_id}/similar-by-tags")
+async def get_similar_tag_movies(
+    movie_id: str,
+    limit: int = Query(default=10, ge=1, le=50, description="返回数量")
+):
+    """
+    标签相似的电影
+    
+    - **movie_id**: 电影ID
+    - **limit**: 返回数量（1-50）
+    
+    按TF-IDF标签向量的余弦相似度降序，每部电影附带 similarity 和 shared_tags（贡献最大的共同标签）；
+    电影没有标签时返回空列表，标签向量尚未构建（dev/build_tag_vectors.py）时返回503
+    """
+    return await db.get_similar_tag_movies(movie_id, limit=limit)
+
+
+@app.get("/api/tags")
+async def search_tags(
+    q: Optional[str] = Query(default=None, description="标签前缀（不区分大小写），不传返回最常用的标签"),
+    limit: int = Query(default=20, ge=1, le=100, description="返回数量")
+):
+    """
+    搜索标签
+    
+    - **q**: 标签前缀
+    - **limit**: 返回数量（1-100）
+    
+    结果按打了该标签的电影数降序，每个标签附带 movie_count
+    """
+    return tag_dicts(require_tag_vectors().search_tags(q, limit=limit))
+
+
+@app.get("/api/tags/{tag:path}/movies")
+async def get_movies_by_tag(
+    tag: str,
+    limit: int = Query(default=20, ge=1, le=100, description="返回数量")
+):
+    """
+    打了某个标签的电影
+    
+    - **tag**: 标签名（不区分大小写，可以包含 /）
+    - **limit**: 返回数量（1-100）
+    
+    按打该标签的用户数降序，每部电影附带 tag_count；标签不存在时返回空列表
+    """
+    return await db.get_movies_by_tag(tag, limit=limit)
 
 
 @app.get("/api/network/movie/{movie_id}")
 async def get_movie_network(
     movie_id: str,
     depth: int = Query(default=2, ge=1, le=3, description="关系深度（1-3）"),
-    max_nodes: int = Query(default=100, ge=10, le=500, description="最大节点数量（10-500）")
+    max_nodes: int = Query(default=100, ge=10, le=500, description="最大节点数量（10-500）"),
+    mode: str = Query(default="bfs", pattern="^(bfs|paths|projection)$", description="扩展方式（bfs/paths/projection）")
 ):
     """
     获取电影的关系网络
@@ -96,12 +290,11 @@ async def get_movie_network(
     - **movie_id**: 电影ID
     - **depth**: 关系深度，1表示1度关系，2表示2度关系，3表示3度关系
     - **max_nodes**: 最大节点数量限制，用于控制返回的数据量，避免卡顿
+    - **mode**: bfs 逐层扩展并按度数挑选邻居（默认）；paths 枚举可变长度路径；
+      projection 与paths相同但在数据库端去重投影（paths/projection 仅Neo4j后端支持，其他后端返回400）
     """
-    try:
-        network_data = db.get_movie_network(movie_id, depth=depth, max_nodes=max_nodes)
-        return network_data
-    except Exception as e:
-        return {"error": str(e)}
+    network_data = await db.get_movie_network(movie_id, depth=depth, max_nodes=max_nodes, mode=mode)
+    return network_data
 
 
 @app.get("/api/recommendations/user/{user_id}")
@@ -117,11 +310,8 @@ async def get_user_recommendations(
     - **limit**: 返回推荐数量（1-50）
     - **min_rating**: 最低评分阈值，用于确定用户喜欢的电影（0.5-5.0）
     """
-    try:
-        recommendations = db.get_user_recommendations(user_id, limit=limit, min_rating=min_rating)
-        return recommendations
-    except Exception as e:
-        return {"error": str(e)}
+    recommendations = await db.get_user_recommendations(user_id, limit=limit, min_rating=min_rating)
+    return recommendations
 
 
 @app.get("/api/recommendations/user/{user_id}/liked")
@@ -137,11 +327,8 @@ async def get_user_liked_movies(
     - **limit**: 返回数量（1-50）
     - **min_rating**: 最低评分阈值（0.5-5.0）
     """
-    try:
-        movies = db.get_user_liked_movies(user_id, min_rating=min_rating, limit=limit)
-        return movies
-    except Exception as e:
-        return {"error": str(e)}
+    movies = await db.get_user_liked_movies(user_id, min_rating=min_rating, limit=limit)
+    return movies
 
 
 @app.get("/api/network/path/{start_type}/{start_id}/{end_type}/{end_id}")
@@ -150,35 +337,36 @@ async def get_shortest_path(
     start_id: str,
     end_type: str,
     end_id: str,
-    max_depth: int = Query(default=6, ge=1, le=10, description="最大搜索深度（1-10）")
+    max_depth: int = Query(default=6, ge=1, le=10, description="最大搜索深度（1-10）"),
+    algorithm: str = Query(default="shortest", pattern="^(shortest|k_shortest|bidirectional|weighted)$",
+                           description="路径算法（shortest/k_shortest/bidirectional/weighted）"),
+    rel_types: Optional[str] = Query(default=None, description="允许遍历的关系类型，逗号分隔，如 RATED 或 RATED,TAGGED"),
+    via: Optional[str] = Query(default=None, description="允许出现在路径上的节点类型，逗号分隔，如 Movie,User"),
+    k: int = Query(default=3, ge=1, le=10, description="k_shortest 模式返回的路径数（1-10）")
 ):
     """
     查找两个节点之间的最短路径（六度空间）
     
-    - **start_type**: 起始节点类型（如 'User', 'Movie'），支持 'Person' 作为 'User' 的别名
-    - **start_id**: 起始节点ID
+    - **start_type**: 起始节点类型（User/Movie/Genre），支持 'Person' 作为 'User' 的别名
+    - **start_id**: 起始节点ID（Genre为名称）
     - **end_type**: 目标节点类型，支持 'Person' 作为 'User' 的别名
     - **end_id**: 目标节点ID
     - **max_depth**: 最大搜索深度（默认6度）
+    - **algorithm**: shortest 单条最短路径（默认）；k_shortest 前k条最短路径（结果另含paths）；
+      bidirectional 有界双向BFS；weighted 按度数加权的最短路径，避开超级节点（结果另含cost）
+    - **rel_types**: 只经由这些关系类型，默认 IN_GENRE,RATED,TAGGED
+    - **via**: 路径上只允许这些节点类型（端点类型总是允许），如 Movie,User 可避开Genre超级节点
+    - **k**: k_shortest 模式返回的路径数
     """
-    try:
-        # 支持Person作为User的别名
-        actual_start_type = 'User' if start_type == 'Person' else start_type
-        actual_end_type = 'User' if end_type == 'Person' else end_type
-        
-        path_data = db.find_shortest_path(
-            start_type=actual_start_type,
-            start_id=start_id,
-            end_type=actual_end_type,
-            end_id=end_id,
-            max_depth=max_depth
-        )
-        return path_data
-    except Exception as e:
-        return {"error": str(e)}
-
-
-@app.on_event("shutdown")
-async def shutdown_event():
-    """应用关闭时关闭数据库连接"""
-    db.close()
+    path_data = await db.find_shortest_path(
+        start_type=start_type,
+        start_id=start_id,
+        end_type=end_type,
+        end_id=end_id,
+        max_depth=max_depth,
+        algorithm=algorithm,
+        rel_types=[rel_type.strip() for rel_type in rel_types.split(',')] if rel_types else None,
+        via_labels=[label.strip() for label in via.split(',')] if via else None,
+        k=k
+    )
+    return path_data
@@ -0,0 +1,415 @@
+"""
+查询与接口的性能指标
+
+- 查询：Neo4jDatabase / AsyncNeo4jDatabase 的会话由 InstrumentedSession / AsyncInstrumentedSession 包装，
+  每次 session.run 记录查询名称、总耗时、返回行数以及服务端的 result_available_after / result_consumed_after；
+  SQLiteDatabase 在 _fetch 中记录同样的指标（没有服务端耗时）
+- 慢查询：超过 SLOW_QUERY_MS 的查询进入内存中的慢查询日志；开启 SLOW_QUERY_PROFILE 时
+  在同一会话中用 PROFILE 重新执行一次，记录执行计划各算子的行数和 db hits（同一查询有冷却时间）
+- 接口：main.py 的中间件按路由模板和状态码记录请求耗时
+
+GET /metrics 以 Prometheus 文本格式输出，GET /metrics/slow-queries 返回慢查询日志。
+"""
+import os
+import re
+import string
+import threading
+import time
+from collections import deque
+
+# 延迟直方图的桶上界（秒）
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# 慢查询阈值（毫秒）
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "100"))
+
+# 保留最近的慢查询条数
+SLOW_QUERY_LOG_SIZE = int(os.getenv("SLOW_QUERY_LOG_SIZE", "100"))
+
+# 是否对慢查询执行 PROFILE（会在当前请求中再执行一次查询，默认关闭）
+SLOW_QUERY_PROFILE = os.getenv("SLOW_QUERY_PROFILE", "0") == "1"
+
+# 同一查询两次 PROFILE 之间的最短间隔（秒）
+SLOW_QUERY_PROFILE_INTERVAL = float(os.getenv("SLOW_QUERY_PROFILE_INTERVAL", "300"))
+
+# 慢查询日志中超过这个长度的列表参数只记录长度，查询文本截断到 MAX_LOGGED_QUERY 个字符
+MAX_LOGGED_LIST = 10
+MAX_LOGGED_QUERY = 2000
+
+# 未登记的临时语句统一记为这个名称，避免标签基数无限增长
+UNKNOWN_QUERY = 'other'
+
+# 指标名前缀
+METRIC_PREFIX = 'film_community'
+
+
+class QueryNames:
+    """
+    查询文本 -> 指标中使用的名称
+
+    按模块常量登记（MOVIES_QUERY -> movies）；用 str.format 填充的模板（如 SHORTEST_PATH_QUERY）
+    编译为正则表达式，填充后的每种变体都记为模板的名称。
+    """
+
+    def __init__(self):
+        self._exact = {}
+        self._templates = []
+        self._resolved = {}
+
+    def register(self, namespace, suffix):
+        """
+        登记命名空间（通常是模块的 globals()）中以 suffix 结尾的字符串常量
+
+        Args:
+            namespace: 名称 -> 值 的字典
+            suffix: 常量名后缀，如 '_QUERY' 或 '_SQL'
+        """
+        for constant, text in namespace.items():
+            if not constant.endswith(suffix) or not isinstance(text, str):
+                continue
+            name = constant[:-len(suffix)].lower()
+            self._exact[text] = name
+            pattern = template_pattern(text)
+            if pattern is not None:
+                self._templates.append((pattern, name))
+        self._resolved.clear()
+
+    def name(self, query):
+        """查询文本对应的名称，未登记时为 UNKNOWN_QUERY"""
+        name = self._exact.get(query) or self._resolved.get(query)
+        if name is not None:
+            return name
+        name = next((name for pattern, name in self._templates if pattern.fullmatch(query)), UNKNOWN_QUERY)
+        # 模板变体的数量有限（路径查询的标签/关系组合），这里只是避免逐个匹配正则
+        if len(self._resolved) < 4096:
+            self._resolved[query] = name
+        return name
+
+
+def template_pattern(text):
+    """
+    str.format 模板 -> 匹配其填充结果的正则表达式
+
+    只有全部花括号都是 {名称} 占位符或 {{ }} 转义时才算模板；Cypher 的 map 字面量（{id: $movie_id}）
+    和子查询（EXISTS { ... }）不是，返回None。
+    """
+    try:
+        parts = list(string.Formatter().parse(text))
+    except ValueError:
+        return None
+    fields = [(field, spec, conversion) for _, field, spec, conversion in parts if field is not None]
+    if not fields or not all(field.isidentifier() and not spec and conversion is None
+                             for field, spec, conversion in fields):
+        return None
+    return re.compile(''.join(re.escape(literal) + ('.*?' if field is not None else '')
+                              for literal, field, _, _ in parts), re.DOTALL)
+
+
+def format_labels(labels):
+    """(('query', 'movies'),) -> {query="movies"}"""
+    if not labels:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in labels)
+    return '{' + ','.join(f'{key}="{value}"' for (key, _), value in zip(labels, escaped)) + '}'
+
+
+def format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    """Prometheus 直方图，每组标签一份桶计数"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        # 标签 -> [各桶（非累积）计数..., 超出最大桶的计数]、总数、总和
+        self.series = {}
+
+    def observe(self, labels, value):
+        counts, count, total = self.series.get(labels) or ([0] * (len(self.buckets) + 1), 0, 0.0)
+        counts[next((i for i, bound in enumerate(self.buckets) if value <= bound), len(self.buckets))] += 1
+        self.series[labels] = (counts, count + 1, total + value)
+
+    def lines(self, metric):
+        """Prometheus 文本格式的样本行（桶计数为累积值）"""
+        for labels, (counts, count, total) in sorted(self.series.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                yield f"{metric}_bucket{format_labels(labels + (('le', format_value(bound)),))} {cumulative}"
+            yield f"{metric}_bucket{format_labels(labels + (('le', '+Inf'),))} {count}"
+            yield f"{metric}_sum{format_labels(labels)} {format_value(total)}"
+            yield f"{metric}_count{format_labels(labels)} {count}"
+
+
+class MetricsRegistry:
+    """
+    进程内的查询/接口指标和慢查询日志
+
+    同步后端在线程池中执行查询，所有写入都持有同一把锁。
+    """
+
+    def __init__(self, slow_query_ms=SLOW_QUERY_MS, slow_log_size=SLOW_QUERY_LOG_SIZE,
+                 profile=SLOW_QUERY_PROFILE, profile_interval=SLOW_QUERY_PROFILE_INTERVAL):
+        self.slow_query_ms = slow_query_ms
+        self.profile = profile
+        self.profile_interval = profile_interval
+        self.slow_queries = deque(maxlen=slow_log_size)
+        self._lock = threading.Lock()
+        self._profiled_at = {}
+        self.query_duration = Histogram()
+        self.request_duration = Histogram()
+        # 计数器：(指标名, 标签) -> 值
+        self.counters = {}
+
+    def _increment(self, metric, labels, value=1):
+        self.counters[(metric, labels)] = self.counters.get((metric, labels), 0) + value
+
+    def observe_query(self, name, seconds, rows=0, available_after_ms=None, consumed_after_ms=None, error=False):
+        """记录一次查询"""
+        labels = (('query', name),)
+        with self._lock:
+            self.query_duration.observe(labels, seconds)
+            self._increment('query_rows_total', labels, rows)
+            if available_after_ms is not None:
+                self._increment('query_server_available_after_seconds_total', labels, available_after_ms / 1000)
+            if consumed_after_ms is not None:
+                self._increment('query_server_consumed_after_seconds_total', labels, consumed_after_ms / 1000)
+            if error:
+                self._increment('query_errors_total', labels)
+            if seconds * 1000 >= self.slow_query_ms:
+                self._increment('slow_queries_total', labels)
+
+    def observe_request(self, method, route, status, seconds):
+        """记录一次HTTP请求（route 为路由模板，如 /api/network/movie/{movie_id}）"""
+        with self._lock:
+            self.request_duration.observe((('method', method), ('route', route), ('status', str(status))), seconds)
+
+    def is_slow(self, seconds):
+        return seconds * 1000 >= self.slow_query_ms
+
+    def should_profile(self, name):
+        """慢查询是否需要 PROFILE：已开启且该查询不在冷却时间内"""
+        if not self.profile:
+            return False
+        now = time.monotonic()
+        with self._lock:
+            if now - self._profiled_at.get(name, -self.profile_interval) < self.profile_interval:
+                return False
+            self._profiled_at[name] = now
+            return True
+
+    def log_slow_query(self, name, query, params, seconds, rows, available_after_ms=None, consumed_after_ms=None,
+                       profile=None):
+        """记录一条慢查询并打印摘要"""
+        entry = {
+            'query': name,
+            'wall_ms': round(seconds * 1000, 2),
+            'rows': rows,
+            'available_after_ms': available_after_ms,
+            'consumed_after_ms': consumed_after_ms,
+            'at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'parameters': {key: loggable_value(value) for key, value in (params or {}).items()},
+            'text': query.strip()[:MAX_LOGGED_QUERY],
+            'profile': profile,
+        }
+        with self._lock:
+            self.slow_queries.append(entry)
+        server = f"，服务端 {available_after_ms}+{consumed_after_ms} ms" if available_after_ms is not None else ''
+        print(f"[慢查询] {name} 耗时 {entry['wall_ms']} ms，返回 {rows} 行{server}")
+
+    def slow_query_log(self):
+        """慢查询日志，最近的在前"""
+        with self._lock:
+            return list(reversed(self.slow_queries))
+
+    def render(self, extra_lines=()):
+        """Prometheus 文本格式（text/plain; version=0.0.4）"""
+        lines = []
+        with self._lock:
+            histograms = (
+                ('query_duration_seconds', '每个查询的客户端耗时（含读取全部结果）', self.query_duration),
+                ('http_request_duration_seconds', '每个接口的请求耗时', self.request_duration),
+            )
+            for metric, description, histogram in histograms:
+                metric = f"{METRIC_PREFIX}_{metric}"
+                lines += [f"# HELP {metric} {description}", f"# TYPE {metric} histogram"]
+                lines += histogram.lines(metric)
+            for metric in sorted({metric for metric, _ in self.counters}):
+                lines += [f"# TYPE {METRIC_PREFIX}_{metric} counter"]
+                lines += [f"{METRIC_PREFIX}_{metric}{format_labels(labels)} {format_value(value)}"
+                          for (name, labels), value in sorted(self.counters.items()) if name == metric]
+        lines += extra_lines
+        return '\n'.join(lines) + '\n'
+
+
+def stats_lines(subsystem, stats):
+    """把统计字典（如 ResultCache.stats()）中的数值输出为 gauge，如 film_community_cache_hits"""
+    lines = []
+    for key, value in stats.items():
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            metric = f"{METRIC_PREFIX}_{subsystem}_{key}"
+            lines += [f"# TYPE {metric} gauge", f"{metric} {format_value(value)}"]
+    return lines
+
+
+def loggable_value(value):
+    """慢查询日志中的参数值：长列表只记录长度"""
+    if isinstance(value, (list, tuple)) and len(value) > MAX_LOGGED_LIST:
+        return f"<{len(value)} items>"
+    return value
+
+
+def profile_summary(plan):
+    """
+    PROFILE 执行计划（ResultSummary.profile）-> 各算子的行数和 db hits
+
+    Returns:
+        dict: total_db_hits 以及按树的先序排列的 operators（depth 为层级）
+    """
+    operators = []
+
+    def walk(node, depth):
+        operators.append({
+            'operator': node.get('operatorType'),
+            'rows': node.get('rows'),
+            'db_hits': node.get('dbHits'),
+            'details': (node.get('args') or {}).get('Details'),
+            'depth': depth,
+        })
+        for child in node.get('children') or []:
+            walk(child, depth + 1)
+
+    if plan:
+        walk(plan, 0)
+    return {'total_db_hits': sum(operator['db_hits'] or 0 for operator in operators), 'operators': operators}
+
+
+class RecordedResult:
+    """已完整读取的查询结果，支持调用方用到的迭代、single() 和 consume()"""
+
+    def __init__(self, records, summary):
+        self.records = records
+        self.summary = summary
+
+    def __iter__(self):
+        return iter(self.records)
+
+    def single(self):
+        return self.records[0] if self.records else None
+
+    def data(self):
+        return [record.data() for record in self.records]
+
+    def consume(self):
+        return self.summary
+
+
+class AsyncRecordedResult(RecordedResult):
+    """RecordedResult 的异步版本（async for / await single() / await consume()）"""
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for record in self.records:
+            yield record
+
+    async def single(self):
+        return super().single()
+
+    async def data(self):
+        return super().data()
+
+    async def consume(self):
+        return self.summary
+
+
+def server_timings(summary):
+    """ResultSummary -> (result_available_after, result_consumed_after)，单位毫秒"""
+    return getattr(summary, 'result_available_after', None), getattr(summary, 'result_consumed_after', None)
+
+
+class InstrumentedSession:
+    """
+    包装 neo4j.Session：run() 立即读取全部结果并记录指标
+
+    API的查询结果本来就会被完整读取，提前读完只是把耗时计入查询本身。
+    """
+
+    def __init__(self, session, registry=None, names=None):
+        self._session = session
+        self._registry = registry or metrics
+        self._names = names or query_names
+
+    def __enter__(self):
+        self._session.__enter__()
+        return self
+
+    def __exit__(self, *exc_info):
+        return self._session.__exit__(*exc_info)
+
+    def __getattr__(self, name):
+        return getattr(self._session, name)
+
+    def run(self, query, parameters=None, **kwargs):
+        name = self._names.name(query)
+        params = {**(parameters or {}), **kwargs}
+        start = time.perf_counter()
+        try:
+            result = self._session.run(query, params)
+            records = list(result)
+            summary = result.consume()
+        except Exception:
+            self._registry.observe_query(name, time.perf_counter() - start, error=True)
+            raise
+        elapsed = time.perf_counter() - start
+        available_after, consumed_after = server_timings(summary)
+        self._registry.observe_query(name, elapsed, len(records), available_after, consumed_after)
+        if self._registry.is_slow(elapsed):
+            profile = None
+            if self._registry.should_profile(name):
+                profile = profile_summary(self._session.run('PROFILE ' + query, params).consume().profile)
+            self._registry.log_slow_query(name, query, params, elapsed, len(records),
+                                          available_after, consumed_after, profile)
+        return RecordedResult(records, summary)
+
+
+class AsyncInstrumentedSession:
+    """InstrumentedSession 的异步版本，包装 neo4j.AsyncSession"""
+
+    def __init__(self, session, registry=None, names=None):
+        self._session = session
+        self._registry = registry or metrics
+        self._names = names or query_names
+
+    def __getattr__(self, name):
+        return getattr(self._session, name)
+
+    async def run(self, query, parameters=None, **kwargs):
+        name = self._names.name(query)
+        params = {**(parameters or {}), **kwargs}
+        start = time.perf_counter()
+        try:
+            result = await self._session.run(query, params)
+            records = [record async for record in result]
+            summary = await result.consume()
+        except Exception:
+            self._registry.observe_query(name, time.perf_counter() - start, error=True)
+            raise
+        elapsed = time.perf_counter() - start
+        available_after, consumed_after = server_timings(summary)
+        self._registry.observe_query(name, elapsed, len(records), available_after, consumed_after)
+        if self._registry.is_slow(elapsed):
+            profile = None
+            if self._registry.should_profile(name):
+                profiled = await self._session.run('PROFILE ' + query, params)
+                profile = profile_summary((await profiled.consume()).profile)
+            self._registry.log_slow_query(name, query, params, elapsed, len(records),
+                                          available_after, consumed_after, profile)
+        return AsyncRecordedResult(records, summary)
+
+
+# 进程内共用的指标和查询名称（database.py、sqlite_database.py 导入时登记各自的查询常量）
+metrics = MetricsRegistry()
+query_names = QueryNames()
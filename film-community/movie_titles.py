@@ -0,0 +1,42 @@
+"""
+MovieLens 电影标题解析
+
+movies.csv 的标题带有上映年份，如 "Toy Story (1995)"。导入脚本（dev/import_data.py）按此规则
+写入 Movie.title/Movie.year，内存图快照直接读CSV时用同样的函数，两者的标题和年份完全一致。
+"""
+import re
+
+import pandas as pd
+
+# 标题中的年份，如 "Toy Story (1995)"
+TITLE_YEAR_PATTERN = r'^(.*?)\s*\((\d{4})\)\s*$'
+
+
+def parse_movie_title(title):
+    """
+    解析电影标题和年份
+
+    Returns:
+        tuple: (标题, 年份)，没有年份时为 (原标题, None)
+    """
+    match = re.search(TITLE_YEAR_PATTERN, title)
+    if match:
+        return match.group(1).strip(), int(match.group(2))
+    return title, None
+
+
+def parse_movie_titles(titles):
+    """
+    parse_movie_title 的向量化版本
+
+    Args:
+        titles: 原始标题Series
+
+    Returns:
+        DataFrame: title列（无年份时为原标题）和可空整数year列
+    """
+    parts = titles.str.extract(TITLE_YEAR_PATTERN)
+    return pd.DataFrame({
+        'title': parts[0].str.strip().fillna(titles),
+        'year': pd.to_numeric(parts[1]).astype('Int64'),
+    })
@@ -0,0 +1,65 @@
+"""
+电影评分聚合
+
+导入脚本（dev/import_data.py）把结果物化为 Movie 节点属性，内存图快照和SQLite后端
+用同样的函数在加载时计算，三者的数值完全一致。
+
+MovieLens的评分是0.5的整数倍，每部电影只需一次 groupby 得到各分数档的评分数（直方图），
+评分数、平均分和贝叶斯加权分都由直方图推出；分块读取CSV时，各块的直方图直接相加即可。
+"""
+import numpy as np
+import pandas as pd
+
+# 分数档：0.5, 1.0, ..., 5.0
+RATING_VALUES = np.arange(1, 11) * 0.5
+
+# 贝叶斯加权分的先验评分数：评分很少的电影向全站平均分收缩
+BAYESIAN_PRIOR_COUNT = 10
+
+
+def rating_histogram(ratings):
+    """
+    每部电影各分数档的评分数
+
+    Args:
+        ratings: DataFrame，包含 movie_id 和 rating 列
+
+    Returns:
+        DataFrame: 以 movie_id 为索引，列为 0..9（对应 RATING_VALUES）
+    """
+    bins = (np.rint(ratings['rating'].to_numpy(np.float64) * 2).astype(np.int64) - 1).clip(0, len(RATING_VALUES) - 1)
+    return (ratings.groupby([ratings['movie_id'].to_numpy(), bins]).size()
+            .unstack(fill_value=0)
+            .reindex(columns=range(len(RATING_VALUES)), fill_value=0)
+            .rename_axis('movie_id'))
+
+
+def movie_rating_stats(histogram, movie_ids=None, prior_count=BAYESIAN_PRIOR_COUNT):
+    """
+    由直方图计算每部电影的评分统计
+
+    贝叶斯加权分 = (先验评分数 × 全站平均分 + 评分总和) / (先验评分数 + 评分数)
+
+    Args:
+        histogram: rating_histogram 的输出（可以是多块直方图之和）
+        movie_ids: 需要输出的全部电影ID；没有评分的电影评分数为0、平均分为None、加权分为全站平均分
+        prior_count: 先验评分数
+
+    Returns:
+        DataFrame: 以 movie_id 为索引，列为 rating_count、avg_rating、bayesian_rating、
+                   rating_histogram（长度10的整数列表）；attrs['global_mean'] 为全站平均分
+    """
+    if movie_ids is not None:
+        histogram = histogram.reindex(movie_ids, fill_value=0)
+    counts = histogram.to_numpy(np.int64)
+    rating_count = counts.sum(axis=1)
+    rating_sum = counts @ RATING_VALUES
+    global_mean = float(rating_sum.sum() / rating_count.sum()) if rating_count.sum() else 0.0
+    stats = pd.DataFrame({
+        'rating_count': rating_count,
+        'avg_rating': np.where(rating_count > 0, np.round(rating_sum / np.maximum(rating_count, 1), 4), None),
+        'bayesian_rating': np.round((prior_count * global_mean + rating_sum) / (prior_count + rating_count), 4),
+        'rating_histogram': counts.tolist(),
+    }, index=histogram.index)
+    stats.attrs['global_mean'] = global_mean
+    return stats
@@ -0,0 +1,157 @@
+"""
+图数据库模式管理
+
+集中定义电影知识图谱所需的唯一性约束与索引，供导入脚本和API服务共用。
+所有语句均使用 IF NOT EXISTS，可以重复执行。
+"""
+
+# 唯一性约束：名称 -> 创建语句
+CONSTRAINTS = {
+    'movie_id_unique': "CREATE CONSTRAINT movie_id_unique IF NOT EXISTS "
+                       "FOR (m:Movie) REQUIRE m.id IS UNIQUE",
+    'user_id_unique': "CREATE CONSTRAINT user_id_unique IF NOT EXISTS "
+                      "FOR (u:User) REQUIRE u.id IS UNIQUE",
+    'genre_name_unique': "CREATE CONSTRAINT genre_name_unique IF NOT EXISTS "
+                         "FOR (g:Genre) REQUIRE g.name IS UNIQUE",
+    'tag_name_unique': "CREATE CONSTRAINT tag_name_unique IF NOT EXISTS "
+                       "FOR (t:Tag) REQUIRE t.name IS UNIQUE",
+}
+
+# 索引：名称 -> 创建语句
+INDEXES = {
+    'movie_title_fulltext': "CREATE FULLTEXT INDEX movie_title_fulltext IF NOT EXISTS "
+                            "FOR (m:Movie) ON EACH [m.title]",
+    'user_id_text': "CREATE TEXT INDEX user_id_text IF NOT EXISTS "
+                    "FOR (u:User) ON (u.id_text)",
+    'user_rating_count': "CREATE INDEX user_rating_count IF NOT EXISTS "
+                         "FOR (u:User) ON (u.rating_count)",
+    'movie_bayesian_rating': "CREATE INDEX movie_bayesian_rating IF NOT EXISTS "
+                             "FOR (m:Movie) ON (m.bayesian_rating)",
+    'movie_rating_count': "CREATE INDEX movie_rating_count IF NOT EXISTS "
+                          "FOR (m:Movie) ON (m.rating_count)",
+    'movie_avg_rating': "CREATE INDEX movie_avg_rating IF NOT EXISTS "
+                        "FOR (m:Movie) ON (m.avg_rating)",
+    'movie_year': "CREATE INDEX movie_year IF NOT EXISTS "
+                  "FOR (m:Movie) ON (m.year)",
+    'rated_rating': "CREATE INDEX rated_rating IF NOT EXISTS "
+                    "FOR ()-[r:RATED]-() ON (r.rating)",
+    'rated_timestamp': "CREATE INDEX rated_timestamp IF NOT EXISTS "
+                       "FOR ()-[r:RATED]-() ON (r.timestamp)",
+}
+
+# 每个约束/索引的定义：名称 -> (种类, 标签或关系类型, 属性)，与 SHOW CONSTRAINTS/INDEXES 的字段对应
+# 已有的模式对象按定义比较，名称不同但定义相同（如基线版本或 neo4j-admin 导入时创建的）也视为已存在
+SCHEMA_DEFINITIONS = {
+    'movie_id_unique': ('UNIQUENESS', ('Movie',), ('id',)),
+    'user_id_unique': ('UNIQUENESS', ('User',), ('id',)),
+    'genre_name_unique': ('UNIQUENESS', ('Genre',), ('name',)),
+    'tag_name_unique': ('UNIQUENESS', ('Tag',), ('name',)),
+    'movie_title_fulltext': ('FULLTEXT', ('Movie',), ('title',)),
+    'user_id_text': ('TEXT', ('User',), ('id_text',)),
+    'user_rating_count': ('RANGE', ('User',), ('rating_count',)),
+    'movie_bayesian_rating': ('RANGE', ('Movie',), ('bayesian_rating',)),
+    'movie_rating_count': ('RANGE', ('Movie',), ('rating_count',)),
+    'movie_avg_rating': ('RANGE', ('Movie',), ('avg_rating',)),
+    'movie_year': ('RANGE', ('Movie',), ('year',)),
+    'rated_rating': ('RANGE', ('RATED',), ('rating',)),
+    'rated_timestamp': ('RANGE', ('RATED',), ('timestamp',)),
+}
+
+SHOW_CONSTRAINTS_QUERY = "SHOW CONSTRAINTS YIELD name, type, labelsOrTypes, properties"
+SHOW_INDEXES_QUERY = "SHOW INDEXES YIELD name, type, labelsOrTypes, properties"
+
+# 等待索引上线的超时时间（秒）
+INDEX_WAIT_TIMEOUT = 300
+
+
+def schema_signature(kind, labels, properties):
+    """
+    模式对象的定义签名
+
+    约束类型在不同Neo4j版本中为 UNIQUENESS 或 NODE_PROPERTY_UNIQUENESS 等，统一为 UNIQUENESS；
+    4.x 的 BTREE 索引与 5.x 的 RANGE 索引视为同一种。
+    """
+    if 'UNIQUENESS' in kind:
+        kind = 'UNIQUENESS'
+    elif kind == 'BTREE':
+        kind = 'RANGE'
+    return kind, tuple(labels or ()), tuple(properties or ())
+
+
+def missing_schema(constraint_records, index_records):
+    """
+    对比 SHOW CONSTRAINTS / SHOW INDEXES 的结果，找出缺失的模式对象
+
+    Returns:
+        list: 名称和定义都不存在的约束/索引名称，为空表示模式完整
+    """
+    names, signatures = set(), set()
+    for record in list(constraint_records) + list(index_records):
+        names.add(record['name'])
+        signatures.add(schema_signature(record['type'], record['labelsOrTypes'], record['properties']))
+    return [
+        name for name in list(CONSTRAINTS) + list(INDEXES)
+        if name not in names and schema_signature(*SCHEMA_DEFINITIONS[name]) not in signatures
+    ]
+
+
+def schema_statement(name):
+    """约束/索引名称 -> 创建语句"""
+    return CONSTRAINTS.get(name) or INDEXES[name]
+
+
+def ensure_schema(driver, wait=True):
+    """
+    创建缺失的约束和索引（幂等）
+
+    Args:
+        driver: Neo4j驱动实例
+        wait: 是否等待索引填充完成
+
+    Returns:
+        list: 本次检查时缺失（因此被创建）的模式对象名称
+    """
+    missing = check_schema(driver)
+    with driver.session() as session:
+        for name in missing:
+            session.run(schema_statement(name)).consume()
+        if wait:
+            session.run(f"CALL db.awaitIndexes({INDEX_WAIT_TIMEOUT})").consume()
+    return missing
+
+
+def check_schema(driver):
+    """
+    检查约束和索引是否都已存在（按定义比较，见 missing_schema）
+
+    Args:
+        driver: Neo4j驱动实例
+
+    Returns:
+        list: 缺失的约束/索引名称，为空表示模式完整
+    """
+    with driver.session() as session:
+        constraints = [record.data() for record in session.run(SHOW_CONSTRAINTS_QUERY)]
+        indexes = [record.data() for record in session.run(SHOW_INDEXES_QUERY)]
+    return missing_schema(constraints, indexes)
+
+
+async def async_ensure_schema(driver, wait=True):
+    """ensure_schema 的异步版本，driver 为 AsyncDriver"""
+    missing = await async_check_schema(driver)
+    async with driver.session() as session:
+        for name in missing:
+            await (await session.run(schema_statement(name))).consume()
+        if wait:
+            await (await session.run(f"CALL db.awaitIndexes({INDEX_WAIT_TIMEOUT})")).consume()
+    return missing
+
+
+async def async_check_schema(driver):
+    """check_schema 的异步版本，driver 为 AsyncDriver"""
+    async with driver.session() as session:
+        result = await session.run(SHOW_CONSTRAINTS_QUERY)
+        constraints = [record.data() async for record in result]
+        result = await session.run(SHOW_INDEXES_QUERY)
+        indexes = [record.data() async for record in result]
+    return missing_schema(constraints, indexes)
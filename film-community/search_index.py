@@ -0,0 +1,140 @@
+"""
+进程内的电影标题搜索索引
+
+启动时从 Movie 节点构建，之后的联想搜索完全在内存中完成：
+- 倒排索引：词 -> 包含该词的电影
+- 有序词表：用二分查找做前缀匹配
+- 三元组（trigram）索引：词既无精确匹配也无前缀匹配时做模糊匹配
+所有文本先做小写和去重音处理，因此搜索不区分大小写。
+"""
+import heapq
+import re
+import time
+import unicodedata
+from bisect import bisect_left
+from collections import Counter
+
+TOKEN_PATTERN = re.compile(r'\w+')
+
+# 各种匹配方式的权重：精确 > 前缀 > 模糊
+EXACT_WEIGHT = 3.0
+PREFIX_WEIGHT = 2.0
+FUZZY_WEIGHT = 1.0
+
+# 模糊匹配要求的最小三元组相似度（Jaccard）
+FUZZY_MIN_SIMILARITY = 0.3
+
+# 短于该长度的词不做模糊匹配（三元组太少，误匹配多）
+FUZZY_MIN_LENGTH = 4
+
+# 标题以查询串开头时的额外加分
+TITLE_PREFIX_BONUS = 1.0
+
+
+def normalize(text):
+    """小写并去掉重音符号（Amélie -> amelie）"""
+    decomposed = unicodedata.normalize('NFKD', text.lower())
+    return ''.join(ch for ch in decomposed if not unicodedata.combining(ch))
+
+
+def tokenize(text):
+    """将文本切分为规范化后的词"""
+    return TOKEN_PATTERN.findall(normalize(text or ''))
+
+
+def trigrams(term):
+    """词的三元组集合，两端补空格使首尾字符也有足够的权重"""
+    padded = f" {term} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class TitleSearchIndex:
+    """
+    电影标题的内存索引
+
+    每个查询词分别匹配词表中的词（精确、前缀或模糊），一部电影必须匹配所有查询词，
+    得分为各查询词最佳匹配权重之和；前缀匹配按长度比例折算，越接近完整词得分越高。
+    """
+
+    def __init__(self, movies):
+        """
+        Args:
+            movies: 电影字典列表（movie_record_to_dict 的输出）
+        """
+        start = time.perf_counter()
+        self.movies = list(movies)
+        self._titles = [normalize(movie['title']) for movie in self.movies]
+        postings = {}
+        for doc, movie in enumerate(self.movies):
+            for term in set(tokenize(movie['title'])):
+                postings.setdefault(term, []).append(doc)
+        self._postings = postings
+        self._vocabulary = sorted(postings)
+        self._trigrams = {}
+        for term in self._vocabulary:
+            for gram in trigrams(term):
+                self._trigrams.setdefault(gram, []).append(term)
+        self.build_seconds = time.perf_counter() - start
+
+    def __len__(self):
+        return len(self.movies)
+
+    def search(self, keyword, limit=10):
+        """
+        按相关度搜索电影
+
+        Returns:
+            list: 电影字典列表（附加score字段），按得分降序
+        """
+        query_terms = tokenize(keyword)
+        if not query_terms:
+            return []
+
+        scores = None
+        for query_term in dict.fromkeys(query_terms):
+            term_scores = {}
+            for term, weight in self._match_terms(query_term):
+                for doc in self._postings[term]:
+                    if weight > term_scores.get(doc, 0.0):
+                        term_scores[doc] = weight
+            if scores is None:
+                scores = term_scores
+            else:
+                scores = {doc: score + term_scores[doc] for doc, score in scores.items() if doc in term_scores}
+            if not scores:
+                return []
+
+        # 标题以整个查询串开头的电影额外加分；同分时较短的标题优先
+        phrase = ' '.join(query_terms)
+        for doc in scores:
+            if self._titles[doc].startswith(phrase):
+                scores[doc] += TITLE_PREFIX_BONUS
+        ranked = heapq.nlargest(limit, scores.items(), key=lambda item: (item[1], -len(self._titles[item[0]])))
+        return [{**self.movies[doc], 'score': round(score, 4)} for doc, score in ranked]
+
+    def _match_terms(self, query_term):
+        """
+        词表中与查询词匹配的词及其权重
+
+        Returns:
+            list: (词, 权重) 列表
+        """
+        matches = []
+        position = bisect_left(self._vocabulary, query_term)
+        while position < len(self._vocabulary) and self._vocabulary[position].startswith(query_term):
+            term = self._vocabulary[position]
+            if term == query_term:
+                matches.append((term, EXACT_WEIGHT))
+            else:
+                matches.append((term, PREFIX_WEIGHT * len(query_term) / len(term)))
+            position += 1
+        if matches or len(query_term) < FUZZY_MIN_LENGTH:
+            return matches
+
+        query_grams = trigrams(query_term)
+        shared = Counter(term for gram in query_grams for term in self._trigrams.get(gram, ()))
+        for term, common in shared.items():
+            similarity = common / (len(query_grams) + len(trigrams(term)) - common)
+            if similarity >= FUZZY_MIN_SIMILARITY:
+                matches.append((term, FUZZY_WEIGHT * similarity))
+        return matches
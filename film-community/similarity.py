@@ -0,0 +1,108 @@
+"""
+基于稀疏评分矩阵的余弦相似度 top-k 邻居
+
+离线任务（dev/compute_user_similarity.py、dev/compute_movie_similarity.py）
+和内存图快照（graph_snapshot.py）共用。
+"""
+import numpy as np
+
+
+class CosineNeighbours:
+    """
+    余弦相似度 top-k 邻居
+
+    构造时预先计算行范数和转置矩阵，之后可以只为需要的行计算邻居。
+    同时用0/1矩阵统计两行的共同非零列数，少于 min_common 的行对不参与排名。
+    """
+
+    def __init__(self, matrix, top_k, min_common):
+        """
+        Args:
+            matrix: CSR矩阵，每行一个实体（用户或电影）
+            top_k: 每行保留的邻居数
+            min_common: 两行至少有这么多共同非零列才参与排名
+        """
+        self.matrix = matrix
+        self.top_k = top_k
+        self.min_common = min_common
+        self.binary = matrix.copy()
+        self.binary.data[:] = 1.0
+        norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+        norms[norms == 0] = 1.0
+        self.norms = norms
+        self.matrix_t = matrix.T.tocsr()
+        self.binary_t = self.binary.T.tocsr()
+
+    def scores(self, rows):
+        """
+        一组行与所有行的相似度
+
+        Returns:
+            tuple: (相似度矩阵, 共同非零列数矩阵)，形状均为 (len(rows), 总行数)；
+                   共同非零列数少于 min_common 的行对以及行与自身的相似度为0
+        """
+        dots = (self.matrix[rows] @ self.matrix_t).toarray()
+        common = (self.binary[rows] @ self.binary_t).toarray()
+        scores = dots / self.norms[rows, None] / self.norms[None, :]
+        scores[common < self.min_common] = 0.0
+        scores[np.arange(len(rows)), rows] = 0.0
+        return scores, common
+
+    def blocks(self, targets, block_size=512):
+        """分块（block_size 控制稠密中间矩阵的内存占用）产生 (行号数组, 相似度矩阵, 共同非零列数矩阵)"""
+        for offset in range(0, len(targets), block_size):
+            rows = targets[offset:offset + block_size]
+            yield (rows, *self.scores(rows))
+
+    def compute(self, targets, block_size=512):
+        """
+        分块计算目标行的 top_k 邻居
+
+        Returns:
+            list: 与targets一一对应，每项为 (邻居行号数组, 相似度数组, 共同非零列数数组)，按相似度降序
+        """
+        results = []
+        for rows, scores, common in self.blocks(targets, block_size):
+            k = min(self.top_k, scores.shape[1] - 1)
+            top = np.argpartition(-scores, k, axis=1)[:, :k]
+            for i in range(len(rows)):
+                candidates = top[i][scores[i, top[i]] > 0]
+                order = candidates[np.argsort(-scores[i, candidates], kind='stable')]
+                results.append((order, scores[i, order], common[i, order].astype(np.int64)))
+        return results
+
+
+def top_k_cosine(matrix, targets, top_k, block_size, min_common):
+    """
+    分块计算目标行与所有行之间的余弦相似度，保留每行的 top_k
+
+    Args:
+        matrix: CSR矩阵，每行一个实体（用户或电影）
+        targets: 需要计算的行号数组
+        top_k: 每行保留的邻居数
+        block_size: 每块计算的行数（控制稠密中间矩阵的内存占用）
+        min_common: 两行至少有这么多共同非零列才参与排名
+
+    Returns:
+        list: 与targets一一对应，每项为 (邻居行号数组, 相似度数组, 共同非零列数数组)，按相似度降序
+    """
+    return CosineNeighbours(matrix, top_k, min_common).compute(targets, block_size)
+
+
+def center_by_user_mean(ratings, user_index):
+    """
+    减去每位用户的平均评分（调整余弦相似度）
+
+    中心化后恰好为0的评分仍然要计入共同评分数，用极小值占位。
+
+    Args:
+        ratings: 评分数组
+        user_index: 每条评分对应的用户行号（0..用户数-1）
+    """
+    ratings = ratings.astype(np.float64)
+    counts = np.bincount(user_index)
+    user_means = np.divide(np.bincount(user_index, weights=ratings), counts,
+                           out=np.zeros(len(counts)), where=counts > 0)
+    centered = ratings - user_means[user_index]
+    centered[centered == 0] = 1e-9
+    return centered
@@ -0,0 +1,719 @@
+"""
+基于SQLite的本地后端
+
+从随附的 ml-latest-small CSV 构建一个SQLite数据库文件，提供与 Neo4jDatabase 相同的公共方法，
+用于在没有Neo4j服务的机器（如CI）上运行API、压测和基准测试。
+
+图结构保存为 nodes / relationships / adjacency 三张表（adjacency 中每条关系按两个方向各存一行），
+业务查询使用 movies / users / ratings / movie_genres 等表，相似用户/相似电影在建库时算好。
+CSV变化后在临时文件中重建，完成后用 os.replace 原子替换数据库文件，各线程在下次查询时重新连接。
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+from database import (
+    FIRST_PAGE_CURSOR, PATH_ALGORITHMS, MAX_K_PATHS, SIMILAR_USER_NEIGHBOURS, SEARCH_MODES,
+    InvalidArgument, check_mode,
+    safe_int_convert, clamp_network_params, path_query_params, user_id_prefix, k_shortest_paths,
+    LevelNetworkExpansion, WeightedPathSearch,
+    movie_record_to_dict, rated_movie_record_to_dict, top_movie_record_to_dict, top_movies_sort_property,
+    scored_movie_record_to_dict, build_movie_page, user_record_to_dict,
+    liked_movie_record_to_dict, build_recommendations, factor_predictions, factor_strategy_records,
+    tag_predictions, tag_strategy_records, tagged_movie_dicts, similar_tag_movie_dicts,
+)
+from graph_snapshot import DEFAULT_DATA_DIR, RELATIONSHIP_TYPES, GraphSnapshot, csv_version
+from metrics import metrics, query_names
+from search_index import TitleSearchIndex, tokenize
+from tag_vectors import require_tag_vectors, tag_vectors
+
+# 默认数据库文件（与CSV放在一起，已加入.gitignore）
+DEFAULT_SQLITE_PATH = os.path.join(DEFAULT_DATA_DIR, 'movielens.sqlite')
+
+# 表和索引：名称 -> 创建语句
+SQLITE_SCHEMA = {
+    'meta': "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)",
+    'movies': "CREATE TABLE IF NOT EXISTS movies (id INTEGER PRIMARY KEY, title TEXT, year INTEGER, node_id INTEGER, "
+              "rating_count INTEGER, avg_rating REAL, bayesian_rating REAL, rating_histogram TEXT)",
+    'movie_genres': "CREATE TABLE IF NOT EXISTS movie_genres (movie_id INTEGER, genre TEXT, PRIMARY KEY (movie_id, genre))",
+    'users': "CREATE TABLE IF NOT EXISTS users (id INTEGER PRIMARY KEY, id_text TEXT, rating_count INTEGER, node_id INTEGER)",
+    'ratings': "CREATE TABLE IF NOT EXISTS ratings (user_id INTEGER, movie_id INTEGER, rating REAL, "
+               "PRIMARY KEY (user_id, movie_id)) WITHOUT ROWID",
+    'similar_users': "CREATE TABLE IF NOT EXISTS similar_users (user_id INTEGER, other_id INTEGER, score REAL, "
+                     "common_movies INTEGER)",
+    'similar_movies': "CREATE TABLE IF NOT EXISTS similar_movies (movie_id INTEGER, other_id INTEGER, score REAL, "
+                      "common_users INTEGER)",
+    'nodes': "CREATE TABLE IF NOT EXISTS nodes (node_id INTEGER PRIMARY KEY, label TEXT, key TEXT, name TEXT, "
+             "properties TEXT, degree INTEGER)",
+    'relationships': "CREATE TABLE IF NOT EXISTS relationships (rel_id INTEGER PRIMARY KEY, source INTEGER, "
+                     "target INTEGER, type TEXT)",
+    'adjacency': "CREATE TABLE IF NOT EXISTS adjacency (node_id INTEGER, neighbour_id INTEGER, rel_id INTEGER, "
+                 "type TEXT)",
+    'movie_genres_genre': "CREATE INDEX IF NOT EXISTS movie_genres_genre ON movie_genres (genre, movie_id)",
+    'movies_bayesian_rating': "CREATE INDEX IF NOT EXISTS movies_bayesian_rating ON movies (bayesian_rating)",
+    'movies_rating_count': "CREATE INDEX IF NOT EXISTS movies_rating_count ON movies (rating_count)",
+    'movies_avg_rating': "CREATE INDEX IF NOT EXISTS movies_avg_rating ON movies (avg_rating)",
+    'movies_year': "CREATE INDEX IF NOT EXISTS movies_year ON movies (year)",
+    'users_id_text': "CREATE INDEX IF NOT EXISTS users_id_text ON users (id_text)",
+    'ratings_movie': "CREATE INDEX IF NOT EXISTS ratings_movie ON ratings (movie_id)",
+    'similar_users_user': "CREATE INDEX IF NOT EXISTS similar_users_user ON similar_users (user_id, score)",
+    'similar_movies_movie': "CREATE INDEX IF NOT EXISTS similar_movies_movie ON similar_movies (movie_id, score)",
+    'adjacency_node': "CREATE INDEX IF NOT EXISTS adjacency_node ON adjacency (node_id, type)",
+    'relationships_source': "CREATE INDEX IF NOT EXISTS relationships_source ON relationships (source)",
+}
+
+# 全文检索表（FTS5，编译时未启用FTS5的SQLite上fulltext模式退回到内存标题索引）
+MOVIE_TITLE_FTS = "CREATE VIRTUAL TABLE IF NOT EXISTS movie_title_fts USING fts5(title, content='movies', content_rowid='id')"
+
+MOVIE_COLUMNS = """
+m.id as id, m.title as title, m.year as year,
+(SELECT group_concat(genre, '|') FROM movie_genres WHERE movie_id = m.id) as genres
+"""
+
+MOVIE_STATS_COLUMNS = "m.rating_count as rating_count, m.avg_rating as avg_rating"
+
+ALL_MOVIES_SQL = f"SELECT {MOVIE_COLUMNS} FROM movies m"
+
+MOVIES_SQL = f"""
+SELECT {MOVIE_COLUMNS}, {MOVIE_STATS_COLUMNS} FROM movies m ORDER BY m.id LIMIT :limit OFFSET :skip
+"""
+
+MOVIES_PAGE_SQL = f"""
+SELECT {MOVIE_COLUMNS}, {MOVIE_STATS_COLUMNS} FROM movies m WHERE m.id > :after_id ORDER BY m.id LIMIT :limit
+"""
+
+SEARCH_MOVIES_FULLTEXT_SQL = f"""
+SELECT {MOVIE_COLUMNS}, -bm25(movie_title_fts) as score
+FROM movie_title_fts JOIN movies m ON m.id = movie_title_fts.rowid
+WHERE movie_title_fts MATCH :match
+ORDER BY score DESC
+LIMIT :limit
+"""
+
+# contains模式：区分大小写的子串匹配
+SEARCH_MOVIES_SQL = f"""
+SELECT {MOVIE_COLUMNS} FROM movies m WHERE instr(m.title, :keyword) > 0 ORDER BY m.title LIMIT :limit
+"""
+
+# GLOB前缀匹配可以使用 id_text 索引
+SEARCH_USERS_SQL = """
+SELECT id, rating_count FROM users WHERE id_text GLOB :pattern
+ORDER BY rating_count DESC, id LIMIT :limit
+"""
+
+# {sort_property} 只会填入 TOP_MOVIES_SORTS 中的列名
+TOP_MOVIES_SQL = f"""
+SELECT {MOVIE_COLUMNS}, {MOVIE_STATS_COLUMNS},
+       m.bayesian_rating as bayesian_rating, m.rating_histogram as rating_histogram
+FROM movies m
+WHERE m.{{sort_property}} IS NOT NULL AND m.rating_count >= :min_ratings
+  AND (:year_from IS NULL OR m.year >= :year_from)
+  AND (:year_to IS NULL OR m.year <= :year_to)
+  AND (:genre IS NULL OR EXISTS (SELECT 1 FROM movie_genres WHERE movie_id = m.id AND genre = :genre))
+ORDER BY m.{{sort_property}} DESC, m.id
+LIMIT :limit
+"""
+
+NETWORK_LEVEL_SQL = """
+WITH candidates AS (
+    SELECT DISTINCT a.node_id as source, a.neighbour_id as node_id, n.degree as weight
+    FROM adjacency a JOIN nodes n ON n.node_id = a.neighbour_id
+    WHERE a.node_id IN (SELECT value FROM json_each(:frontier))
+      AND a.neighbour_id NOT IN (SELECT value FROM json_each(:visited))
+),
+ranked AS (
+    SELECT source, node_id, weight, ROW_NUMBER() OVER (PARTITION BY source ORDER BY weight DESC, node_id) as rank
+    FROM candidates
+)
+SELECT source, node_id, weight FROM ranked
+WHERE rank <= :per_node
+ORDER BY source, rank
+"""
+
+PATH_EXPAND_SQL = """
+SELECT a.node_id as source, a.neighbour_id as target, a.rel_id as rel_id, n.degree as degree
+FROM adjacency a JOIN nodes n ON n.node_id = a.neighbour_id
+WHERE a.node_id IN (SELECT value FROM json_each(:frontier))
+  AND a.type IN (SELECT value FROM json_each(:types))
+  AND n.label IN (SELECT value FROM json_each(:labels))
+ORDER BY a.node_id, a.rel_id
+"""
+
+GENRE_PREFERENCE_SQL = """
+SELECT g.genre as genre, count(*) as movie_count, avg(r.rating) as avg_rating
+FROM ratings r JOIN movie_genres g ON g.movie_id = r.movie_id
+WHERE r.user_id = :user_id AND r.rating >= :min_rating
+GROUP BY g.genre
+ORDER BY movie_count DESC, g.genre
+LIMIT 10
+"""
+
+SIMILAR_USERS_SQL = """
+SELECT other_id as user_id, common_movies, score as similarity
+FROM similar_users WHERE user_id = :user_id
+ORDER BY score DESC
+LIMIT 5
+"""
+
+RECOMMEND_BY_GENRE_SQL = f"""
+WITH top_genres AS (
+    SELECT g.genre as genre, count(*) as genre_count
+    FROM ratings r JOIN movie_genres g ON g.movie_id = r.movie_id
+    WHERE r.user_id = :user_id AND r.rating >= :min_rating
+    GROUP BY g.genre
+    ORDER BY genre_count DESC, g.genre
+    LIMIT 5
+)
+SELECT {MOVIE_COLUMNS}, '类型偏好: ' || t.genre as reason, 1 as score
+FROM top_genres t
+JOIN movie_genres mg ON mg.genre = t.genre
+JOIN movies m ON m.id = mg.movie_id
+WHERE NOT EXISTS (SELECT 1 FROM ratings WHERE user_id = :user_id AND movie_id = m.id)
+ORDER BY t.genre_count DESC, t.genre, m.id
+LIMIT :limit
+"""
+
+RECOMMEND_BY_SIMILAR_USERS_SQL = f"""
+WITH neighbours AS (
+    SELECT other_id, score, common_movies FROM similar_users
+    WHERE user_id = :user_id
+    ORDER BY score DESC
+    LIMIT :neighbours
+),
+candidates AS (
+    SELECT r.movie_id as movie_id, max(n.score) as max_score, max(n.common_movies) as max_common_movies
+    FROM neighbours n JOIN ratings r ON r.user_id = n.other_id
+    WHERE NOT EXISTS (SELECT 1 FROM ratings WHERE user_id = :user_id AND movie_id = r.movie_id)
+    GROUP BY r.movie_id
+)
+SELECT {MOVIE_COLUMNS}, '相似用户推荐 (共同评分' || c.max_common_movies || '部电影)' as reason, 2 as score
+FROM candidates c JOIN movies m ON m.id = c.movie_id
+ORDER BY c.max_score DESC, c.max_common_movies DESC, m.id
+LIMIT :limit
+"""
+
+RECOMMEND_BY_SIMILAR_MOVIES_SQL = f"""
+WITH weighted AS (
+    SELECT s.other_id as movie_id, liked.title as liked_title, s.score * r.rating as weight
+    FROM ratings r
+    JOIN movies liked ON liked.id = r.movie_id
+    JOIN similar_movies s ON s.movie_id = r.movie_id
+    WHERE r.user_id = :user_id AND r.rating >= :min_rating
+      AND NOT EXISTS (SELECT 1 FROM ratings WHERE user_id = :user_id AND movie_id = s.other_id)
+),
+totals AS (
+    SELECT movie_id, liked_title,
+           sum(weight) OVER (PARTITION BY movie_id) as total_weight,
+           ROW_NUMBER() OVER (PARTITION BY movie_id ORDER BY weight DESC) as rank
+    FROM weighted
+)
+SELECT {MOVIE_COLUMNS}, '基于您喜欢的《' || t.liked_title || '》' as reason, 3 as score
+FROM totals t JOIN movies m ON m.id = t.movie_id
+WHERE t.rank = 1
+ORDER BY t.total_weight DESC, m.id
+LIMIT :limit
+"""
+
+MOVIES_BY_ID_SQL = f"""
+SELECT {MOVIE_COLUMNS}
+FROM movies m
+WHERE m.id IN (SELECT value FROM json_each(:movie_ids))
+"""
+
+# 隐因子模型只排除了训练时已有的评分，训练之后用户评过分的电影在这里排除
+FACTOR_MOVIES_SQL = f"""
+SELECT {MOVIE_COLUMNS}
+FROM movies m
+WHERE m.id IN (SELECT value FROM json_each(:movie_ids))
+  AND NOT EXISTS (SELECT 1 FROM ratings r WHERE r.user_id = :user_id AND r.movie_id = m.id)
+"""
+
+USER_RATINGS_SQL = "SELECT movie_id as id, rating FROM ratings WHERE user_id = :user_id"
+
+LIKED_MOVIES_SQL = f"""
+SELECT {MOVIE_COLUMNS}, r.rating as rating
+FROM ratings r JOIN movies m ON m.id = r.movie_id
+WHERE r.user_id = :user_id AND r.rating >= :min_rating
+ORDER BY r.rating DESC, m.title
+LIMIT :limit
+"""
+
+
+# 指标和慢查询日志中按常量名称（去掉 _SQL 后缀）标识查询
+query_names.register(globals(), '_SQL')
+
+
+def sqlite_record(row):
+    """sqlite3.Row -> 与Cypher查询结果字段相同的字典（genres拆分为列表）"""
+    record = dict(row)
+    if 'genres' in record:
+        record['genres'] = record['genres'].split('|') if record['genres'] else []
+    if record.get('rating_histogram') is not None:
+        record['rating_histogram'] = json.loads(record['rating_histogram'])
+    return record
+
+
+class SQLiteDatabase:
+    """
+    SQLite后端，公共方法与 Neo4jDatabase 相同（同步，由 backends.SyncBackendAdapter 放入线程池执行）
+
+    每个线程使用自己的连接；数据库文件被替换后，各线程在下次查询时重新连接。
+    """
+
+    def __init__(self, path=DEFAULT_SQLITE_PATH, data_dir=DEFAULT_DATA_DIR):
+        self.path = path
+        self.data_dir = data_dir
+        self._local = threading.local()
+        self._connections = []
+        self._connections_lock = threading.Lock()
+        self._generation = 0
+        self._load_lock = threading.Lock()
+        self._title_index = None
+        self._title_index_version = None
+        self.has_fts = False
+
+    # ==================== 连接与建库 ====================
+
+    def connect(self):
+        """当前线程的连接（数据库文件替换后重新打开）"""
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.generation != self._generation:
+            if connection is not None:
+                connection.close()
+            connection = sqlite3.connect(self.path, check_same_thread=False)
+            connection.row_factory = sqlite3.Row
+            with self._connections_lock:
+                self._connections.append(connection)
+            self._local.connection = connection
+            self._local.generation = self._generation
+        return connection
+
+    def close(self):
+        """关闭所有线程的连接"""
+        with self._connections_lock:
+            for connection in self._connections:
+                connection.close()
+            self._connections.clear()
+            self._generation += 1
+
+    def _fetch(self, sql, **params):
+        """执行查询并返回全部记录，记录耗时和返回行数；慢查询附带 EXPLAIN QUERY PLAN（见 metrics）"""
+        name = query_names.name(sql)
+        start = time.perf_counter()
+        try:
+            records = [sqlite_record(row) for row in self.connect().execute(sql, params)]
+        except Exception:
+            metrics.observe_query(name, time.perf_counter() - start, error=True)
+            raise
+        elapsed = time.perf_counter() - start
+        metrics.observe_query(name, elapsed, len(records))
+        if metrics.is_slow(elapsed):
+            plan = None
+            if metrics.should_profile(name):
+                plan = {'plan': [row['detail'] for row in self.connect().execute('EXPLAIN QUERY PLAN ' + sql, params)]}
+            metrics.log_slow_query(name, sql, params, elapsed, len(records), profile=plan)
+        return records
+
+    def load(self, force=False):
+        """
+        CSV变化（或数据库文件不存在）时重建数据库
+
+        Returns:
+            bool: 是否重建
+        """
+        with self._load_lock:
+            version = csv_version(self.data_dir)
+            if not force and os.path.exists(self.path) and self.get_data_version() == version:
+                self.has_fts = self._has_table('movie_title_fts')
+                return False
+            start = time.perf_counter()
+            temp_path = f"{self.path}.tmp"
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            connection = sqlite3.connect(temp_path)
+            try:
+                self._build(connection, GraphSnapshot.from_csv(self.data_dir), version)
+            finally:
+                connection.close()
+            os.replace(temp_path, self.path)
+            self._generation += 1
+            self.has_fts = self._has_table('movie_title_fts')
+            print(f"[SQLite] 已从CSV重建 {self.path}，耗时 {time.perf_counter() - start:.1f} 秒")
+            return True
+
+    @staticmethod
+    def _build(connection, snapshot, version):
+        """把快照的数据写入新的数据库文件"""
+        for statement in SQLITE_SCHEMA.values():
+            connection.execute(statement)
+
+        movie_rows = []
+        for row in range(snapshot.n_movies):
+            stats = snapshot.movie_stats(row)
+            movie_rows.append((int(snapshot.movie_ids[row]), snapshot.titles[row], snapshot.years[row], row,
+                               stats['rating_count'], stats['avg_rating'], stats['bayesian_rating'],
+                               json.dumps(stats['rating_histogram'])))
+        connection.executemany("INSERT INTO movies VALUES (?, ?, ?, ?, ?, ?, ?, ?)", movie_rows)
+        connection.executemany("INSERT INTO movie_genres VALUES (?, ?)", [
+            (movie_row[0], genre) for movie_row in movie_rows for genre in snapshot.movie_genres(movie_row[3])
+        ])
+        connection.executemany("INSERT INTO users VALUES (?, ?, ?, ?)", [
+            (int(user_id), str(user_id), int(snapshot.rating_count[row]), row + snapshot.user_offset)
+            for row, user_id in enumerate(snapshot.user_ids)
+        ])
+        ratings = snapshot.ratings.tocoo()
+        connection.executemany("INSERT INTO ratings VALUES (?, ?, ?)", zip(
+            snapshot.user_ids[ratings.row].tolist(), snapshot.movie_ids[ratings.col].tolist(), ratings.data.tolist()
+        ))
+
+        connection.executemany("INSERT INTO similar_users VALUES (?, ?, ?, ?)", [
+            (int(snapshot.user_ids[row]), int(snapshot.user_ids[other]), float(score), int(common))
+            for row, (order, scores, commons) in enumerate(snapshot._user_neighbours)
+            for other, score, common in zip(order, scores, commons)
+        ])
+        movie_neighbours = snapshot.similar_movies(list(range(snapshot.n_movies)))
+        connection.executemany("INSERT INTO similar_movies VALUES (?, ?, ?, ?)", [
+            (int(snapshot.movie_ids[row]), int(snapshot.movie_ids[other]), float(score), int(common))
+            for row, (order, scores, commons) in movie_neighbours.items()
+            for other, score, common in zip(order, scores, commons)
+        ])
+
+        node_rows = []
+        for node in range(snapshot.n_nodes):
+            node_dict = snapshot.node_dict(node)
+            node_rows.append((node, node_dict['type'], node_dict['id'], node_dict['name'],
+                              json.dumps(node_dict['properties'], ensure_ascii=False), int(snapshot.degree[node])))
+        connection.executemany("INSERT INTO nodes VALUES (?, ?, ?, ?, ?, ?)", node_rows)
+        rel_types = [RELATIONSHIP_TYPES[rel_type] for rel_type in snapshot.rel_type]
+        connection.executemany("INSERT INTO relationships VALUES (?, ?, ?, ?)", zip(
+            range(len(rel_types)), snapshot.rel_source.tolist(), snapshot.rel_target.tolist(), rel_types
+        ))
+        sources = np.repeat(np.arange(snapshot.n_nodes), snapshot.degree)
+        connection.executemany("INSERT INTO adjacency VALUES (?, ?, ?, ?)", zip(
+            sources.tolist(), snapshot.adjacency.tolist(), snapshot.adjacency_rel.tolist(),
+            [RELATIONSHIP_TYPES[rel_type] for rel_type in snapshot.adjacency_type]
+        ))
+
+        try:
+            connection.execute(MOVIE_TITLE_FTS)
+            connection.execute("INSERT INTO movie_title_fts(movie_title_fts) VALUES ('rebuild')")
+        except sqlite3.OperationalError:
+            pass
+        connection.execute("INSERT INTO meta VALUES ('data_version', ?)", (version,))
+        connection.commit()
+
+    def _has_table(self, name):
+        return self.connect().execute(
+            "SELECT 1 FROM sqlite_master WHERE name = ?", (name,)
+        ).fetchone() is not None
+
+    # ==================== 生命周期 ====================
+
+    def warm_up(self, connections=None):
+        """确保数据库文件存在且与CSV一致"""
+        self.load()
+
+    def health(self):
+        start = time.perf_counter()
+        try:
+            self.connect().execute("SELECT 1").fetchone()
+        except sqlite3.Error as e:
+            return {'status': 'unavailable', 'engine': 'sqlite', 'error': str(e)}
+        return {'status': 'ok', 'engine': 'sqlite', 'path': self.path, 'fulltext': self.has_fts,
+                'query_latency_ms': round((time.perf_counter() - start) * 1000, 2)}
+
+    def check_schema(self):
+        """缺失的表/索引名称"""
+        existing = {row['name'] for row in self.connect().execute("SELECT name FROM sqlite_master")}
+        return [name for name in SQLITE_SCHEMA if name not in existing]
+
+    def ensure_schema(self):
+        """缺失时从CSV重建数据库"""
+        missing = self.check_schema()
+        if missing:
+            self.load(force=True)
+        return missing
+
+    def get_data_version(self):
+        try:
+            row = self.connect().execute("SELECT value FROM meta WHERE key = 'data_version'").fetchone()
+        except sqlite3.OperationalError:
+            return None
+        return row['value'] if row else None
+
+    def get_title_index(self):
+        version = self.get_data_version()
+        if self._title_index is None or version != self._title_index_version:
+            rows = self._fetch(ALL_MOVIES_SQL)
+            self._title_index = TitleSearchIndex(movie_record_to_dict(row) for row in rows)
+            self._title_index_version = version
+        return self._title_index
+
+    # ==================== 电影与用户 ====================
+
+    def get_movies(self, limit=100, skip=0):
+        rows = self._fetch(MOVIES_SQL, limit=limit, skip=skip)
+        return [rated_movie_record_to_dict(row) for row in rows]
+
+    def get_movies_page(self, after_id=None, limit=100):
+        after_id = FIRST_PAGE_CURSOR if after_id is None else safe_int_convert(after_id)
+        rows = self._fetch(MOVIES_PAGE_SQL, after_id=after_id, limit=limit)
+        return build_movie_page(rows, limit)
+
+    def get_top_movies(self, sort='score', genre=None, year_from=None, year_to=None, min_ratings=0, limit=20):
+        """与 Neo4jDatabase.get_top_movies 相同的排行榜，读取建库时计算的评分统计"""
+        rows = self._fetch(TOP_MOVIES_SQL.format(sort_property=top_movies_sort_property(sort)),
+                           genre=genre, year_from=year_from, year_to=year_to, min_ratings=min_ratings, limit=limit)
+        return [top_movie_record_to_dict(row) for row in rows]
+
+    def get_movie_count(self):
+        return self.connect().execute("SELECT count(*) FROM movies").fetchone()[0]
+
+    def search_movies(self, keyword, limit=10, mode='index'):
+        """index 内存标题索引；fulltext 使用FTS5（bm25排序）；contains 区分大小写的子串匹配"""
+        check_mode('搜索方式', mode, SEARCH_MODES)
+        if mode == 'index' or (mode == 'fulltext' and not self.has_fts):
+            return self.get_title_index().search(keyword, limit=limit)
+        if mode == 'fulltext':
+            # FTS5不支持模糊匹配，每个词按前缀匹配
+            match = ' AND '.join(f'"{term}"*' for term in tokenize(keyword))
+            if not match:
+                return []
+            rows = self._fetch(SEARCH_MOVIES_FULLTEXT_SQL, match=match, limit=limit)
+            return [scored_movie_record_to_dict(row) for row in rows]
+        rows = self._fetch(SEARCH_MOVIES_SQL, keyword=keyword, limit=limit)
+        return [movie_record_to_dict(row) for row in rows]
+
+    def search_users(self, keyword, limit=10):
+        """按ID前缀搜索用户（GLOB前缀匹配可以使用id_text索引），按评分数降序"""
+        prefix = user_id_prefix(keyword)
+        if prefix is None:
+            return []
+        rows = self._fetch(SEARCH_USERS_SQL, pattern=f"{prefix}*", limit=limit)
+        return [user_record_to_dict(row) for row in rows]
+
+    def get_user_liked_movies(self, user_id, min_rating=4.0, limit=10):
+        rows = self._fetch(LIKED_MOVIES_SQL, user_id=safe_int_convert(user_id), min_rating=min_rating, limit=limit)
+        return [liked_movie_record_to_dict(row) for row in rows]
+
+    # ==================== 标签 ====================
+
+    def get_movies_by_tag(self, tag, limit=20):
+        matches = require_tag_vectors().movies_by_tag(tag, limit)
+        return tagged_movie_dicts(self._movies_by_id([movie_id for movie_id, _ in matches]), matches)
+
+    def get_similar_tag_movies(self, movie_id, limit=10):
+        matches = require_tag_vectors().similar_movies(safe_int_convert(movie_id), limit)
+        return similar_tag_movie_dicts(self._movies_by_id([movie_id for movie_id, _, _ in matches]), matches)
+
+    def _movies_by_id(self, movie_ids):
+        return self._fetch(MOVIES_BY_ID_SQL, movie_ids=json.dumps(movie_ids)) if movie_ids else []
+
+    # ==================== 关系网络与路径 ====================
+
+    def _node_dicts(self, node_ids):
+        """节点编号 -> 与 node_to_dict 相同格式的字典"""
+        rows = self.connect().execute(
+            "SELECT node_id, label, key, name, properties FROM nodes WHERE node_id IN (SELECT value FROM json_each(?))",
+            (json.dumps(list(node_ids)),)
+        )
+        return {
+            row['node_id']: {'id': row['key'], 'name': row['name'], 'type': row['label'],
+                             'properties': json.loads(row['properties'])}
+            for row in rows
+        }
+
+    def _link_dicts(self, rel_ids, nodes):
+        rows = self.connect().execute(
+            "SELECT rel_id, source, target, type FROM relationships WHERE rel_id IN (SELECT value FROM json_each(?))",
+            (json.dumps(list(rel_ids)),)
+        )
+        links = {row['rel_id']: {'source': nodes[row['source']]['id'], 'target': nodes[row['target']]['id'],
+                                 'type': row['type']} for row in rows}
+        return [links[rel_id] for rel_id in rel_ids]
+
+    def get_movie_network(self, movie_id, depth=2, max_nodes=100, mode='bfs'):
+        """与Neo4j bfs模式相同的逐层扩展；paths/projection 是Neo4j的查询方式，SQLite后端不支持"""
+        if mode != 'bfs':
+            raise InvalidArgument(f"SQLite后端只支持 bfs 模式，不支持: {mode}")
+        depth, max_nodes = clamp_network_params(depth, max_nodes)
+        row = self.connect().execute("SELECT node_id FROM movies WHERE id = ?", (safe_int_convert(movie_id),)).fetchone()
+        if row is None:
+            return {'nodes': [], 'links': []}
+
+        expansion = LevelNetworkExpansion(row['node_id'], depth, max_nodes)
+        while (frontier := expansion.next_frontier()) is not None:
+            rows = self.connect().execute(NETWORK_LEVEL_SQL, {
+                'frontier': json.dumps(frontier), 'visited': json.dumps(expansion.selected),
+                'per_node': expansion.per_node,
+            })
+            expansion.expand((row['source'], row['node_id'], row['weight']) for row in rows)
+        selected = expansion.selected
+
+        ids = json.dumps(selected)
+        rel_ids = [row['rel_id'] for row in self.connect().execute("""
+        SELECT rel_id FROM relationships
+        WHERE source IN (SELECT value FROM json_each(:ids)) AND target IN (SELECT value FROM json_each(:ids))
+        ORDER BY rel_id
+        """, {'ids': ids})]
+        nodes = self._node_dicts(selected)
+        return {'nodes': [nodes[node] for node in selected], 'links': self._link_dicts(rel_ids, nodes)}
+
+    def _expand_path_frontier(self, frontier, types, labels):
+        return self.connect().execute(PATH_EXPAND_SQL, {
+            'frontier': json.dumps(frontier), 'types': json.dumps(types), 'labels': json.dumps(labels),
+        })
+
+    def _bfs_path(self, start, end, max_depth, types, labels, banned_nodes=frozenset(), banned_rels=frozenset()):
+        """
+        精确的双向BFS：每轮用一条SQL展开较小一侧的整个前沿，两侧相遇时停止
+
+        只展开较小的一侧，避免从重度用户或类型一侧展开数千个节点（Yen算法的每次分叉搜索都会调用）。
+
+        Returns:
+            tuple: (节点编号列表, 关系编号列表)，不可达时返回None
+        """
+        if start == end:
+            return [start], []
+        # 每侧：节点 -> (上一个节点, 关系, 深度)
+        parents = ({start: (None, None, 0)}, {end: (None, None, 0)})
+        frontiers = [[start], [end]]
+        depths = [0, 0]
+        while sum(depths) < max_depth and frontiers[0] and frontiers[1]:
+            side = 0 if len(frontiers[0]) <= len(frontiers[1]) else 1
+            visited, other = parents[side], parents[1 - side]
+            depth = depths[side] + 1
+            next_frontier = []
+            meeting = None
+            for row in self._expand_path_frontier(frontiers[side], types, labels):
+                target = row['target']
+                if target in visited or target in banned_nodes or row['rel_id'] in banned_rels:
+                    continue
+                visited[target] = (row['source'], row['rel_id'], depth)
+                next_frontier.append(target)
+                # 同一层可能有多个相遇点，取另一侧深度最小的，保证路径最短
+                if target in other and (meeting is None or other[target][2] < other[meeting][2]):
+                    meeting = target
+            if meeting is not None:
+                start_half, end_half = self._walk(parents[0], meeting), self._walk(parents[1], meeting)
+                nodes = [node for node, _ in reversed(start_half)] + [node for node, _ in end_half[1:]]
+                rels = [rel for _, rel in reversed(start_half) if rel is not None] + \
+                       [rel for _, rel in end_half if rel is not None]
+                return nodes, rels
+            frontiers[side] = next_frontier
+            depths[side] = depth
+        return None
+
+    @staticmethod
+    def _walk(parents, node):
+        """从相遇点沿父指针走回该侧的端点，返回 [(节点, 到父节点的关系)]"""
+        steps = []
+        while node is not None:
+            parent, rel, _ = parents[node]
+            steps.append((node, rel))
+            node = parent
+        return steps
+
+    def find_shortest_path(self, start_type, start_id, end_type, end_id, max_depth=6,
+                           algorithm='shortest', rel_types=None, via_labels=None, k=3):
+        """
+        与 Neo4jDatabase.find_shortest_path 相同的参数和返回格式
+
+        shortest 和 bidirectional 都使用精确的双向BFS；k_shortest 使用Yen算法（分叉搜索次数有上限）；
+        weighted 与Neo4j后端相同，由 WeightedPathSearch 逐批扩展（这里不限制每个节点的邻居数）。
+        """
+        template, params = path_query_params(start_type, start_id, end_type, end_id, max_depth, rel_types, via_labels)
+        if algorithm not in PATH_ALGORITHMS:
+            raise InvalidArgument(f"不支持的路径算法: {algorithm}，可选值: {', '.join(PATH_ALGORITHMS)}")
+        start = self._find_node(template['start_type'], params['start_id'])
+        end = self._find_node(template['end_type'], params['end_id'])
+        types, labels = template['rel_types'].split('|'), params['labels']
+
+        if algorithm == 'weighted':
+            if start is None or end is None:
+                return {'nodes': [], 'links': []}
+            search = WeightedPathSearch(start, end, template['max_depth'])
+            while (frontier := search.next_frontier()) is not None:
+                rows = self._expand_path_frontier(frontier, types, labels)
+                search.expand((row['source'], row['target'], row['degree'], row['rel_id']) for row in rows)
+            path = search.path()
+            return {**self._path_dict(*path), 'cost': search.cost} if path else {'nodes': [], 'links': []}
+
+        if algorithm != 'k_shortest':
+            path = self._bfs_path(start, end, template['max_depth'], types, labels) \
+                if start is not None and end is not None else None
+            return self._path_dict(*path) if path else {'nodes': [], 'links': []}
+
+        paths = []
+        if start is not None and end is not None:
+            def shortest(source, target, depth, banned_nodes, banned_rels):
+                return self._bfs_path(source, target, depth, types, labels, banned_nodes, banned_rels)
+            paths = k_shortest_paths(shortest, start, end, template['max_depth'], max(1, min(int(k), MAX_K_PATHS)))
+        nodes, links = {}, {}
+        for path_nodes, path_rels in paths:
+            result = self._path_dict(path_nodes, path_rels)
+            for node in result['nodes']:
+                nodes.setdefault(node['id'], node)
+            for link in result['links']:
+                links.setdefault((link['source'], link['target'], link['type']), link)
+        node_keys = self._node_dicts({node for path_nodes, _ in paths for node in path_nodes})
+        return {'nodes': list(nodes.values()), 'links': list(links.values()),
+                'paths': [[node_keys[node]['id'] for node in path_nodes] for path_nodes, _ in paths]}
+
+    def _find_node(self, label, key):
+        row = self.connect().execute(
+            "SELECT node_id FROM nodes WHERE label = ? AND key = ?", (label, str(key))
+        ).fetchone()
+        return row['node_id'] if row else None
+
+    def _path_dict(self, node_ids, rel_ids):
+        nodes = self._node_dicts(node_ids)
+        return {'nodes': [nodes[node] for node in node_ids], 'links': self._link_dicts(rel_ids, nodes)}
+
+    # ==================== 推荐 ====================
+
+    def get_user_recommendations(self, user_id, limit=20, min_rating=4.0):
+        """与 Neo4jDatabase.get_user_recommendations 相同的五种策略和返回格式"""
+        start = time.perf_counter()
+        user_id = safe_int_convert(user_id)
+        predictions = factor_predictions(user_id, limit)
+        queries = {
+            'genre_preferences': (GENRE_PREFERENCE_SQL, {'user_id': user_id, 'min_rating': min_rating}),
+            'similar_users': (SIMILAR_USERS_SQL, {'user_id': user_id}),
+            'genre_strategy': (RECOMMEND_BY_GENRE_SQL, {'user_id': user_id, 'min_rating': min_rating, 'limit': limit}),
+            'similar_users_strategy': (RECOMMEND_BY_SIMILAR_USERS_SQL,
+                                       {'user_id': user_id, 'limit': limit, 'neighbours': SIMILAR_USER_NEIGHBOURS}),
+            'similar_movies_strategy': (RECOMMEND_BY_SIMILAR_MOVIES_SQL,
+                                        {'user_id': user_id, 'min_rating': min_rating, 'limit': limit}),
+        }
+        if predictions:
+            queries['factor_strategy'] = (FACTOR_MOVIES_SQL,
+                                          {'user_id': user_id,
+                                           'movie_ids': json.dumps([movie_id for movie_id, _ in predictions])})
+        if tag_vectors.get() is not None:
+            queries['user_ratings'] = (USER_RATINGS_SQL, {'user_id': user_id})
+        records, timings = {}, {}
+        for name, (sql, params) in queries.items():
+            query_start = time.perf_counter()
+            records[name] = self._fetch(sql, **params)
+            timings[name] = round((time.perf_counter() - query_start) * 1000, 2)
+        tag_matches = tag_predictions(records.get('user_ratings', []), min_rating, limit)
+        if tag_matches:
+            query_start = time.perf_counter()
+            records['tag_strategy'] = self._movies_by_id([movie_id for movie_id, _, _ in tag_matches])
+            timings['tag_strategy'] = round((time.perf_counter() - query_start) * 1000, 2)
+        timings['total'] = round((time.perf_counter() - start) * 1000, 2)
+        result = build_recommendations(
+            records['genre_preferences'], records['similar_users'],
+            records['genre_strategy'], records['similar_users_strategy'], records['similar_movies_strategy'],
+            limit, timings=timings,
+            factor_recs=factor_strategy_records(records.get('factor_strategy', []), predictions),
+            tag_recs=tag_strategy_records(records.get('tag_strategy', []), tag_matches)
+        )
+        result['reasoning']['source'] = 'live'
+        return result
+
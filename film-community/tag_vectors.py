@@ -0,0 +1,257 @@
+"""
+电影标签向量（TF-IDF）
+
+tags.csv 的每一行是一位用户给一部电影打的一个标签。离线（dev/build_tag_vectors.py）把标签归一化
+（去掉首尾空白、转小写，与导入时 Tag.name 的规则相同），统计每部电影的每个标签被多少位用户打过，
+得到 电影×标签 计数矩阵，再向量化地算出TF-IDF：
+- tf = 1 + log(计数)：亚线性，少数用户反复打的标签不会压过其他标签
+- idf = log((1 + 电影数) / (1 + 含该标签的电影数)) + 1：平滑，只出现在一部电影上的标签权重最高
+- 每行做L2归一化，两部电影的余弦相似度就是行向量的点积
+
+矩阵以CSR数组保存为 .npy 文件，服务端与隐因子模型一样用 mmap 方式加载（见 factor_model.py）。
+相似电影和标签推荐都只需一次稀疏矩阵-向量乘法，按标签找电影只是一段预先排好序的切片。
+"""
+import os
+import time
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from factor_model import FactorModelLoader, load_model_arrays, save_model_arrays
+
+# 默认目录（已加入.gitignore），可用 TAG_MODEL_DIR 覆盖
+DEFAULT_TAG_MODEL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'models', 'tags')
+TAG_MODEL_DIR = os.getenv("TAG_MODEL_DIR", DEFAULT_TAG_MODEL_DIR)
+
+# 模型由这些数组组成，每个数组保存为同名 .npy 文件：
+# - movie_ids/tag_names：行号、列号对应的电影ID和标签名（均升序）
+# - indptr/indices/weights/counts：电影行的CSR，weights 为归一化的TF-IDF，counts 为打该标签的用户数
+# - tag_indptr/tag_movies/tag_counts：每个标签的电影行号，按用户数、TF-IDF权重降序排好
+MODEL_ARRAYS = ('movie_ids', 'tag_names', 'indptr', 'indices', 'weights', 'counts',
+                'tag_indptr', 'tag_movies', 'tag_counts')
+
+# 每条推荐/相似电影附带的共同标签数
+SHARED_TAGS = 3
+
+
+class TagVectorsUnavailable(RuntimeError):
+    """标签向量尚未构建"""
+
+
+def normalize_tags(tags):
+    """标签归一化：去掉首尾空白并转小写（与导入脚本中的 toLower(trim(tag)) 一致）"""
+    return tags.astype(str).str.strip().str.lower()
+
+
+def movie_tag_counts(tags):
+    """
+    统计每部电影的每个标签被多少位用户打过
+
+    Args:
+        tags: DataFrame，包含 user_id/movie_id/tag 列（tags.csv 的每一行）
+
+    Returns:
+        DataFrame: movie_id/tag/count 列，tag 已归一化
+    """
+    tags = tags.assign(tag=normalize_tags(tags['tag']))
+    tags = tags[tags['tag'] != ''].drop_duplicates(['user_id', 'movie_id', 'tag'])
+    return tags.groupby(['movie_id', 'tag']).size().rename('count').reset_index()
+
+
+class TagVectors:
+    """
+    电影的TF-IDF标签向量
+
+    只包含至少有一个标签的电影；没有标签的电影查不到相似电影，也不会被推荐。
+    """
+
+    def __init__(self, movie_ids, tag_names, indptr, indices, weights, counts, tag_indptr, tag_movies, tag_counts,
+                 meta=None):
+        self.movie_ids = movie_ids
+        self.tag_names = tag_names
+        self.indptr = indptr
+        self.indices = indices
+        self.weights = weights
+        self.counts = counts
+        self.tag_indptr = tag_indptr
+        self.tag_movies = tag_movies
+        self.tag_counts = tag_counts
+        self.meta = meta or {}
+        self.matrix = sparse.csr_matrix((weights, indices, indptr), shape=(len(movie_ids), len(tag_names)),
+                                        copy=False)
+
+    @classmethod
+    def build(cls, counts):
+        """
+        由每部电影的标签计数构建TF-IDF向量
+
+        Args:
+            counts: DataFrame，包含 movie_id/tag/count 列（movie_tag_counts 的输出，或图中 HAS_TAG.count）
+        """
+        start = time.perf_counter()
+        movie_ids, rows = np.unique(counts['movie_id'].to_numpy(np.int64), return_inverse=True)
+        tag_names, cols = np.unique(counts['tag'].to_numpy(str), return_inverse=True)
+        count_matrix = sparse.csr_matrix((counts['count'].to_numpy(np.float64), (rows, cols)),
+                                         shape=(len(movie_ids), len(tag_names)))
+        count_matrix.sum_duplicates()
+        count_matrix.sort_indices()
+
+        document_frequency = np.bincount(count_matrix.indices, minlength=len(tag_names))
+        idf = np.log((1 + len(movie_ids)) / (1 + document_frequency)) + 1
+        weights = (1 + np.log(count_matrix.data)) * idf[count_matrix.indices]
+        row_lengths = np.diff(count_matrix.indptr)
+        norms = np.sqrt(np.add.reduceat(weights ** 2, count_matrix.indptr[:-1])) if len(weights) else np.zeros(0)
+        weights /= np.repeat(norms, row_lengths)
+
+        # 按标签分组：标签升序，同一标签内按用户数、TF-IDF权重降序，再按电影ID升序
+        entry_rows = np.repeat(np.arange(len(movie_ids)), row_lengths)
+        order = np.lexsort((entry_rows, -weights, -count_matrix.data, count_matrix.indices))
+        tag_indptr = np.zeros(len(tag_names) + 1, dtype=np.int32)
+        np.cumsum(document_frequency, out=tag_indptr[1:])
+
+        meta = {
+            'movies': len(movie_ids),
+            'tags': len(tag_names),
+            'movie_tags': int(count_matrix.nnz),
+            'tag_applications': int(count_matrix.data.sum()),
+            'build_seconds': round(time.perf_counter() - start, 3),
+            'built_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        }
+        # 索引统一为int32，加载时 csr_matrix 可以直接引用mmap数组而不必转换类型
+        return cls(movie_ids, tag_names, count_matrix.indptr.astype(np.int32), count_matrix.indices.astype(np.int32),
+                   weights.astype(np.float32), count_matrix.data.astype(np.int32), tag_indptr,
+                   entry_rows[order].astype(np.int32), count_matrix.data[order].astype(np.int32), meta)
+
+    def save(self, model_dir):
+        """保存为 .npy 文件；meta.json 最后写入，加载方看到它时其余文件已经完整"""
+        save_model_arrays(model_dir, {name: getattr(self, name) for name in MODEL_ARRAYS}, self.meta)
+
+    @classmethod
+    def load(cls, model_dir, mmap=True):
+        """加载标签向量，mmap=True 时数组按需从页缓存读取，不复制到进程内存"""
+        arrays, meta = load_model_arrays(model_dir, MODEL_ARRAYS, mmap)
+        return cls(meta=meta, **arrays)
+
+    def movie_row(self, movie_id):
+        """电影ID -> 行号，电影没有标签时返回None"""
+        row = int(np.searchsorted(self.movie_ids, movie_id))
+        return row if row < len(self.movie_ids) and self.movie_ids[row] == movie_id else None
+
+    def tag_column(self, tag):
+        """标签名（归一化前后均可）-> 列号，不存在时返回None"""
+        tag = str(tag).strip().lower()
+        col = int(np.searchsorted(self.tag_names, tag))
+        return col if col < len(self.tag_names) and self.tag_names[col] == tag else None
+
+    def search_tags(self, keyword=None, limit=20):
+        """
+        按前缀查找标签（tag_names 已排序，二分定位范围），没有关键词时返回全部标签
+
+        Returns:
+            list: (标签, 电影数) 列表，按电影数降序、标签升序
+        """
+        prefix = str(keyword or '').strip().lower()
+        start = int(np.searchsorted(self.tag_names, prefix))
+        end = int(np.searchsorted(self.tag_names, prefix + '\U0010ffff')) if prefix else len(self.tag_names)
+        movie_counts = np.diff(self.tag_indptr[start:end + 1])
+        order = np.lexsort((np.arange(end - start), -movie_counts))[:limit]
+        return [(str(self.tag_names[start + i]), int(movie_counts[i])) for i in order]
+
+    def movies_by_tag(self, tag, limit=20):
+        """
+        打了该标签的电影
+
+        Returns:
+            list: (电影ID, 打该标签的用户数) 列表，按用户数降序；标签不存在时为空列表
+        """
+        col = self.tag_column(tag)
+        if col is None:
+            return []
+        start = self.tag_indptr[col]
+        end = min(self.tag_indptr[col + 1], start + limit)
+        return [(int(self.movie_ids[row]), int(count))
+                for row, count in zip(self.tag_movies[start:end], self.tag_counts[start:end])]
+
+    def similar_movies(self, movie_id, limit=10):
+        """
+        标签向量余弦相似度最高的电影
+
+        Returns:
+            list: (电影ID, 相似度, 共同标签列表) 列表，按相似度降序；电影没有标签时为空列表
+        """
+        row = self.movie_row(movie_id)
+        if row is None:
+            return []
+        profile = np.zeros(len(self.tag_names))
+        start, end = self.indptr[row], self.indptr[row + 1]
+        profile[self.indices[start:end]] = self.weights[start:end]
+        scores = self.matrix @ profile
+        scores[row] = 0
+        return self._top(scores, limit, profile)
+
+    def recommend(self, ratings, min_rating=4.0, limit=20):
+        """
+        按用户喜欢的电影的标签推荐
+
+        用户的标签偏好为喜欢的电影（评分 >= min_rating）的TF-IDF向量按评分加权求和，
+        归一化后与每部电影求余弦相似度，排除已评分的电影。
+
+        Args:
+            ratings: (电影ID, 评分) 序列，用户的全部评分
+            min_rating: 喜欢的电影的最低评分
+            limit: 返回数量
+
+        Returns:
+            list: (电影ID, 相似度, 共同标签列表) 列表，按相似度降序；喜欢的电影都没有标签时为空列表
+        """
+        ratings = list(ratings)
+        if not ratings:
+            return []
+        movie_ids = np.array([movie_id for movie_id, _ in ratings], dtype=np.int64)
+        values = np.array([rating for _, rating in ratings], dtype=np.float64)
+        rows = np.searchsorted(self.movie_ids, movie_ids).clip(0, max(len(self.movie_ids) - 1, 0))
+        known = self.movie_ids[rows] == movie_ids if len(self.movie_ids) else np.zeros(len(rows), dtype=bool)
+        liked = known & (values >= min_rating)
+        if not liked.any():
+            return []
+        profile = self.matrix[rows[liked]].T @ values[liked]
+        profile /= np.linalg.norm(profile)
+        scores = self.matrix @ profile
+        scores[rows[known]] = 0
+        return self._top(scores, limit, profile)
+
+    def _top(self, scores, limit, profile):
+        """取得分最高（且大于0）的 limit 部电影，附带对得分贡献最大的几个标签"""
+        candidates = np.flatnonzero(scores > 0)
+        if len(candidates) > limit:
+            candidates = candidates[np.argpartition(-scores[candidates], limit - 1)[:limit]]
+        candidates = candidates[np.lexsort((candidates, -scores[candidates]))]
+        results = []
+        for row in candidates:
+            start, end = self.indptr[row], self.indptr[row + 1]
+            tags = self.indices[start:end]
+            contribution = self.weights[start:end] * profile[tags]
+            shared = tags[np.argsort(-contribution, kind='stable')[:SHARED_TAGS]]
+            results.append((int(self.movie_ids[row]), float(scores[row]),
+                            [str(self.tag_names[col]) for col in shared if profile[col] > 0]))
+        return results
+
+
+def load_tags_csv(data_dir):
+    """读取 tags.csv（全部行，同一用户给同一电影的多个标签都保留）"""
+    return pd.read_csv(os.path.join(data_dir, 'tags.csv')).rename(
+        columns={'userId': 'user_id', 'movieId': 'movie_id'}
+    )
+
+
+def require_tag_vectors():
+    """返回当前的标签向量，尚未构建时抛出 TagVectorsUnavailable"""
+    model = tag_vectors.get()
+    if model is None:
+        raise TagVectorsUnavailable("标签向量尚未构建，请先运行 dev/build_tag_vectors.py")
+    return model
+
+
+# 服务端共用的加载器
+tag_vectors = FactorModelLoader(TAG_MODEL_DIR, model_class=TagVectors, name='标签向量')
@@ -0,0 +1,146 @@
+"""
+结果缓存（ResultCache / CachedDatabase）
+
+运行：python -m unittest discover -s tests（在 film-community 目录下）
+"""
+import asyncio
+import os
+import sys
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from cache import CachedDatabase, ResultCache, estimate_size  # noqa: E402
+
+
+class FakeClock:
+    """替代 time.monotonic，测试中手动推进时间"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class StubBackend:
+    """记录调用次数的后端，数据版本和是否可用由测试控制"""
+
+    def __init__(self):
+        self.version = 1
+        self.available = True
+        self.calls = 0
+
+    async def get_data_version(self):
+        if not self.available:
+            raise ConnectionError("数据库不可用")
+        return self.version
+
+    async def get_movie_network(self, movie_id, depth=2):
+        if not self.available:
+            raise ConnectionError("数据库不可用")
+        self.calls += 1
+        return {'nodes': [movie_id] * depth, 'links': []}
+
+
+class ResultCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        patcher = mock.patch('cache.time.monotonic', self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_lru_eviction(self):
+        cache = ResultCache(max_entries=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        self.assertEqual(cache.get('a'), (True, 1))
+        cache.set('c', 3)
+        self.assertEqual(cache.get('b'), (False, None))
+        self.assertEqual(cache.get('a'), (True, 1))
+        self.assertEqual(cache.get('c'), (True, 3))
+        self.assertEqual(cache.stats()['evictions'], 1)
+
+    def test_byte_bound(self):
+        value = {'payload': 'x' * 100}
+        size = estimate_size(value)
+        cache = ResultCache(max_entries=100, max_bytes=size * 2)
+        for key in ('a', 'b', 'c'):
+            cache.set(key, value)
+        self.assertEqual(cache.stats()['entries'], 2)
+        self.assertEqual(cache.bytes, size * 2)
+        self.assertFalse(cache.get('a')[0])
+
+        cache.set('big', {'payload': 'x' * size * 2})
+        self.assertFalse(cache.get('big')[0])
+        self.assertEqual(cache.stats()['rejections'], 1)
+        self.assertEqual(cache.bytes, size * 2)
+
+    def test_overwrite_keeps_byte_count(self):
+        cache = ResultCache()
+        cache.set('a', 'x' * 10)
+        cache.set('a', 'x' * 20)
+        self.assertEqual(cache.bytes, estimate_size('x' * 20))
+
+    def test_ttl_expiry(self):
+        cache = ResultCache(ttl=10)
+        cache.set('a', 1)
+        self.clock.now += 9.9
+        self.assertEqual(cache.get('a'), (True, 1))
+        self.clock.now += 0.1
+        self.assertEqual(cache.get('a'), (False, None))
+        self.assertEqual(cache.stats()['expirations'], 1)
+        self.assertEqual(cache.bytes, 0)
+
+
+class CachedDatabaseTest(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        patcher = mock.patch('cache.time.monotonic', self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.backend = StubBackend()
+        self.db = CachedDatabase(self.backend, ResultCache(ttl=60), methods=['get_movie_network'],
+                                 version_check_interval=5)
+
+    def network(self, movie_id=1, **kwargs):
+        return asyncio.run(self.db.get_movie_network(movie_id, **kwargs))
+
+    def test_hits_are_marked(self):
+        self.assertFalse(self.network()['cached'])
+        self.assertTrue(self.network()['cached'])
+        self.assertFalse(self.network(depth=3)['cached'])
+        self.assertEqual(self.backend.calls, 2)
+
+    def test_version_change_invalidates(self):
+        self.network()
+        self.backend.version = 2
+        self.clock.now += 1
+        self.assertTrue(self.network()['cached'])
+        self.clock.now += 5
+        self.assertFalse(self.network()['cached'])
+        self.assertEqual(self.backend.calls, 2)
+        self.assertEqual(self.db.cache.stats()['invalidations'], 1)
+
+    def test_serves_cached_entries_when_version_check_fails(self):
+        self.network()
+        self.backend.available = False
+        self.clock.now += 5
+        with mock.patch('builtins.print'):
+            self.assertTrue(self.network()['cached'])
+            with self.assertRaises(ConnectionError):
+                self.network(2)
+            self.clock.now += 60
+            with self.assertRaises(ConnectionError):
+                self.network()
+        self.assertEqual(self.db.cache.stats()['version_check_failures'], 2)
+
+        self.backend.available = True
+        self.clock.now += 5
+        self.assertFalse(self.network()['cached'])
+
+
+if __name__ == '__main__':
+    unittest.main()
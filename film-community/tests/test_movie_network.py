@@ -0,0 +1,114 @@
+"""
+bfs模式关系网络的节点数
+
+运行：python -m unittest discover -s tests（在 film-community 目录下，需要 ml-latest-small 数据）
+"""
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from database import LevelNetworkExpansion  # noqa: E402
+from graph_snapshot import GraphSnapshot  # noqa: E402
+from sqlite_database import SQLiteDatabase  # noqa: E402
+
+# 覆盖热门电影、冷门电影以及各种深度和节点数
+MOVIE_IDS = (1, 2, 50, 318, 2571, 7153, 99114, 136469, 193609)
+DEPTHS = (1, 2, 3)
+MAX_NODES = (10, 100, 500)
+
+
+def expand(adjacency, weights, start, depth, max_nodes):
+    """在内存中的邻接表上执行 LevelNetworkExpansion"""
+    expansion = LevelNetworkExpansion(start, depth, max_nodes)
+    while (frontier := expansion.next_frontier()) is not None:
+        candidates = []
+        for source in frontier:
+            neighbours = sorted((node for node in adjacency.get(source, ()) if node not in expansion.selected),
+                                key=lambda node: -weights[node])
+            candidates.extend((source, node, weights[node]) for node in neighbours[:expansion.per_node])
+        expansion.expand(candidates)
+    return expansion.selected
+
+
+def reachable_count(snapshot, start, depth):
+    """深度内可达的节点数（含起点）"""
+    seen = {start}
+    frontier = [start]
+    for _ in range(depth):
+        _, targets, _ = snapshot.neighbours(frontier)
+        frontier = [node for node in set(targets.tolist()) if node not in seen]
+        seen.update(frontier)
+    return len(seen)
+
+
+class LevelNetworkExpansionTest(unittest.TestCase):
+
+    def test_shared_neighbours_do_not_use_up_budget(self):
+        # 起点的10个邻居共享同样的高权重邻居 h0..h4，各自另有10个独有的低权重邻居
+        adjacency = {'s': [f'a{i}' for i in range(10)]}
+        weights = {f'a{i}': 100 for i in range(10)}
+        for i in range(10):
+            adjacency[f'a{i}'] = [f'h{j}' for j in range(5)] + [f'a{i}_{j}' for j in range(10)]
+            weights.update({f'a{i}_{j}': 1 for j in range(10)})
+        weights.update({f'h{j}': 50 for j in range(5)})
+
+        selected = expand(adjacency, weights, 's', depth=2, max_nodes=60)
+        self.assertEqual(len(selected), 60)
+        self.assertEqual(len(set(selected)), 60)
+        self.assertTrue({f'h{j}' for j in range(5)} <= set(selected))
+
+    def test_leftover_budget_fills_from_earlier_levels(self):
+        # 第二层只有一个新节点，剩余名额由第一层未选中的节点补足
+        adjacency = {'s': [f'a{i}' for i in range(30)], 'a0': ['b']}
+        weights = {f'a{i}': 30 - i for i in range(30)}
+        weights['b'] = 1
+
+        selected = expand(adjacency, weights, 's', depth=2, max_nodes=25)
+        self.assertEqual(len(selected), 25)
+        self.assertEqual(len(set(selected)), 25)
+
+    def test_returns_all_reachable_nodes_when_fewer_than_max(self):
+        adjacency = {'s': ['a', 'b'], 'a': ['c'], 'c': ['d']}
+        weights = {'a': 2, 'b': 1, 'c': 1, 'd': 1}
+        self.assertEqual(sorted(expand(adjacency, weights, 's', depth=2, max_nodes=100)), ['a', 'b', 'c', 's'])
+
+
+class MovieNetworkSizeTest(unittest.TestCase):
+    """max_nodes 个节点可达时，各后端都恰好返回 max_nodes 个节点"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.snapshot = GraphSnapshot.from_csv()
+        cls.tempdir = tempfile.TemporaryDirectory()
+        cls.sqlite = SQLiteDatabase(os.path.join(cls.tempdir.name, 'movielens.sqlite'))
+        cls.sqlite.load()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.sqlite.close()
+        cls.tempdir.cleanup()
+
+    def assert_network_size(self, get_movie_network):
+        for movie_id in MOVIE_IDS:
+            start = self.snapshot.find_movie(movie_id)
+            self.assertIsNotNone(start)
+            for depth in DEPTHS:
+                reachable = reachable_count(self.snapshot, start, depth)
+                for max_nodes in MAX_NODES:
+                    with self.subTest(movie_id=movie_id, depth=depth, max_nodes=max_nodes):
+                        network = get_movie_network(movie_id, depth, max_nodes)
+                        keys = {(node['type'], node['id']) for node in network['nodes']}
+                        self.assertEqual(len(keys), len(network['nodes']))
+                        self.assertEqual(len(network['nodes']), min(max_nodes, reachable))
+
+    def test_snapshot(self):
+        self.assert_network_size(self.snapshot.movie_network)
+
+    def test_sqlite(self):
+        self.assert_network_size(self.sqlite.get_movie_network)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,249 @@
+"""
+路径查找算法（Yen算法的k条最短路径、双向BFS、加权路径）以及关系类型/途经标签过滤
+
+运行：python -m unittest discover -s tests（在 film-community 目录下，需要 ml-latest-small 数据）
+"""
+import os
+import sys
+import unittest
+from unittest import mock
+
+import numpy as np
+from neo4j.exceptions import CypherSyntaxError
+from scipy import sparse
+from scipy.sparse import csgraph
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from database import (  # noqa: E402
+    K_SHORTEST_PATHS_QUERY, PATH_ENDPOINTS_QUERY, PATH_NODE_KEYS, PATH_RELATIONSHIP_TYPES, Neo4jDatabase,
+    WeightedPathSearch, k_shortest_paths, path_node_key,
+)
+from graph_snapshot import LABELS, RELATIONSHIP_TYPES, GraphSnapshot  # noqa: E402
+
+# (起点类型, 起点ID, 终点类型, 终点ID)：用户、热门/冷门电影和类型之间的组合
+ENDPOINTS = (
+    ('User', 1, 'User', 2),
+    ('User', 1, 'Movie', 193609),
+    ('Movie', 1, 'Movie', 136469),
+    ('Movie', 99114, 'Genre', 'Film-Noir'),
+    ('User', 610, 'Genre', 'Documentary'),
+    ('Movie', 7153, 'User', 53),
+)
+
+# (关系类型, 途经标签)
+FILTERS = (
+    (None, None),
+    (['RATED'], None),
+    (['IN_GENRE'], None),
+    (['IN_GENRE', 'RATED'], ['Genre']),
+    (['RATED', 'TAGGED'], ['Movie']),
+)
+
+
+class SnapshotPathTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.snapshot = GraphSnapshot.from_csv()
+
+    def node(self, node_dict):
+        """结果中的节点字典 -> 快照节点编号"""
+        label = node_dict['type']
+        return self.snapshot.find_node(label, path_node_key(label, node_dict['id']))
+
+    def matrix(self, rel_types=None, via_labels=None, endpoints=(), weighted=False):
+        """
+        独立于快照搜索代码的参照图：只保留允许的关系类型和节点标签（端点标签总是允许）
+
+        weighted 时进入节点的代价为 WeightedPathSearch.step_cost(度数)，否则每步为1
+        """
+        snapshot = self.snapshot
+        labels = {LABELS.index(label) for label in (via_labels or PATH_NODE_KEYS)}
+        labels |= {LABELS.index(label) for label, _ in endpoints}
+        types = [RELATIONSHIP_TYPES.index(rel_type) for rel_type in (rel_types or PATH_RELATIONSHIP_TYPES)]
+        keep = (np.isin(snapshot.rel_type, types)
+                & np.isin(snapshot.label[snapshot.rel_source], list(labels))
+                & np.isin(snapshot.label[snapshot.rel_target], list(labels)))
+        sources = np.concatenate([snapshot.rel_source[keep], snapshot.rel_target[keep]])
+        targets = np.concatenate([snapshot.rel_target[keep], snapshot.rel_source[keep]])
+        # 平行关系（同一用户对同一电影的多个标签）只保留一条，避免构建稀疏矩阵时权重被累加
+        pairs = np.unique(np.stack([sources, targets], axis=1), axis=0)
+        if weighted:
+            weights = 1.0 + np.log(np.maximum(snapshot.degree[pairs[:, 1]], 1))
+        else:
+            weights = np.ones(len(pairs))
+        return sparse.csr_matrix((weights, (pairs[:, 0], pairs[:, 1])), shape=(snapshot.n_nodes, snapshot.n_nodes))
+
+    def reference_distance(self, start, end, **kwargs):
+        distances = csgraph.dijkstra(self.matrix(**kwargs), indices=start)
+        return distances[end]
+
+    def assert_valid_path(self, result, rel_types=None, via_labels=None, endpoints=()):
+        """单条路径的结果：节点不重复、标签都允许，相邻节点之间有允许类型的关系"""
+        links = {}
+        for link in result['links']:
+            links.setdefault(frozenset((link['source'], link['target'])), set()).add(link['type'])
+        labels = set(via_labels or PATH_NODE_KEYS) | {label for label, _ in endpoints}
+        path = [self.node(node) for node in result['nodes']]
+        self.assertEqual(len(set(path)), len(path))
+        self.assertTrue(all(node['type'] in labels for node in result['nodes']))
+        path_ids = [node['id'] for node in result['nodes']]
+        for left, right in zip(path_ids, path_ids[1:]):
+            self.assertTrue(links.get(frozenset((left, right)), set()) & set(rel_types or PATH_RELATIONSHIP_TYPES))
+
+    def cases(self):
+        for start_type, start_id, end_type, end_id in ENDPOINTS:
+            for rel_types, via_labels in FILTERS:
+                yield dict(start_type=start_type, start_id=start_id, end_type=end_type, end_id=end_id,
+                           rel_types=rel_types, via_labels=via_labels)
+
+    def endpoints(self, case):
+        start = self.snapshot.find_node(case['start_type'], case['start_id'])
+        end = self.snapshot.find_node(case['end_type'], case['end_id'])
+        return start, end, ((case['start_type'], start), (case['end_type'], end))
+
+    def test_shortest_and_bidirectional_match_bfs(self):
+        for case in self.cases():
+            start, end, endpoints = self.endpoints(case)
+            expected = self.reference_distance(start, end, rel_types=case['rel_types'],
+                                               via_labels=case['via_labels'], endpoints=endpoints)
+            for algorithm in ('shortest', 'bidirectional'):
+                with self.subTest(algorithm=algorithm, **case):
+                    result = self.snapshot.shortest_path(max_depth=8, algorithm=algorithm, **case)
+                    if np.isinf(expected) or expected > 8:
+                        self.assertEqual(result, {'nodes': [], 'links': []})
+                        continue
+                    self.assertEqual(len(result['links']), expected)
+                    self.assertEqual((self.node(result['nodes'][0]), self.node(result['nodes'][-1])), (start, end))
+                    self.assert_valid_path(result, case['rel_types'], case['via_labels'], endpoints)
+
+    def k_shortest(self, **kwargs):
+        """
+        执行k_shortest，同时记录Yen算法返回的原始路径
+
+        结果中的节点ID在不同标签之间可能重复（用户1与电影1），原始路径的节点编号和关系编号才能判断是否有环、是否重复
+
+        Returns:
+            tuple: (结果字典, (节点编号列表, 关系编号列表) 列表)
+        """
+        raw = []
+
+        def record(*args, **kw):
+            raw.extend(k_shortest_paths(*args, **kw))
+            return raw
+
+        with mock.patch('graph_snapshot.k_shortest_paths', side_effect=record):
+            result = self.snapshot.shortest_path(algorithm='k_shortest', **kwargs)
+        return result, raw
+
+    def test_k_shortest_paths_are_loopless_distinct_and_ordered(self):
+        snapshot = self.snapshot
+        for case in self.cases():
+            start, end, endpoints = self.endpoints(case)
+            expected = self.reference_distance(start, end, rel_types=case['rel_types'],
+                                               via_labels=case['via_labels'], endpoints=endpoints)
+            labels = {LABELS.index(label) for label in (case['via_labels'] or PATH_NODE_KEYS)}
+            labels |= {LABELS.index(label) for label, _ in endpoints}
+            types = {RELATIONSHIP_TYPES.index(rel_type) for rel_type in (case['rel_types'] or PATH_RELATIONSHIP_TYPES)}
+            with self.subTest(**case):
+                result, raw = self.k_shortest(max_depth=6, k=5, **case)
+                if np.isinf(expected) or expected > 6:
+                    self.assertEqual(result['paths'], [])
+                    continue
+                self.assertEqual(len(raw[0][1]), expected)
+                self.assertEqual([len(rels) for _, rels in raw], sorted(len(rels) for _, rels in raw))
+                self.assertEqual(len({(tuple(nodes), tuple(rels)) for nodes, rels in raw}), len(raw))
+                self.assertEqual(result['paths'], [[snapshot.node_key(node) for node in nodes] for nodes, _ in raw])
+                for nodes, rels in raw:
+                    self.assertEqual((nodes[0], nodes[-1]), (start, end))
+                    self.assertEqual(len(set(nodes)), len(nodes))
+                    self.assertLessEqual(len(rels), 6)
+                    self.assertTrue(all(snapshot.label[node] in labels for node in nodes))
+                    for left, right, rel in zip(nodes, nodes[1:], rels):
+                        self.assertIn(snapshot.rel_type[rel], types)
+                        self.assertEqual({snapshot.rel_source[rel], snapshot.rel_target[rel]}, {left, right})
+
+    def test_k_shortest_finds_k_paths(self):
+        result = self.snapshot.shortest_path('User', 1, 'User', 2, max_depth=4, algorithm='k_shortest', k=5)
+        self.assertEqual(len(result['paths']), 5)
+
+    def test_weighted_returns_minimum_cost_path(self):
+        for case in self.cases():
+            start, end, endpoints = self.endpoints(case)
+            expected = self.reference_distance(start, end, rel_types=case['rel_types'],
+                                               via_labels=case['via_labels'], endpoints=endpoints, weighted=True)
+            with self.subTest(**case):
+                result = self.snapshot.shortest_path(max_depth=10, algorithm='weighted', **case)
+                if np.isinf(expected):
+                    self.assertEqual(result, {'nodes': [], 'links': []})
+                    continue
+                self.assertAlmostEqual(result['cost'], expected, places=3)
+                path = [self.node(node) for node in result['nodes']]
+                self.assertEqual((path[0], path[-1]), (start, end))
+                cost = sum(WeightedPathSearch.step_cost(self.snapshot.degree[node]) for node in path[1:])
+                self.assertAlmostEqual(cost, expected, places=3)
+                self.assert_valid_path(result, case['rel_types'], case['via_labels'], endpoints)
+
+    def test_filters_exclude_other_labels_and_types(self):
+        result = self.snapshot.shortest_path('Movie', 1, 'Movie', 2, algorithm='shortest', via_labels=['Genre'])
+        self.assertEqual([node['type'] for node in result['nodes']], ['Movie', 'Genre', 'Movie'])
+        for algorithm in ('shortest', 'bidirectional', 'weighted', 'k_shortest'):
+            with self.subTest(algorithm=algorithm):
+                # 用户之间只能经由电影相连
+                result = self.snapshot.shortest_path('User', 1, 'User', 2, algorithm=algorithm, via_labels=['Genre'])
+                self.assertEqual(result['nodes'], [])
+                result = self.snapshot.shortest_path('User', 1, 'Genre', 'Drama', algorithm=algorithm,
+                                                     rel_types=['RATED', 'TAGGED'])
+                self.assertEqual(result['nodes'], [])
+
+
+class FakeSession:
+    """按查询文本返回预设结果的会话，用于驱动查询计划"""
+
+    def __init__(self, responses):
+        self.responses = responses
+        self.queries = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def run(self, query, **params):
+        self.queries.append(query)
+        response = self.responses[query]
+        if isinstance(response, Exception):
+            raise response
+        return iter(response)
+
+
+class KShortestFallbackTest(unittest.TestCase):
+    """服务器不支持 SHORTEST k（Neo4j 5.21 之前）时改用Yen算法，而不是返回500"""
+
+    def test_syntax_error_falls_back_to_yen(self):
+        db = Neo4jDatabase()
+        template = dict(start_type='User', start_key='id', end_type='User', end_key='id',
+                        rel_types='|'.join(sorted(PATH_RELATIONSHIP_TYPES)), max_depth=6)
+        k_query = K_SHORTEST_PATHS_QUERY.format(k=3, **template)
+        endpoints_query = PATH_ENDPOINTS_QUERY.format(**template)
+        session = FakeSession({k_query: CypherSyntaxError("Invalid input 'SHORTEST'"), endpoints_query: []})
+        with mock.patch.object(db, 'get_session', return_value=session):
+            for _ in range(2):
+                result = db.find_shortest_path('User', 1, 'User', 2, algorithm='k_shortest', k=3)
+                self.assertEqual(result, {'nodes': [], 'links': [], 'paths': []})
+        # 第一次遇到语法错误后不再尝试 SHORTEST k
+        self.assertEqual(session.queries, [k_query, endpoints_query, endpoints_query])
+
+    def test_other_errors_propagate(self):
+        db = Neo4jDatabase()
+        session = mock.MagicMock()
+        session.__enter__.return_value = session
+        session.run.side_effect = CypherSyntaxError("Invalid input")
+        with mock.patch.object(db, 'get_session', return_value=session):
+            with self.assertRaises(CypherSyntaxError):
+                db.find_shortest_path('User', 1, 'User', 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
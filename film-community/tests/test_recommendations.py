@@ -0,0 +1,138 @@
+"""
+推荐策略的合并
+
+运行：python -m unittest discover -s tests（在 film-community 目录下，需要 ml-latest-small 数据）
+"""
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from database import (  # noqa: E402
+    build_recommendations, build_stored_recommendations, factor_predictions, stored_recommendation_rows,
+    tag_predictions,
+)
+from factor_model import FactorModel, factor_models, load_ratings_csv  # noqa: E402
+from graph_snapshot import DEFAULT_DATA_DIR, GraphSnapshot  # noqa: E402
+from sqlite_database import SQLiteDatabase  # noqa: E402
+from tag_vectors import TagVectors, load_tags_csv, movie_tag_counts, tag_vectors  # noqa: E402
+
+USER_IDS = range(1, 31)
+
+# 训练时留出的评分数：模拟训练之后用户新增的评分
+HELD_OUT_RATINGS = 20
+
+
+def strategy_records(score, movie_ids):
+    """构造某一策略的推荐记录"""
+    reasons = {1: '类型偏好: Drama', 2: '相似用户推荐（共同评分5部）', 3: '基于您喜欢的《Heat》',
+               4: '隐因子模型预测评分 4.5', 5: '标签相似: heist'}
+    return [{'id': movie_id, 'title': f'Movie {movie_id}', 'year': 2000, 'genres': ['Drama'],
+             'reason': reasons[score], 'score': score} for movie_id in movie_ids]
+
+
+def build(limit, **strategies):
+    """strategies 为 策略编号 -> 电影ID列表"""
+    recs = {score: strategy_records(score, strategies.get(f's{score}', [])) for score in range(1, 6)}
+    return build_recommendations([], [], recs[1], recs[2], recs[3], limit, factor_recs=recs[4], tag_recs=recs[5])
+
+
+class InterleaveTest(unittest.TestCase):
+
+    def test_every_strategy_appears(self):
+        result = build(10, s1=range(100, 110), s2=range(200, 210), s3=range(300, 310),
+                       s4=range(400, 410), s5=range(500, 510))
+        strategies = [rec['strategy'] for rec in result['recommendations']]
+        self.assertEqual(len(strategies), 10)
+        self.assertEqual(strategies[:5], ['类型偏好推荐', '相似用户推荐', '相似电影推荐', '隐因子推荐', '标签相似推荐'])
+        self.assertEqual(strategies.count('隐因子推荐'), 2)
+
+    def test_duplicates_go_to_the_earlier_turn(self):
+        result = build(10, s1=[1, 2, 3], s4=[1, 4, 2])
+        self.assertEqual([(rec['id'], rec['score']) for rec in result['recommendations']],
+                         [('1', 1), ('4', 4), ('2', 1), ('3', 1)])
+
+    def test_exhausted_strategies_leave_room_for_others(self):
+        result = build(6, s1=range(100, 110), s4=[400])
+        self.assertEqual([rec['score'] for rec in result['recommendations']], [1, 4, 1, 1, 1, 1])
+
+    def test_stored_top_n_restores_live_order(self):
+        live = build(50, s1=range(100, 120), s2=[100, 200, 201], s3=range(300, 320),
+                     s4=[300, 301, 400, 401], s5=range(500, 520))
+        stored = stored_recommendation_rows(live)
+        strategies = ('genre', 'similar_users', 'similar_movies', 'latent_factors', 'tags')
+        records = [{'id': int(rec['id']), 'title': rec['title'], 'year': rec['year'], 'genres': ['Drama'],
+                    'reason': row['reason'], 'strategy': row['strategy'], 'reasoning': stored['reasoning']}
+                   for rec, row in zip(live['recommendations'], stored['recommendations'])]
+        self.assertEqual({row['strategy'] for row in stored['recommendations']}, set(strategies))
+        for limit in (10, 20, 50):
+            with self.subTest(limit=limit):
+                restored = build_stored_recommendations(records[:limit], limit)
+                self.assertEqual(restored['recommendations'], live['recommendations'][:limit])
+
+
+class ModelStrategyTest(unittest.TestCase):
+    """构建好隐因子模型和标签向量后，各后端的推荐中都有策略4、5的结果，且不含用户已评分的电影"""
+
+    @classmethod
+    def setUpClass(cls):
+        ratings, movie_ids = load_ratings_csv(DEFAULT_DATA_DIR)
+        held_out = ratings[ratings['user_id'] == 1].index[:HELD_OUT_RATINGS]
+        cls.model_dir = tempfile.TemporaryDirectory()
+        factor_dir = os.path.join(cls.model_dir.name, 'factors')
+        tag_dir = os.path.join(cls.model_dir.name, 'tags')
+        FactorModel.fit(ratings.drop(held_out), movie_ids, factors=16, iterations=5).save(factor_dir)
+        TagVectors.build(movie_tag_counts(load_tags_csv(DEFAULT_DATA_DIR))).save(tag_dir)
+        cls.original_model_dirs = factor_models.model_dir, tag_vectors.model_dir
+        factor_models.model_dir, tag_vectors.model_dir = factor_dir, tag_dir
+        cls.rated = ratings.groupby('user_id')['movie_id'].apply(lambda ids: set(ids.astype(str)))
+        cls.ratings = ratings.rename(columns={'movie_id': 'id'}).groupby('user_id')
+
+        cls.snapshot = GraphSnapshot.from_csv()
+        cls.sqlite = SQLiteDatabase(os.path.join(cls.model_dir.name, 'movielens.sqlite'))
+        cls.sqlite.load()
+
+    @classmethod
+    def tearDownClass(cls):
+        factor_models.model_dir, tag_vectors.model_dir = cls.original_model_dirs
+        cls.sqlite.close()
+        cls.model_dir.cleanup()
+
+    def assert_factor_recommendations(self, get_user_recommendations):
+        for user_id in USER_IDS:
+            for limit in (10, 50):
+                with self.subTest(user_id=user_id, limit=limit):
+                    self.assertTrue(factor_predictions(user_id, limit))
+                    recs = get_user_recommendations(user_id, limit)['recommendations']
+                    self.assertIn('隐因子推荐', {rec['strategy'] for rec in recs})
+                    self.assertFalse({rec['id'] for rec in recs} & self.rated[user_id])
+
+    def assert_tag_recommendations(self, get_user_recommendations):
+        users = [user_id for user_id in USER_IDS
+                 if tag_predictions(self.ratings.get_group(user_id).to_dict('records'), 4.0, 10)]
+        self.assertGreaterEqual(len(users), len(USER_IDS) // 2)
+        for user_id in users:
+            for limit in (10, 50):
+                with self.subTest(user_id=user_id, limit=limit):
+                    recs = get_user_recommendations(user_id, limit)['recommendations']
+                    tag_recs = [rec for rec in recs if rec['strategy'] == '标签相似推荐']
+                    self.assertTrue(tag_recs)
+                    self.assertTrue(all(rec['details']['matched_tag'] for rec in tag_recs))
+                    self.assertFalse({rec['id'] for rec in recs} & self.rated[user_id])
+
+    def test_snapshot_factor_strategy(self):
+        self.assert_factor_recommendations(self.snapshot.recommendations)
+
+    def test_sqlite_factor_strategy(self):
+        self.assert_factor_recommendations(self.sqlite.get_user_recommendations)
+
+    def test_snapshot_tag_strategy(self):
+        self.assert_tag_recommendations(self.snapshot.recommendations)
+
+    def test_sqlite_tag_strategy(self):
+        self.assert_tag_recommendations(self.sqlite.get_user_recommendations)
+
+
+if __name__ == '__main__':
+    unittest.main()